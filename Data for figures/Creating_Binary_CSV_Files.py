@@ -14,6 +14,20 @@ import os
 import zipfile
 import shutil
 import sys
+from binary_activity import light_summary, get_dataframe, add_binary, times, hourly_totals
+from bout_analytics import group_bouts, bout_summary
+from circadian import binned_activity, combine_bins, circadian_fit
+from behavior_sequences import group_sequences, sequence_summary
+from synchrony import synchrony_analysis
+from event_validation import validate_events, report_summary
+from group_aggregates import activity_counts, combine_counts, save_counts
+from activity_store import open_activity_store, store_events, store_activity, create_indexes
+from cohort_config import load_cohort, sucrose_groups, normalized_groups, light_on
+from interval_activity import activity_intervals, output_intervals, interval_light_summary, interval_hourly_totals, interval_group_counts
+from instrumentation import stage, timed
+from memory_budget import parse_budget, new_budget, check_budget, write_budget_report
+from shared_activity import share_activity, activity_frame, release_activity, save_occupancy
+from workbook_reader import columnar_archive
 
 #----------------------------------------------------------
 # Check Python Version
@@ -22,142 +36,6 @@ if sys.version < "3.8.2":
     raise Exception("Must be using Python 3.8.2 or newer")
 
 
-#----------------------------------------------------------
-# Define Custom Methods
-#----------------------------------------------------------
-
-# Method to calculate time spent consuming food during (1) light and (2) dark phases
-def light_summary(df, timeseries):
-    # Time of light on, the data start at light on
-    light_start = pd.to_datetime('1970-01-02 09:00:00')
-    #Separate dataframes into light and dark times
-    dark = timeseries[timeseries.index<light_start]
-    light = timeseries[timeseries.index>light_start]
-    # Calculate total food consumption per rat
-    total_eating_light = light.sum(axis=0)
-    total_eating_dark  = dark.sum(axis=0)
-    # Record food comsumption into a new dataframe, using rat number as index
-    for x in total_eating_light.index[:-1]:
-        ind = int(x[-2:])
-        df.loc[ind]=[total_eating_light[x], total_eating_dark[x]]
-    return (df)
-
-# Method to collect all the .xlxs files into lists separated by diet and create a single dataframe
-def get_dataframe(diet_name, video_archive):
-    # Create a dataframe using .xlsx files from raw video data
-    list_to_fill = [name for name in video_archive.namelist() 
-                    if name.endswith((diet_name + ".xlsx", diet_name + ".xls")) 
-                    & name.startswith(('Raw'))]
-    diet_dataframe = pd.DataFrame()
-    for i in list_to_fill:
-        df = pd.read_excel(video_archive.open(i), index_col = "seconds")
-        diet_dataframe = diet_dataframe.append(df)
-    diet_dataframe = diet_dataframe.sort_index()
-    return diet_dataframe
-
-
-# Method to create diet dataframe with all of the data and add columns logging which activity was performed at each time interval
-# A '1' indicates the activity STARTed and occured over that time interval. 
-# A '0' indicates the activity STOPped and did not occur over that time interval. 
-def add_binary(all_data):
-    all_data_copy = all_data.copy()
-    behaviors = ['Water', 'Feeding', 'Grooming', 'Rearing', 'Sleeping/Resting', 'Sucrose']
-    #Add columns that log which activity was performed (except for Zoomie)
-    for i in behaviors:
-        behavior_dataframe = all_data_copy.where(all_data_copy.Behavior == i)
-        to_binary_dict = {"START":1, "STOP":0}
-        all_data_copy[i + "_" + 'Activity'] = behavior_dataframe["Status"].replace(to_binary_dict)
-    #Add column for locomotor activity (Zoomie) since it uses POINT to indicate activity rather than START or STOP
-    zoom = (all_data_copy['Status']>= 'POINT') & (all_data_copy['Behavior'] == 'Zoomie')
-    all_data_copy['Zoomie_Activity'] = zoom.astype(int)
-    
-    return all_data_copy
-
-# Method to design a 1-second bin pivot table ordered by rat Name and showing 'duration' of feeding activity indicated by '1's.
-def times(activity_capitalized, all_data_copy, diet, counts = False):
-    # Create a dataframe with rows as time indices and columns as rat numbers. Values will be "1" or "0".
-    times = all_data_copy.pivot_table(index = 'seconds', columns = ['Name'], values = [activity_capitalized + '_Activity'])
-    
-    # Round up any non-zero fractions to '1' - there have been cases where 2 activities "START"ed at the exact same time so instead of a "1" for both columns, there was a "0.5" for both. Therefore, we need to round 0.5 up to 1 
-    times = np.ceil(times)
-
-    # Forward-fill the empty NaN values for each rat with the '0' or '1' that came before it - THIS WILL CALCULATE THE DURATION OF THE ACTIVITY (for counts/bouts, set the "counts" parameter to True)
-    if counts == False:
-        times = times.ffill()
-    
-    # Backward-fill remaining empty Nan values for each rat with a '0'
-    times = times.fillna(0)
-    
-    # Resample dataframe into 1-second intervals
-    if counts == False:
-        times = times.resample("1S").ffill()
-    else:
-        times = times.resample("1S").max()
-    
-    # Backward-fill remaining empty Nan values for each rat with a '0'
-    times = times.fillna(0)
-    
-    # Convert the dataframe to integers rather than floats - for faster processing
-    times = times.astype(int)
-    
-    ## Actively look into the Excel files, find the hours or intervals not recorded for each rat, and set each of those hours to NaN
-    if diet == "Control Adlib":
-        times.loc['1970-01-01 08:00:00':'1970-01-01 10:59:59', (activity_capitalized + '_Activity','Rat09')] = np.nan
-        times.loc['1970-01-01 19:00:00':'1970-01-01 19:59:59', (activity_capitalized + '_Activity','Rat09')] = np.nan
-        
-    if diet == "Control Restricted":
-        times.loc['1970-01-01 07:00:00':'1970-01-01 07:59:59'] = np.nan
-        times.loc['1970-01-01 18:00:00':'1970-01-01 18:59:59'] = np.nan
-        times.loc['1970-01-01 23:00:00':'1970-01-01 23:59:59', (activity_capitalized + '_Activity','Rat14')] = np.nan
-        times.loc['1970-01-01 23:00:00':'1970-01-01 23:59:59', (activity_capitalized + '_Activity','Rat18')] = np.nan
-        
-    if diet == "HFHS Adlib":
-        times.loc['1970-01-01 14:00:00':'1970-01-01 19:59:59', (activity_capitalized + '_Activity','Rat27')] = np.nan
-        
-    # Rearrange hours so Hour 21 is the first hour
-    m = times.index.get_level_values(0) > datetime.datetime(1970, 1, 1, 20, 59, 59)
-    idx1 = times.index.get_level_values(0)
-    times.index = idx1.where(m, idx1 +  datetime.timedelta(days=1))
-
-    times = times.sort_index()                
-    
-    # Add 16 extra hours with value of '0' for time-restricted animals - 0's FOR FEEDING AND SUCROSE ACTIVITY FOR ANYTHING OUTSIDE 8-HOUR INTERVAL
-    if diet == "HFHS Restricted" or diet == "Control Restricted":
-        dates = ["1970-01-01 21:00:00", "1970-01-01 22:00:00", "1970-01-02 7:00:00", 
-                 "1970-01-02 8:00:00", "1970-01-02 9:00:00", "1970-01-02 10:00:00", 
-                 "1970-01-02 11:00:00", "1970-01-02 12:00:00", "1970-01-02 13:00:00", 
-                 "1970-01-02 14:00:00", "1970-01-02 15:00:00", "1970-01-02 16:00:00", 
-                 "1970-01-02 17:00:00", "1970-01-02 18:00:00", "1970-01-02 19:00:00", 
-                 "1970-01-02 20:00:00"]
-
-        for i in dates:
-            ts = pd.to_datetime(i, format="%Y-%m-%d %H:%M:%S")
-            # Change the number of 0's to the number of rats
-            if diet == "HFHS Restricted":
-                new_row = pd.DataFrame([[0, 0, 0, 0, 0, 0, 0]], columns = times.columns, index=[ts])
-            if diet == "Control Restricted":
-                new_row = pd.DataFrame([[0, 0, 0, 0, 0, 0, 0, 0, 0]], columns = times.columns, index=[ts])
-            times = pd.concat([times, pd.DataFrame(new_row)], ignore_index=False)
-        times = times.sort_index()
-    
-    
-    # Construct normalized rat for diet group by finding the average of activity for all rats at each 1-second interval - Replace Nan values with 0 if any
-    times[('','mean')] = times.mean(axis=1).fillna(0)
-    
-    # Drop duplicate rows based on the time indices
-    times = times.loc[~times.index.duplicated(keep='first')]
-    
-    # Remove multi-level columns
-    times.columns = times.columns.get_level_values(1)
-    
-    # Rename the Index from "Name" to ""
-    times = times.rename_axis(columns = {"Name":""})
-        
-    return times
-
-
-
-
 #----------------------------------------------------------
 # Create Directories to Hold Figures In
 #----------------------------------------------------------
@@ -165,6 +43,10 @@ if not os.path.exists("Feeding_Binary_CSV_Files"):
     os.mkdir("Feeding_Binary_CSV_Files")
 if not os.path.exists("Sucrose_Binary_CSV_Files"):
     os.mkdir("Sucrose_Binary_CSV_Files")
+if not os.path.exists("Circadian_CSV_Files"):
+    os.mkdir("Circadian_CSV_Files")
+if not os.path.exists("Behavior_Sequence_CSV_Files"):
+    os.mkdir("Behavior_Sequence_CSV_Files")
 
 
 
@@ -172,172 +54,394 @@ if not os.path.exists("Sucrose_Binary_CSV_Files"):
 #----------------------------------------------------------
 # Download Raw Data
 #----------------------------------------------------------
+# Cohort to process - the 2018VT study (2018VT_cohort.json) unless the TRF_COHORT environment variable names another cohort configuration (see cohort_config.py)
+cohort = load_cohort()
+diet_groups = cohort["groups"]
+sucrose_diet_groups = sucrose_groups(cohort)
+
 # Download all Binary Feeding Data
-video_archive = zipfile.ZipFile(r'Raw Video Data.zip')
+video_archive = zipfile.ZipFile(cohort["video_archive"])
+# Events of every workbook in a compact columnar file next to the archive - written by the first run, read by later runs (see workbook_reader.py)
+columnar = timed("columnar_events", columnar_archive, cohort["video_archive"])
+
+# Create metafile that holds group information
+body_weight = pd.read_csv(cohort["metafile"]).T
+body_weight.columns = body_weight.iloc[0]
+metafile = body_weight.iloc[1:3].T
+groups = metafile.Diet + ' ' + metafile.Feeding
 
-# Extract all .xlsx files from video archive into 4 pandas dataframes - separated by diet
-cont_restr_compiled = get_dataframe("Control_Restricted", video_archive)
-hfhs_restr_compiled = get_dataframe("HFHS_Restricted", video_archive)
-cont_adlib_compiled = get_dataframe("Control_Adlib", video_archive)
-hfhs_adlib_compiled = get_dataframe("HFHS_Adlib", video_archive)
+# Memory budget - off unless the TRF_MEMORY_BUDGET environment variable is set to a size (i.e. TRF_MEMORY_BUDGET=1.5GB, see memory_budget.py)
+# With a budget, the 1-second feeding and sucrose activity that the synchrony files need from every diet group is kept on disk
+budget = new_budget(parse_budget(os.environ["TRF_MEMORY_BUDGET"])) if os.environ.get("TRF_MEMORY_BUDGET") else None
 
-# Add columns of 1s and 0s for each activity to specify whether a behavior is occurring 
-# Create the binary dataframes
-cont_restr_binary = add_binary(cont_restr_compiled)
-hfhs_restr_binary = add_binary(hfhs_restr_compiled)
-cont_adlib_binary = add_binary(cont_adlib_compiled)
-hfhs_adlib_binary = add_binary(hfhs_adlib_compiled)
+# Resolution of the sub-second files (optional, see "Generate Sub-Second Activity CSV Files" below)
+resolution = os.environ.get("TRF_RESOLUTION")
+
+# Activity store (optional, see "Fill the Activity Store" below)
+if os.environ.get("TRF_ACTIVITY_STORE"):
+    activity_store = open_activity_store(os.environ["TRF_ACTIVITY_STORE"], reset = True)
+    activity_store_rows = 0
 
 
 
 
 #----------------------------------------------------------
-# Generate Feeding Binary CSV Files by diet group
+# Process One Diet Group at a Time
 #----------------------------------------------------------
-# Design a dataframe to analyze time/duration of specific activity for all rats and a "normalized" rat (see below for explanation) over 24 hours
-# Create the 1-second binary dataframes
-hfhs_restr_feeding = times('Feeding', hfhs_restr_binary, "HFHS Restricted")
-cont_restr_feeding = times('Feeding', cont_restr_binary, "Control Restricted")
-hfhs_adlib_feeding = times('Feeding', hfhs_adlib_binary, "HFHS Adlib")
-cont_adlib_feeding = times('Feeding', cont_adlib_binary, "Control Adlib")
-
-# Create CSV file for Normalized Feeding Activity
-# A normalized rat for a diet group is the average of all rat activity (excluding NaN values) for every 1-second interval of time
-# 1 means all rats were performing the activity simultaneously in the 1-second time interval
-# 0 means no rats were performing the activity simultaneously in the 1-second time interval
-# Values range from 0 to 1
-normalized_feeding = pd.DataFrame()
-normalized_feeding = normalized_feeding.append(cont_adlib_feeding['mean'])
-normalized_feeding = normalized_feeding.append(hfhs_adlib_feeding['mean'])
-normalized_feeding = normalized_feeding.append(cont_restr_feeding['mean'])
-normalized_feeding = normalized_feeding.append(hfhs_restr_feeding['mean'])
-feeding_to_print = normalized_feeding.T
-feeding_to_print = feeding_to_print.sort_index().fillna(0)
-feeding_to_print.to_csv('Feeding_Binary_CSV_Files/Feeding_Normalized_Activity.csv', index = True, index_label = "Date_Time", header = ['Control Ad Lib', 'HFHS Ad Lib', 'Control Restricted', 'HFHS Restricted'], date_format='%Y-%m-%d %H:%M:%S')
-
-# Create 1-Second Binned CSV files for Feeding Activity for All Rats in Each Diet Group
-cont_restr_feeding.to_csv("Feeding_Binary_CSV_Files/Feeding_Control_Restricted_Binary.csv", index = True, columns = cont_restr_feeding.columns[:-1], date_format='%Y-%m-%d %H:%M:%S', index_label = "Date_Time")
-hfhs_restr_feeding.to_csv("Feeding_Binary_CSV_Files/Feeding_HFHS_Restricted_Binary.csv", index = True, columns = hfhs_restr_feeding.columns[:-1], date_format='%Y-%m-%d %H:%M:%S', index_label = "Date_Time")
-hfhs_adlib_feeding.to_csv("Feeding_Binary_CSV_Files/Feeding_HFHS_AdLib_Binary.csv", index = True, columns = hfhs_adlib_feeding.columns[:-1], date_format='%Y-%m-%d %H:%M:%S', index_label = "Date_Time")
-cont_adlib_feeding.to_csv("Feeding_Binary_CSV_Files/Feeding_Control_AdLib_Binary.csv", index = True, columns = cont_adlib_feeding.columns[:-1], date_format='%Y-%m-%d %H:%M:%S', index_label = "Date_Time")
+# The events and the 1-second activity of a diet group are released before the next diet group is read - only the
+# results of every diet group (and the 1-second feeding and sucrose activity, for the synchrony files) are kept
+event_reports = []
+feeding = {}
+sucrose = {}
+feeding_means = {}
+sucrose_means = {}
+feeding_counts = {}
+sucrose_counts = {}
+food_total = pd.DataFrame(columns = ["light_food", "dark_food"])
+sucrose_total = pd.DataFrame(columns = ["light_sucrose", "dark_sucrose"])
+feeding_hourly = []
+sucrose_hourly = []
+feeding_bout_parts = []
+sucrose_bout_parts = []
+circadian_bins = []
+sequence_parts = []
+intervals = {'Feeding': {}, 'Sucrose': {}}
+
+# Every diet group keeps its 1-second feeding and sucrose activity until the synchrony files are written - the files of the
+# activity kept on disk (memory budget) are removed in the "finally" block below, also when the run stops with an error
+try:
+    for group in diet_groups:
+        # Extract all .xlsx files of the diet group from video archive into one pandas dataframe
+        events = timed("ingestion", get_dataframe, group["archive_name"], video_archive, columnar, group = group["archive_name"])
+
+        # Check the event stream of every rat (START/STOP pairs, seconds in workbook order, POINT only for Zoomie) - see event_validation.py
+        # The binary activity is created as before; every problem is listed with its rat, behavior, time and workbook row in event_validation_report.csv
+        with stage("validation", group = group["name"]) as timing:
+            event_reports.append(validate_events(events).assign(diet = group["name"]))
+            timing.rows = len(events)
+
+        # Add columns of 1s and 0s for each activity to specify whether a behavior is occurring 
+        # Create the binary dataframe
+        binary = timed("binarization", add_binary, events, group = group["archive_name"])
+        del events
+
+        # Design a dataframe to analyze time/duration of every behavior for all rats and a "normalized" rat over 24 hours
+        # Create the 1-second binary dataframes (sucrose only for the diet groups with access to sucrose)
+        # Locomotor activity (Zoomie) is logged as POINT events, so count the events in each second instead of filling durations
+        group_frames = {}
+        for behavior in ['Feeding', 'Water', 'Grooming', 'Rearing', 'Sleeping/Resting', 'Zoomie'] + (['Sucrose'] if group["sucrose"] else []):
+            group_frames[behavior] = timed("times", times, behavior, binary, group["name"], behavior == 'Zoomie', cohort, group = group["name"], behavior = behavior)
+
+        # Collect the feeding results of the diet group: the normalized rat, the sums and counts behind it, the light/dark and hourly totals and the bouts
+        with stage("aggregation", group = group["name"], behavior = "Feeding"):
+            feeding_means[group["name"]] = group_frames['Feeding']['mean'].copy()
+            feeding_counts[group["name"]] = activity_counts(group_frames['Feeding'])
+            food_total = light_summary(food_total, group_frames['Feeding'], light_on(cohort))
+            feeding_hourly.append(hourly_totals(group_frames['Feeding']))
+            feeding_bout_parts.append(group_bouts(group_frames['Feeding']))
+
+        # Create 1-Second Binned CSV file for Feeding Activity for All Rats in the Diet Group
+        with stage("csv_export", output = "Feeding binary CSV files", group = group["name"]):
+            group_frames['Feeding'].to_csv("Feeding_Binary_CSV_Files/Feeding_" + group["file_name"] + "_Binary.csv", index = True, columns = group_frames['Feeding'].columns[:-1], date_format='%Y-%m-%d %H:%M:%S', index_label = "Date_Time")
+
+        if group["sucrose"]:
+            with stage("aggregation", group = group["name"], behavior = "Sucrose"):
+                sucrose_means[group["name"]] = group_frames['Sucrose']['mean'].copy()
+                sucrose_counts[group["name"]] = activity_counts(group_frames['Sucrose'])
+                sucrose_total = light_summary(sucrose_total, group_frames['Sucrose'], light_on(cohort))
+                sucrose_hourly.append(hourly_totals(group_frames['Sucrose']))
+                sucrose_bout_parts.append(group_bouts(group_frames['Sucrose']))
+
+            # Create 1-Second Binned CSV file for Sucrose Activity for All Rats in the Diet Group
+            # These files have always been written from the feeding dataframes (with the rat columns of the sucrose dataframes) - kept so that the published archives do not change
+            with stage("csv_export", output = "Sucrose binary CSV files", group = group["name"]):
+                group_frames['Feeding'].to_csv("Sucrose_Binary_CSV_Files/Sucrose_" + group["file_name"] + "_Binary.csv", index = True, columns = group_frames['Sucrose'].columns[:-1], date_format='%Y-%m-%d %H:%M:%S', index_label = "Date_Time")
+
+        # Average the 1-second activity of every behavior into the bins of the circadian analysis
+        with stage("circadian", group = group["name"]):
+            circadian_bins.append(binned_activity(group_frames))
+
+        # Count the seconds every pair of behaviors occur together and the transitions from one behavior to the next for every rat
+        with stage("behavior_sequences", group = group["name"]):
+            sequence_parts.append(group_sequences(group_frames, binary, groups))
+
+        # Keep the 1-second activity of every behavior as uint8 occupancy matrices, for the ethogram of every rat (see ethogram.py)
+        with stage("csv_export", output = "Occupancy matrices", group = group["name"]):
+            save_occupancy("Behavior_Sequence_CSV_Files/" + group["file_name"] + "_Occupancy.npz", group["label"], group_frames)
+
+        # Load the raw events, the bouts and the minute and hourly activity of every behavior and rat into the activity store (optional)
+        if os.environ.get("TRF_ACTIVITY_STORE"):
+            with stage("activity_store", output = os.environ["TRF_ACTIVITY_STORE"], group = group["name"]):
+                activity_store_rows += store_events(activity_store, binary, groups, cohort)
+                activity_store_rows += store_activity(activity_store, group_frames, groups)
+
+        # Active and unrecorded feeding and sucrose intervals of every rat as annotated, for the sub-second files (optional)
+        if resolution:
+            with stage("sub_second", group = group["name"]):
+                intervals['Feeding'][group["name"]] = activity_intervals('Feeding', binary, group["name"], False, cohort)
+                if group["sucrose"]:
+                    intervals['Sucrose'][group["name"]] = activity_intervals('Sucrose', binary, group["name"], False, cohort)
+
+        # Keep the 1-second feeding and sucrose activity for the synchrony files - on disk as uint8 occupancy matrices when there is a memory budget
+        if budget is None:
+            feeding[group["name"]] = group_frames['Feeding']
+            if group["sucrose"]:
+                sucrose[group["name"]] = group_frames['Sucrose']
+        else:
+            feeding[group["name"]] = share_activity({group["name"]: group_frames['Feeding']})
+            if group["sucrose"]:
+                sucrose[group["name"]] = share_activity({group["name"]: group_frames['Sucrose']})
+        del binary, group_frames
+        check_budget(budget, "diet group", group["name"])
+
+    # Write the problems found in the event streams of all diet groups
+    with stage("validation", output = "event_validation_report.csv"):
+        event_report = pd.concat(event_reports, ignore_index = True)
+        event_report = event_report[["diet"] + [column for column in event_report.columns if column != "diet"]]
+        event_report.to_csv("event_validation_report.csv", index = False)
+    if len(event_report) > 0:
+        print(str(len(event_report)) + " annotation problems (see event_validation_report.csv):")
+        print(report_summary(event_report).to_string())
 
 
 
 
 #----------------------------------------------------------
-# Generate Feeding Hourly Activity CSV File
+# Generate Feeding Binary CSV Files by diet group
 #----------------------------------------------------------
-# Create CSV file for Light and Dark Feeding Activity for Each Rat
-column_names = ["light_food", "dark_food"]
-df = pd.DataFrame(columns = column_names)
+    # Create CSV file for Normalized Feeding Activity
+    # A normalized rat for a diet group is the average of all rat activity (excluding NaN values) for every 1-second interval of time
+    # 1 means all rats were performing the activity simultaneously in the 1-second time interval
+    # 0 means no rats were performing the activity simultaneously in the 1-second time interval
+    # Values range from 0 to 1
+    # The ad lib groups come first (see normalized_groups() in cohort_config.py)
+    with stage("aggregation", output = "Feeding_Normalized_Activity.csv"):
+        # One column per diet group (the columns are named by the header below)
+        feeding_to_print = pd.concat([feeding_means[group["name"]] for group in normalized_groups(diet_groups)], axis = 1)
+        feeding_to_print = feeding_to_print.sort_index().fillna(0)
+    with stage("csv_export", output = "Feeding_Normalized_Activity.csv"):
+        feeding_to_print.to_csv('Feeding_Binary_CSV_Files/Feeding_Normalized_Activity.csv', index = True, index_label = "Date_Time", header = [group["label"] for group in normalized_groups(diet_groups)], date_format='%Y-%m-%d %H:%M:%S')
 
-df = light_summary(df, cont_adlib_feeding)
-df = light_summary(df, cont_restr_feeding)
-df = light_summary(df, hfhs_adlib_feeding)
-df = light_summary(df, hfhs_restr_feeding)
+    # Save the Sums (active rats) and Counts (recorded rats) behind the Normalized Feeding Activity for every 1-second interval of time
+    # Cohorts can be merged by adding these and the normalized activity recomputed from them (see group_aggregates.py)
+    with stage("csv_export", output = "Feeding_Activity_Counts.npz"):
+        save_counts('Feeding_Binary_CSV_Files/Feeding_Activity_Counts.npz', combine_counts({group["label"]: feeding_counts[group["name"]] for group in normalized_groups(diet_groups)}))
 
-# Create metafile that holds group information
-body_weight = pd.read_csv("2018VT - daily weight log.csv").T
-body_weight.columns = body_weight.iloc[0]
-metafile = body_weight.iloc[1:3].T
 
-# Create group variable that specifies diet for each rat
-df['group']=metafile.loc[df.index].Diet+' '+metafile.loc[df.index].Feeding
-df.to_csv('Feeding_Binary_CSV_Files/food_total.csv')
 
-# Create CSV file that totals amount of time spent feeding per hour
-# Resample all of the dataframes by 1 Hour. 
-cont_adlib_feeding_hourly = cont_adlib_feeding.iloc[:, :-1].resample("1H").agg(pd.Series.sum, skipna=False).T
-hfhs_adlib_feeding_hourly = hfhs_adlib_feeding.iloc[:, :-1].resample("1H").agg(pd.Series.sum, skipna=False).T
-cont_restr_feeding_hourly = cont_restr_feeding.iloc[:, :-1].resample("1H").agg(pd.Series.sum, skipna=False).T
-hfhs_restr_feeding_hourly = hfhs_restr_feeding.iloc[:, :-1].resample("1H").agg(pd.Series.sum, skipna=False).T
 
-# Combine all 4 new dataframes into one list
-hourly_feeding_frames = [cont_adlib_feeding_hourly, cont_restr_feeding_hourly, hfhs_adlib_feeding_hourly, hfhs_restr_feeding_hourly]
+#----------------------------------------------------------
+# Generate Feeding Hourly Activity CSV File
+#----------------------------------------------------------
+    # Create CSV file for Light and Dark Feeding Activity for Each Rat
+    with stage("aggregation", output = "food_total.csv") as timing:
+        # Create group variable that specifies diet for each rat
+        food_total['group']=metafile.loc[food_total.index].Diet+' '+metafile.loc[food_total.index].Feeding
+        timing.rows = len(food_total)
+    with stage("csv_export", output = "food_total.csv"):
+        food_total.to_csv('Feeding_Binary_CSV_Files/food_total.csv')
+
+    # Create CSV file that totals amount of time spent feeding per hour
+    # Resample all of the dataframes by 1 Hour - the columns are labeled with the hour they start at ("21:00", "22:00", ...)
+    with stage("aggregation", output = "food_total_by_hour.csv") as timing:
+        # Concatenate/Merge the hourly totals of all diet groups into 1 dataframe
+        feeding_hourly_frame = pd.concat(feeding_hourly)
+
+        # Set the index of new dataframe as just rat numbers (i.e. "2" instead of "Rat2"). 
+        # This will set the index to the same index as the metafile
+        feeding_hourly_frame.index = feeding_hourly_frame.index.map(lambda x: int(str(x)[3:]))
+
+        # Add a new column that holds the diet group information (which diet group the rat belongs to)
+        feeding_hourly_frame['group']=metafile.loc[feeding_hourly_frame.index].Diet+' '+metafile.loc[feeding_hourly_frame.index].Feeding
+        timing.rows = len(feeding_hourly_frame)
+
+    # Create CSV file
+    with stage("csv_export", output = "food_total_by_hour.csv"):
+        feeding_hourly_frame.to_csv("Feeding_Binary_CSV_Files/food_total_by_hour.csv")
+
+    # Create CSV files that describe the bouts and meals of feeding activity for each rat and each diet group
+    with stage("aggregation", output = "feeding bout CSV files") as timing:
+        feeding_bouts, feeding_bouts_by_group, feeding_bout_durations = bout_summary(*zip(*feeding_bout_parts), groups)
+        timing.rows = len(feeding_bouts)
+    with stage("csv_export", output = "feeding bout CSV files"):
+        feeding_bouts.to_csv("Feeding_Binary_CSV_Files/feeding_bouts_by_rat.csv")
+        feeding_bouts_by_group.to_csv("Feeding_Binary_CSV_Files/feeding_bouts_by_group.csv")
+        feeding_bout_durations.to_csv("Feeding_Binary_CSV_Files/feeding_bout_durations_by_group.csv")
+
+    # Create CSV files that measure how synchronized feeding is for every pair of rats, within and across diet groups
+    # Synchrony compares every pair of rats, so it is the one step that needs the 1-second activity of all diet groups at once
+    with stage("synchrony", output = "feeding synchrony CSV files") as timing:
+        feeding_frames = [feeding[group["name"]] if budget is None else activity_frame(feeding[group["name"]], group["name"]) for group in diet_groups]
+        feeding_synchrony, feeding_synchrony_by_group = synchrony_analysis(feeding_frames, groups)
+        del feeding_frames
+        timing.rows = len(feeding_synchrony)
+    with stage("csv_export", output = "feeding synchrony CSV files"):
+        feeding_synchrony.to_csv("Feeding_Binary_CSV_Files/feeding_synchrony_by_pair.csv", index = False)
+        feeding_synchrony_by_group.to_csv("Feeding_Binary_CSV_Files/feeding_synchrony_by_group.csv")
+    check_budget(budget, "feeding synchrony")
 
-# Concatenate/Merge all 4 dataframes into 1 dataframe
-feeding_hourly_frame = pd.concat(hourly_feeding_frames)
 
-# Set the index of new dataframe as just rat numbers (i.e. "2" instead of "Rat2"). 
-# This will set the index to the same index as the metafile
-feeding_hourly_frame.index = feeding_hourly_frame.index.map(lambda x: int(str(x)[3:]))
 
-# Add a new column that holds the diet group information (which of the 4 diet groups that the rat belongs to)
-feeding_hourly_frame['group']=metafile.loc[feeding_hourly_frame.index].Diet+' '+metafile.loc[feeding_hourly_frame.index].Feeding
 
-# Rename all of the columns into actual hour times - making it easier to choose columns
-feeding_hourly_frame.columns = ["21:00", "22:00", "23:00", "0:00", "1:00", "2:00", "3:00", "4:00",
-                                "5:00", "6:00", "7:00", "8:00", "9:00", "10:00", "11:00", "12:00",
-                                "13:00", "14:00", "15:00", "16:00", "17:00", "18:00", "19:00", "20:00",
-                                "group"]
+#----------------------------------------------------------
+# Generate Sucrose Binary CSV Files by diet group
+#----------------------------------------------------------
+    # Create CSV file for Normalized Sucrose Activity
+    with stage("aggregation", output = "Sucrose_Normalized_Activity.csv"):
+        # One column per diet group (the columns are named by the header below)
+        sucrose_to_print = pd.concat([sucrose_means[group["name"]] for group in normalized_groups(sucrose_diet_groups)], axis = 1)
+        sucrose_to_print = sucrose_to_print.sort_index().fillna(0)
+    with stage("csv_export", output = "Sucrose_Normalized_Activity.csv"):
+        sucrose_to_print.to_csv('Sucrose_Binary_CSV_Files/Sucrose_Normalized_Activity.csv', index = True, index_label = "Date_Time", header = [group["label"] for group in normalized_groups(sucrose_diet_groups)], date_format='%Y-%m-%d %H:%M:%S')
 
-# Create CSV file
-feeding_hourly_frame.to_csv("Feeding_Binary_CSV_Files/food_total_by_hour.csv")
+    # Save the Sums and Counts behind the Normalized Sucrose Activity
+    with stage("csv_export", output = "Sucrose_Activity_Counts.npz"):
+        save_counts('Sucrose_Binary_CSV_Files/Sucrose_Activity_Counts.npz', combine_counts({group["label"]: sucrose_counts[group["name"]] for group in normalized_groups(sucrose_diet_groups)}))
 
 
 
 
 #----------------------------------------------------------
-# Generate Sucrose Binary CSV Files by diet group
+# Generate Sucrose Hourly Activity CSV Files by diet group
 #----------------------------------------------------------
-# Create the 1-second dataframes for Sucrose Activity
-hfhs_restr_sucrose = times('Sucrose', hfhs_restr_binary, "HFHS Restricted")
-hfhs_adlib_sucrose = times('Sucrose', hfhs_adlib_binary, "HFHS Adlib")
+    # Create CSV file for Light and Dark Sucrose Activity for Each Rat
+    with stage("aggregation", output = "sucrose_total.csv") as timing:
+        sucrose_total['group']=metafile.loc[sucrose_total.index].Diet+' '+metafile.loc[sucrose_total.index].Feeding
+        timing.rows = len(sucrose_total)
+    with stage("csv_export", output = "sucrose_total.csv"):
+        sucrose_total.to_csv('Sucrose_Binary_CSV_Files/sucrose_total.csv')
+
+    # Create CSV file that total amount of time spent drinking sucrose per hour
+    # Resample all of the dataframes by 1 Hour - the columns are labeled with the hour they start at ("21:00", "22:00", ...)
+    with stage("aggregation", output = "sucrose_total_by_hour.csv") as timing:
+        # Concatenate/Merge the hourly totals of the diet groups with access to sucrose into 1 dataframe
+        sucrose_hourly_frame = pd.concat(sucrose_hourly)
+
+        # Set the index of the new dataframe as just the rat numbers (i.e. "2" instead of "Rat2"). 
+        # This will set the index to the same index as the groups_data dataframe
+        sucrose_hourly_frame.index = sucrose_hourly_frame.index.map(lambda x: int(str(x)[3:]))
+
+        # Add a new column that holds the diet group information (which diet group the rat belongs to)
+        sucrose_hourly_frame['group']=metafile.loc[sucrose_hourly_frame.index].Diet+' '+metafile.loc[sucrose_hourly_frame.index].Feeding
+        timing.rows = len(sucrose_hourly_frame)
+
+    # Create CSV file
+    with stage("csv_export", output = "sucrose_total_by_hour.csv"):
+        sucrose_hourly_frame.to_csv("Sucrose_Binary_CSV_Files/sucrose_total_by_hour.csv")
+
+    # Create CSV files that describe the bouts of sucrose drinking activity for each rat and each diet group with access to sucrose
+    with stage("aggregation", output = "sucrose bout CSV files") as timing:
+        sucrose_bouts, sucrose_bouts_by_group, sucrose_bout_durations = bout_summary(*zip(*sucrose_bout_parts), groups)
+        timing.rows = len(sucrose_bouts)
+    with stage("csv_export", output = "sucrose bout CSV files"):
+        sucrose_bouts.to_csv("Sucrose_Binary_CSV_Files/sucrose_bouts_by_rat.csv")
+        sucrose_bouts_by_group.to_csv("Sucrose_Binary_CSV_Files/sucrose_bouts_by_group.csv")
+        sucrose_bout_durations.to_csv("Sucrose_Binary_CSV_Files/sucrose_bout_durations_by_group.csv")
+
+    # Create CSV files that measure how synchronized sucrose drinking is for every pair of rats with access to sucrose
+    with stage("synchrony", output = "sucrose synchrony CSV files") as timing:
+        sucrose_frames = [sucrose[group["name"]] if budget is None else activity_frame(sucrose[group["name"]], group["name"]) for group in sucrose_diet_groups]
+        sucrose_synchrony, sucrose_synchrony_by_group = synchrony_analysis(sucrose_frames, groups)
+        del sucrose_frames
+        timing.rows = len(sucrose_synchrony)
+    with stage("csv_export", output = "sucrose synchrony CSV files"):
+        sucrose_synchrony.to_csv("Sucrose_Binary_CSV_Files/sucrose_synchrony_by_pair.csv", index = False)
+        sucrose_synchrony_by_group.to_csv("Sucrose_Binary_CSV_Files/sucrose_synchrony_by_group.csv")
+    check_budget(budget, "sucrose synchrony")
+finally:
+    # The 1-second activity is not needed anymore
+    if budget is not None:
+        for shared in list(feeding.values()) + list(sucrose.values()):
+            release_activity(shared)
+del feeding, sucrose
 
-# Create CSV file for Normalized Sucrose Activity
-normalized_sucrose = pd.DataFrame()
-normalized_sucrose = normalized_sucrose.append(hfhs_adlib_sucrose['mean'])
-normalized_sucrose = normalized_sucrose.append(hfhs_restr_sucrose['mean'])
-sucrose_to_print = normalized_sucrose.T
-sucrose_to_print = sucrose_to_print.sort_index().fillna(0)
-sucrose_to_print.to_csv('Sucrose_Binary_CSV_Files/Sucrose_Normalized_Activity.csv', index = True, index_label = "Date_Time", header = ['HFHS Ad Lib', 'HFHS Restricted'], date_format='%Y-%m-%d %H:%M:%S')
 
-# Create 1-Second Binned CSV file for Sucrose Activity for All Rats in Each HFHS Group
-hfhs_restr_feeding.to_csv("Sucrose_Binary_CSV_Files/Sucrose_HFHS_Restricted_Binary.csv", index = True, columns = hfhs_restr_sucrose.columns[:-1], date_format='%Y-%m-%d %H:%M:%S', index_label = "Date_Time")
-hfhs_adlib_feeding.to_csv("Sucrose_Binary_CSV_Files/Sucrose_HFHS_AdLib_Binary.csv", index = True, columns = hfhs_adlib_sucrose.columns[:-1], date_format='%Y-%m-%d %H:%M:%S', index_label = "Date_Time")
+
+
+#----------------------------------------------------------
+# Generate Circadian Rhythm CSV Files
+#----------------------------------------------------------
+# Fit a 24-hour cosinor (mesor, amplitude, acrophase) and a Lomb-Scargle periodogram to every behavior of every rat
+# The 1-second activity of every diet group was averaged into bins above, so only the bins of all diet groups are combined here
+with stage("circadian", output = "circadian CSV files") as timing:
+    binned = combine_bins(circadian_bins, ['Feeding', 'Sucrose', 'Water', 'Grooming', 'Rearing', 'Sleeping/Resting', 'Zoomie'])
+    circadian_by_rat, circadian_by_group, circadian_periodogram = circadian_fit(binned, groups)
+    timing.rows = len(circadian_by_rat)
+with stage("csv_export", output = "circadian CSV files"):
+    circadian_by_rat.to_csv("Circadian_CSV_Files/circadian_by_rat.csv")
+    circadian_by_group.to_csv("Circadian_CSV_Files/circadian_by_group.csv")
+    circadian_periodogram.to_csv("Circadian_CSV_Files/periodogram_by_group.csv")
 
 
 
 
 #----------------------------------------------------------
-# Generate Sucrose Hourly Activity CSV Files by diet group
+# Generate Behavior Co-occurrence and Transition CSV Files
 #----------------------------------------------------------
-# Create CSV file for Light and Dark Sucrose Activity for Each Rat
-column_names = ["light_sucrose", "dark_sucrose"]
-df = pd.DataFrame(columns = column_names)
+# Combine the co-occurrences and transitions counted for every diet group above
+with stage("behavior_sequences", output = "behavior sequence CSV files") as timing:
+    (co_occurrence_by_rat, co_occurrence_by_group, transitions_by_rat,
+     transitions_by_group, sucrose_feeding) = sequence_summary(*zip(*sequence_parts), groups)
+    timing.rows = len(co_occurrence_by_rat) + len(transitions_by_rat)
+with stage("csv_export", output = "behavior sequence CSV files"):
+    co_occurrence_by_rat.to_csv("Behavior_Sequence_CSV_Files/co_occurrence_by_rat.csv", index = False)
+    co_occurrence_by_group.to_csv("Behavior_Sequence_CSV_Files/co_occurrence_by_group.csv", index = False)
+    transitions_by_rat.to_csv("Behavior_Sequence_CSV_Files/transitions_by_rat.csv", index = False)
+    transitions_by_group.to_csv("Behavior_Sequence_CSV_Files/transitions_by_group.csv", index = False)
+    sucrose_feeding.to_csv("Behavior_Sequence_CSV_Files/sucrose_feeding_by_rat.csv")
+check_budget(budget, "circadian and behavior sequences")
 
-df = light_summary(df, hfhs_adlib_sucrose)
-df = light_summary(df, hfhs_restr_sucrose)
 
-df['group']=metafile.loc[df.index].Diet+' '+metafile.loc[df.index].Feeding
-df.to_csv('Sucrose_Binary_CSV_Files/sucrose_total.csv')
 
-# Create CSV file that total amount of time spent drinking sucrose per hour
-# Resample all of the dataframes by 1 Hour.
-hfhs_adlib_sucrose_hourly = hfhs_adlib_sucrose.iloc[:, :-1].resample("1H").agg(pd.Series.sum, skipna=False).T
-hfhs_restr_sucrose_hourly = hfhs_restr_sucrose.iloc[:, :-1].resample("1H").agg(pd.Series.sum, skipna=False).T
 
-# Combine 2 dataframes into one list
-hourly_sucrose_frames = [hfhs_adlib_sucrose_hourly, hfhs_restr_sucrose_hourly]
-
-# Concatenate/Merge both dataframes into 1 dataframe
-sucrose_hourly_frame = pd.concat(hourly_sucrose_frames)
+#----------------------------------------------------------
+# Fill the Activity Store (optional)
+#----------------------------------------------------------
+# Set the TRF_ACTIVITY_STORE environment variable to a file name (i.e. TRF_ACTIVITY_STORE=activity.sqlite) to also load the raw
+# events, the bouts and the minute and hourly activity of every behavior and rat into one indexed SQLite database (see activity_store.py)
+# The rows of every diet group were added above - the indexes are created once all rows are in
+if os.environ.get("TRF_ACTIVITY_STORE"):
+    with stage("activity_store", output = os.environ["TRF_ACTIVITY_STORE"]) as timing:
+        create_indexes(activity_store)
+        activity_store.close()
+        timing.rows = activity_store_rows
 
-# Set the index of the new dataframe as just the rat numbers (i.e. "2" instead of "Rat2"). 
-# This will set the index to the same index as the groups_data dataframe
-sucrose_hourly_frame.index = sucrose_hourly_frame.index.map(lambda x: int(str(x)[3:]))
 
-# Add a new column that holds the diet group information (which of the 2 HFHS groups that the rat belongs to)
-sucrose_hourly_frame['group']=metafile.loc[sucrose_hourly_frame.index].Diet+' '+metafile.loc[sucrose_hourly_frame.index].Feeding
 
-# Rename all of the columns into actual hour times - making it easier to choose columns
-sucrose_hourly_frame.columns = ["21:00", "22:00", "23:00", "0:00", "1:00", "2:00", "3:00", "4:00",
-                                "5:00", "6:00", "7:00", "8:00", "9:00", "10:00", "11:00", "12:00",
-                                "13:00", "14:00", "15:00", "16:00", "17:00", "18:00", "19:00", "20:00",
-                                "group"]
 
-# Create CSV file
-sucrose_hourly_frame.to_csv("Sucrose_Binary_CSV_Files/sucrose_total_by_hour.csv")
+#----------------------------------------------------------
+# Generate Sub-Second Activity CSV Files (optional)
+#----------------------------------------------------------
+# Set the TRF_RESOLUTION environment variable to a resolution that divides a day (i.e. TRF_RESOLUTION=100ms) to also create
+# Sub_Second_CSV_Files.zip: the feeding and sucrose intervals as annotated (to the millisecond), and the light/dark totals,
+# hourly totals (in seconds) and sums and counts behind the normalized activity at that resolution (see interval_activity.py)
+# The intervals of every diet group were collected above
+if resolution:
+    if not os.path.exists("Sub_Second_CSV_Files"):
+        os.mkdir("Sub_Second_CSV_Files")
+    with stage("sub_second", output = "Sub_Second_CSV_Files") as timing:
+        rows = 0
+        for activity, activity_groups, column_names, prefix in [('Feeding', diet_groups, ["light_food", "dark_food"], "food"),
+                                                                ('Sucrose', sucrose_diet_groups, ["light_sucrose", "dark_sucrose"], "sucrose")]:
+            # Active and unrecorded intervals of every rat on the clock of the binary CSV files
+            interval_frame = pd.concat([output_intervals(intervals[activity][group["name"]]).assign(group = group["label"]) for group in activity_groups], ignore_index = True)
+            interval_frame[["group", "rat", "kind", "start", "end"]].to_csv("Sub_Second_CSV_Files/" + activity + "_Intervals.csv", index = False, date_format='%Y-%m-%d %H:%M:%S.%f')
+
+            df = pd.DataFrame(columns = column_names)
+            for group in activity_groups:
+                df = interval_light_summary(df, intervals[activity][group["name"]], light_on(cohort), resolution)
+            df['group'] = metafile.loc[df.index].Diet + ' ' + metafile.loc[df.index].Feeding
+            df.to_csv("Sub_Second_CSV_Files/" + prefix + "_total.csv")
+
+            hourly_frame = pd.concat([interval_hourly_totals(intervals[activity][group["name"]], resolution) for group in activity_groups])
+            hourly_frame.index = hourly_frame.index.map(lambda x: int(str(x)[3:]))
+            hourly_frame['group'] = metafile.loc[hourly_frame.index].Diet + ' ' + metafile.loc[hourly_frame.index].Feeding
+            hourly_frame.to_csv("Sub_Second_CSV_Files/" + prefix + "_total_by_hour.csv")
+
+            save_counts("Sub_Second_CSV_Files/" + activity + "_Activity_Counts.npz",
+                        interval_group_counts({group["label"]: intervals[activity][group["name"]] for group in normalized_groups(activity_groups)}, resolution))
+            rows += len(interval_frame)
+        timing.rows = rows
 
 
 
@@ -346,17 +450,39 @@ sucrose_hourly_frame.to_csv("Sucrose_Binary_CSV_Files/sucrose_total_by_hour.csv"
 # Create Zip File and Remove Directory
 #----------------------------------------------------------
 # Create Zip File
-shutil.make_archive("Feeding_Binary_CSV_Files", 'zip', "Feeding_Binary_CSV_Files")
-shutil.make_archive("Sucrose_Binary_CSV_Files", 'zip', "Sucrose_Binary_CSV_Files")
-
-# Remove Directories
-folders_to_remove = [name for name in os.listdir()
-                    if (name.startswith(('Feeding_Binary_CSV_Files')))  & (not name.endswith((".zip")))]
-for folder in folders_to_remove:
-    shutil.rmtree(folder)
+with stage("zip_archives"):
+    shutil.make_archive("Feeding_Binary_CSV_Files", 'zip', "Feeding_Binary_CSV_Files")
+    shutil.make_archive("Sucrose_Binary_CSV_Files", 'zip', "Sucrose_Binary_CSV_Files")
+    shutil.make_archive("Circadian_CSV_Files", 'zip', "Circadian_CSV_Files")
+    shutil.make_archive("Behavior_Sequence_CSV_Files", 'zip', "Behavior_Sequence_CSV_Files")
+    if os.path.exists("Sub_Second_CSV_Files"):
+        shutil.make_archive("Sub_Second_CSV_Files", 'zip', "Sub_Second_CSV_Files")
+
+    # Remove Directories
+    folders_to_remove = [name for name in os.listdir()
+                        if (name.startswith(('Feeding_Binary_CSV_Files')))  & (not name.endswith((".zip")))]
+    for folder in folders_to_remove:
+        shutil.rmtree(folder)
     
-folders_to_remove = [name for name in os.listdir()
-                    if (name.startswith(('Sucrose_Binary_CSV_Files')))  & (not name.endswith((".zip")))]
-for folder in folders_to_remove:
-    shutil.rmtree(folder)
-
+    folders_to_remove = [name for name in os.listdir()
+                        if (name.startswith(('Sucrose_Binary_CSV_Files')))  & (not name.endswith((".zip")))]
+    for folder in folders_to_remove:
+        shutil.rmtree(folder)
+
+    folders_to_remove = [name for name in os.listdir()
+                        if (name.startswith(('Circadian_CSV_Files')))  & (not name.endswith((".zip")))]
+    for folder in folders_to_remove:
+        shutil.rmtree(folder)
+
+    folders_to_remove = [name for name in os.listdir()
+                        if (name.startswith(('Behavior_Sequence_CSV_Files')))  & (not name.endswith((".zip")))]
+    for folder in folders_to_remove:
+        shutil.rmtree(folder)
+
+    folders_to_remove = [name for name in os.listdir()
+                        if (name.startswith(('Sub_Second_CSV_Files')))  & (not name.endswith((".zip")))]
+    for folder in folders_to_remove:
+        shutil.rmtree(folder)
+
+# Write the peak memory of every step of the memory budget (see memory_budget.py)
+write_budget_report(budget)
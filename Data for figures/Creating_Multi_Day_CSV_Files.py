@@ -0,0 +1,175 @@
+# Creating CSV Files of Feeding and Sucrose Activity for Multi-Day Recordings
+# Used to create the daily binary CSV files of Creating_Binary_CSV_Files.py for continuous recordings of any length for
+# Time-Restricted Feeding in the Active Phase Drives Periods of Rapid Food Consumption in Rats Fed a High-Fat, High-Sugar Diet with Liquid Sucrose
+# by Kush Attal, Julia Wickman Shihoko Kojima, Sarah N. Blythe, Natalia Toporikova
+#
+# Usage:
+#     python Creating_Multi_Day_CSV_Files.py --archive "Raw Video Data.zip" --window 1D --anchor 21:00
+#
+# The recording is processed one window at a time (a day starting at lights off by default): only the events of a window
+# are read and binarized, the state of every rat is carried into the next window, and only one window of 1-second activity is held in memory. Every window gets its own folder (named after the date the window starts)
+# with the same files as the daily output of Creating_Binary_CSV_Files.py.
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import pandas as pd
+import numpy as np
+import argparse
+import os
+import zipfile
+import shutil
+from binary_activity import (light_summary, get_dataframe, diet_workbooks, add_binary, activity_rats, window_events, window_states,
+                             recording_windows, times_window, hourly_totals)
+from cohort_config import load_cohort, normalized_groups, unrecorded_gaps
+from instrumentation import stage, timed
+from shared_activity import save_occupancy
+from workbook_reader import columnar_archive, columnar_overview
+
+
+#----------------------------------------------------------
+# Read Options
+#----------------------------------------------------------
+parser = argparse.ArgumentParser(description = "Create daily binary CSV files for multi-day recordings")
+parser.add_argument("--archive", default = None, help = "zip archive of the raw video workbooks (default: the archive of the cohort configuration)")
+parser.add_argument("--window", default = "1D", help = "length of each processing window (i.e. 1D or 12H)")
+parser.add_argument("--anchor", default = None, help = "time of day every window starts at (default: lights off of the cohort configuration)")
+parser.add_argument("--light-offset", default = "12H", help = "time from the window start to light on")
+parser.add_argument("--gaps", default = None, help = "CSV file of intervals not recorded (columns start, end, rat) - default: the unrecorded intervals of the cohort configuration")
+arguments = parser.parse_args()
+
+# Cohort to process - the 2018VT study unless the TRF_COHORT environment variable names another cohort configuration (see cohort_config.py)
+cohort = load_cohort()
+archive = arguments.archive or cohort["video_archive"]
+anchor = arguments.anchor or cohort["day_start"]
+
+# Diet groups: name in the archive, name of the output files, column of the normalized files and feeding schedule
+diets = [(group["archive_name"], group["file_name"], group["label"], group["restricted"]) for group in normalized_groups(cohort["groups"])]
+sucrose_diets = [group["archive_name"] for group in cohort["groups"] if group["sucrose"]]
+
+# Intervals not recorded for each diet group - the "unrecorded" intervals of the cohort configuration unless --gaps is given
+gaps = {group["archive_name"]: pd.read_csv(arguments.gaps) if arguments.gaps is not None else unrecorded_gaps(group)
+        for group in cohort["groups"]}
+
+
+#----------------------------------------------------------
+# Download Raw Data
+#----------------------------------------------------------
+# The events are read one window at a time from the columnar file of the archive (see workbook_reader.py): the first and
+# last event and the rats of every group are found without reading the events, and only the events of the window being
+# binarized are held in memory. Without a columnar file (a text column holds numbers) the time-sorted events of every
+# group are kept instead and sliced one window at a time
+video_archive = zipfile.ZipFile(archive)
+columnar = timed("columnar_events", columnar_archive, archive)
+events = {}
+feeding_rats = {}
+sucrose_rats = {}
+recorded = {}
+for diet, _, _, _ in diets:
+    workbooks = diet_workbooks(diet, video_archive)
+    if columnar is not None and all(name in columnar["positions"] for name in workbooks):
+        first, last, rats = timed("ingestion", columnar_overview, columnar, workbooks, group = diet)
+        recorded[diet] = (first, last)
+        feeding_rats[diet] = rats.get('Feeding', np.empty(0, dtype = object))
+        if diet in sucrose_diets:
+            sucrose_rats[diet] = rats.get('Sucrose', np.empty(0, dtype = object))
+    else:
+        events[diet] = timed("ingestion", get_dataframe, diet, video_archive, columnar, group = diet)
+        recorded[diet] = (events[diet].index.min(), events[diet].index.max())
+        feeding_rats[diet] = activity_rats('Feeding', events[diet])
+        if diet in sucrose_diets:
+            sucrose_rats[diet] = activity_rats('Sucrose', events[diet])
+
+# Create metafile that holds group information
+body_weight = pd.read_csv(cohort["metafile"]).T
+body_weight.columns = body_weight.iloc[0]
+metafile = body_weight.iloc[1:3].T
+
+windows = recording_windows(min(start for start, _ in recorded.values()), max(end for _, end in recorded.values()),
+                            arguments.window, anchor)
+
+
+#----------------------------------------------------------
+# Define Custom Methods
+#----------------------------------------------------------
+
+# Method to read the events of one diet group within one window [window_start, window_end) - from the columnar file, or from
+# the events kept in memory when there is none
+def diet_window_events(diet, window_start, window_end):
+    if diet in events:
+        return window_events(events[diet], window_start, window_end)
+    return timed("ingestion", get_dataframe, diet, video_archive, columnar, window_start, window_end, group = diet, window = str(window_start))
+
+# Method to binarize the events of one window and collect the feeding and sucrose state changes of every diet group
+# "carried" holds the state of every rat at the end of the previous window ({(activity, diet): states}) and is updated for the next window
+def collect_window_states(carried, window_start, window_end):
+    feeding_states = {}
+    sucrose_states = {}
+    for diet, _, _, _ in diets:
+        binary = timed("binarization", add_binary, diet_window_events(diet, window_start, window_end), group = diet)
+        for activity, rats, states in [('Feeding', feeding_rats, feeding_states), ('Sucrose', sucrose_rats, sucrose_states)]:
+            if diet in rats:
+                states[diet] = window_states(activity, binary, window_start, rats[diet], carried.get((activity, diet)))
+                carried[(activity, diet)] = states[diet].iloc[-1]
+        del binary
+    return feeding_states, sucrose_states
+
+# Method to write the daily CSV files of one activity for one window
+def write_window(activity, states, folder, window_start, window_end, total_columns):
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    light_start = window_start + pd.Timedelta(arguments.light_offset)
+    normalized = []
+    totals = pd.DataFrame(columns = total_columns)
+    hourly_frames = []
+    for diet, file_name, column_name, restricted in diets:
+        if diet not in states:
+            continue
+        with stage("times", group = diet, behavior = activity, window = str(window_start)) as timing:
+            times = times_window(states[diet], window_start, window_end, recorded[diet][0], recorded[diet][1],
+                                 zero_outside_recording = restricted, gaps = gaps[diet])
+            timing.rows = len(times)
+        times.to_csv(folder + "/" + activity + "_" + file_name + "_Binary.csv", index = True, columns = times.columns[:-1],
+                     date_format = '%Y-%m-%d %H:%M:%S', index_label = "Date_Time")
+        save_occupancy(folder + "/" + activity + "_" + file_name + "_Occupancy.npz", column_name, {activity: times})
+        normalized.append(times['mean'].rename(column_name))
+        totals = light_summary(totals, times, light_start)
+        hourly_frames.append(hourly_totals(times))
+        del times
+
+    # Normalized activity of every diet group
+    pd.concat(normalized, axis = 1).fillna(0).to_csv(folder + "/" + activity + "_Normalized_Activity.csv", index = True,
+                                                     index_label = "Date_Time", date_format = '%Y-%m-%d %H:%M:%S')
+
+    # Light and dark activity of every rat
+    totals['group'] = metafile.loc[totals.index].Diet + ' ' + metafile.loc[totals.index].Feeding
+    totals.to_csv(folder + "/" + ("food" if activity == "Feeding" else "sucrose") + "_total.csv")
+
+    # Activity of every rat per hour
+    hourly_frame = pd.concat(hourly_frames)
+    hourly_frame.index = hourly_frame.index.map(lambda x: int(str(x)[3:]))
+    hourly_frame['group'] = metafile.loc[hourly_frame.index].Diet + ' ' + metafile.loc[hourly_frame.index].Feeding
+    hourly_frame.to_csv(folder + "/" + ("food" if activity == "Feeding" else "sucrose") + "_total_by_hour.csv")
+
+
+#----------------------------------------------------------
+# Generate Daily CSV Files One Window at a Time
+#----------------------------------------------------------
+carried = {}
+for window_start, window_end in windows:
+    feeding_states, sucrose_states = collect_window_states(carried, window_start, window_end)
+    day = window_start.strftime("%Y-%m-%d") if pd.Timedelta(arguments.window) >= pd.Timedelta("1D") else window_start.strftime("%Y-%m-%d_%H%M")
+    write_window("Feeding", feeding_states, "Feeding_Multi_Day_CSV_Files/" + day, window_start, window_end,
+                 ["light_food", "dark_food"])
+    write_window("Sucrose", sucrose_states, "Sucrose_Multi_Day_CSV_Files/" + day, window_start, window_end,
+                 ["light_sucrose", "dark_sucrose"])
+
+
+#----------------------------------------------------------
+# Create Zip File and Remove Directory
+#----------------------------------------------------------
+with stage("zip_archives"):
+    for folder in ["Feeding_Multi_Day_CSV_Files", "Sucrose_Multi_Day_CSV_Files"]:
+        shutil.make_archive(folder, 'zip', folder)
+        shutil.rmtree(folder)
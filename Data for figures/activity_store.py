@@ -0,0 +1,204 @@
+# Embedded Activity Store for Raw Events, Bouts and Binned Activity
+# Used by Creating_Binary_CSV_Files.py to load the activity of every rat into one SQLite database for
+# Time-Restricted Feeding in the Active Phase Drives Periods of Rapid Food Consumption in Rats Fed a High-Fat, High-Sugar Diet with Liquid Sucrose
+# by Kush Attal, Julia Wickman Shihoko Kojima, Sarah N. Blythe, Natalia Toporikova
+#
+# Tables (one row per rat and ...):
+#   - events:          raw START/STOP/POINT event of the video data
+#   - bouts:           bout of a behavior (with its meal number, see bout_analytics.py)
+#   - minute_activity: minute of a behavior - seconds active (or Zoomie counts) and seconds recorded
+#   - hourly_activity: hour of a behavior - seconds active (or Zoomie counts) and seconds recorded
+# Every table has an index on (rat, behavior, time) and on (diet_group, time), so a query such as
+# "Feeding of the HFHS restriction rats from 04:00 to 07:00" is an index range scan:
+#     python activity_store.py activity.sqlite minute_activity --group "HFHS restriction" --behavior Feeding --start "1970-01-02 04:00" --end "1970-01-02 07:00"
+# Times are text ("1970-01-02 04:00:00") so that they sort and compare in time order. All tables use the clock of times():
+# the recording runs from the day start of the cohort (21:00 for 2018VT) on 1970-01-01 to the same time on 1970-01-02.
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import pandas as pd
+import numpy as np
+import argparse
+import datetime
+import sqlite3
+from bout_analytics import bout_table, assign_meals, INTER_MEAL_INTERVAL
+from cohort_config import load_cohort_config, day_start
+
+
+#----------------------------------------------------------
+# Define Table Layout
+#----------------------------------------------------------
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    rat        INTEGER NOT NULL,
+    diet_group TEXT NOT NULL,
+    behavior   TEXT NOT NULL,
+    status     TEXT NOT NULL,
+    time       TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bouts (
+    rat        INTEGER NOT NULL,
+    diet_group TEXT NOT NULL,
+    behavior   TEXT NOT NULL,
+    time       TEXT NOT NULL,
+    stop       TEXT NOT NULL,
+    duration   REAL NOT NULL,
+    interval   REAL,
+    meal       INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS minute_activity (
+    rat        INTEGER NOT NULL,
+    diet_group TEXT NOT NULL,
+    behavior   TEXT NOT NULL,
+    time       TEXT NOT NULL,
+    active_s   REAL NOT NULL,
+    recorded_s INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS hourly_activity (
+    rat        INTEGER NOT NULL,
+    diet_group TEXT NOT NULL,
+    behavior   TEXT NOT NULL,
+    time       TEXT NOT NULL,
+    active_s   REAL NOT NULL,
+    recorded_s INTEGER NOT NULL
+);
+"""
+
+# Tables of the store and their columns (the time of a bout is its START)
+TABLE_COLUMNS = {"events": ["rat", "diet_group", "behavior", "status", "time"],
+                 "bouts": ["rat", "diet_group", "behavior", "time", "stop", "duration", "interval", "meal"],
+                 "minute_activity": ["rat", "diet_group", "behavior", "time", "active_s", "recorded_s"],
+                 "hourly_activity": ["rat", "diet_group", "behavior", "time", "active_s", "recorded_s"]}
+
+# Text format of the times - raw events keep their fractions of a second
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+EVENT_TIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+#----------------------------------------------------------
+# Define Custom Methods
+#----------------------------------------------------------
+
+# Method to open (and create if needed) the activity store - set "reset" to True to drop the rows of a previous run
+def open_activity_store(path, reset = False):
+    store = sqlite3.connect(path)
+    store.executescript(SCHEMA)
+    if reset:
+        for table in TABLE_COLUMNS:
+            store.execute("DELETE FROM " + table)
+    store.commit()
+    return store
+
+# Method to create the indexes of every table - done once all rows are in, which is faster than updating the indexes row by row
+def create_indexes(store):
+    for table in TABLE_COLUMNS:
+        store.execute("CREATE INDEX IF NOT EXISTS " + table + "_by_rat ON " + table + " (rat, behavior, time)")
+        store.execute("CREATE INDEX IF NOT EXISTS " + table + "_by_group ON " + table + " (diet_group, time)")
+    store.execute("ANALYZE")
+    store.commit()
+
+# Method to append rows (a list of tuples in the column order of TABLE_COLUMNS) to one table
+def append_rows(store, table, rows):
+    columns = TABLE_COLUMNS[table]
+    store.executemany("INSERT INTO " + table + " (" + ", ".join(columns) + ") VALUES (" + ", ".join("?" * len(columns)) + ")", rows)
+    store.commit()
+    return len(rows)
+
+# Method to turn rat Names (i.e. "Rat02") into rat numbers (i.e. 2) - the index of the metafile
+def rat_numbers(names):
+    return np.array([int(str(name)[3:]) for name in names], dtype = np.int64)
+
+# Method to put raw event times on the clock of times() - times before the day start of the cohort (the 2018VT study unless
+# "cohort" is given, see cohort_config.py) move to the next day
+def clock_times(index, cohort = None):
+    if cohort is None:
+        cohort = load_cohort_config()
+    index = pd.DatetimeIndex(index)
+    return index.where(index >= day_start(cohort), index + datetime.timedelta(days = 1))
+
+# Method to store the raw events of one diet group (a dataframe from get_dataframe() or add_binary())
+# "groups" maps rat number (i.e. 2 for "Rat02") to diet group
+def store_events(store, all_data, groups, cohort = None):
+    rats = rat_numbers(all_data['Name'])
+    rows = list(zip(rats.tolist(), groups.loc[rats].astype(str).tolist(), all_data['Behavior'].astype(str).tolist(),
+                    all_data['Status'].astype(str).tolist(), clock_times(all_data.index, cohort).strftime(EVENT_TIME_FORMAT).tolist()))
+    return append_rows(store, "events", rows)
+
+# Method to store the bouts of one behavior of one diet group (a 1-second dataframe from times())
+def store_bouts(store, behavior, times, groups, inter_meal_interval = INTER_MEAL_INTERVAL):
+    bouts = assign_meals(bout_table(times), inter_meal_interval)
+    rats = rat_numbers(bouts['rat'])
+    intervals = [None if np.isnan(interval) else interval for interval in bouts['interval'].tolist()]
+    rows = list(zip(rats.tolist(), groups.loc[rats].astype(str).tolist(), [behavior] * len(bouts),
+                    pd.DatetimeIndex(bouts['start']).strftime(TIME_FORMAT).tolist(), pd.DatetimeIndex(bouts['stop']).strftime(TIME_FORMAT).tolist(),
+                    bouts['duration'].tolist(), intervals, bouts['meal'].astype(int).tolist()))
+    return append_rows(store, "bouts", rows)
+
+# Method to store the activity of one behavior of one diet group (a 1-second dataframe from times()) in bins of "frequency"
+# Bins without a single recorded second are left out
+def store_binned_activity(store, table, behavior, times, groups, frequency):
+    rats = [rat for rat in times.columns if rat != 'mean']
+    resampled = times[rats].astype(float).resample(frequency)
+    active = resampled.sum().to_numpy()
+    recorded = resampled.count()
+    bin_times = recorded.index.strftime(TIME_FORMAT).to_numpy()
+    recorded = recorded.to_numpy()
+    numbers = rat_numbers(rats)
+    diet_groups = groups.loc[numbers].astype(str).to_numpy()
+    # Rows are bins, columns are rats - keep the recorded cells only
+    bin_rows, rat_columns = np.nonzero(recorded > 0)
+    rows = list(zip(numbers[rat_columns].tolist(), diet_groups[rat_columns].tolist(), [behavior] * len(bin_rows),
+                    bin_times[bin_rows].tolist(), active[bin_rows, rat_columns].tolist(), recorded[bin_rows, rat_columns].tolist()))
+    return append_rows(store, table, rows)
+
+# Method to store the bouts and the minute and hourly activity of every behavior of one diet group
+# "frames" maps each behavior to its 1-second dataframe from times()
+def store_activity(store, frames, groups, inter_meal_interval = INTER_MEAL_INTERVAL):
+    rows = 0
+    for behavior, times in frames.items():
+        rows += store_bouts(store, behavior, times, groups, inter_meal_interval)
+        rows += store_binned_activity(store, "minute_activity", behavior, times, groups, "1T")
+        rows += store_binned_activity(store, "hourly_activity", behavior, times, groups, "1H")
+    return rows
+
+# Method to query one table - every argument is optional and the filters use the table indexes
+# "start" is inclusive and "end" exclusive, i.e. query_activity(store, "minute_activity", diet_group = "HFHS restriction",
+# behavior = "Feeding", start = "1970-01-02 04:00", end = "1970-01-02 07:00")
+def query_activity(store, table, diet_group = None, rat = None, behavior = None, start = None, end = None):
+    conditions = []
+    parameters = []
+    for column, value in [("diet_group", diet_group), ("rat", rat), ("behavior", behavior)]:
+        if value is not None:
+            conditions.append(column + " = ?")
+            parameters.append(value)
+    if start is not None:
+        conditions.append("time >= ?")
+        parameters.append(str(pd.Timestamp(start).strftime(TIME_FORMAT)))
+    if end is not None:
+        conditions.append("time < ?")
+        parameters.append(str(pd.Timestamp(end).strftime(TIME_FORMAT)))
+    sql = "SELECT " + ", ".join(TABLE_COLUMNS[table]) + " FROM " + table
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY rat, behavior, time"
+    return pd.read_sql_query(sql, store, params = parameters)
+
+
+#----------------------------------------------------------
+# Query the Store from the Command Line
+#----------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Query the activity store written by Creating_Binary_CSV_Files.py (TRF_ACTIVITY_STORE)")
+    parser.add_argument("store", help = "SQLite file of the activity store")
+    parser.add_argument("table", choices = list(TABLE_COLUMNS))
+    parser.add_argument("--group", help = "diet group, i.e. \"HFHS restriction\"")
+    parser.add_argument("--rat", type = int, help = "rat number, i.e. 2 for Rat02")
+    parser.add_argument("--behavior", help = "i.e. Feeding")
+    parser.add_argument("--start", help = "first time (inclusive), i.e. \"1970-01-02 04:00\"")
+    parser.add_argument("--end", help = "last time (exclusive), i.e. \"1970-01-02 07:00\"")
+    arguments = parser.parse_args()
+    store = sqlite3.connect(arguments.store)
+    print(query_activity(store, arguments.table, arguments.group, arguments.rat, arguments.behavior,
+                         arguments.start, arguments.end).to_csv(index = False), end = "")
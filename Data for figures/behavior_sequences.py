@@ -0,0 +1,142 @@
+# Methods for Behavior Co-occurrence and Transition Analysis
+# Used by Creating_Binary_CSV_Files.py to relate the behaviors logged in the raw video data to each other for
+# Time-Restricted Feeding in the Active Phase Drives Periods of Rapid Food Consumption in Rats Fed a High-Fat, High-Sugar Diet with Liquid Sucrose
+# by Kush Attal, Julia Wickman Shihoko Kojima, Sarah N. Blythe, Natalia Toporikova
+#
+# Co-occurrence: the 1-second activity of every behavior is packed into bitmaps (8 seconds per byte), and the number of
+# seconds two behaviors overlap is the popcount of the bitwise AND of their bitmaps.
+# Transitions: the START (and POINT) events of every rat, in time order, give the first-order transition counts
+# and probabilities from one behavior to the next.
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import pandas as pd
+import numpy as np
+
+
+#----------------------------------------------------------
+# Define Default Settings
+#----------------------------------------------------------
+# All behaviors logged in the raw video data (add_binary() creates an "_Activity" column for each of them)
+BEHAVIORS = ['Feeding', 'Sucrose', 'Water', 'Grooming', 'Rearing', 'Sleeping/Resting', 'Zoomie']
+
+# Number of 1 bits in every byte value
+POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype = np.uint8)
+
+# Number of rats whose bitmaps are compared at once (limits the memory of the bitwise AND)
+RAT_CHUNK = 8
+
+
+#----------------------------------------------------------
+# Define Custom Methods
+#----------------------------------------------------------
+
+# Method to pack the 1-second activity of one diet group into bitmaps
+# "frames" maps each behavior to its 1-second dataframe from times(); unrecorded (NaN) seconds are packed as 0
+# Returns the rat Names, the behaviors and a (rat x behavior x byte) uint8 array
+def packed_bitmaps(frames):
+    behaviors = list(frames)
+    aligned = pd.concat({behavior: times.drop(columns = 'mean') for behavior, times in frames.items()}, axis = 1).sort_index()
+    rats = sorted(set(aligned.columns.get_level_values(1)))
+    # Rats without a single event of a behavior (dropped by the pivot table in times()) get an all-zero bitmap
+    aligned = aligned.reindex(columns = pd.MultiIndex.from_product([behaviors, rats]))
+    active = aligned.to_numpy() >= 1
+    bits = np.packbits(active, axis = 0)
+    bits = np.ascontiguousarray(bits.T.reshape(len(behaviors), len(rats), -1).transpose(1, 0, 2))
+    return rats, behaviors, bits
+
+# Method to count, for every rat, the seconds each pair of behaviors occur together (rat x behavior x behavior)
+# The diagonal holds the seconds spent in each behavior
+def co_occurrence(bits, rat_chunk = RAT_CHUNK):
+    number_of_rats, number_of_behaviors, _ = bits.shape
+    counts = np.empty((number_of_rats, number_of_behaviors, number_of_behaviors), dtype = np.int64)
+    for start in range(0, number_of_rats, rat_chunk):
+        chunk = bits[start:start + rat_chunk]
+        counts[start:start + rat_chunk] = POPCOUNT[chunk[:, :, None, :] & chunk[:, None, :, :]].sum(axis = -1, dtype = np.int64)
+    return counts
+
+# Method to count the first-order transitions between behaviors of every rat from the raw event stream (rat x from x to)
+# A behavior "happens" when it STARTs (or, for Zoomie, at every POINT)
+def transition_counts(all_data, behaviors = BEHAVIORS):
+    events = all_data[all_data['Status'].isin(['START', 'POINT'])]
+    rat_names = pd.Categorical(events['Name'])
+    behavior_codes = pd.Categorical(events['Behavior'], categories = behaviors).codes.astype(np.int64)
+    seconds = events.index.to_numpy()
+    rat_codes = rat_names.codes.astype(np.int64)
+
+    order = np.lexsort((seconds, rat_codes))
+    rat_codes = rat_codes[order]
+    behavior_codes = behavior_codes[order]
+    keep = behavior_codes >= 0
+    rat_codes = rat_codes[keep]
+    behavior_codes = behavior_codes[keep]
+
+    # Consecutive events of the same rat are one transition
+    same_rat = rat_codes[1:] == rat_codes[:-1]
+    number_of_behaviors = len(behaviors)
+    flat = (rat_codes[1:][same_rat] * number_of_behaviors + behavior_codes[:-1][same_rat]) * number_of_behaviors + behavior_codes[1:][same_rat]
+    counts = np.bincount(flat, minlength = len(rat_names.categories) * number_of_behaviors ** 2)
+    return list(rat_names.categories), counts.reshape(len(rat_names.categories), number_of_behaviors, number_of_behaviors)
+
+# Method to turn a (rat x behavior x behavior) array into a long dataframe with one row per rat and pair of behaviors
+def long_table(rats, behaviors, counts, groups, names):
+    number_of_behaviors = len(behaviors)
+    rat_numbers = [int(str(rat)[3:]) for rat in rats]
+    table = pd.DataFrame({"rat": np.repeat(rat_numbers, number_of_behaviors ** 2),
+                          names[0]: np.tile(np.repeat(behaviors, number_of_behaviors), len(rats)),
+                          names[1]: np.tile(behaviors, len(rats) * number_of_behaviors),
+                          names[2]: counts.reshape(-1)})
+    table.insert(1, "group", groups.loc[table["rat"]].to_numpy())
+    return table
+
+# Method to count the co-occurrences and transitions of every rat of one diet group
+# "group_frames" is a {behavior: 1-second dataframe} dictionary and "all_data" the matching dataframe from add_binary()
+# Returns the co-occurrence and transition tables of the rats of the diet group
+def group_sequences(group_frames, all_data, groups, behaviors = BEHAVIORS):
+    rats, bitmap_behaviors, bits = packed_bitmaps({behavior: group_frames[behavior] for behavior in behaviors if behavior in group_frames})
+    co_occurrence_frame = long_table(rats, bitmap_behaviors, co_occurrence(bits), groups, ["behavior", "with_behavior", "seconds"])
+    rats, counts = transition_counts(all_data, behaviors)
+    return co_occurrence_frame, long_table(rats, behaviors, counts, groups, ["from_behavior", "to_behavior", "count"])
+
+# Method to run the co-occurrence and transition analysis for all diet groups
+# "frames" is a list (one per diet group) of {behavior: 1-second dataframe} dictionaries, "event_frames" the matching
+# dataframes from add_binary() and "groups" maps rat number (i.e. 2 for "Rat02") to diet group
+# Returns the co-occurrence and transition tables per rat and per diet group, and the sucrose/feeding summary of every HFHS rat
+def behavior_sequence_analysis(frames, event_frames, groups, behaviors = BEHAVIORS):
+    co_occurrence_frames = []
+    transition_frames = []
+    for group_frames, all_data in zip(frames, event_frames):
+        co_occurrence_frame, transition_frame = group_sequences(group_frames, all_data, groups, behaviors)
+        co_occurrence_frames.append(co_occurrence_frame)
+        transition_frames.append(transition_frame)
+    return sequence_summary(co_occurrence_frames, transition_frames, groups)
+
+# Method to combine the results of group_sequences() of several diet groups (i.e. one diet group at a time, see Creating_Binary_CSV_Files.py)
+def sequence_summary(co_occurrence_frames, transition_frames, groups):
+    co_occurrence_by_rat = pd.concat(co_occurrence_frames, ignore_index = True)
+    transitions_by_rat = pd.concat(transition_frames, ignore_index = True)
+
+    # Fraction of the seconds spent in "behavior" that overlap with "with_behavior", and probability of each transition
+    behavior_seconds = co_occurrence_by_rat[co_occurrence_by_rat["behavior"] == co_occurrence_by_rat["with_behavior"]].set_index(["rat", "behavior"])["seconds"]
+    co_occurrence_by_rat["fraction"] = co_occurrence_by_rat["seconds"] / behavior_seconds.loc[list(zip(co_occurrence_by_rat["rat"], co_occurrence_by_rat["behavior"]))].to_numpy()
+    transitions_by_rat["probability"] = transitions_by_rat["count"] / transitions_by_rat.groupby(["rat", "from_behavior"])["count"].transform("sum")
+
+    co_occurrence_by_group = co_occurrence_by_rat.groupby(["group", "behavior", "with_behavior"], sort = False)["seconds"].sum().reset_index()
+    group_seconds = co_occurrence_by_group[co_occurrence_by_group["behavior"] == co_occurrence_by_group["with_behavior"]].set_index(["group", "behavior"])["seconds"]
+    co_occurrence_by_group["fraction"] = co_occurrence_by_group["seconds"] / group_seconds.loc[list(zip(co_occurrence_by_group["group"], co_occurrence_by_group["behavior"]))].to_numpy()
+    transitions_by_group = transitions_by_rat.groupby(["group", "from_behavior", "to_behavior"], sort = False)["count"].sum().reset_index()
+    transitions_by_group["probability"] = transitions_by_group["count"] / transitions_by_group.groupby(["group", "from_behavior"])["count"].transform("sum")
+
+    # Sucrose and feeding interplay of every rat that had access to sucrose
+    seconds = co_occurrence_by_rat.set_index(["rat", "behavior", "with_behavior"])["seconds"]
+    probability = transitions_by_rat.set_index(["rat", "from_behavior", "to_behavior"])["probability"]
+    sucrose_feeding = pd.DataFrame({"sucrose_s": seconds.xs(('Sucrose', 'Sucrose'), level = [1, 2]),
+                                    "feeding_s": seconds.xs(('Feeding', 'Feeding'), level = [1, 2]),
+                                    "overlap_s": seconds.xs(('Sucrose', 'Feeding'), level = [1, 2]),
+                                    "sucrose_to_feeding": probability.xs(('Sucrose', 'Feeding'), level = [1, 2]),
+                                    "feeding_to_sucrose": probability.xs(('Feeding', 'Sucrose'), level = [1, 2])})
+    sucrose_feeding = sucrose_feeding[sucrose_feeding["sucrose_s"] > 0].astype({"sucrose_s": int, "feeding_s": int, "overlap_s": int})
+    sucrose_feeding.insert(0, "group", groups.loc[sucrose_feeding.index].to_numpy())
+    return co_occurrence_by_rat, co_occurrence_by_group, transitions_by_rat, transitions_by_group, sucrose_feeding
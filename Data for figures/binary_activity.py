@@ -0,0 +1,269 @@
+# Methods for Creating Binary Activity Data
+# Used by Creating_Binary_CSV_Files.py to turn the raw video annotations into 1-second binary activity for
+# Time-Restricted Feeding in the Active Phase Drives Periods of Rapid Food Consumption in Rats Fed a High-Fat, High-Sugar Diet with Liquid Sucrose
+# by Kush Attal, Julia Wickman Shihoko Kojima, Sarah N. Blythe, Natalia Toporikova
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import pandas as pd
+import numpy as np
+import datetime
+import zipfile
+import os
+from workbook_reader import read_events, columnar_events, EVENT_COLUMNS
+from cohort_config import load_cohort_config, cohort_group, unrecorded_gaps, day_start, restricted_hours, FOOD_ACTIVITIES
+
+
+#----------------------------------------------------------
+# Define Custom Methods
+#----------------------------------------------------------
+
+# Method to calculate time spent consuming food during (1) light and (2) dark phases
+# "light_start" is the time of light on - for multi-day recordings pass the light on time of the day being summarized
+def light_summary(df, timeseries, light_start = pd.to_datetime('1970-01-02 09:00:00')):
+    #Separate dataframes into light and dark times
+    dark = timeseries[timeseries.index<light_start]
+    light = timeseries[timeseries.index>light_start]
+    # Calculate total food consumption per rat
+    total_eating_light = light.sum(axis=0)
+    total_eating_dark  = dark.sum(axis=0)
+    # Record food comsumption into a new dataframe, using rat number as index
+    for x in total_eating_light.index[:-1]:
+        ind = int(str(x)[3:])
+        df.loc[ind]=[total_eating_light[x], total_eating_dark[x]]
+    return (df)
+
+# Method to collect all the .xlxs files into lists separated by diet and create a single dataframe
+# "columnar" (optional) is the columnar file of the video archive from columnar_archive() - the events are then read from it instead of the workbooks
+# "start" and "end" (optional) keep only the events of one window [start, end) - see window_events()
+def get_dataframe(diet_name, video_archive, columnar = None, start = None, end = None):
+    # Create a dataframe using .xlsx files from raw video data
+    list_to_fill = diet_workbooks(diet_name, video_archive)
+    if columnar is not None and all(name in columnar["positions"] for name in list_to_fill):
+        diet_dataframe = columnar_events(columnar, list_to_fill, start, end)
+    elif list_to_fill:
+        diet_dataframe = pd.concat([read_workbook(video_archive.open(i), i) for i in list_to_fill])
+        keep = np.ones(len(diet_dataframe), dtype = bool)
+        if start is not None:
+            keep &= diet_dataframe.index >= start
+        if end is not None:
+            keep &= diet_dataframe.index < end
+        diet_dataframe = diet_dataframe[keep]
+    else:
+        diet_dataframe = pd.DataFrame()
+    diet_dataframe = diet_dataframe.sort_index()
+    return diet_dataframe
+
+# Method to list the .xlsx/.xls files of one diet group in the raw video archive
+def diet_workbooks(diet_name, video_archive):
+    return [name for name in video_archive.namelist()
+            if name.endswith((diet_name + ".xlsx", diet_name + ".xls"))
+            & name.startswith(('Raw'))]
+
+# Method to read the events of one .xlsx file (a path or an open file) - the seconds, Behavior, Status and Name columns
+# .xlsx workbooks are streamed row by row (see workbook_reader.py); older .xls workbooks are read with pandas
+# The file name of the workbook ("name", by default the path or the name of the open file) is kept in "source_workbook"
+def read_workbook(file, name = None):
+    if zipfile.is_zipfile(file):
+        df = read_events(file)
+    else:
+        if hasattr(file, "seek"):
+            file.seek(0)
+        df = pd.read_excel(file, index_col = "seconds")[EVENT_COLUMNS[1:]]
+        # Keep the workbook row of every event (row 1 is the header) so that annotation problems can be traced back
+        df['source_row'] = np.arange(len(df)) + 2
+    df['source_workbook'] = os.path.basename(str(name if name is not None else getattr(file, "name", file)))
+    return df
+
+
+# Method to create diet dataframe with all of the data and add columns logging which activity was performed at each time interval
+# A '1' indicates the activity STARTed and occured over that time interval. 
+# A '0' indicates the activity STOPped and did not occur over that time interval. 
+def add_binary(all_data):
+    all_data_copy = all_data.copy()
+    behaviors = ['Water', 'Feeding', 'Grooming', 'Rearing', 'Sleeping/Resting', 'Sucrose']
+    #Add columns that log which activity was performed (except for Zoomie)
+    for i in behaviors:
+        behavior_dataframe = all_data_copy.where(all_data_copy.Behavior == i)
+        to_binary_dict = {"START":1, "STOP":0}
+        all_data_copy[i + "_" + 'Activity'] = behavior_dataframe["Status"].replace(to_binary_dict)
+    #Add column for locomotor activity (Zoomie) since it uses POINT to indicate activity rather than START or STOP
+    zoom = (all_data_copy['Status']>= 'POINT') & (all_data_copy['Behavior'] == 'Zoomie')
+    all_data_copy['Zoomie_Activity'] = zoom.astype(int)
+    
+    return all_data_copy
+
+# Method to design a 1-second bin pivot table ordered by rat Name and showing 'duration' of feeding activity indicated by '1's.
+# "diet" is the name of a diet group of the cohort configuration (the 2018VT study unless "cohort" is given, see cohort_config.py)
+# "zero_outside_window" adds the rows of 0s outside the feeding window of time-restricted groups - by default only for Feeding and Sucrose
+def times(activity_capitalized, all_data_copy, diet, counts = False, cohort = None, zero_outside_window = None):
+    if cohort is None:
+        cohort = load_cohort_config()
+    group = cohort_group(cohort, diet)
+
+    # Create a dataframe with rows as time indices and columns as rat numbers. Values will be "1" or "0".
+    times = all_data_copy.pivot_table(index = 'seconds', columns = ['Name'], values = [activity_capitalized + '_Activity'])
+    times.columns = times.columns.get_level_values(1)
+    
+    # Round up any non-zero fractions to '1' - there have been cases where 2 activities "START"ed at the exact same time so instead of a "1" for both columns, there was a "0.5" for both. Therefore, we need to round 0.5 up to 1 
+    times = np.ceil(times)
+
+    # Forward-fill the empty NaN values for each rat with the '0' or '1' that came before it - THIS WILL CALCULATE THE DURATION OF THE ACTIVITY (for counts/bouts, set the "counts" parameter to True)
+    if counts == False:
+        times = times.ffill()
+    
+    # Backward-fill remaining empty Nan values for each rat with a '0'
+    times = times.fillna(0)
+    
+    # Resample dataframe into 1-second intervals
+    if counts == False:
+        times = times.resample("1S").ffill()
+    else:
+        times = times.resample("1S").max()
+    
+    # Backward-fill remaining empty Nan values for each rat with a '0'
+    times = times.fillna(0)
+    
+    # Convert the dataframe to integers rather than floats - for faster processing
+    times = times.astype(int)
+    
+    ## Set the hours or intervals not recorded for each rat (the "unrecorded" intervals of the diet group) to NaN
+    if group is not None:
+        times = apply_gaps(times, unrecorded_gaps(group))
+        
+    # Rearrange hours so the first hour of the recording (lights off) is the first hour
+    m = times.index.get_level_values(0) >= day_start(cohort)
+    idx1 = times.index.get_level_values(0)
+    times.index = idx1.where(m, idx1 +  datetime.timedelta(days=1))
+
+    times = times.sort_index()                
+    
+    # Add a row of '0's for every hour outside the feeding window for time-restricted animals - 0's FOR FEEDING AND SUCROSE ACTIVITY FOR ANYTHING OUTSIDE THE FEEDING WINDOW
+    # The other behaviors were not restricted, so the hours outside the feeding window are left out of their tables
+    if zero_outside_window is None:
+        zero_outside_window = activity_capitalized in FOOD_ACTIVITIES
+    if group is not None and group["restricted"] and zero_outside_window:
+        # One '0' for every rat
+        new_rows = pd.DataFrame(0, columns = times.columns, index = restricted_hours(cohort))
+        times = pd.concat([times, new_rows], ignore_index=False)
+        times = times.sort_index()
+    
+    
+    # Construct normalized rat for diet group by finding the average of activity for all rats at each 1-second interval - Replace Nan values with 0 if any
+    times['mean'] = times.mean(axis=1).fillna(0)
+    
+    # Drop duplicate rows based on the time indices
+    times = times.loc[~times.index.duplicated(keep='first')]
+    
+    # Rename the Index from "Name" to ""
+    times = times.rename_axis(columns = "")
+        
+    return times
+
+
+#----------------------------------------------------------
+# Define Methods for Multi-Day Recordings
+#----------------------------------------------------------
+# times() handles one 24-hour recording that starts on 1970-01-01. The methods below handle continuous recordings of
+# any length with real dates: the events are binarized and the 1-second activity is built one window (a day by default)
+# at a time, carrying the state of every rat from one window into the next, so only one window of state changes and
+# 1-second rows is held in memory no matter how many days were recorded.
+
+# Method to list the rats with START/STOP events of one activity - the rat columns of the 1-second tables of that activity
+def activity_rats(activity_capitalized, all_data):
+    return np.sort(all_data.loc[all_data.Behavior == activity_capitalized, "Name"].dropna().unique())
+
+# Method to pick the events of one window [window_start, window_end) from the time-sorted events of get_dataframe()
+def window_events(all_data, window_start, window_end):
+    return all_data.iloc[all_data.index.searchsorted(window_start, side = "left"):all_data.index.searchsorted(window_end, side = "left")]
+
+# Method to collect the state changes of one activity for every rat within one window (the binarized events of window_events())
+# "rats" are the rat columns (see activity_rats()) and "carried" the state of every rat when the previous window ended
+# (None for the first window) - the last row of the returned states is the state to carry into the next window
+def window_states(activity_capitalized, window_data, window_start, rats, carried = None, counts = False):
+    states = window_data.pivot_table(index = 'seconds', columns = 'Name', values = activity_capitalized + '_Activity')
+    # Round "0.5" up to "1" when 2 activities STARTed at the exact same time (see times())
+    states = np.ceil(states).reindex(columns = rats)
+    # Forward-fill so every row holds the state of every rat (for counts/bouts, set the "counts" parameter to True)
+    if counts == False:
+        if carried is None:
+            carried = pd.Series(0.0, index = rats)
+        # The carried state sits just before the window start, so an event at the window start still replaces it
+        states = pd.concat([carried.to_frame(window_start - pd.Timedelta(1, unit = "ns")).T, states]).ffill()
+    return states.fillna(0).astype(float)
+
+# Method to split a recording into windows - every window starts at the "anchor" time of day (21:00 = lights off)
+# Returns a list of (window start, window end) timestamps covering the first to the last event
+def recording_windows(first_time, last_time, window = "1D", anchor = "21:00"):
+    window = pd.Timedelta(window)
+    window_start = pd.Timestamp(first_time).normalize() + pd.Timedelta(anchor + ":00")
+    # Step back to the last window start at or before the first event
+    if window_start > first_time:
+        window_start -= window * int(np.ceil((window_start - first_time) / window))
+    windows = []
+    while window_start <= last_time:
+        windows.append((window_start, window_start + window))
+        window_start += window
+    return windows
+
+# Method to set the hours or intervals not recorded for each rat to NaN
+# "gaps" is a dataframe with the columns "start", "end" and "rat" (a blank "rat" sets the interval to NaN for all rats)
+def apply_gaps(times, gaps):
+    if gaps is None:
+        return times
+    for _, gap in gaps.iterrows():
+        rats = times.columns if pd.isna(gap["rat"]) or gap["rat"] == "" else [gap["rat"]]
+        rats = [rat for rat in rats if rat in times.columns]
+        times.loc[pd.Timestamp(gap["start"]):pd.Timestamp(gap["end"]), rats] = np.nan
+    return times
+
+# Method to design the 1-second pivot table of one window - the same layout as times() (rat columns and a "mean" column)
+# Seconds outside the recording are NaN, or 0 when "zero_outside_recording" is True (time-restricted animals had no food)
+def times_window(states, window_start, window_end, recorded_from, recorded_to, counts = False,
+                 zero_outside_recording = False, gaps = None, frequency = "1S"):
+    frequency = pd.Timedelta(frequency)
+    grid = pd.date_range(window_start, window_end - frequency, freq = frequency)
+    # Only the events inside the window and the last event before it are needed
+    first = max(states.index.searchsorted(window_start, side = "right") - 1, 0)
+    last = states.index.searchsorted(window_end, side = "left")
+    window_states = states.iloc[first:last]
+    if counts == False:
+        times = window_states.reindex(grid, method = "ffill")
+    else:
+        window_states = window_states[window_states.index >= window_start]
+        times = window_states.groupby(window_states.index.floor(frequency)).max().reindex(grid)
+    times = times.fillna(0)
+    outside = (grid < recorded_from.floor(frequency)) | (grid > recorded_to)
+    times.loc[outside] = 0 if zero_outside_recording else np.nan
+    times = apply_gaps(times, gaps)
+    # Keep fully recorded rats as integers, like times()
+    times = times.apply(lambda rat: rat.astype(int) if rat.notna().all() else rat)
+
+    # Construct normalized rat for diet group by finding the average of activity for all rats at each 1-second interval
+    times['mean'] = times.mean(axis = 1).fillna(0)
+    times = times.rename_axis(columns = "")
+    return times
+
+# Method to stream the 1-second pivot tables of a multi-day recording one window at a time
+# Yields (window start, 1-second dataframe) - each dataframe has the daily layout of times()
+# "all_data" are the events of get_dataframe(); only the events of one window are binarized at a time
+def times_by_window(activity_capitalized, all_data, window = "1D", anchor = "21:00", counts = False,
+                    zero_outside_recording = False, gaps = None, frequency = "1S"):
+    rats = activity_rats(activity_capitalized, all_data)
+    recorded_from = all_data.index.min()
+    recorded_to = all_data.index.max()
+    carried = None
+    for window_start, window_end in recording_windows(recorded_from, recorded_to, window, anchor):
+        states = window_states(activity_capitalized, add_binary(window_events(all_data, window_start, window_end)), window_start,
+                               rats, carried, counts)
+        carried = states.iloc[-1] if len(states) else carried
+        yield window_start, times_window(states, window_start, window_end, recorded_from, recorded_to, counts,
+                                         zero_outside_recording, gaps, frequency)
+
+# Method to total the activity of every rat per hour of a window - rows are rats, columns are hour labels ("21:00", "22:00", ...)
+def hourly_totals(times):
+    hourly = times.iloc[:, :-1].resample("1H").agg(pd.Series.sum, skipna = False).T
+    hourly.columns = [str(hour.hour) + ":00" for hour in hourly.columns]
+    return hourly
@@ -0,0 +1,133 @@
+# Methods for Meal and Bout Microstructure Analysis
+# Used by Creating_Binary_CSV_Files.py to break the 1-second binary activity into bouts and meals for
+# Time-Restricted Feeding in the Active Phase Drives Periods of Rapid Food Consumption in Rats Fed a High-Fat, High-Sugar Diet with Liquid Sucrose
+# by Kush Attal, Julia Wickman Shihoko Kojima, Sarah N. Blythe, Natalia Toporikova
+#
+# A bout is an uninterrupted run of 1's for one rat. Bouts that are separated by less than the inter-meal interval
+# belong to the same meal. All rats of a diet group are handled at once with NumPy - there is no loop over rats or bouts.
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import pandas as pd
+import numpy as np
+
+
+#----------------------------------------------------------
+# Define Default Settings
+#----------------------------------------------------------
+# Bouts separated by less than this many seconds are part of the same meal
+INTER_MEAL_INTERVAL = 600
+
+# Edges (in sec) of the bins of the bout duration distribution
+DURATION_BINS = [0, 5, 10, 30, 60, 120, 300, 600, np.inf]
+
+
+#----------------------------------------------------------
+# Define Custom Methods
+#----------------------------------------------------------
+
+# Method to find every bout in a 1-second binary dataframe from times() (rat columns, the "mean" column is skipped)
+# Returns one row per bout with the rat, the START and STOP time, the duration and the interval since the previous bout (in sec)
+# Seconds that were not recorded (NaN) count as no activity
+def bout_table(times):
+    rats = [rat for rat in times.columns if rat != 'mean']
+    active = (times[rats].to_numpy() == 1).astype(np.int8)
+    # +1 where a bout starts and -1 one row after it stops; padding closes bouts that run to the end of the recording
+    edges = np.diff(np.pad(active, ((1, 1), (0, 0))), axis = 0)
+    # Transposing keeps the bouts ordered by rat and then by time, so the n-th START and n-th STOP belong together
+    start_rat, start_row = np.nonzero(edges.T == 1)
+    _, stop_row = np.nonzero(edges.T == -1)
+
+    # Use the time index so that rows that are not 1 second apart (i.e. the zero rows of restricted groups) are timed correctly
+    row_times = times.index.to_numpy()
+    row_times = np.append(row_times, row_times[-1] + np.timedelta64(1, 's'))
+    starts = row_times[start_row]
+    stops = row_times[stop_row]
+    durations = (stops - starts) / np.timedelta64(1, 's')
+
+    intervals = np.full(len(starts), np.nan)
+    same_rat = start_rat[1:] == start_rat[:-1]
+    intervals[1:][same_rat] = ((starts[1:] - stops[:-1]) / np.timedelta64(1, 's'))[same_rat]
+    return pd.DataFrame({"rat": np.asarray(rats)[start_rat], "start": starts, "stop": stops,
+                         "duration": durations, "interval": intervals})
+
+# Method to number the meals of every rat - a new meal starts with the first bout of a rat or after a pause of at least "inter_meal_interval" sec
+def assign_meals(bouts, inter_meal_interval = INTER_MEAL_INTERVAL):
+    bouts = bouts.copy()
+    new_meal = bouts["interval"].isna() | (bouts["interval"] >= inter_meal_interval)
+    bouts["meal"] = new_meal.groupby(bouts["rat"]).cumsum()
+    return bouts
+
+# Method to summarize the bouts and meals of every rat
+# Eating rate is expressed as the fraction of each meal spent eating (seconds active / meal length) since food intake per bout was not weighed
+def rat_summary(bouts, times):
+    rats = [rat for rat in times.columns if rat != 'mean']
+    recorded_hours = times[rats].notna().sum() / 3600
+    by_rat = bouts.groupby("rat")
+    summary = pd.DataFrame({"bouts": by_rat.size(),
+                            "active_s": by_rat["duration"].sum(),
+                            "mean_bout_s": by_rat["duration"].mean(),
+                            "median_bout_s": by_rat["duration"].median(),
+                            "p90_bout_s": by_rat["duration"].quantile(0.9),
+                            "mean_interval_s": by_rat["interval"].mean(),
+                            "median_interval_s": by_rat["interval"].median()})
+
+    meals = bouts.groupby(["rat", "meal"]).agg(first_start = ("start", "min"), last_stop = ("stop", "max"),
+                                               active_s = ("duration", "sum"), bouts = ("duration", "size"))
+    meals["meal_s"] = (meals["last_stop"] - meals["first_start"]).dt.total_seconds()
+    meals["eating_rate"] = meals["active_s"] / meals["meal_s"]
+    by_meal = meals.groupby(level = "rat")
+    summary["meals"] = by_meal.size()
+    summary["mean_meal_s"] = by_meal["meal_s"].mean()
+    summary["mean_bouts_per_meal"] = by_meal["bouts"].mean()
+    summary["mean_eating_rate"] = by_meal["eating_rate"].mean()
+
+    # Rats without a single bout get zero bouts and meals
+    summary = summary.reindex(rats)
+    summary[["bouts", "active_s", "meals"]] = summary[["bouts", "active_s", "meals"]].fillna(0)
+    summary["bouts_per_hour"] = summary["bouts"] / recorded_hours
+    summary.index.name = "rat"
+    return summary
+
+# Method to count the bouts of every rat in each duration bin (rows are rats, columns are the bins)
+def duration_distribution(bouts, bins = DURATION_BINS):
+    labels = [str(low) + "-" + str(high) + " s" if high != np.inf else ">" + str(low) + " s" for low, high in zip(bins[:-1], bins[1:])]
+    binned = pd.cut(bouts["duration"], bins, labels = labels, right = False)
+    return pd.crosstab(bouts["rat"], binned).reindex(columns = labels, fill_value = 0)
+
+# Method to find the bouts of one diet group - returns the summary of every rat and the bout duration distribution of every rat
+def group_bouts(times, inter_meal_interval = INTER_MEAL_INTERVAL, bins = DURATION_BINS):
+    bouts = assign_meals(bout_table(times), inter_meal_interval)
+    distribution = duration_distribution(bouts, bins).reindex([rat for rat in times.columns if rat != 'mean'], fill_value = 0)
+    return rat_summary(bouts, times), distribution
+
+# Method to combine the results of group_bouts() of several diet groups (i.e. one diet group at a time, see Creating_Binary_CSV_Files.py)
+def bout_summary(rat_frames, distributions, groups):
+    by_rat = pd.concat(rat_frames)
+    distribution = pd.concat(distributions)
+
+    # Set the index to rat numbers (i.e. "2" instead of "Rat02") - the same index as the metafile
+    by_rat.index = by_rat.index.map(lambda x: int(str(x)[3:]))
+    distribution.index = distribution.index.map(lambda x: int(str(x)[3:]))
+    by_rat['group'] = groups.loc[by_rat.index]
+
+    by_group = by_rat.groupby('group').agg(['mean', 'sem'])
+    by_group.columns = [column + "_" + statistic for column, statistic in by_group.columns]
+    by_group.insert(0, "rats", by_rat.groupby('group').size())
+    distribution = distribution.groupby(groups.loc[distribution.index].to_numpy()).sum()
+    distribution.index.name = 'group'
+    return by_rat, by_group, distribution
+
+# Method to analyze all diet groups of one activity
+# "frames" is a list of 1-second dataframes from times() and "groups" maps rat number (i.e. 2 for "Rat02") to diet group
+# Returns the summary of every rat, the average of every diet group and the bout duration distribution of every diet group
+def bout_analysis(frames, groups, inter_meal_interval = INTER_MEAL_INTERVAL, bins = DURATION_BINS):
+    rat_frames = []
+    distributions = []
+    for times in frames:
+        rat_frame, distribution = group_bouts(times, inter_meal_interval, bins)
+        rat_frames.append(rat_frame)
+        distributions.append(distribution)
+    return bout_summary(rat_frames, distributions, groups)
@@ -0,0 +1,159 @@
+# Methods for Circadian Rhythm Analysis
+# Used by Creating_Binary_CSV_Files.py to fit the daily rhythm of every behavior for
+# Time-Restricted Feeding in the Active Phase Drives Periods of Rapid Food Consumption in Rats Fed a High-Fat, High-Sugar Diet with Liquid Sucrose
+# by Kush Attal, Julia Wickman Shihoko Kojima, Sarah N. Blythe, Natalia Toporikova
+#
+# The 1-second activity from times() is averaged into bins (1 minute by default). Each column of the binned matrix
+# (one rat and one behavior) gets a 24-hour cosinor fit (mesor, amplitude, acrophase) and a Lomb-Scargle periodogram.
+# All columns are fitted together with matrix products, and bins that were not recorded (NaN) are left out of the fits.
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import pandas as pd
+import numpy as np
+
+
+#----------------------------------------------------------
+# Define Default Settings
+#----------------------------------------------------------
+# Length of the bins the 1-second activity is averaged into
+BIN_SIZE = "1T"
+
+# Period (in hours) of the cosinor fit
+CIRCADIAN_PERIOD = 24
+
+# Periods (in hours) of the Lomb-Scargle periodogram
+PERIODOGRAM_PERIODS = np.arange(1, 36.5, 0.5)
+
+
+#----------------------------------------------------------
+# Define Custom Methods
+#----------------------------------------------------------
+
+# Method to average the 1-second activity from times() into bins - bins without a single recorded second are NaN
+# "frames" maps each behavior to its 1-second dataframe; returns one matrix with (behavior, rat) columns
+def binned_activity(frames, bin_size = BIN_SIZE):
+    binned = []
+    for behavior, times in frames.items():
+        rats = [rat for rat in times.columns if rat != 'mean']
+        behavior_bins = times[rats].astype(float).resample(bin_size).mean()
+        behavior_bins.columns = pd.MultiIndex.from_product([[behavior], rats], names = ["behavior", "rat"])
+        binned.append(behavior_bins)
+    return pd.concat(binned, axis = 1)
+
+# Method to turn the time index into hours since midnight of the first day, so that acrophases are clock times
+def clock_hours(index):
+    return ((index - index[0].normalize()) / pd.Timedelta("1H")).to_numpy(dtype = float)
+
+# Method to fit "mesor + amplitude * cos(2 pi (t - acrophase) / period)" to every column of a (time x column) matrix at once
+# Returns the mesor, amplitude, acrophase (clock time of the peak, in hours) and fraction of variance explained (r_squared) of every column
+def cosinor(values, hours, period = CIRCADIAN_PERIOD):
+    recorded = ~np.isnan(values)
+    weights = recorded.astype(float)
+    y = np.where(recorded, values, 0)
+    omega = 2 * np.pi / period
+    basis = np.stack([np.ones_like(hours), np.cos(omega * hours), np.sin(omega * hours)], axis = 1)
+
+    # Least squares over the recorded bins of each column: solve (X'WX) b = X'Wy for all columns together
+    normal_matrix = np.einsum("tc,ti,tj->cij", weights, basis, basis)
+    right_side = np.einsum("tc,ti->ci", y, basis)
+    coefficients = np.einsum("cij,cj->ci", np.linalg.pinv(normal_matrix), right_side)
+    mesor, beta, gamma = coefficients.T
+
+    fitted = basis @ coefficients.T
+    count = weights.sum(axis = 0)
+    mean = y.sum(axis = 0) / np.where(count > 0, count, np.nan)
+    total = (weights * (y - mean) ** 2).sum(axis = 0)
+    residual = (weights * (y - fitted) ** 2).sum(axis = 0)
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        r_squared = np.where(total > 0, 1 - residual / total, np.nan)
+    return pd.DataFrame({"mesor": mesor, "amplitude": np.hypot(beta, gamma),
+                         "acrophase_h": (np.arctan2(gamma, beta) / omega) % period,
+                         "r_squared": r_squared, "recorded_bins": count.astype(int)})
+
+# Method to compute the normalized Lomb-Scargle periodogram of every column of a (time x column) matrix at once
+# Unlike an FFT, the Lomb-Scargle periodogram does not need evenly spaced samples, so unrecorded (NaN) bins are simply left out
+# Returns a (column x period) array of power normalized by the variance of each column
+def lomb_scargle(values, hours, periods = PERIODOGRAM_PERIODS):
+    recorded = ~np.isnan(values)
+    weights = recorded.astype(float)
+    count = weights.sum(axis = 0)
+    mean = np.where(recorded, values, 0).sum(axis = 0) / np.where(count > 0, count, np.nan)
+    centered = np.where(recorded, values - mean, 0)
+    variance = (centered ** 2).sum(axis = 0) / np.maximum(count - 1, 1)
+
+    phase = np.outer(hours, 2 * np.pi / np.asarray(periods, dtype = float))
+    cosine = np.cos(phase)
+    sine = np.sin(phase)
+    # Time offset tau of every column and period: tan(2 omega tau) = sum(sin(2 omega t)) / sum(cos(2 omega t))
+    omega_tau = 0.5 * np.arctan2(weights.T @ np.sin(2 * phase), weights.T @ np.cos(2 * phase))
+    cos_tau = np.cos(omega_tau)
+    sin_tau = np.sin(omega_tau)
+
+    y_cos = centered.T @ cosine
+    y_sin = centered.T @ sine
+    cos_cos = weights.T @ cosine ** 2
+    sin_sin = weights.T @ sine ** 2
+    cos_sin = weights.T @ (cosine * sine)
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        power = 0.5 * ((y_cos * cos_tau + y_sin * sin_tau) ** 2
+                       / (cos_cos * cos_tau ** 2 + 2 * cos_sin * cos_tau * sin_tau + sin_sin * sin_tau ** 2)
+                       + (y_sin * cos_tau - y_cos * sin_tau) ** 2
+                       / (sin_sin * cos_tau ** 2 - 2 * cos_sin * cos_tau * sin_tau + cos_cos * sin_tau ** 2))
+        power = power / variance[:, None]
+    return power
+
+# Method to run the cosinor fit and periodogram for every rat and every behavior, and summarize them per diet group
+# "frames" maps each behavior to a list of 1-second dataframes from times() and "groups" maps rat number (i.e. 2 for "Rat02") to diet group
+# Returns the fits of every rat, the fits of every diet group and the mean periodogram of every diet group
+def circadian_analysis(frames, groups, bin_size = BIN_SIZE, period = CIRCADIAN_PERIOD, periods = PERIODOGRAM_PERIODS):
+    behavior_frames = {behavior: pd.concat(times_list, axis = 1).drop(columns = 'mean').sort_index()
+                       for behavior, times_list in frames.items()}
+    return circadian_fit(binned_activity(behavior_frames, bin_size), groups, period, periods)
+
+# Method to combine the bins of several diet groups (binned_activity() of one diet group at a time) into the matrix of binned_activity()
+# "group_bins" is a list of binned matrices with (behavior, rat) columns and "behaviors" the order of the behaviors
+# Every behavior gets all bins from its first to its last bin, like the bins of the 1-second activity of all diet groups together
+def combine_bins(group_bins, behaviors, bin_size = BIN_SIZE):
+    binned = []
+    for behavior in behaviors:
+        behavior_bins = pd.concat([bins[[behavior]] for bins in group_bins if behavior in bins.columns.get_level_values(0)], axis = 1).sort_index()
+        binned.append(behavior_bins.reindex(pd.date_range(behavior_bins.index[0], behavior_bins.index[-1], freq = bin_size)))
+    return pd.concat(binned, axis = 1)
+
+# Method to fit the cosinor and periodogram to a binned matrix from binned_activity() or combine_bins(), and summarize them per diet group
+def circadian_fit(binned, groups, period = CIRCADIAN_PERIOD, periods = PERIODOGRAM_PERIODS):
+    hours = clock_hours(binned.index)
+    values = binned.to_numpy()
+
+    by_rat = cosinor(values, hours, period)
+    power = lomb_scargle(values, hours, periods)
+    by_rat["peak_period_h"] = np.asarray(periods)[np.nanargmax(np.where(np.isnan(power), -np.inf, power), axis = 1)]
+    by_rat["peak_power"] = np.nanmax(np.where(np.isnan(power), -np.inf, power), axis = 1)
+    by_rat.index = binned.columns
+    by_rat = by_rat.reset_index()
+    by_rat["rat"] = by_rat["rat"].map(lambda x: int(str(x)[3:]))
+    by_rat["group"] = groups.loc[by_rat["rat"]].to_numpy()
+
+    # Group summary: mean mesor and amplitude, and circular mean of the acrophases
+    angle = 2 * np.pi * by_rat["acrophase_h"] / period
+    by_rat["_cos"] = np.cos(angle)
+    by_rat["_sin"] = np.sin(angle)
+    grouped = by_rat.groupby(["behavior", "group"], sort = False)
+    by_group = grouped[["mesor", "amplitude", "r_squared", "peak_power"]].agg(['mean', 'sem'])
+    by_group.columns = [column + "_" + statistic for column, statistic in by_group.columns]
+    by_group.insert(0, "rats", grouped.size())
+    mean_cos = grouped["_cos"].mean()
+    mean_sin = grouped["_sin"].mean()
+    by_group.insert(5, "acrophase_h", (np.arctan2(mean_sin, mean_cos) * period / (2 * np.pi)) % period)
+    # Length of the mean acrophase vector: 1 when all rats peak at the same time, 0 when the peaks are spread around the clock
+    by_group.insert(6, "acrophase_coherence", np.hypot(mean_sin, mean_cos))
+    by_rat = by_rat.drop(columns = ["_cos", "_sin"]).set_index(["behavior", "rat"])
+
+    periodogram = pd.DataFrame(power, columns = [str(p) + " h" for p in periods])
+    periodogram["behavior"] = by_rat.index.get_level_values("behavior")
+    periodogram["group"] = by_rat["group"].to_numpy()
+    periodogram = periodogram.groupby(["behavior", "group"], sort = False).mean()
+    return by_rat, by_group, periodogram
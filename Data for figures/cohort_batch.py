@@ -0,0 +1,140 @@
+# Batch Runs of Creating_Binary_CSV_Files.py over Many Cohorts
+# Used to create the binary CSV files of every cohort in a manifest for
+# Time-Restricted Feeding in the Active Phase Drives Periods of Rapid Food Consumption in Rats Fed a High-Fat, High-Sugar Diet with Liquid Sucrose
+# by Kush Attal, Julia Wickman Shihoko Kojima, Sarah N. Blythe, Natalia Toporikova
+#
+# A cohort is one experiment, described by a cohort configuration (see cohort_config.py): a zip archive of raw video
+# workbooks, a daily weight log (the metafile with the Diet and Feeding of every rat) and its diet groups. A manifest lists
+# the cohorts - each one names its configuration ("config", the 2018VT study by default) and may replace its name and input files:
+#     {"cohorts": [{"name": "2018VT"},
+#                  {"name": "2019Q1", "config": "2019Q1/cohort.json"},
+#                  {"name": "2019Q2", "config": "2019Q1/cohort.json", "video_archive": "2019Q2/videos.zip", "metafile": "2019Q2/weights.csv"}]}
+# Paths are relative to the manifest.
+#
+# Every cohort runs Creating_Binary_CSV_Files.py in its own Python process, inside its own output folder
+# (<output>/<cohort name>/), so the ZIP archives, the annotation report and the log (run.log) of one cohort never mix
+# with another. Up to "processes" cohorts run at the same time. When all cohorts are done, <output>/cohort_index.csv
+# lists every output file of every cohort (and the cohorts that failed):
+#     python cohort_batch.py cohorts.json --output Cohorts --processes 4
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import pandas as pd
+import argparse
+import concurrent.futures
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+import zipfile
+from cohort_config import load_cohort_config, DEFAULT_CONFIG
+
+
+#----------------------------------------------------------
+# Define Default Settings
+#----------------------------------------------------------
+# Pipeline run for every cohort
+PIPELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Creating_Binary_CSV_Files.py")
+
+# Settings a manifest entry may have
+MANIFEST_SETTINGS = ["name", "config", "video_archive", "metafile"]
+
+# Columns of the combined index
+INDEX_COLUMNS = ["cohort", "status", "seconds", "archive", "file", "bytes", "log"]
+
+
+#----------------------------------------------------------
+# Define Custom Methods
+#----------------------------------------------------------
+
+# Method to load the configuration of one manifest entry and replace its name and input files ("folder" is the folder relative paths start from)
+def manifest_cohort(entry, folder = "."):
+    unknown = set(entry) - set(MANIFEST_SETTINGS)
+    if unknown:
+        raise Exception("Unknown cohort settings: " + ", ".join(sorted(unknown)))
+    cohort = load_cohort_config(os.path.join(folder, entry["config"]) if "config" in entry else DEFAULT_CONFIG)
+    for key in ["video_archive", "metafile"]:
+        if key in entry:
+            cohort[key] = os.path.abspath(os.path.join(folder, entry[key]))
+    cohort["name"] = entry.get("name", cohort["name"])
+    return cohort
+
+# Method to read a manifest of cohorts - cohort names must be unique and usable as folder names
+def read_manifest(path):
+    with open(path) as file:
+        manifest = json.load(file)
+    cohorts = [manifest_cohort(entry, os.path.dirname(os.path.abspath(path))) for entry in manifest["cohorts"]]
+    names = [cohort["name"] for cohort in cohorts]
+    for name in names:
+        if not re.fullmatch(r"[A-Za-z0-9_.\- ]+", str(name)) or name in (".", ".."):
+            raise Exception("Cohort name " + repr(name) + " can not be used as a folder name")
+    duplicated = sorted(set(name for name in names if names.count(name) > 1))
+    if duplicated:
+        raise Exception("Cohort names must be unique: " + ", ".join(duplicated))
+    return cohorts
+
+# Method to run the pipeline for one cohort in its own process and output folder (the resolved configuration is saved as cohort.json)
+# Returns one record with the status ("done" or "failed"), the run time in seconds and the log file of the cohort
+def run_cohort(cohort, output, pipeline = PIPELINE):
+    folder = os.path.join(output, cohort["name"])
+    os.makedirs(folder, exist_ok = True)
+    with open(os.path.join(folder, "cohort.json"), "w") as file:
+        json.dump(cohort, file, indent = 2)
+    environment = dict(os.environ, TRF_COHORT = os.path.join(os.path.abspath(folder), "cohort.json"))
+    start = time.perf_counter()
+    with open(os.path.join(folder, "run.log"), "w") as log:
+        result = subprocess.run([sys.executable, pipeline], cwd = folder, env = environment, stdout = log, stderr = subprocess.STDOUT)
+    return {"cohort": cohort["name"], "status": "done" if result.returncode == 0 else "failed",
+            "seconds": round(time.perf_counter() - start, 1), "log": os.path.join(cohort["name"], "run.log")}
+
+# Method to list the output files of one cohort - one row per file inside each ZIP archive, plus the annotation report
+def cohort_outputs(output, record):
+    folder = os.path.join(output, record["cohort"])
+    rows = []
+    if record["status"] == "done":
+        for archive in sorted(name for name in os.listdir(folder) if name.endswith(".zip")):
+            with zipfile.ZipFile(os.path.join(folder, archive)) as zipped:
+                rows += [dict(record, archive = os.path.join(record["cohort"], archive), file = member.filename, bytes = member.file_size)
+                         for member in zipped.infolist() if not member.is_dir()]
+        report = os.path.join(folder, "event_validation_report.csv")
+        if os.path.exists(report):
+            rows.append(dict(record, archive = "", file = os.path.join(record["cohort"], "event_validation_report.csv"), bytes = os.path.getsize(report)))
+    # Failed cohorts keep one row that points to their log
+    return rows or [dict(record, archive = "", file = "", bytes = 0)]
+
+# Method to run the pipeline for every cohort, "processes" cohorts at a time, and write the combined index (<output>/cohort_index.csv)
+# Every cohort is a separate Python process; the threads of the pool only start these processes and wait for them
+def run_batch(cohorts, output, processes = None, pipeline = PIPELINE):
+    os.makedirs(output, exist_ok = True)
+    processes = processes or os.cpu_count() or 1
+    with concurrent.futures.ThreadPoolExecutor(max_workers = processes) as pool:
+        futures = {pool.submit(run_cohort, cohort, output, pipeline): cohort["name"] for cohort in cohorts}
+        records = {}
+        for future in concurrent.futures.as_completed(futures):
+            record = future.result()
+            records[record["cohort"]] = record
+            print(record["cohort"] + ": " + record["status"] + " in " + str(record["seconds"]) + " s", flush = True)
+    # List the cohorts in the order of the manifest
+    index = pd.DataFrame([row for cohort in cohorts for row in cohort_outputs(output, records[cohort["name"]])], columns = INDEX_COLUMNS)
+    index.to_csv(os.path.join(output, "cohort_index.csv"), index = False)
+    return index
+
+
+#----------------------------------------------------------
+# Run a Manifest from the Command Line
+#----------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Run Creating_Binary_CSV_Files.py for every cohort of a manifest")
+    parser.add_argument("manifest", help = "JSON file that lists the cohorts")
+    parser.add_argument("--output", default = "Cohorts", help = "folder of the cohort output folders and the combined index")
+    parser.add_argument("--processes", type = int, default = None, help = "number of cohorts run at the same time (default: number of CPUs)")
+    arguments = parser.parse_args()
+    index = run_batch(read_manifest(arguments.manifest), arguments.output, arguments.processes)
+    failed = index.loc[index.status == "failed", "cohort"].unique()
+    if len(failed) > 0:
+        print("Failed cohorts (see run.log in their folders): " + ", ".join(failed))
+        sys.exit(1)
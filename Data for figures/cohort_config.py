@@ -0,0 +1,123 @@
+# Cohort Configuration
+# Used by Creating_Binary_CSV_Files.py, binary_activity.py, cohort_batch.py and figures_and_analysis.py to describe the design of an experiment for
+# Time-Restricted Feeding in the Active Phase Drives Periods of Rapid Food Consumption in Rats Fed a High-Fat, High-Sugar Diet with Liquid Sucrose
+# by Kush Attal, Julia Wickman Shihoko Kojima, Sarah N. Blythe, Natalia Toporikova
+#
+# A cohort configuration is a JSON file (2018VT_cohort.json is the design of this study):
+#   - "video_archive", "metafile":  raw video workbooks and daily weight log (paths are relative to the configuration file)
+#   - "day_start", "light_on":      lights off (the first hour of the 24-hour recording) and lights on
+#   - "feeding_window":             hours the time-restricted rats had food - every other hour gets a row of 0s of Feeding and Sucrose
+#   - "groups":                     one entry per diet group, in the order of the rows of the output files:
+#         "name"            diet group passed to times() (i.e. "HFHS Restricted")
+#         "archive_name"    end of the workbook file names (i.e. Rat20_full_day_HFHS_Restricted.xlsx)
+#         "file_name"       name in the binary CSV file names (i.e. Feeding_HFHS_Restricted_Binary.csv)
+#         "label"           column of the normalized activity files (i.e. "HFHS Restricted")
+#         "metafile_group"  Diet + ' ' + Feeding of the daily weight log (i.e. "HFHS restriction")
+#         "restricted"      time-restricted feeding (rows of 0s of Feeding and Sucrose outside the feeding window)
+#         "sucrose"         access to sucrose
+#         "unrecorded"      intervals not recorded (start, end, rat - a blank rat means all rats), on the clock of the workbooks
+#   - "analysis_windows":           named lists of hours compared in the statistics (i.e. "three_hour_period")
+# Several configurations can be loaded in one process - nothing in them is kept in global state.
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import pandas as pd
+import json
+import os
+
+
+#----------------------------------------------------------
+# Define Default Settings
+#----------------------------------------------------------
+# Configuration of the 2018VT study
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "2018VT_cohort.json")
+
+# Settings every configuration must have
+REQUIRED_SETTINGS = ["name", "video_archive", "metafile", "day_start", "light_on", "feeding_window", "groups", "analysis_windows"]
+REQUIRED_GROUP_SETTINGS = ["name", "archive_name", "file_name", "label", "metafile_group", "restricted", "sucrose", "unrecorded"]
+
+# Activities the time-restricted rats could not perform outside the feeding window (the food was taken away)
+FOOD_ACTIVITIES = ['Feeding', 'Sucrose']
+
+
+#----------------------------------------------------------
+# Define Custom Methods
+#----------------------------------------------------------
+
+# Method to check a configuration and make its paths absolute ("folder" is the folder relative paths start from)
+def resolve_config(cohort, folder = "."):
+    missing = [setting for setting in REQUIRED_SETTINGS if setting not in cohort]
+    for group in cohort.get("groups", []):
+        missing += [str(group.get("name")) + "." + setting for setting in REQUIRED_GROUP_SETTINGS if setting not in group]
+    if missing:
+        raise Exception("Cohort configuration is missing: " + ", ".join(missing))
+    names = [group["name"] for group in cohort["groups"]]
+    if len(set(names)) != len(names):
+        raise Exception("Diet group names of cohort " + str(cohort["name"]) + " must be unique")
+    cohort = dict(cohort)
+    for key in ["video_archive", "metafile"]:
+        cohort[key] = os.path.abspath(os.path.join(folder, cohort[key]))
+    return cohort
+
+# Method to load a cohort configuration file
+def load_cohort_config(path = DEFAULT_CONFIG):
+    with open(path) as file:
+        return resolve_config(json.load(file), os.path.dirname(os.path.abspath(path)))
+
+# Method to load the cohort of this run - the configuration file in the TRF_COHORT environment variable, or the 2018VT study
+def load_cohort():
+    return load_cohort_config(os.environ.get("TRF_COHORT") or DEFAULT_CONFIG)
+
+# Method to find the settings of one diet group by name - None if the cohort has no such group
+def cohort_group(cohort, name):
+    for group in cohort["groups"]:
+        if group["name"] == name:
+            return group
+    return None
+
+# Method to list the diet groups with access to sucrose
+def sucrose_groups(cohort):
+    return [group for group in cohort["groups"] if group["sucrose"]]
+
+# Method to list the diet groups in the column order of the normalized activity files (ad lib groups first)
+def normalized_groups(groups):
+    return [group for group in groups if not group["restricted"]] + [group for group in groups if group["restricted"]]
+
+# Method to find a setting (i.e. "metafile_group" or "label") of the 4 diet groups of the 2x2 design of the figures and statistics
+# Returns the settings of the control ad lib, control restricted, HFHS ad lib and HFHS restricted groups (HFHS groups had sucrose)
+def design_groups(cohort, setting):
+    settings = []
+    for sucrose, restricted in [(False, False), (False, True), (True, False), (True, True)]:
+        groups = [group for group in cohort["groups"] if group["sucrose"] == sucrose and group["restricted"] == restricted]
+        if len(groups) != 1:
+            raise Exception("Cohort " + str(cohort["name"]) + " must have one diet group with sucrose " + str(sucrose).lower()
+                            + " and restricted " + str(restricted).lower())
+        settings.append(groups[0][setting])
+    return settings
+
+# Method to turn the unrecorded intervals of one diet group into a gaps dataframe (start, end, rat) for apply_gaps()
+def unrecorded_gaps(group):
+    return pd.DataFrame(group["unrecorded"], columns = ["start", "end", "rat"])
+
+# Method to find the first second of the recording (lights off on 1970-01-01, the clock of times())
+def day_start(cohort):
+    return pd.Timestamp("1970-01-01 " + cohort["day_start"])
+
+# Method to find lights on (the first light second after day_start)
+def light_on(cohort):
+    light = pd.Timestamp("1970-01-01 " + cohort["light_on"])
+    return light if light > day_start(cohort) else light + pd.Timedelta(days = 1)
+
+# Method to list the hours that get a row of 0s of Feeding and Sucrose for time-restricted rats (every hour of the day outside the feeding window)
+def restricted_hours(cohort):
+    hours = pd.date_range(day_start(cohort), periods = 24, freq = "1H")
+    window_start = pd.Timedelta(cohort["feeding_window"]["start"] + ":00")
+    window_end = pd.Timedelta(cohort["feeding_window"]["end"] + ":00")
+    clock = hours - hours.normalize()
+    if window_start <= window_end:
+        fed = (clock >= window_start) & (clock < window_end)
+    else:
+        fed = (clock >= window_start) | (clock < window_end)
+    return hours[~fed]
@@ -0,0 +1,203 @@
+# Ethogram Rasters of the Activity of Every Rat
+# Used to draw when every rat performed every behavior, from the occupancy matrices of Creating_Binary_CSV_Files.py, for
+# Time-Restricted Feeding in the Active Phase Drives Periods of Rapid Food Consumption in Rats Fed a High-Fat, High-Sugar Diet with Liquid Sucrose
+# by Kush Attal, Julia Wickman Shihoko Kojima, Sarah N. Blythe, Natalia Toporikova
+#
+# Every diet group is drawn as one image: a row per rat and a column per bin of time (1 minute by default), colored by the
+# behavior the rat spent the most seconds of the bin on. The image is built with NumPy from the uint8 occupancy matrices
+# (see save_occupancy() in shared_activity.py) and drawn with a single imshow() per diet group, so hundreds of rats take
+# about as long to draw as a few:
+#     python ethogram.py Behavior_Sequence_CSV_Files.zip Ethogram.png
+# The archives of Creating_Multi_Day_CSV_Files.py hold the occupancy matrices of every day; their days are joined in time
+# order and can be drawn as a double-plotted actogram, where every row is one day of one rat followed by the next day:
+#     python ethogram.py Feeding_Multi_Day_CSV_Files.zip Actogram.png --double-plot
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import pandas as pd
+import numpy as np
+import matplotlib.pyplot as plt
+import matplotlib.patches as mpatches
+from matplotlib.colors import to_rgb
+import argparse
+import io
+import zipfile
+from shared_activity import load_occupancy, UNRECORDED
+
+
+#----------------------------------------------------------
+# Define Default Settings
+#----------------------------------------------------------
+# Color of every behavior - behaviors are listed in this order, and the first one wins when a rat spent as many seconds of a bin on two behaviors
+BEHAVIOR_COLORS = {"Feeding": "#d62728", "Sucrose": "#ff7f0e", "Water": "#1f77b4", "Grooming": "#9467bd",
+                   "Rearing": "#2ca02c", "Sleeping/Resting": "#393b79", "Zoomie": "#e377c2"}
+# Colors of bins without any behavior, bins that were not recorded and behaviors without a color above
+INACTIVE_COLOR = "white"
+UNRECORDED_COLOR = "0.8"
+OTHER_COLORS = ["#8c564b", "#bcbd22", "#17becf", "#7f7f7f"]
+
+# Width of a column of the image in seconds
+BIN_SECONDS = 60
+
+
+#----------------------------------------------------------
+# Define Custom Methods
+#----------------------------------------------------------
+
+# Method to turn the occupancy matrices of several behaviors (rows are seconds, columns are rats) into an image of behavior codes
+# (rows are rats, columns are bins of "bin_seconds"): 0 where no behavior was active, i + 1 where the i-th behavior was active for the
+# most seconds of the bin (the first one wins ties) and len(occupancies) + 1 where not a single second of the bin was recorded
+def ethogram_codes(occupancies, bin_seconds = BIN_SECONDS):
+    seconds, rats = occupancies[0].shape
+    bins = -(-seconds // bin_seconds)
+    active = np.zeros((len(occupancies), bins, rats), dtype = np.int32)
+    recorded = np.zeros((bins, rats), dtype = np.int32)
+    for position, occupancy in enumerate(occupancies):
+        # Seconds after the end of the recording fill the last bin as unrecorded
+        padded = np.asarray(occupancy)
+        if seconds % bin_seconds != 0:
+            padded = np.full((bins * bin_seconds, rats), UNRECORDED, dtype = np.uint8)
+            padded[:seconds] = occupancy
+        padded = padded.reshape(bins, bin_seconds, rats)
+        # Active seconds are 1 to UNRECORDED - 1 (subtracting 1 turns 0 into 255 and UNRECORDED into 254)
+        active[position] = ((padded - np.uint8(1)) < UNRECORDED - 1).sum(axis = 1, dtype = np.int32)
+        recorded = np.maximum(recorded, (padded != UNRECORDED).sum(axis = 1, dtype = np.int32))
+    codes = np.where(active.max(axis = 0) > 0, active.argmax(axis = 0) + 1, 0)
+    codes = np.where(recorded == 0, len(occupancies) + 1, codes)
+    return codes.T.astype(np.uint8)
+
+# Method to double-plot an image of behavior codes (rows are rats, columns are bins over several days) as an actogram
+# Every rat gets one row per day, holding that day followed by the next one (the last day is followed by "fill"), so rows are two days wide
+def double_plot(codes, bins_per_day, fill):
+    rats, bins = codes.shape
+    days = max(-(-bins // bins_per_day), 1)
+    padded = np.full((rats, (days + 1) * bins_per_day), fill, dtype = codes.dtype)
+    padded[:, :bins] = codes
+    padded = padded.reshape(rats, days + 1, bins_per_day)
+    return np.concatenate([padded[:, :-1], padded[:, 1:]], axis = 2).reshape(rats * days, 2 * bins_per_day)
+
+# Method to merge the columns of an image of behavior codes down to at most "columns" columns, with the rule of ethogram_codes():
+# every merged column holds the behavior of the most columns (the first behavior on a tie), 0 when no column has a behavior and
+# "unrecorded" when no column was recorded
+def downsample_codes(codes, columns, unrecorded):
+    rats, bins = codes.shape
+    factor = -(-bins // max(int(columns), 1))
+    if factor <= 1:
+        return codes
+    padded = np.full((rats, -(-bins // factor) * factor), unrecorded, dtype = codes.dtype)
+    padded[:, :bins] = codes
+    blocks = padded.reshape(rats, -1, factor)
+    # A row of zeros keeps the stack valid without behaviors - it never wins, because a merged column without a behavior is 0
+    counts = np.stack([(blocks == code).sum(axis = 2, dtype = np.int32) for code in range(1, unrecorded)] + [np.zeros(blocks.shape[:2], dtype = np.int32)])
+    merged = np.where(counts.max(axis = 0) > 0, counts.argmax(axis = 0) + 1, 0)
+    merged = np.where((blocks != unrecorded).any(axis = 2), merged, unrecorded)
+    return merged.astype(codes.dtype)
+
+# Method to join the occupancy matrices of one diet group on one 1-second time index and one list of rats
+# "parts" is a list of (rat Names, time index, {behavior: occupancy matrix}) - i.e. one per behavior, or one per behavior and day of a
+# multi-day recording; seconds and rats missing from every part of a behavior are unrecorded for that behavior
+def join_occupancy(parts):
+    rats = list(dict.fromkeys(rat for part_rats, _, _ in parts for rat in part_rats))
+    behaviors = list(dict.fromkeys(behavior for _, _, part_behaviors in parts for behavior in part_behaviors))
+    start = min(part_index[0] for _, part_index, _ in parts)
+    end = max(part_index[-1] for _, part_index, _ in parts)
+    index = np.arange(start, end + np.timedelta64(1, "s"), np.timedelta64(1, "s"))
+    occupancy = {behavior: np.full((len(index), len(rats)), UNRECORDED, dtype = np.uint8) for behavior in behaviors}
+    for part_rats, part_index, part_behaviors in parts:
+        rows = ((part_index - start) // np.timedelta64(1, "s")).astype(np.int64)
+        columns = [rats.index(rat) for rat in part_rats]
+        for behavior, matrix in part_behaviors.items():
+            occupancy[behavior][rows[:, None], columns] = matrix
+    return rats, index, occupancy
+
+# Method to read the occupancy matrices of every diet group from an archive of Creating_Binary_CSV_Files.py or Creating_Multi_Day_CSV_Files.py
+# Returns {diet group: (rat Names, time index, {behavior: occupancy matrix})}; the files of the day folders of a diet group are joined in time order
+def load_archive(path):
+    parts = {}
+    with zipfile.ZipFile(path) as archive:
+        for name in sorted(archive.namelist()):
+            if name.endswith("_Occupancy.npz"):
+                group, behaviors = load_occupancy(io.BytesIO(archive.read(name)))
+                parts.setdefault(group, []).extend((rats, index, {behavior: matrix}) for behavior, (rats, index, matrix) in behaviors.items())
+    if not parts:
+        raise ValueError(path + " holds no occupancy matrices (*_Occupancy.npz)")
+    return {group: join_occupancy(group_parts) for group, group_parts in parts.items()}
+
+# Method to list the behaviors of all diet groups in the order of BEHAVIOR_COLORS (other behaviors last) with their colors
+def behavior_colors(groups):
+    behaviors = list(dict.fromkeys(behavior for _, _, occupancy in groups.values() for behavior in occupancy))
+    behaviors.sort(key = lambda behavior: list(BEHAVIOR_COLORS).index(behavior) if behavior in BEHAVIOR_COLORS else len(BEHAVIOR_COLORS))
+    others = iter(OTHER_COLORS * len(behaviors))
+    return {behavior: BEHAVIOR_COLORS[behavior] if behavior in BEHAVIOR_COLORS else next(others) for behavior in behaviors}
+
+# Method to draw the ethogram of every diet group into one figure - one image per diet group, with a row per rat
+# (a row per rat and day, two days wide, when "double" is True) and a column per bin of "bin_seconds"
+def ethogram_figure(groups, path, bin_seconds = BIN_SECONDS, double = False, dpi = 300):
+    colors = behavior_colors(groups)
+    behaviors = list(colors)
+    # RGB color of every code, so that the image is drawn as colors rather than codes
+    palette = (np.array([to_rgb(color) for color in [INACTIVE_COLOR] + list(colors.values()) + [UNRECORDED_COLOR]]) * 255).astype(np.uint8)
+    bins_per_day = 86400 // bin_seconds
+    images = {}
+    for group, (rats, index, occupancy) in groups.items():
+        # Codes of the behaviors of this diet group, turned into the codes of all behaviors of the figure
+        group_behaviors = [behavior for behavior in behaviors if behavior in occupancy]
+        codes = ethogram_codes([occupancy[behavior] for behavior in group_behaviors], bin_seconds)
+        codes = np.array([0] + [behaviors.index(behavior) + 1 for behavior in group_behaviors] + [len(behaviors) + 1], dtype = np.uint8)[codes]
+        if double:
+            codes = double_plot(codes, bins_per_day, len(behaviors) + 1)
+        images[group] = (rats, index, codes)
+
+    rows = [codes.shape[0] for _, _, codes in images.values()]
+    f, axes = plt.subplots(len(images), 1, figsize = (7.48, min(max(sum(rows) * 0.12 + len(images) * 0.6, 3), 9.34)),
+                           gridspec_kw = {"height_ratios": [max(count, 2) for count in rows]}, squeeze = False)
+    for ax, (group, (rats, index, codes)) in zip(axes[:, 0], images.items()):
+        hours = codes.shape[1] * bin_seconds / 3600
+        # Bins are merged (by the behavior of most bins) down to the pixels of the panel, and every code is drawn as a block of one
+        # color - smoothing the image as it is scaled down would blend the colors of neighboring bins and the rows of the double plot
+        width = ax.get_window_extent().width * dpi / f.dpi
+        image = palette[downsample_codes(codes, width, len(behaviors) + 1)]
+        ax.imshow(image, aspect = "auto", interpolation = "nearest", extent = (0, hours, image.shape[0], 0))
+        # Clock time of the ticks, from the first second of the recording
+        start = pd.Timestamp(index[0])
+        step = 6 if hours > 24 else 3
+        ticks = np.arange(0, hours + 0.001, step)
+        ax.set_xticks(ticks)
+        ax.set_xticklabels([(start + pd.Timedelta(hours = tick)).strftime("%H:%M") for tick in ticks], fontsize = 6)
+        # Name every rat when there are few enough rows to read them
+        days = image.shape[0] // len(rats)
+        if image.shape[0] <= 40:
+            ax.set_yticks(np.arange(len(rats)) * days + 0.5)
+            ax.set_yticklabels(rats, fontsize = 6)
+        else:
+            ax.set_yticks([])
+            ax.set_ylabel(str(len(rats)) + " rats", fontsize = 8)
+        if double and days > 1:
+            ax.hlines(np.arange(1, len(rats)) * days, 0, hours, color = "black", lw = 0.5)
+        ax.set_title(group, fontsize = 8, fontweight = "bold", loc = "left")
+    axes[-1, 0].set_xlabel("Time of day" + (" (two days per row)" if double else ""), fontsize = 8, fontweight = "bold")
+    handles = [mpatches.Patch(color = color, label = behavior) for behavior, color in colors.items()]
+    handles.append(mpatches.Patch(color = UNRECORDED_COLOR, label = "Not recorded"))
+    f.legend(handles = handles, loc = "lower center", ncol = len(handles), fontsize = 6, frameon = False)
+    f.tight_layout(rect = (0, 0.04, 1, 1))
+    f.savefig(path, dpi = dpi)
+    plt.close(f)
+
+
+#----------------------------------------------------------
+# Draw an Ethogram from the Command Line
+#----------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Draw the activity of every rat as one raster image per diet group")
+    parser.add_argument("archive", help = "archive with occupancy matrices (i.e. Behavior_Sequence_CSV_Files.zip or Feeding_Multi_Day_CSV_Files.zip)")
+    parser.add_argument("output", help = "image file of the figure (i.e. Ethogram.png)")
+    parser.add_argument("--bin", default = "1min", help = "width of a column of the image (i.e. 30s or 5min, must divide a day)")
+    parser.add_argument("--double-plot", action = "store_true", help = "draw a double-plotted actogram (two days per row) for multi-day recordings")
+    parser.add_argument("--dpi", type = int, default = 300, help = "resolution of the image file")
+    arguments = parser.parse_args()
+    bin_seconds = int(pd.Timedelta(arguments.bin).total_seconds())
+    if bin_seconds < 1 or 86400 % bin_seconds != 0:
+        raise SystemExit("--bin must be a whole number of seconds that divides a day, not " + arguments.bin)
+    ethogram_figure(load_archive(arguments.archive), arguments.output, bin_seconds, arguments.double_plot, arguments.dpi)
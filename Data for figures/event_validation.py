@@ -0,0 +1,135 @@
+# Methods for Validating Raw Video Annotations
+# Used by Creating_Binary_CSV_Files.py to check the event stream of every rat before it is turned into binary activity for
+# Time-Restricted Feeding in the Active Phase Drives Periods of Rapid Food Consumption in Rats Fed a High-Fat, High-Sugar Diet with Liquid Sucrose
+# by Kush Attal, Julia Wickman Shihoko Kojima, Sarah N. Blythe, Natalia Toporikova
+#
+# add_binary() and times() assume well-formed annotations: an unmatched START or a STOP without a START silently becomes
+# a forward-filled artifact. validate_events() checks every rat's events at once with NumPy (no loop over rats or events)
+# and returns one report row per problem, with the rat, behavior, status, time, workbook and workbook row of the event.
+# The report does not change the binary activity - it only shows where the annotations need a second look.
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import pandas as pd
+import numpy as np
+from behavior_sequences import BEHAVIORS
+
+
+#----------------------------------------------------------
+# Define Default Settings
+#----------------------------------------------------------
+# Status values of the annotations
+STATUSES = ['START', 'STOP', 'POINT']
+
+# Behaviors logged as POINT events (all other behaviors are logged as START/STOP pairs)
+POINT_BEHAVIORS = ['Zoomie']
+
+# Behaviors that cannot happen at the same time as each other - a rat does not eat or drink while sleeping or resting
+EXCLUSIVE_BEHAVIORS = {'Sleeping/Resting': ['Feeding', 'Sucrose', 'Water']}
+
+# Checks of the report and what each of them means
+CHECKS = {"unknown_behavior": "behavior is blank or not one of the logged behaviors",
+          "unknown_status": "status is not START, STOP or POINT",
+          "point_status": "POINT is only used for Zoomie, and Zoomie only uses POINT",
+          "seconds_not_monotonic": "seconds go back in time compared to the previous row of the workbook",
+          "stop_without_start": "STOP without an open START of the same behavior",
+          "start_without_stop": "START followed by another START of the same behavior before any STOP",
+          "start_never_stopped": "START that is still open at the end of the recording",
+          "overlapping_behaviors": "START while a behavior that cannot happen at the same time (i.e. Sleeping/Resting and Feeding) is still open"}
+
+# Columns of the report
+REPORT_COLUMNS = ["check", "rat", "behavior", "status", "seconds", "workbook", "row", "problem"]
+
+
+#----------------------------------------------------------
+# Define Custom Methods
+#----------------------------------------------------------
+
+# Method to find the STARTs of one behavior ("started") while another behavior ("opened") of the same rat is open
+# All arguments are arrays of integer codes (see validate_events()); returns the positions of the STARTs
+def starts_while_open(rat_codes, behavior_codes, status_codes, seconds, rows, opened, started):
+    start = STATUSES.index('START')
+    opening = np.nonzero((behavior_codes == opened) & np.isin(status_codes, [start, STATUSES.index('STOP')]))[0]
+    starting = np.nonzero((behavior_codes == started) & (status_codes == start))[0]
+    events = np.concatenate([opening, starting])
+    is_opening = np.r_[np.ones(len(opening), dtype = bool), np.zeros(len(starting), dtype = bool)]
+    # Order by rat and time - at the same second the events of the open behavior go first, so a START right at its STOP is fine
+    order = np.lexsort((rows[events], ~is_opening, seconds[events], rat_codes[events]))
+    events = events[order]
+    is_opening = is_opening[order]
+    # Last START or STOP of the open behavior up to every event - flag the STARTs that follow a START of the same rat
+    last_opening = np.maximum.accumulate(np.where(is_opening, np.arange(len(events)), -1)) if len(events) else np.empty(0, dtype = np.int64)
+    previous = events[np.maximum(last_opening, 0)]
+    flagged = (~is_opening & (last_opening >= 0) & (rat_codes[previous] == rat_codes[events]) & (status_codes[previous] == start))
+    return events[flagged]
+
+# Method to check the raw events of one diet group (a dataframe from get_dataframe()) - returns one report row per problem
+# The "workbook" and "row" of the report are the workbook and workbook row of the event ("source_workbook" and "source_row" from
+# get_dataframe(); otherwise blank and the position in "all_data")
+def validate_events(all_data, behaviors = BEHAVIORS, point_behaviors = POINT_BEHAVIORS, exclusive_behaviors = EXCLUSIVE_BEHAVIORS):
+    # Compare integer codes instead of strings - unknown (or blank) behaviors and statuses get the code -1
+    rat_names = pd.Categorical(all_data['Name'].astype(str))
+    rat_codes = rat_names.codes.astype(np.int64)
+    behavior_codes = pd.Categorical(all_data['Behavior'], categories = behaviors).codes.astype(np.int64)
+    status_codes = pd.Categorical(all_data['Status'], categories = STATUSES).codes
+    seconds = all_data.index.to_numpy()
+    if 'source_row' in all_data.columns:
+        rows = all_data['source_row'].to_numpy(dtype = np.int64)
+    else:
+        rows = np.arange(len(all_data), dtype = np.int64)
+    if 'source_workbook' in all_data.columns:
+        workbooks = all_data['source_workbook'].to_numpy(dtype = object)
+    else:
+        workbooks = np.full(len(all_data), "", dtype = object)
+    flagged = []
+
+    # Unknown behaviors and statuses, and POINT events of START/STOP behaviors (or the other way around)
+    known_behavior = behavior_codes >= 0
+    known_status = status_codes >= 0
+    point_behavior = np.isin(behavior_codes, [behaviors.index(behavior) for behavior in point_behaviors])
+    point = status_codes == STATUSES.index('POINT')
+    flagged.append(("unknown_behavior", np.nonzero(~known_behavior)[0]))
+    flagged.append(("unknown_status", np.nonzero(~known_status)[0]))
+    flagged.append(("point_status", np.nonzero(known_behavior & known_status & (point_behavior != point))[0]))
+
+    # Seconds of every rat must not go back in time in the order of the workbook
+    order = np.lexsort((rows, rat_codes))
+    same_rat = rat_codes[order][1:] == rat_codes[order][:-1]
+    flagged.append(("seconds_not_monotonic", order[1:][same_rat & (seconds[order][1:] < seconds[order][:-1])]))
+
+    # START and STOP of every rat and behavior (one stream of events) must alternate, beginning with a START and ending with a STOP
+    paired = np.nonzero(known_behavior & ~point_behavior & known_status & ~point)[0]
+    stream = rat_codes[paired] * len(behaviors) + behavior_codes[paired]
+    order = np.lexsort((rows[paired], seconds[paired], stream))
+    stream = stream[order]
+    order = paired[order]
+    start = status_codes[order] == STATUSES.index('START')
+    new_stream = np.r_[True, stream[1:] != stream[:-1]]
+    last_of_stream = np.r_[stream[1:] != stream[:-1], True]
+    after_start = np.r_[False, start[:-1]] & ~new_stream
+    flagged.append(("stop_without_start", order[~start & ~after_start]))
+    # A START followed by another START: the first one was never stopped
+    flagged.append(("start_without_stop", order[np.nonzero(start & after_start)[0] - 1]))
+    flagged.append(("start_never_stopped", order[start & last_of_stream]))
+
+    # A START of a behavior while an exclusive behavior of the same rat is open (i.e. Feeding while Sleeping/Resting, or the other way around)
+    for behavior, others in exclusive_behaviors.items():
+        for other in others:
+            for opened, started in [(behavior, other), (other, behavior)]:
+                flagged.append(("overlapping_behaviors", starts_while_open(rat_codes, behavior_codes, status_codes, seconds, rows,
+                                                                           behaviors.index(opened), behaviors.index(started))))
+
+    # Build the report from the flagged rows only
+    checks = np.concatenate([np.full(len(positions), check, dtype = object) for check, positions in flagged])
+    positions = np.concatenate([positions for _, positions in flagged])
+    report = pd.DataFrame({"check": checks, "rat": np.asarray(rat_names.categories, dtype = object)[rat_codes[positions]],
+                           "behavior": all_data['Behavior'].to_numpy()[positions], "status": all_data['Status'].to_numpy()[positions],
+                           "seconds": seconds[positions], "workbook": workbooks[positions], "row": rows[positions]})
+    report["problem"] = report["check"].map(CHECKS)
+    return report.sort_values(["rat", "workbook", "row", "check"], kind = "stable", ignore_index = True)[REPORT_COLUMNS]
+
+# Method to count the problems of a report by check (every check is listed, also the ones without problems)
+def report_summary(report):
+    return report.groupby("check").size().reindex(list(CHECKS), fill_value = 0)
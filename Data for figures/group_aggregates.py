@@ -0,0 +1,92 @@
+# Mergeable Sum and Count Aggregates of Normalized Group Activity
+# Used by Creating_Binary_CSV_Files.py to store the normalized activity of every diet group in a form that can be merged for
+# Time-Restricted Feeding in the Active Phase Drives Periods of Rapid Food Consumption in Rats Fed a High-Fat, High-Sugar Diet with Liquid Sucrose
+# by Kush Attal, Julia Wickman Shihoko Kojima, Sarah N. Blythe, Natalia Toporikova
+#
+# The "normalized rat" of a diet group (the "mean" column of times()) is, for every second, the number of active rats
+# divided by the number of rats recorded in that second. Storing these two integers (sum and count) instead of only
+# their ratio makes cohorts, days or lab sites mergeable: add the sums and counts of two cohorts and divide again to get
+# the normalized activity of both together, without reading any per-rat data.
+#
+# Merge the counts of several cohorts and write their normalized activity:
+#     python group_aggregates.py merged.npz cohort1/Feeding_Activity_Counts.npz cohort2/Feeding_Activity_Counts.npz --normalized merged.csv
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import pandas as pd
+import numpy as np
+import argparse
+from table_schema import smallest_integer
+
+
+#----------------------------------------------------------
+# Define Custom Methods
+#----------------------------------------------------------
+
+# Method to count, for every second, the active rats (sum) and the recorded rats (count) of one diet group (a 1-second dataframe from times())
+def activity_counts(times):
+    rats = [rat for rat in times.columns if rat != 'mean']
+    values = times[rats].to_numpy(dtype = float)
+    recorded = ~np.isnan(values)
+    return pd.DataFrame({"sum": np.where(recorded, values, 0).sum(axis = 1).astype(np.int64),
+                         "count": recorded.sum(axis = 1).astype(np.int64)}, index = times.index)
+
+# Method to collect the sums and counts of several diet groups on one time index (seconds a group has no row for get 0 and 0)
+# "frames" maps the diet group (i.e. "HFHS Restricted") to its 1-second dataframe from times()
+# Returns a dataframe with (group, "sum"/"count") columns
+def group_counts(frames):
+    return combine_counts({group: activity_counts(times) for group, times in frames.items()})
+
+# Method to collect the sums and counts from activity_counts() of several diet groups on one time index, like group_counts()
+def combine_counts(counts):
+    counts = pd.concat(counts, axis = 1).sort_index()
+    return counts.fillna(0).astype(np.int64)
+
+# Method to add the sums and counts of several cohorts (or days, or lab sites) - groups and seconds missing from a cohort count as 0
+def merge_counts(*counts):
+    merged = counts[0]
+    for other in counts[1:]:
+        merged = merged.add(other, fill_value = 0)
+    return merged.sort_index().fillna(0).astype(np.int64)
+
+# Method to compute the normalized activity (the fraction of recorded rats that were active) of every group from the sums and counts
+# Seconds without a single recorded rat are 0, like the "mean" column of times()
+def normalized_activity(counts):
+    groups = list(dict.fromkeys(counts.columns.get_level_values(0)))
+    sums = counts.xs("sum", axis = 1, level = 1)[groups].to_numpy(dtype = float)
+    recorded = counts.xs("count", axis = 1, level = 1)[groups].to_numpy()
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        normalized = np.where(recorded > 0, sums / recorded, 0)
+    return pd.DataFrame(normalized, index = counts.index, columns = groups)
+
+# Method to save the sums and counts as compact integer arrays (the smallest integer type that fits) in a compressed .npz file
+def save_counts(path, counts):
+    arrays = {"time": counts.index.to_numpy(dtype = "datetime64[ns]").view(np.int64)}
+    for group, kind in counts.columns:
+        values = counts[(group, kind)].to_numpy()
+        arrays[group + "/" + kind] = values.astype(smallest_integer(values))
+    np.savez_compressed(path, **arrays)
+
+# Method to load the sums and counts saved by save_counts()
+def load_counts(path):
+    with np.load(path) as arrays:
+        index = pd.DatetimeIndex(arrays["time"].view("datetime64[ns]"))
+        columns = [tuple(name.rsplit("/", 1)) for name in arrays.files if name != "time"]
+        return pd.DataFrame({column: arrays["/".join(column)].astype(np.int64) for column in columns}, index = index)
+
+
+#----------------------------------------------------------
+# Merge Cohorts from the Command Line
+#----------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Merge the activity counts of several cohorts (i.e. Feeding_Activity_Counts.npz)")
+    parser.add_argument("output", help = ".npz file of the merged counts")
+    parser.add_argument("counts", nargs = "+", help = ".npz files to merge")
+    parser.add_argument("--normalized", help = "also write the normalized activity of the merged cohorts to this CSV file")
+    arguments = parser.parse_args()
+    merged = merge_counts(*[load_counts(path) for path in arguments.counts])
+    save_counts(arguments.output, merged)
+    if arguments.normalized:
+        normalized_activity(merged).to_csv(arguments.normalized, index_label = "Date_Time", date_format = '%Y-%m-%d %H:%M:%S')
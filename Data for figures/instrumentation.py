@@ -0,0 +1,186 @@
+# Per-Stage Timing and Memory Instrumentation
+# Used by Creating_Binary_CSV_Files.py and figures_and_analysis.py to record where the time and memory of a run go
+#
+# Instrumentation is off unless the TRF_PROFILE environment variable is set to an output prefix, i.e.
+#     TRF_PROFILE=profile python Creating_Binary_CSV_Files.py
+# writes "profile.json" (one record per stage with wall time, CPU time, peak RSS and rows processed) and
+# "profile.trace.json" (Chrome trace format - open in chrome://tracing or https://ui.perfetto.dev) when the run ends.
+# Stages may run in several threads (see stage_graph.py); the trace shows each thread on its own row.
+# When TRF_PROFILE is not set, stage() hands back one shared do-nothing object, so the wrapped code runs as before.
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+
+
+#----------------------------------------------------------
+# Define Stage Recorders
+#----------------------------------------------------------
+# Completed stages of this run - None while instrumentation is disabled
+recorded_stages = None
+
+# Stages that are currently open in each thread (to record the nesting depth of each stage)
+thread_stages = threading.local()
+
+# Number of stages open in any thread - the peak resident memory is process-wide, so it is only reset when no other stage is open
+open_stage_count = 0
+open_stage_lock = threading.Lock()
+
+# Output prefix of the JSON report and the Chrome trace
+report_prefix = None
+
+# Stage recorder used while instrumentation is disabled - a single shared object that does nothing
+class DisabledStage:
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+DISABLED_STAGE = DisabledStage()
+
+# Stage recorder used while instrumentation is enabled
+# Set "rows" inside the with-block to record how many rows the stage processed
+# A stage opened while no other stage is open resets the peak resident memory and reports its own peak ("peak_rss_mb");
+# nested stages, stages that overlap a stage of another thread and stages on systems without a peak reset report the peak of the
+# process since the last reset ("process_peak_rss_mb")
+class Stage:
+    def __init__(self, name, details):
+        self.name = name
+        self.details = details
+        self.rows = None
+
+    def __enter__(self):
+        global open_stage_count
+        with open_stage_lock:
+            self.own_peak = open_stage_count == 0 and reset_peak_rss()
+            open_stage_count += 1
+        self.depth = len(current_stages())
+        current_stages().append(self)
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global open_stage_count
+        wall_end = time.perf_counter()
+        cpu_end = time.process_time()
+        current_stages().remove(self)
+        peak = peak_rss_mb()
+        with open_stage_lock:
+            open_stage_count -= 1
+        record = {"stage": self.name,
+                  "start_s": round(self.wall_start - run_start, 6),
+                  "wall_s": round(wall_end - self.wall_start, 6),
+                  "cpu_s": round(cpu_end - self.cpu_start, 6),
+                  "peak_rss_mb" if self.own_peak else "process_peak_rss_mb": peak,
+                  "rows": self.rows,
+                  "depth": self.depth,
+                  "thread": threading.get_ident(),
+                  "status": "ok" if exc_type is None else "failed"}
+        record.update(self.details)
+        recorded_stages.append(record)
+        return False
+
+
+#----------------------------------------------------------
+# Define Custom Methods
+#----------------------------------------------------------
+
+# Method to list the stages that are currently open in this thread
+def current_stages():
+    if not hasattr(thread_stages, "stack"):
+        thread_stages.stack = []
+    return thread_stages.stack
+
+# Method to wrap a pipeline stage: "with stage('times', group = diet) as timing: ..."
+def stage(name, **details):
+    if recorded_stages is None:
+        return DISABLED_STAGE
+    return Stage(name, details)
+
+# Method to run a single function call as a stage: "binary = timed('binarization', add_binary, compiled, group = diet)"
+# The number of rows of the returned dataframe is recorded as the rows processed
+def timed(name, function, *arguments, **details):
+    if recorded_stages is None:
+        return function(*arguments)
+    with Stage(name, details) as timing:
+        result = function(*arguments)
+        timing.rows = len(result) if hasattr(result, "__len__") else None
+    return result
+
+# Method to reset the peak resident memory of this process so that every stage reports its own peak (Linux only)
+# On other systems the reported peak is the peak of the whole run up to the end of the stage
+# Returns True if the peak was reset
+def reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+# Method to reset the peak resident memory from outside a stage (i.e. for the memory budget) without cutting short the peak of
+# a stage that is open in any thread - returns True if the peak was reset, False if the system cannot reset it and None if a
+# stage is open (the peak is then left alone)
+def reset_peak_outside_stages():
+    with open_stage_lock:
+        if open_stage_count > 0:
+            return None
+        return reset_peak_rss()
+
+# Method to read the peak resident memory of this process (in MB)
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 2)
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 2)
+
+# Method to turn instrumentation on for the rest of the run; the reports are written when the run ends
+def enable_instrumentation(prefix):
+    global recorded_stages, report_prefix, run_start
+    if recorded_stages is None:
+        recorded_stages = []
+        run_start = time.perf_counter()
+        atexit.register(write_reports)
+    report_prefix = prefix
+
+# Method to write the JSON report and the Chrome trace of all recorded stages
+def write_reports():
+    if not recorded_stages:
+        return
+    with open(report_prefix + ".json", "w") as report:
+        json.dump({"script": os.path.basename(sys.argv[0]), "stages": recorded_stages}, report, indent = 1)
+
+    # Chrome trace format: one complete ("X") event per stage, with times in microseconds and one row ("tid") per thread
+    trace_events = []
+    for record in recorded_stages:
+        arguments = {key: value for key, value in record.items() if key not in ("stage", "start_s", "wall_s", "depth", "thread")}
+        trace_events.append({"name": record["stage"], "cat": "stage", "ph": "X", "pid": os.getpid(), "tid": record["thread"],
+                             "ts": round(record["start_s"] * 1e6, 1), "dur": round(record["wall_s"] * 1e6, 1),
+                             "args": arguments})
+    with open(report_prefix + ".trace.json", "w") as trace:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, trace)
+
+
+#----------------------------------------------------------
+# Turn on Instrumentation from the Environment
+#----------------------------------------------------------
+if os.environ.get("TRF_PROFILE"):
+    enable_instrumentation(os.environ["TRF_PROFILE"])
@@ -0,0 +1,311 @@
+# Sub-Second Interval Representation of Binary Activity
+# Used by Creating_Binary_CSV_Files.py to keep the fractional seconds of the raw video annotations for
+# Time-Restricted Feeding in the Active Phase Drives Periods of Rapid Food Consumption in Rats Fed a High-Fat, High-Sugar Diet with Liquid Sucrose
+# by Kush Attal, Julia Wickman Shihoko Kojima, Sarah N. Blythe, Natalia Toporikova
+#
+# times() samples the activity of every rat once per second, so a sucrose lick of 300 ms either fills a whole second or
+# is lost. activity_intervals() keeps the activity as it was annotated instead: one row per interval a rat was active
+# (START to STOP, in nanoseconds) plus the intervals that were not recorded. Its size depends on the number of events,
+# not on the resolution. Any resolution that divides a day (i.e. "100ms", "10ms", "1S") is derived from it on demand:
+#   - sample_activity() gives the ranges of samples every rat was active or not recorded
+#   - activity_frame() gives the dataframe of times() (rat columns and a "mean" column) at that resolution
+#   - interval_light_summary(), interval_hourly_totals() and interval_counts() give the light/dark totals, the hourly totals
+#     and the sums and counts behind the normalized activity straight from the intervals, without a sample per rat
+# At a resolution of "1S" every one of these is exactly what times(), light_summary(), hourly_totals() and
+# group_counts() give, including the rows of 0s added for time-restricted rats. Totals are in seconds at any resolution.
+#
+#     feeding = activity_intervals('Feeding', binary_dataframe, "HFHS Restricted", cohort = cohort)
+#     hourly = interval_hourly_totals(feeding, "100ms")
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import pandas as pd
+import numpy as np
+from cohort_config import load_cohort_config, cohort_group, day_start, restricted_hours, FOOD_ACTIVITIES
+
+
+#----------------------------------------------------------
+# Define Default Settings
+#----------------------------------------------------------
+# Resolution of the sub-second files of Creating_Binary_CSV_Files.py
+DEFAULT_RESOLUTION = "100ms"
+
+# Nanoseconds in one second and in one day
+SECOND = pd.Timedelta("1S").value
+DAY = pd.Timedelta("1D").value
+
+
+#----------------------------------------------------------
+# Define Custom Methods
+#----------------------------------------------------------
+
+# Method to turn a resolution (i.e. "100ms") into a number of nanoseconds - it must divide a day, so that the samples
+# moved to the next day (see times()) stay on the same grid
+def resolution_step(resolution):
+    step = pd.Timedelta(resolution).value
+    if step <= 0 or DAY % step != 0:
+        raise ValueError("resolution must divide one day evenly (i.e. 100ms, 1S): " + str(resolution))
+    return step
+
+# Method to collect the intervals every rat of one diet group performed an activity (the state changes behind times())
+# "diet" is the name of a diet group of the cohort configuration (the 2018VT study unless "cohort" is given, see cohort_config.py)
+# Returns a dictionary with the rat Names (the column order of times()), the active and unrecorded intervals (rat, start, end
+# in nanoseconds on the clock of the workbooks - "start" is included, "end" is not), the first and last event of the activity
+# and the times of the rows of 0s added for time-restricted rats. With "counts" set to True (Zoomie), the intervals are the
+# STARTs themselves (start equals end), like times() with "counts". "zero_outside_window" is the same as in times().
+def activity_intervals(activity_capitalized, all_data_copy, diet, counts = False, cohort = None, zero_outside_window = None):
+    if cohort is None:
+        cohort = load_cohort_config()
+    group = cohort_group(cohort, diet)
+    column = activity_capitalized + '_Activity'
+    events = all_data_copy[['Name', column]].dropna()
+    events = pd.DataFrame({"rat": events['Name'].to_numpy(), "time": events.index.to_numpy(dtype = "datetime64[ns]").view(np.int64),
+                           "value": pd.to_numeric(events[column]).to_numpy(dtype = float)})
+    # 2 activities that STARTed and STOPped at the exact same time count as a START (the np.ceil of times())
+    events = events.groupby(["rat", "time"], as_index = False)["value"].max()
+    rats = sorted(events["rat"].unique())
+    first, last = events["time"].min(), events["time"].max()
+
+    if counts == False:
+        # Keep only the events that change the state of a rat - every rat starts inactive
+        previous = events.groupby("rat")["value"].shift(1).fillna(0)
+        changes = events[events["value"] != previous].copy()
+        # An activity lasts until the next change of the same rat, or until the end of the recording
+        changes["end"] = changes.groupby("rat")["time"].shift(-1).fillna(last + 1).astype(np.int64)
+        changes = changes[changes["value"] == 1]
+        intervals = pd.DataFrame({"rat": changes["rat"].to_numpy(), "start": changes["time"].to_numpy(), "end": changes["end"].to_numpy()})
+    else:
+        starts = events[events["value"] == 1]
+        intervals = pd.DataFrame({"rat": starts["rat"].to_numpy(), "start": starts["time"].to_numpy(), "end": starts["time"].to_numpy()})
+
+    # The unrecorded intervals of the cohort configuration include their last second
+    unrecorded = []
+    for gap in (group["unrecorded"] if group is not None else []):
+        for rat in (rats if gap["rat"] == "" else [rat for rat in rats if rat == gap["rat"]]):
+            unrecorded.append({"rat": rat, "start": pd.Timestamp(gap["start"]).value, "end": pd.Timestamp(gap["end"]).value + SECOND})
+    if zero_outside_window is None:
+        zero_outside_window = activity_capitalized in FOOD_ACTIVITIES
+    zero_times = restricted_hours(cohort) if group is not None and group["restricted"] and zero_outside_window else pd.DatetimeIndex([])
+
+    return {"activity": activity_capitalized, "counts": counts, "rats": rats,
+            "intervals": intervals, "unrecorded": pd.DataFrame(unrecorded, columns = ["rat", "start", "end"]),
+            "first": int(first), "last": int(last), "day_start": day_start(cohort).value,
+            "zero_times": zero_times.to_numpy(dtype = "datetime64[ns]").view(np.int64)}
+
+# Method to find the constant-level ranges of overlapping weighted ranges - "rat" is a rat number, "first" and "last" are sample numbers
+# (first included, last not). Returns the rat, first, last and level (sum of the weights of the ranges covering it) of every range with a level above 0
+def sweep_ranges(rat, first, last, weight):
+    keep = last > first
+    rat, first, last, weight = rat[keep], first[keep], last[keep], weight[keep]
+    if len(rat) == 0:
+        return rat, first, last, weight
+    points = np.concatenate([first, last])
+    changes = np.concatenate([weight, -weight])
+    rats = np.concatenate([rat, rat])
+    order = np.lexsort((points, rats))
+    points, changes, rats = points[order], changes[order], rats[order]
+    # Sum the changes at the same point of the same rat, then follow the level from one point to the next
+    same = np.r_[False, (points[1:] == points[:-1]) & (rats[1:] == rats[:-1])]
+    block = np.cumsum(~same) - 1
+    points, rats = points[~same], rats[~same]
+    level = np.cumsum(np.bincount(block, weights = changes).astype(np.int64))
+    inside = level[:-1] > 0
+    return rats[:-1][inside], points[:-1][inside], points[1:][inside], level[:-1][inside]
+
+# Method to turn intervals of time (ns, on the clock of the workbooks) into ranges of sample numbers (every sample is at origin + number * step)
+def time_ranges(start, end, origin, step, samples, points = False):
+    if points:
+        # A START counts for the sample it falls in (the 1-second maximum of times() with "counts")
+        first = (start - origin) // step
+        last = first + 1
+    else:
+        # An interval counts for the samples at or after its start and before its end (the forward-fill of times())
+        first = -((origin - start) // step)
+        last = -((origin - end) // step)
+    return np.clip(first, 0, samples), np.clip(last, 0, samples)
+
+# Method to find the output time (the clock of times(), where the hours before lights off move to the next day) of sample numbers
+def output_times(activity, numbers, origin, step):
+    times = origin + numbers * step
+    return np.where(times < activity["day_start"], times + DAY, times)
+
+# Method to find which rows of 0s of time-restricted rats are kept when a second of times() has the same time
+# times() adds these rows, sorts and keeps the first row of every time - whichever row pandas' sort put first is kept. The
+# rows of 0s are on whole hours, so this is decided once on the 1-second samples and holds at every resolution
+def kept_zero_rows(activity):
+    if len(activity["zero_times"]) == 0:
+        return np.zeros(0, dtype = bool)
+    origin = activity["first"] // SECOND * SECOND
+    recorded = np.sort(output_times(activity, np.arange((activity["last"] - origin) // SECOND + 1), origin, SECOND))
+    index = np.concatenate([recorded, activity["zero_times"]]).view("datetime64[ns]")
+    order = np.argsort(index, kind = "quicksort")
+    ordered = index[order]
+    kept = order[np.r_[True, ordered[1:] != ordered[:-1]]]
+    zero_kept = np.zeros(len(activity["zero_times"]), dtype = bool)
+    zero_kept[kept[kept >= len(recorded)] - len(recorded)] = True
+    return zero_kept
+
+# Method to find the sample numbers of output times (-1 for times without a sample)
+def sample_numbers(activity, times, origin, step, samples):
+    numbers = np.full(len(times), -1, dtype = np.int64)
+    # A time after lights off is either a sample of the first day or a sample before lights off moved to the next day
+    for raw, valid in [(times, times >= activity["day_start"]), (times - DAY, times - DAY < activity["day_start"])]:
+        inside = valid & (raw >= origin) & ((raw - origin) % step == 0) & ((raw - origin) // step < samples)
+        numbers[inside] = (raw[inside] - origin) // step
+    return numbers
+
+# Method to find the first and last output time of the samples (the samples before lights off move to the next day)
+def output_span(activity, origin, step, samples):
+    wrap = min(max(-((origin - activity["day_start"]) // step), 0), samples)
+    ends = [number for number in [0, wrap - 1, wrap, samples - 1] if 0 <= number < samples]
+    times = output_times(activity, np.array(ends), origin, step)
+    return times.min(), times.max()
+
+# Method to sample the intervals of one activity at a resolution
+# Returns a dictionary with the sample grid (origin, step and number of samples on the clock of the workbooks), the ranges
+# of samples every rat was active and recorded ("active") and not recorded ("unrecorded") - rat is the position in "rats" -
+# the first and last output time of the samples and the rows of 0s of time-restricted rats that have no sample of their own ("extra_times")
+def sample_activity(activity, resolution = "1S"):
+    step = resolution_step(resolution)
+    origin = activity["first"] // step * step
+    samples = int((activity["last"] - origin) // step + 1)
+    codes = {rat: position for position, rat in enumerate(activity["rats"])}
+
+    intervals = activity["intervals"]
+    active_first, active_last = time_ranges(intervals["start"].to_numpy(), intervals["end"].to_numpy(), origin, step, samples, activity["counts"])
+    active_rat = intervals["rat"].map(codes).to_numpy(dtype = np.int64)
+    unrecorded = activity["unrecorded"]
+    gap_first, gap_last = time_ranges(unrecorded["start"].to_numpy(dtype = np.int64), unrecorded["end"].to_numpy(dtype = np.int64), origin, step, samples)
+    gap_rat = unrecorded["rat"].map(codes).to_numpy(dtype = np.int64)
+
+    # A row of 0s that replaced a recorded sample makes that sample recorded and inactive for every rat
+    zero_numbers = sample_numbers(activity, activity["zero_times"], origin, step, samples)
+    replaced = zero_numbers[(zero_numbers >= 0) & kept_zero_rows(activity)]
+    replaced_rat = np.repeat(np.arange(len(activity["rats"])), len(replaced))
+    replaced = np.tile(replaced, len(activity["rats"]))
+
+    # Merge the active ranges (STARTs in the same sample) and the unrecorded ranges of every rat, then split the samples into
+    # active (level 1) and unrecorded (level 2 or 3)
+    active_rat, active_first, active_last, _ = sweep_ranges(active_rat, active_first, active_last, np.ones(len(active_rat), dtype = np.int64))
+    gap_rat, gap_first, gap_last, _ = sweep_ranges(gap_rat, gap_first, gap_last, np.ones(len(gap_rat), dtype = np.int64))
+    rat, first, last, level = sweep_ranges(np.concatenate([active_rat, gap_rat, replaced_rat]),
+                                           np.concatenate([active_first, gap_first, replaced]),
+                                           np.concatenate([active_last, gap_last, replaced + 1]),
+                                           np.concatenate([np.full(len(active_rat), 1), np.full(len(gap_rat), 2), np.full(len(replaced), 4)]))
+    active = (level == 1)
+    missing = (level == 2) | (level == 3)
+    first_time, last_time = output_span(activity, origin, step, samples)
+    return {"origin": origin, "step": step, "samples": samples, "first_time": first_time, "last_time": last_time,
+            "active": pd.DataFrame({"rat": rat[active], "first": first[active], "last": last[active]}),
+            "unrecorded": pd.DataFrame({"rat": rat[missing], "first": first[missing], "last": last[missing]}),
+            "extra_times": activity["zero_times"][zero_numbers < 0]}
+
+# Method to turn a range of output time (ns, start included, end not) into the 2 ranges of sample numbers it covers -
+# samples before lights off are shown on the next day
+def output_ranges(activity, sampled, start, end):
+    ranges = []
+    for low, high in [(max(start, activity["day_start"]), end), (start - DAY, min(end - DAY, activity["day_start"]))]:
+        if high > low:
+            ranges.append(time_ranges(np.array([low]), np.array([high]), sampled["origin"], sampled["step"], sampled["samples"]))
+    return ranges
+
+# Method to count the samples of sample ranges (one rat each) that fall in windows of output time - returns a rats x windows array
+def count_in_windows(activity, sampled, ranges, windows):
+    counts = np.zeros((len(activity["rats"]), len(windows)), dtype = np.int64)
+    rat, first, last = ranges["rat"].to_numpy(), ranges["first"].to_numpy(), ranges["last"].to_numpy()
+    for position, (start, end) in enumerate(windows):
+        for low, high in output_ranges(activity, sampled, start, end):
+            overlap = np.clip(np.minimum(last, high[0]) - np.maximum(first, low[0]), 0, None)
+            counts[:, position] += np.bincount(rat, weights = overlap, minlength = len(activity["rats"])).astype(np.int64)
+    return counts
+
+# Method to design the pivot table of times() from the intervals at any resolution (rat columns and a "mean" column)
+# Memory grows with the number of samples - use it for 1 second or a short recording, and the methods below for the totals
+def activity_frame(activity, resolution = "1S"):
+    sampled = sample_activity(activity, resolution)
+    values = np.zeros((sampled["samples"], len(activity["rats"])))
+    for kind, value in [("active", 1), ("unrecorded", np.nan)]:
+        for rat, first, last in sampled[kind].itertuples(index = False):
+            values[first:last, rat] = value
+    numbers = np.arange(sampled["samples"])
+    index = pd.DatetimeIndex(output_times(activity, numbers, sampled["origin"], sampled["step"]).view("datetime64[ns]"), name = "seconds")
+    times = pd.DataFrame(values, index = index, columns = activity["rats"]).sort_index()
+    # Fully recorded rats are integers, like times()
+    times = times.apply(lambda rat: rat.astype(np.int64) if rat.notna().all() else rat)
+    if len(activity["zero_times"]) > 0:
+        new_rows = pd.DataFrame(0, columns = times.columns, index = pd.DatetimeIndex(sampled["extra_times"].view("datetime64[ns]")))
+        times = pd.concat([times, new_rows]).sort_index()
+    times['mean'] = times.mean(axis = 1).fillna(0)
+    return times.rename_axis(columns = "")
+
+# Method to calculate the seconds every rat performed the activity during (1) light and (2) dark phases - the rows of light_summary()
+def interval_light_summary(df, activity, light_start = pd.to_datetime('1970-01-02 09:00:00'), resolution = "1S"):
+    sampled = sample_activity(activity, resolution)
+    light_start = pd.Timestamp(light_start).value
+    # The second of light on itself is in neither phase, like light_summary()
+    windows = [(light_start + 1, np.iinfo(np.int64).max // 2), (np.iinfo(np.int64).min // 2, light_start)]
+    seconds = count_in_windows(activity, sampled, sampled["active"], windows) * sampled["step"] / SECOND
+    for position, rat in enumerate(activity["rats"]):
+        df.loc[int(str(rat)[3:])] = list(seconds[position])
+    return df
+
+# Method to total the seconds of activity of every rat per hour - the rows and columns of hourly_totals()
+# Hours with any unrecorded sample are NaN
+def interval_hourly_totals(activity, resolution = "1S"):
+    sampled = sample_activity(activity, resolution)
+    first = min(np.concatenate([[sampled["first_time"]], sampled["extra_times"]]))
+    last = max(np.concatenate([[sampled["last_time"]], sampled["extra_times"]]))
+    hours = pd.date_range(pd.Timestamp(first).floor("1H"), pd.Timestamp(last).floor("1H"), freq = "1H")
+    windows = [(hour.value, hour.value + pd.Timedelta("1H").value) for hour in hours]
+    seconds = count_in_windows(activity, sampled, sampled["active"], windows) * sampled["step"] / SECOND
+    missing = count_in_windows(activity, sampled, sampled["unrecorded"], windows) > 0
+    return pd.DataFrame(np.where(missing, np.nan, seconds), index = activity["rats"],
+                        columns = [str(hour.hour) + ":00" for hour in hours])
+
+# Method to count, for every sample, the active rats (sum) and the recorded rats (count) - the rows of activity_counts() in group_aggregates.py
+# Only 2 numbers per sample are kept, whatever the number of rats
+def interval_counts(activity, resolution = "1S"):
+    sampled = sample_activity(activity, resolution)
+    changes = {}
+    for kind in ["active", "unrecorded"]:
+        ranges = sampled[kind]
+        change = np.zeros(sampled["samples"] + 1, dtype = np.int64)
+        np.add.at(change, ranges["first"].to_numpy(), 1)
+        np.add.at(change, ranges["last"].to_numpy(), -1)
+        changes[kind] = np.cumsum(change[:-1])
+    index = output_times(activity, np.arange(sampled["samples"]), sampled["origin"], sampled["step"])
+    extra = sampled["extra_times"]
+    counts = pd.DataFrame({"sum": np.concatenate([changes["active"], np.zeros(len(extra), dtype = np.int64)]),
+                           "count": np.concatenate([len(activity["rats"]) - changes["unrecorded"], np.full(len(extra), len(activity["rats"]))])},
+                          index = pd.DatetimeIndex(np.concatenate([index, extra]).view("datetime64[ns]")))
+    return counts.sort_index()
+
+# Method to collect the sums and counts of several diet groups on one time index - the layout of group_counts() in group_aggregates.py
+# "activities" maps the diet group (i.e. "HFHS Restricted") to its intervals from activity_intervals()
+def interval_group_counts(activities, resolution = "1S"):
+    counts = pd.concat({group: interval_counts(activity, resolution) for group, activity in activities.items()}, axis = 1).sort_index()
+    return counts.fillna(0).astype(np.int64)
+
+# Method to list the active and unrecorded intervals of one activity on the clock of times() (times before lights off move to the next day)
+# Returns a dataframe with the rat, kind ("active" or "unrecorded"), start and end of every interval
+def output_intervals(activity):
+    frames = []
+    for kind in ["intervals", "unrecorded"]:
+        frame = activity[kind]
+        start, end = frame["start"].to_numpy(dtype = np.int64), frame["end"].to_numpy(dtype = np.int64)
+        # Split the intervals that cross lights off - the part before moves to the next day
+        before = np.minimum(end, activity["day_start"])
+        after = np.maximum(start, activity["day_start"])
+        pieces = pd.DataFrame({"rat": np.concatenate([frame["rat"].to_numpy(), frame["rat"].to_numpy()]),
+                               "start": np.concatenate([start + DAY, after]), "end": np.concatenate([before + DAY, end])})
+        # STARTs of "counts" activities are single points (start equals end)
+        keep = np.concatenate([(before > start) | ((start == end) & (start < activity["day_start"])), (end > after) | ((start == end) & (start >= activity["day_start"]))])
+        pieces = pieces[keep]
+        pieces.insert(1, "kind", "active" if kind == "intervals" else "unrecorded")
+        frames.append(pieces)
+    intervals = pd.concat(frames, ignore_index = True).sort_values(["rat", "start", "kind"], ignore_index = True)
+    intervals["start"] = pd.to_datetime(intervals["start"])
+    intervals["end"] = pd.to_datetime(intervals["end"])
+    return intervals
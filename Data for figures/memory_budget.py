@@ -0,0 +1,93 @@
+# Memory Budget for Processing One Diet Group at a Time
+# Used by Creating_Binary_CSV_Files.py to keep the memory of a run below a set limit for
+# Time-Restricted Feeding in the Active Phase Drives Periods of Rapid Food Consumption in Rats Fed a High-Fat, High-Sugar Diet with Liquid Sucrose
+# by Kush Attal, Julia Wickman Shihoko Kojima, Sarah N. Blythe, Natalia Toporikova
+#
+# The memory budget is off unless the TRF_MEMORY_BUDGET environment variable is set to a size, i.e.
+#     TRF_MEMORY_BUDGET=1.5GB python Creating_Binary_CSV_Files.py
+# Creating_Binary_CSV_Files.py then keeps the 1-second activity it needs across diet groups as uint8 occupancy matrices on
+# disk (see shared_activity.py) instead of dataframes in memory, and checks the peak resident memory after every diet group
+# and every step across diet groups. A step that goes over the budget stops the run with a MemoryError; either way the
+# peak of every step is written to memory_budget_report.csv.
+# The peak is reset after every check (Linux only), but not while an instrumentation stage is open - the peak of the next step
+# then starts at the last reset ("peak_since" in the report), which still finds the step that went over the budget. Systems
+# that cannot reset the peak only have the peak of the whole process, so there the peaks are reported but not enforced.
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import pandas as pd
+import ctypes
+import gc
+import re
+from instrumentation import peak_rss_mb, reset_peak_outside_stages
+
+
+#----------------------------------------------------------
+# Define Default Settings
+#----------------------------------------------------------
+# Size units of TRF_MEMORY_BUDGET (a number without a unit is in MB)
+UNITS = {"": 1, "K": 1 / 1024, "KB": 1 / 1024, "M": 1, "MB": 1, "G": 1024, "GB": 1024}
+
+
+#----------------------------------------------------------
+# Define Custom Methods
+#----------------------------------------------------------
+
+# Method to turn a size (i.e. "1500", "1500MB" or "1.5GB") into MB
+def parse_budget(text):
+    match = re.fullmatch(r"\s*([0-9]*\.?[0-9]+)\s*([A-Za-z]*)\s*", str(text))
+    if match is None or match.group(2).upper() not in UNITS:
+        raise ValueError("memory budget '" + str(text) + "' is not a size like 1500MB or 1.5GB")
+    return float(match.group(1)) * UNITS[match.group(2).upper()]
+
+# Method to start a memory budget of "limit_mb" MB - returns the budget, which records the peak of every step
+def new_budget(limit_mb):
+    reset = reset_peak_outside_stages()
+    if reset is False:
+        print("Memory: the peak memory cannot be reset on this system, so the budget of " + str(limit_mb) + " MB is reported but not enforced")
+    return {"limit_mb": limit_mb, "steps": [], "enforced": reset is not False, "peak_since": "budget start" if reset else "process start"}
+
+# Method to hand the memory of released dataframes back to the operating system, so that the resident memory goes down
+# (glibc keeps freed memory for later unless asked to return it - nothing to do on other systems)
+def release_memory():
+    gc.collect()
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+# Method to read the resident memory of this process (in MB) - Linux only, None on other systems
+def rss_mb():
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 2)
+    except OSError:
+        pass
+    return None
+
+# Method to record the peak memory of the step that just ended (since the last reset of the peak) and stop the run if it went over the budget
+# Does nothing when there is no budget (None)
+def check_budget(budget, step, group = None, report = "memory_budget_report.csv"):
+    if budget is None:
+        return
+    peak = peak_rss_mb()
+    release_memory()
+    budget["steps"].append({"step": step, "group": group, "peak_rss_mb": peak, "peak_since": budget["peak_since"], "rss_after_mb": rss_mb(),
+                            "limit_mb": budget["limit_mb"], "enforced": budget["enforced"]})
+    if reset_peak_outside_stages():
+        budget["peak_since"] = step + (" (" + group + ")" if group is not None else "")
+    # The earlier checks since "peak_since" were within the budget, so a peak over the budget was reached in this step
+    if budget["enforced"] and peak > budget["limit_mb"]:
+        write_budget_report(budget, report)
+        raise MemoryError("step '" + step + "'" + (" of " + group if group is not None else "") + " used " + str(peak) + " MB, over the memory budget of "
+                          + str(budget["limit_mb"]) + " MB (see " + report + ")")
+    print("Memory: " + step + (" (" + group + ")" if group is not None else "") + " peaked at " + str(peak) + " MB of " + str(budget["limit_mb"]) + " MB" + ("" if budget["enforced"] else " (not enforced)"))
+
+# Method to write the peak memory of every step to a CSV file
+def write_budget_report(budget, path = "memory_budget_report.csv"):
+    if budget is not None:
+        pd.DataFrame(budget["steps"], columns = ["step", "group", "peak_rss_mb", "peak_since", "rss_after_mb", "limit_mb", "enforced"]).to_csv(path, index = False)
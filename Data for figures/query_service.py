@@ -0,0 +1,340 @@
+# Local Read-Only Query Service for Activity and Statistics
+# Used to answer dashboard queries about the outputs of Creating_Binary_CSV_Files.py and figures_and_analysis.py for
+# Time-Restricted Feeding in the Active Phase Drives Periods of Rapid Food Consumption in Rats Fed a High-Fat, High-Sugar Diet with Liquid Sucrose
+# by Kush Attal, Julia Wickman Shihoko Kojima, Sarah N. Blythe, Natalia Toporikova
+#
+# The service reads the archives once at start-up: the sums and counts behind the normalized activity (*_Activity_Counts.npz)
+# (or the normalized activity itself in older archives) and the 1-second feeding activity of every rat are written to memory-mapped .npy files (see shared_activity.py), and the
+# light/dark totals, hourly totals and statistical results are kept as small tables. Queries are answered from these,
+# without opening the archives again, and the last responses are kept in a least-recently-used cache.
+# It needs no network access beyond the local port and only answers GET requests (JSON):
+#     python query_service.py --port 8050
+#     GET /groups
+#     GET /normalized?activity=Feeding&start=1970-01-02 04:00&end=1970-01-02 07:00&bin=15min&group=HFHS Ad Lib&group=HFHS Restricted
+#     GET /rats?group=HFHS Restricted&start=1970-01-02 04:00&end=1970-01-02 07:00&bin=1H
+#     GET /hourly?activity=Sucrose&group=HFHS restriction
+#     GET /totals?activity=Feeding
+#     GET /statistics?figure=Fig3F&max_p=0.05
+#     GET /status
+# Times use the clock of the binary CSV files (21:00 on 1970-01-01 to 21:00 on 1970-01-02, without a time zone); "start" is inclusive,
+# "end" exclusive. Bad queries are answered with status 400 or 404 and unexpected errors with status 500, always as JSON.
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import pandas as pd
+import numpy as np
+import argparse
+import asyncio
+import collections
+import io
+import json
+import os
+import signal
+import sqlite3
+import tempfile
+import traceback
+import urllib.parse
+import zipfile
+from group_aggregates import load_counts, normalized_activity
+from cohort_config import load_cohort
+from shared_activity import share_activity, open_activity, release_activity, UNRECORDED
+
+
+#----------------------------------------------------------
+# Define Default Settings
+#----------------------------------------------------------
+# Folder of the ZIP archives and file of the statistical results
+DATA_FOLDER = os.path.dirname(os.path.abspath(__file__))
+RESULTS_STORE = os.path.join(os.path.dirname(DATA_FOLDER), "Figures_And_Analysis", "statistical_results.sqlite")
+
+# Archive of each activity
+ARCHIVES = {"Feeding": ("Feeding_Binary_CSV_Files.zip", "food"), "Sucrose": ("Sucrose_Binary_CSV_Files.zip", "sucrose")}
+
+# Number of responses kept in the cache
+CACHE_SIZE = 256
+
+# Largest number of bins of one response
+MAX_BINS = 100000
+
+
+#----------------------------------------------------------
+# Define Custom Methods
+#----------------------------------------------------------
+
+# Error of a query - answered with status 400 (or "status") and the message
+class QueryError(Exception):
+    def __init__(self, message, status = 400):
+        super().__init__(message)
+        self.status = status
+
+# Method to write one array to a memory-mapped .npy file and open it read-only
+def map_array(folder, name, array):
+    path = os.path.join(folder, name + ".npy")
+    mapped = np.lib.format.open_memmap(path, mode = "w+", dtype = array.dtype, shape = array.shape)
+    mapped[:] = array
+    mapped.flush()
+    del mapped
+    return np.load(path, mmap_mode = "r")
+
+# Method to load everything the service answers from (once, at start-up)
+# Returns the data of the service - arrays are memory-mapped from files in "folder" (a new temporary folder unless given)
+def load_service_data(data_folder = DATA_FOLDER, results_store = RESULTS_STORE, folder = None, cohort = None):
+    cohort = cohort or load_cohort()
+    folder = folder or tempfile.mkdtemp(prefix = "trf_query_")
+    data = {"folder": folder, "normalized": {}, "hourly": {}, "totals": {}, "rats": None, "statistics": None}
+    for activity, (archive_name, prefix) in ARCHIVES.items():
+        path = os.path.join(data_folder, archive_name)
+        if not os.path.exists(path):
+            continue
+        with zipfile.ZipFile(path) as archive:
+            # Archives written before the counts were added only have the normalized activity
+            if activity + "_Activity_Counts.npz" in archive.namelist():
+                normalized = normalized_activity(load_counts(io.BytesIO(archive.read(activity + "_Activity_Counts.npz"))))
+            else:
+                normalized = pd.read_csv(archive.open(activity + "_Normalized_Activity.csv"), index_col = 'Date_Time', parse_dates = True)
+            seconds = normalized.index.to_numpy(dtype = "datetime64[ns]").view(np.int64)
+            data["normalized"][activity] = {"index": map_array(folder, activity + "_index", seconds), "groups": {}}
+            for position, group in enumerate(normalized.columns):
+                # Running totals of the normalized activity: the mean of any range is a difference of 2 values
+                totals = np.concatenate([[0], np.cumsum(normalized[group].to_numpy(dtype = float))])
+                data["normalized"][activity]["groups"][group] = map_array(folder, activity + "_group" + str(position), totals)
+            data["hourly"][activity] = pd.read_csv(archive.open(prefix + "_total_by_hour.csv"), index_col = 0)
+            data["totals"][activity] = pd.read_csv(archive.open(prefix + "_total.csv"), index_col = 0)
+            # Per-rat feeding activity by group label (the sucrose binary CSV files hold feeding activity, so only the feeding files are served)
+            if activity == "Feeding":
+                frames = {}
+                for group in cohort["groups"]:
+                    name = "Feeding_" + group["file_name"] + "_Binary.csv"
+                    if name in archive.namelist():
+                        frames[group["label"]] = pd.read_csv(archive.open(name), index_col = 0, parse_dates = True)
+                data["rats"] = share_activity(frames, os.path.join(folder, "rats"))
+    if results_store and os.path.exists(results_store):
+        with sqlite3.connect("file:" + urllib.parse.quote(os.path.abspath(results_store)) + "?mode=ro", uri = True) as store:
+            data["statistics"] = pd.read_sql_query("SELECT * FROM results ORDER BY id", store)
+    return data
+
+# Method to remove the memory-mapped files of the service
+def release_service_data(data):
+    release_activity(data)
+
+# Method to read a time of a query (None when it is not given) - the binary CSV files have no time zone, so neither may the query
+def query_time(query, name):
+    if name not in query:
+        return None
+    try:
+        time = pd.Timestamp(query[name][0])
+    except ValueError:
+        raise QueryError("'" + name + "' is not a time: " + query[name][0])
+    if time.tz is not None:
+        raise QueryError("'" + name + "' must not have a time zone (the activity has none): " + query[name][0])
+    return time
+
+# Method to find the bin edges (as int64 ns) of a query - the whole recording unless "start" or "end" are given
+def bin_edges(query, index):
+    start = query_time(query, "start")
+    end = query_time(query, "end")
+    start = pd.Timestamp(int(index[0])) if start is None else start
+    end = pd.Timestamp(int(index[-1])) + pd.Timedelta("1S") if end is None else end
+    try:
+        width = pd.Timedelta(query.get("bin", ["1H"])[0])
+    except ValueError:
+        raise QueryError("'bin' is not a width (i.e. 30S, 15min or 1H): " + query["bin"][0])
+    if width <= pd.Timedelta(0) or end <= start:
+        raise QueryError("'bin' must be positive and 'end' after 'start'")
+    if (end - start) / width > MAX_BINS:
+        raise QueryError("more than " + str(MAX_BINS) + " bins - use a wider 'bin'")
+    edges = pd.date_range(start, end, freq = width)
+    if edges[-1] < end:
+        edges = edges.append(pd.DatetimeIndex([end]))
+    return edges
+
+# Method to find the value of a query that must be one of "choices" (the first choice when it is not given)
+def query_choice(query, name, choices):
+    value = query.get(name, [choices[0] if choices else None])[0]
+    if value not in choices:
+        raise QueryError("unknown " + name + " '" + str(value) + "' - choose from " + ", ".join(map(str, choices)), 404)
+    return value
+
+# Method to answer /normalized - the mean normalized activity of every group in every bin (null for bins without any second)
+def normalized_response(data, query):
+    activity = query_choice(query, "activity", list(data["normalized"]))
+    normalized = data["normalized"][activity]
+    groups = query.get("group", list(normalized["groups"]))
+    for group in groups:
+        query_choice({"group": [group]}, "group", list(normalized["groups"]))
+    edges = bin_edges(query, normalized["index"])
+    rows = np.searchsorted(normalized["index"], edges.to_numpy(dtype = "datetime64[ns]").view(np.int64), side = "left")
+    seconds = np.diff(rows)
+    response = {"activity": activity, "time": edges[:-1].strftime("%Y-%m-%d %H:%M:%S").tolist(), "seconds": seconds.tolist(), "groups": {}}
+    for group in groups:
+        totals = normalized["groups"][group]
+        means = (totals[rows[1:]] - totals[rows[:-1]]) / np.maximum(seconds, 1)
+        response["groups"][group] = [round(float(mean), 6) if count > 0 else None for mean, count in zip(means, seconds)]
+    return response
+
+# Method to answer /rats - the seconds every rat of one group was active and recorded in every bin (feeding)
+def rats_response(data, query):
+    if data["rats"] is None:
+        raise QueryError("no per-rat activity loaded", 404)
+    group = query_choice(query, "group", list(data["rats"]["groups"]))
+    rats, index, occupancy = open_activity(data["rats"], group)
+    edges = bin_edges(query, index.view(np.int64))
+    rows = np.searchsorted(index.view(np.int64), edges.to_numpy(dtype = "datetime64[ns]").view(np.int64), side = "left")
+    response = {"group": group, "time": edges[:-1].strftime("%Y-%m-%d %H:%M:%S").tolist(), "rats": {}}
+    window = occupancy[rows[0]:rows[-1]]
+    recorded = window != UNRECORDED
+    active = np.where(recorded, window, 0).astype(np.int64)
+    starts = rows[:-1] - rows[0]
+    # reduceat needs a start inside the array - empty bins are set to 0 below
+    inside = np.minimum(starts, max(len(window) - 1, 0))
+    empty = np.diff(rows) == 0
+    for position, rat in enumerate(rats):
+        if len(window) == 0:
+            active_seconds = recorded_seconds = np.zeros(len(starts), dtype = np.int64)
+        else:
+            active_seconds = np.add.reduceat(active[:, position], inside)
+            recorded_seconds = np.add.reduceat(recorded[:, position].astype(np.int64), inside)
+            active_seconds[empty] = 0
+            recorded_seconds[empty] = 0
+        response["rats"][rat] = {"active_s": active_seconds.tolist(), "recorded_s": recorded_seconds.tolist()}
+    return response
+
+# Method to answer /hourly and /totals - the rows of one table, optionally of one group (the "group" column, i.e. "HFHS restriction")
+def table_response(data, query, table):
+    activity = query_choice(query, "activity", list(data[table]))
+    frame = data[table][activity]
+    if "group" in query:
+        query_choice(query, "group", sorted(frame["group"].unique()))
+        frame = frame[frame["group"] == query["group"][0]]
+    return {"activity": activity, "rows": json.loads(frame.reset_index().rename(columns = {"index": "rat"}).to_json(orient = "records"))}
+
+# Method to answer /statistics - the statistical results, filtered by any column of the results table (and "max_p")
+def statistics_response(data, query):
+    if data["statistics"] is None:
+        raise QueryError("no statistical results loaded - run figures_and_analysis.py first", 404)
+    results = data["statistics"]
+    for column, values in query.items():
+        if column == "max_p":
+            results = results[results["p"] <= float(values[0])]
+        elif column in results.columns:
+            results = results[results[column].astype(str).isin(values)]
+        else:
+            raise QueryError("unknown filter '" + column + "'")
+    return {"rows": json.loads(results.to_json(orient = "records"))}
+
+# Method to answer one request path (i.e. "/normalized?activity=Feeding&bin=1H") - returns the HTTP status and the JSON body
+def answer(data, target):
+    url = urllib.parse.urlsplit(target)
+    query = urllib.parse.parse_qs(url.query)
+    try:
+        if url.path == "/groups":
+            body = {activity: list(normalized["groups"]) for activity, normalized in data["normalized"].items()}
+            body["rats"] = list(data["rats"]["groups"]) if data["rats"] else []
+        elif url.path == "/normalized":
+            body = normalized_response(data, query)
+        elif url.path == "/rats":
+            body = rats_response(data, query)
+        elif url.path in ("/hourly", "/totals"):
+            body = table_response(data, query, url.path[1:])
+        elif url.path == "/statistics":
+            body = statistics_response(data, query)
+        else:
+            raise QueryError("unknown path " + url.path, 404)
+        return 200, json.dumps(body).encode()
+    except (QueryError, ValueError) as error:
+        return getattr(error, "status", 400), json.dumps({"error": str(error)}).encode()
+    except Exception as error:
+        return internal_error(error)
+
+# Method to answer an unexpected error with status 500 - the traceback is printed for the person running the service
+def internal_error(error):
+    traceback.print_exc()
+    return 500, json.dumps({"error": "internal error (" + type(error).__name__ + "): " + str(error)}).encode()
+
+# Least-recently-used cache of responses - the query parameters are sorted so that equal queries share an entry
+class ResponseCache:
+    def __init__(self, size = CACHE_SIZE):
+        self.size = size
+        self.responses = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, target):
+        url = urllib.parse.urlsplit(target)
+        return url.path + "?" + urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(url.query)))
+
+    def get(self, target):
+        key = self.key(target)
+        if key in self.responses:
+            self.hits += 1
+            self.responses.move_to_end(key)
+            return self.responses[key]
+        self.misses += 1
+        return None
+
+    def put(self, target, response):
+        self.responses[self.key(target)] = response
+        self.responses.move_to_end(self.key(target))
+        while len(self.responses) > self.size:
+            self.responses.popitem(last = False)
+
+# Method to answer one HTTP connection (one GET request, then the connection is closed)
+async def handle_connection(reader, writer, data, cache):
+    try:
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            # Skip the headers - the service does not use them
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            if len(request_line) < 2 or request_line[0] != "GET":
+                status, body = 405, json.dumps({"error": "only GET requests are answered"}).encode()
+            elif urllib.parse.urlsplit(request_line[1]).path == "/status":
+                status, body = 200, json.dumps({"cached": len(cache.responses), "hits": cache.hits, "misses": cache.misses}).encode()
+            else:
+                response = cache.get(request_line[1])
+                if response is None:
+                    # Answer in a worker thread, so that a long query does not hold up the other clients
+                    response = await asyncio.get_running_loop().run_in_executor(None, answer, data, request_line[1])
+                    if response[0] == 200:
+                        cache.put(request_line[1], response)
+                status, body = response
+        except Exception as error:
+            status, body = internal_error(error)
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}[status]
+        writer.write(("HTTP/1.1 " + str(status) + " " + reason + "\r\nContent-Type: application/json\r\nContent-Length: " + str(len(body))
+                      + "\r\nConnection: close\r\n\r\n").encode() + body)
+        await writer.drain()
+    finally:
+        writer.close()
+
+# Method to run the service until it is stopped - only reachable from this computer unless "host" is changed
+async def serve(data, host = "127.0.0.1", port = 8050, cache_size = CACHE_SIZE):
+    cache = ResponseCache(cache_size)
+    server = await asyncio.start_server(lambda reader, writer: handle_connection(reader, writer, data, cache), host, port)
+    print("Answering queries on http://" + host + ":" + str(server.sockets[0].getsockname()[1]), flush = True)
+    async with server:
+        await server.serve_forever()
+
+
+#----------------------------------------------------------
+# Run the Service from the Command Line
+#----------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Answer JSON queries about the activity archives and the statistical results")
+    parser.add_argument("--data", default = DATA_FOLDER, help = "folder of Feeding_Binary_CSV_Files.zip and Sucrose_Binary_CSV_Files.zip")
+    parser.add_argument("--results", default = RESULTS_STORE, help = "statistical results of figures_and_analysis.py (SQLite)")
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = 8050)
+    parser.add_argument("--cache-size", type = int, default = CACHE_SIZE, help = "number of responses kept in the cache")
+    arguments = parser.parse_args()
+    service_data = load_service_data(arguments.data, arguments.results)
+    # Stop on SIGTERM like on Ctrl-C, so that the memory-mapped files are removed
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        asyncio.run(serve(service_data, arguments.host, arguments.port, arguments.cache_size))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        release_service_data(service_data)
@@ -0,0 +1,107 @@
+# Shared Occupancy Matrices on Disk
+# Used to keep the 1-second activity of every diet group out of memory (the memory budget of Creating_Binary_CSV_Files.py and the
+# per-rat activity of query_service.py) and to save the occupancy matrices of the ethograms for
+# Time-Restricted Feeding in the Active Phase Drives Periods of Rapid Food Consumption in Rats Fed a High-Fat, High-Sugar Diet with Liquid Sucrose
+# by Kush Attal, Julia Wickman Shihoko Kojima, Sarah N. Blythe, Natalia Toporikova
+#
+# share_activity() writes the 1-second dataframes from times() once, as uint8 occupancy matrices (rows are seconds,
+# columns are rats) and int64 time indexes, to memory-mapped .npy files. The description it returns (folder, file names
+# and rat Names) is small, and open_activity() turns it into read-only NumPy views backed by the page cache of the
+# operating system - in any thread or process, without copying the activity. Unrecorded (NaN) seconds are stored as UNRECORDED.
+#
+#     shared = share_activity({"HFHS Restricted": hfhs_restr_feeding, "HFHS Adlib": hfhs_adlib_feeding})
+#     try:
+#         rats, index, occupancy = open_activity(shared, "HFHS Restricted")
+#         hfhs_restr_feeding = activity_frame(shared, "HFHS Restricted")
+#     finally:
+#         release_activity(shared)
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import pandas as pd
+import numpy as np
+import os
+import shutil
+import tempfile
+
+
+#----------------------------------------------------------
+# Define Default Settings
+#----------------------------------------------------------
+# Value of the seconds a rat was not recorded (activity is 0 or 1, Zoomie counts are small integers)
+UNRECORDED = 255
+
+
+#----------------------------------------------------------
+# Define Custom Methods
+#----------------------------------------------------------
+
+# Method to turn a 1-second dataframe from times() into rat Names, an int64 time index (ns) and a uint8 occupancy matrix
+# The "mean" column is left out - it can be recomputed from the matrix
+def occupancy_matrix(times):
+    rats = [rat for rat in times.columns if rat != 'mean']
+    values = times[rats].to_numpy(dtype = float)
+    # NaN (unrecorded) seconds count as 0 here - np.nanmax() has no "initial" before numpy 1.22 and fails on empty matrices
+    if np.where(np.isnan(values), 0, values).max(initial = 0) >= UNRECORDED:
+        raise ValueError("activity values must be smaller than " + str(UNRECORDED) + " to fit in a uint8 occupancy matrix")
+    occupancy = np.where(np.isnan(values), UNRECORDED, values).astype(np.uint8)
+    return rats, times.index.to_numpy(dtype = "datetime64[ns]").view(np.int64), occupancy
+
+# Method to write the occupancy matrix and time index of every diet group to memory-mapped files
+# "frames" maps a name (i.e. the diet group) to its 1-second dataframe from times(); the files go to a new temporary folder unless "folder" is given
+# Returns the description of the shared activity - a small dictionary that is cheap to send to worker processes
+def share_activity(frames, folder = None):
+    if folder is None:
+        folder = tempfile.mkdtemp(prefix = "trf_activity_")
+    else:
+        os.makedirs(folder, exist_ok = True)
+    shared = {"folder": folder, "groups": {}}
+    for position, (name, times) in enumerate(frames.items()):
+        rats, index, occupancy = occupancy_matrix(times)
+        files = {"index": "group" + str(position) + "_index.npy", "occupancy": "group" + str(position) + "_occupancy.npy"}
+        for key, array in [("index", index), ("occupancy", occupancy)]:
+            mapped = np.lib.format.open_memmap(os.path.join(folder, files[key]), mode = "w+", dtype = array.dtype, shape = array.shape)
+            mapped[:] = array
+            mapped.flush()
+            del mapped
+        shared["groups"][name] = dict(files, rats = rats)
+    return shared
+
+# Method to open the shared activity of one diet group (in any process) as read-only views
+# Returns the rat Names, the time index (datetime64[ns]) and the uint8 occupancy matrix (rows are seconds, columns are rats)
+def open_activity(shared, name):
+    group = shared["groups"][name]
+    index = np.load(os.path.join(shared["folder"], group["index"]), mmap_mode = "r").view("datetime64[ns]")
+    occupancy = np.load(os.path.join(shared["folder"], group["occupancy"]), mmap_mode = "r")
+    return group["rats"], index, occupancy
+
+# Method to turn the shared activity of one diet group back into a dataframe like times() (this copies the data)
+def activity_frame(shared, name):
+    rats, index, occupancy = open_activity(shared, name)
+    values = np.where(occupancy == UNRECORDED, np.nan, occupancy)
+    times = pd.DataFrame(values, index = pd.DatetimeIndex(np.asarray(index)), columns = pd.Index(rats, name = ""))
+    times['mean'] = times.mean(axis = 1).fillna(0)
+    return times
+
+# Method to save the occupancy matrices of several behaviors of one diet group in a compressed .npz file (i.e. for ethogram.py)
+# "frames" maps the behavior (i.e. "Feeding") to its 1-second dataframe from times(); every behavior keeps its own rat Names and time index
+def save_occupancy(path, group, frames):
+    arrays = {"group": np.array(group)}
+    for behavior, times in frames.items():
+        rats, index, occupancy = occupancy_matrix(times)
+        arrays.update({behavior + "/rats": np.array(rats, dtype = str), behavior + "/time": index, behavior + "/occupancy": occupancy})
+    np.savez_compressed(path, **arrays)
+
+# Method to load the occupancy matrices saved by save_occupancy() ("file" is a path or an open file)
+# Returns the diet group and {behavior: (rat Names, time index (datetime64[ns]), uint8 occupancy matrix)}
+def load_occupancy(file):
+    with np.load(file) as arrays:
+        behaviors = [name.rsplit("/", 1)[0] for name in arrays.files if name.endswith("/occupancy")]
+        return str(arrays["group"]), {behavior: (arrays[behavior + "/rats"].tolist(), arrays[behavior + "/time"].view("datetime64[ns]"),
+                                                 arrays[behavior + "/occupancy"]) for behavior in behaviors}
+
+# Method to remove the files of the shared activity once no process needs them anymore
+def release_activity(shared):
+    shutil.rmtree(shared["folder"], ignore_errors = True)
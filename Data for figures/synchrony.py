@@ -0,0 +1,143 @@
+# Methods for Inter-Animal Synchrony Analysis
+# Used by Creating_Binary_CSV_Files.py to measure whether rats perform an activity together or independently for
+# Time-Restricted Feeding in the Active Phase Drives Periods of Rapid Food Consumption in Rats Fed a High-Fat, High-Sugar Diet with Liquid Sucrose
+# by Kush Attal, Julia Wickman Shihoko Kojima, Sarah N. Blythe, Natalia Toporikova
+#
+# Every pair of rats (within and across diet groups) gets:
+#   - the Jaccard overlap and phi coefficient of their 1-second activity, from popcounts of packed bitmaps
+#   - the lagged cross-correlation over +/- a lag window, from FFTs of their activity
+# Only the seconds recorded for both rats of a pair (at every lag) are compared. All pairs are computed together in chunks of rats or pairs.
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import pandas as pd
+import numpy as np
+from behavior_sequences import POPCOUNT
+
+
+#----------------------------------------------------------
+# Define Default Settings
+#----------------------------------------------------------
+# Largest lag (in sec) of the cross-correlation - a positive lag means the second rat of the pair follows the first
+MAX_LAG = 600
+
+# Number of rats (popcounts) or pairs (cross-correlation) handled at once
+ROW_CHUNK = 16
+PAIR_CHUNK = 16
+
+
+#----------------------------------------------------------
+# Define Custom Methods
+#----------------------------------------------------------
+
+# Method to put the 1-second activity of several diet groups on one time index (rows are seconds, columns are rats)
+# Seconds a rat was not recorded are NaN
+def aligned_activity(frames):
+    return pd.concat([times.drop(columns = 'mean') for times in frames], axis = 1).sort_index()
+
+# Method to count the 1 bits that every row of "left" has in common with every row of "right" (both are packed rat x byte arrays)
+def pairwise_popcount(left, right, row_chunk = ROW_CHUNK):
+    counts = np.empty((len(left), len(right)), dtype = np.int64)
+    for start in range(0, len(left), row_chunk):
+        chunk = left[start:start + row_chunk]
+        counts[start:start + row_chunk] = POPCOUNT[chunk[:, None, :] & right[None, :, :]].sum(axis = -1, dtype = np.int64)
+    return counts
+
+# Method to compute the Jaccard overlap and phi coefficient of every pair of rats (rat x rat arrays)
+# Also returns the number of seconds recorded for both rats
+def jaccard_and_phi(aligned, row_chunk = ROW_CHUNK):
+    values = aligned.to_numpy()
+    active = np.packbits(values >= 1, axis = 0).T
+    recorded = np.packbits(~np.isnan(values), axis = 0).T
+
+    both_active = pairwise_popcount(active, active, row_chunk)
+    # Seconds the first rat was active while the second rat was recorded (and the other way around)
+    first_active = pairwise_popcount(active, recorded, row_chunk)
+    second_active = first_active.T
+    common = pairwise_popcount(recorded, recorded, row_chunk)
+
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        jaccard = both_active / (first_active + second_active - both_active)
+        only_first = first_active - both_active
+        only_second = second_active - both_active
+        neither = common - both_active - only_first - only_second
+        phi = ((both_active * neither - only_first * only_second)
+               / np.sqrt(first_active.astype(float) * (common - first_active) * second_active * (common - second_active)))
+    return jaccard, phi, common
+
+# Method to cut the lags -max_lag to +max_lag out of the cross-correlation of every pair (rows of "first" with rows of "second")
+# Entry k of the inverse FFT is sum over t of first(t) * second(t + k); negative lags sit at the end
+def lag_window(first_spectra, second_spectra, fft_length, max_lag):
+    cross = np.fft.irfft(np.conj(first_spectra) * second_spectra, n = fft_length, axis = 1)
+    return np.concatenate([cross[:, fft_length - max_lag:], cross[:, :max_lag + 1]], axis = 1)
+
+# Method to compute the lagged cross-correlation of every pair of rats with FFTs
+# At every lag the correlation is the Pearson correlation over the seconds recorded for both rats (with their means and
+# variances over those seconds only), from FFT cross-correlations of the activity, the squared activity and the recorded seconds
+# Returns the pairs (first, second), the correlation at lag 0, the largest correlation within +/- max_lag and its lag (in sec)
+def lagged_cross_correlation(aligned, max_lag = MAX_LAG, pair_chunk = PAIR_CHUNK):
+    values = aligned.to_numpy(dtype = float)
+    recorded = ~np.isnan(values)
+    # Center every rat on its own recorded mean to keep the sums small; unrecorded seconds then add nothing to the sums
+    mean = np.nansum(values, axis = 0) / np.maximum(recorded.sum(axis = 0), 1)
+    centered = np.where(recorded, values - mean, 0)
+
+    # Zero-pad so that the circular correlation of the FFT does not wrap around within the lag window
+    fft_length = 1 << int(np.ceil(np.log2(len(values) + max_lag)))
+    activity_spectra = np.fft.rfft(centered, n = fft_length, axis = 0).T.astype(np.complex64)
+    square_spectra = np.fft.rfft(centered ** 2, n = fft_length, axis = 0).T.astype(np.complex64)
+    recorded_spectra = np.fft.rfft(recorded.astype(float), n = fft_length, axis = 0).T.astype(np.complex64)
+    del centered
+
+    first, second = np.triu_indices(values.shape[1], k = 1)
+    lags = np.arange(-max_lag, max_lag + 1)
+    zero_lag = np.empty(len(first))
+    peak = np.empty(len(first))
+    peak_lag = np.empty(len(first), dtype = np.int64)
+    for start in range(0, len(first), pair_chunk):
+        i = first[start:start + pair_chunk]
+        j = second[start:start + pair_chunk]
+        # Sums over the seconds recorded for both rats at every lag
+        common = np.round(lag_window(recorded_spectra[i], recorded_spectra[j], fft_length, max_lag))
+        sum_first = lag_window(activity_spectra[i], recorded_spectra[j], fft_length, max_lag)
+        sum_second = lag_window(recorded_spectra[i], activity_spectra[j], fft_length, max_lag)
+        squares_first = lag_window(square_spectra[i], recorded_spectra[j], fft_length, max_lag)
+        squares_second = lag_window(recorded_spectra[i], square_spectra[j], fft_length, max_lag)
+        products = lag_window(activity_spectra[i], activity_spectra[j], fft_length, max_lag)
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            covariance = products - sum_first * sum_second / common
+            variance_first = squares_first - sum_first ** 2 / common
+            variance_second = squares_second - sum_second ** 2 / common
+            # A rat without any change of activity over the common seconds has no correlation (the variance left is FFT rounding)
+            constant = (variance_first <= 1e-6 * common) | (variance_second <= 1e-6 * common) | (common < 2)
+            window = np.where(constant, np.nan, covariance / np.sqrt(variance_first * variance_second))
+        zero_lag[start:start + pair_chunk] = window[:, max_lag]
+        best = np.argmax(np.where(np.isnan(window), -np.inf, window), axis = 1)
+        peak[start:start + pair_chunk] = window[np.arange(len(i)), best]
+        peak_lag[start:start + pair_chunk] = lags[best]
+    return first, second, zero_lag, peak, peak_lag
+
+# Method to compute the synchrony of every pair of rats for one activity and summarize it per pair of diet groups
+# "frames" is a list of 1-second dataframes from times() and "groups" maps rat number (i.e. 2 for "Rat02") to diet group
+def synchrony_analysis(frames, groups, max_lag = MAX_LAG):
+    aligned = aligned_activity(frames)
+    rats = np.array([int(str(rat)[3:]) for rat in aligned.columns])
+    jaccard, phi, common = jaccard_and_phi(aligned)
+    first, second, zero_lag, peak, peak_lag = lagged_cross_correlation(aligned, max_lag)
+
+    by_pair = pd.DataFrame({"rat": rats[first], "group": groups.loc[rats[first]].to_numpy(),
+                            "other_rat": rats[second], "other_group": groups.loc[rats[second]].to_numpy(),
+                            "common_s": common[first, second],
+                            "jaccard": jaccard[first, second], "phi": phi[first, second],
+                            "zero_lag_r": zero_lag, "peak_r": peak, "peak_lag_s": peak_lag})
+
+    # Summarize within and across diet groups (the order of the 2 groups of a pair does not matter)
+    group_pair = np.sort(by_pair[["group", "other_group"]].to_numpy(dtype = str), axis = 1)
+    summary = by_pair.assign(group = group_pair[:, 0], other_group = group_pair[:, 1])
+    by_group = summary.groupby(["group", "other_group"])[["jaccard", "phi", "zero_lag_r", "peak_r", "peak_lag_s"]].agg(['mean', 'sem'])
+    by_group.columns = [column + "_" + statistic for column, statistic in by_group.columns]
+    by_group.insert(0, "pairs", summary.groupby(["group", "other_group"]).size())
+    by_group.insert(0, "within_group", by_group.index.get_level_values(0) == by_group.index.get_level_values(1))
+    return by_pair, by_group
@@ -0,0 +1,201 @@
+# Compact Column Types for Every Loaded Table
+# Used to load the raw events, binary activity, hourly totals, metafile, termination data and gene data with small dtypes for
+# Time-Restricted Feeding in the Active Phase Drives Periods of Rapid Food Consumption in Rats Fed a High-Fat, High-Sugar Diet with Liquid Sucrose
+# by Kush Attal, Julia Wickman Shihoko Kojima, Sarah N. Blythe, Natalia Toporikova
+#
+# pandas loads text as object strings, counts as float64 and the 1-second activity as int64/float64 (NaN marks the
+# seconds that were not recorded). The schemas below give every column of every table an explicit type:
+#   - "category":  text with few distinct values (behavior, status, rat Name, diet group, ...)
+#   - "uint"/"int": the smallest integer type that holds every value (whole-number floats without NaN are converted too)
+#   - "float":     kept as float64, so that the statistics are computed on the same numbers
+#   - "timedelta": clock text such as "0:17:15.152000"
+# The 1-second activity becomes a uint8 matrix (0/1, or counts for Zoomie) and a separate table of the intervals that
+# were not recorded (the validity mask, in the same start/end/rat layout as apply_gaps() in binary_activity.py).
+#
+# Print the memory of every table with default and compact types:
+#     python table_schema.py
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import pandas as pd
+import numpy as np
+import zipfile
+
+
+#----------------------------------------------------------
+# Define Table Schemas
+#----------------------------------------------------------
+# Raw events from get_dataframe() (the index is the event time)
+EVENT_SCHEMA = {"Subject": "category", "Behavior": "category", "Status": "category", "Time": "float", "Hour": "uint",
+                "Name": "category", "seconds.1": "float", "Real_Time_Hr": "float", "Act_Time": "timedelta", "source_row": "uint",
+                "source_workbook": "category"}
+
+# Hourly totals (food_total_by_hour.csv, sucrose_total_by_hour.csv) - every other column is an hour of seconds active
+HOURLY_SCHEMA = {"group": "category"}
+
+# Light/dark totals (food_total.csv, sucrose_total.csv)
+TOTAL_SCHEMA = {"light_food": "uint", "dark_food": "uint", "light_sucrose": "uint", "dark_sucrose": "uint", "group": "category"}
+
+# Metafile (diet and feeding schedule of every rat)
+METAFILE_SCHEMA = {"Diet": "category", "Feeding": "category"}
+
+# Termination data (2018VT_termination_data_master_document.csv) - every other column is a measurement
+MASTER_DATA_SCHEMA = {"Rat": "uint", "diet": "category", "feeding_schedule": "category", "group": "category", "final_BW": "uint"}
+
+
+#----------------------------------------------------------
+# Define Custom Methods
+#----------------------------------------------------------
+
+# Method to find the smallest integer type that holds every value of an array (unsigned if no value is negative)
+def smallest_integer(values, unsigned = True):
+    low = int(np.min(values)) if len(values) else 0
+    high = int(np.max(values)) if len(values) else 0
+    kinds = [np.uint8, np.uint16, np.uint32, np.uint64] if unsigned and low >= 0 else [np.int8, np.int16, np.int32, np.int64]
+    for kind in kinds:
+        if np.iinfo(kind).min <= low and high <= np.iinfo(kind).max:
+            return kind
+    return np.float64
+
+# Method to convert one column to a schema type - columns that do not fit (i.e. a "uint" column with NaN or fractions) are kept as they are
+def compact_column(column, kind):
+    if kind == "category":
+        return column.astype("category")
+    if kind == "timedelta":
+        return pd.to_timedelta(column.astype(str), errors = "coerce")
+    if kind in ("uint", "int"):
+        values = pd.to_numeric(column, errors = "coerce").to_numpy(dtype = float)
+        missing = np.isnan(values)
+        if missing.all() or not np.array_equal(values[~missing], np.round(values[~missing])):
+            return column
+        kind = smallest_integer(values[~missing], kind == "uint")
+        if not missing.any():
+            return pd.Series(values.astype(kind), index = column.index, name = column.name)
+        # Columns with NaN become nullable integers (i.e. UInt16) - the values plus a separate validity mask
+        return pd.Series(pd.arrays.IntegerArray(np.where(missing, 0, values).astype(kind), missing), index = column.index, name = column.name)
+    return column
+
+# Method to give every column of a table its schema type ("default" is used for columns that are not in the schema)
+def compact_frame(frame, schema, default = None):
+    frame = frame.copy()
+    for column in frame.columns:
+        kind = schema.get(column, default)
+        if kind is not None and kind != "float":
+            frame[column] = compact_column(frame[column], kind)
+    return frame
+
+# Method to compact an index of rat numbers (or any integers) to the smallest integer type
+def compact_index(frame):
+    if pd.api.types.is_integer_dtype(frame.index):
+        frame.index = pd.Index(frame.index.to_numpy().astype(smallest_integer(frame.index.to_numpy())), name = frame.index.name)
+    return frame
+
+# Method to turn 1-second activity (a dataframe from times() or a binary CSV file) into a uint8 activity matrix and the intervals that were not recorded
+# Returns the activity (NaN seconds are 0) and a dataframe of gaps with one row (start, end, rat) per unrecorded interval
+def compact_activity(times):
+    rats = [rat for rat in times.columns if rat != 'mean']
+    values = times[rats].to_numpy(dtype = float)
+    recorded = ~np.isnan(values)
+    activity = pd.DataFrame(np.where(recorded, values, 0).astype(np.uint8), index = times.index, columns = pd.Index(rats, name = times.columns.name))
+
+    # +1 where a gap starts and -1 one row after it ends (the same edge detection as bout_table() in bout_analytics.py)
+    edges = np.diff(np.pad((~recorded).astype(np.int8), ((1, 1), (0, 0))), axis = 0)
+    start_rat, start_row = np.nonzero(edges.T == 1)
+    _, stop_row = np.nonzero(edges.T == -1)
+    gaps = pd.DataFrame({"start": times.index[start_row], "end": times.index[stop_row - 1],
+                         "rat": pd.Categorical(np.asarray(rats)[start_rat], categories = rats)})
+    return activity, gaps
+
+# Method to unpack the gaps into a boolean validity mask (True where the rat was recorded) with the shape of the activity
+def validity_mask(activity, gaps):
+    mask = np.ones(activity.shape, dtype = bool)
+    columns = {rat: position for position, rat in enumerate(activity.columns)}
+    starts = activity.index.searchsorted(gaps["start"], side = "left")
+    ends = activity.index.searchsorted(gaps["end"], side = "right")
+    for start, end, rat in zip(starts, ends, gaps["rat"]):
+        mask[start:end, columns[rat]] = False
+    return pd.DataFrame(mask, index = activity.index, columns = activity.columns)
+
+# Method to turn a compact activity matrix and its gaps back into a float dataframe with NaN for unrecorded seconds (like times())
+def expand_activity(activity, gaps):
+    return activity.astype(float).where(validity_mask(activity, gaps))
+
+# Method to load a 1-second binary CSV file (i.e. Feeding_HFHS_AdLib_Binary.csv) as compact activity and gaps
+def read_binary_csv(file):
+    return compact_activity(pd.read_csv(file, index_col = 0, parse_dates = True))
+
+# Method to load an hourly totals file (food_total_by_hour.csv or sucrose_total_by_hour.csv) - seconds per hour fit in uint16
+def read_hourly_totals(file):
+    return compact_index(compact_frame(pd.read_csv(file, index_col = 0), HOURLY_SCHEMA, default = "uint"))
+
+# Method to load a light/dark totals file (food_total.csv or sucrose_total.csv)
+def read_totals(file):
+    return compact_index(compact_frame(pd.read_csv(file, index_col = 0), TOTAL_SCHEMA))
+
+# Method to turn compact totals back into float64 counts (NaN for hours that were not recorded) and the group as text, like pandas.read_csv gives them
+def expand_totals(frame):
+    counts = frame.drop(columns = ["group"]).astype(float)
+    counts["group"] = frame["group"].astype(str)
+    return counts
+
+# Method to load the metafile (diet and feeding schedule of every rat) from the daily weight log
+def read_metafile(file):
+    body_weight = pd.read_csv(file, index_col = 0)
+    return compact_index(compact_frame(body_weight[["Diet", "Feeding"]], METAFILE_SCHEMA))
+
+# Method to load the termination data (master_data) with the diet group of every rat
+def read_master_data(file):
+    master_data = pd.read_csv(file)
+    master_data["group"] = master_data.diet + ' ' + master_data.feeding_schedule
+    return compact_frame(master_data, MASTER_DATA_SCHEMA)
+
+# Method to load the gene data - the expression values stay float64 and the rat numbers become the smallest integer type
+def read_gene_data(file):
+    return compact_index(pd.read_csv(file, index_col = 0))
+
+# Method to compact the raw events of one diet group (a dataframe from get_dataframe())
+def compact_events(all_data):
+    return compact_frame(all_data, EVENT_SCHEMA)
+
+# Method to measure the memory of a table in bytes (including the text of object columns) - set "index" to False to leave out the index
+def table_bytes(table, index = True):
+    if isinstance(table, tuple):
+        return sum(table_bytes(part, index) for part in table)
+    return int(table.memory_usage(index = index, deep = True).sum())
+
+
+#----------------------------------------------------------
+# Report the Memory of Every Table
+#----------------------------------------------------------
+if __name__ == "__main__":
+    from binary_activity import get_dataframe
+    feeding_archive = zipfile.ZipFile("Feeding_Binary_CSV_Files.zip")
+    video_archive = zipfile.ZipFile("Raw Video Data.zip")
+    rows = []
+    raw_events = pd.concat([get_dataframe(diet, video_archive) for diet in ["Control_Restricted", "HFHS_Restricted", "Control_Adlib", "HFHS_Adlib"]])
+    rows.append(("raw events", table_bytes(raw_events), table_bytes(compact_events(raw_events))))
+    rat_days = []
+    for name in [name for name in feeding_archive.namelist() if name.endswith("_Binary.csv")]:
+        default = pd.read_csv(feeding_archive.open(name), index_col = 0, parse_dates = True)
+        compact = read_binary_csv(feeding_archive.open(name))
+        rows.append((name, table_bytes(default), table_bytes(compact)))
+        # The time index is shared by all rats of a diet group, so a rat-day is measured without it
+        rat_days.append((table_bytes(default, index = False), table_bytes(compact[0], index = False) + table_bytes(compact[1]), default.shape[1] * len(default) / 86400))
+    rows.append(("food_total_by_hour.csv", table_bytes(pd.read_csv(feeding_archive.open("food_total_by_hour.csv"), index_col = 0)),
+                 table_bytes(read_hourly_totals(feeding_archive.open("food_total_by_hour.csv")))))
+    rows.append(("food_total.csv", table_bytes(pd.read_csv(feeding_archive.open("food_total.csv"), index_col = 0)),
+                 table_bytes(read_totals(feeding_archive.open("food_total.csv")))))
+    body_weight = pd.read_csv("2018VT - daily weight log.csv", index_col = 0)
+    rows.append(("metafile", table_bytes(body_weight[["Diet", "Feeding"]]), table_bytes(read_metafile("2018VT - daily weight log.csv"))))
+    master_data = pd.read_csv("2018VT_termination_data_master_document.csv")
+    master_data["group"] = master_data.diet + ' ' + master_data.feeding_schedule
+    rows.append(("master_data", table_bytes(master_data), table_bytes(read_master_data("2018VT_termination_data_master_document.csv"))))
+    rows.append(("gene_data", table_bytes(pd.read_csv("qPCR_normalized_gapdph.csv", index_col = 0)), table_bytes(read_gene_data("qPCR_normalized_gapdph.csv"))))
+
+    default_bytes, compact_bytes, days = np.array(rat_days).sum(axis = 0)
+    rows.append(("1-second activity per rat-day", round(default_bytes / days), round(compact_bytes / days)))
+    report = pd.DataFrame(rows, columns = ["table", "default_bytes", "compact_bytes"]).set_index("table")
+    report["reduction"] = (report["default_bytes"] / report["compact_bytes"]).round(1)
+    print(report.to_string())
@@ -0,0 +1,215 @@
+# Incremental Ingestion of Raw Video Workbooks from a Watched Folder
+# Used to keep the binary CSV archives of Creating_Binary_CSV_Files.py up to date while the videos are being scored for
+# Time-Restricted Feeding in the Active Phase Drives Periods of Rapid Food Consumption in Rats Fed a High-Fat, High-Sugar Diet with Liquid Sucrose
+# by Kush Attal, Julia Wickman Shihoko Kojima, Sarah N. Blythe, Natalia Toporikova
+#
+# Scorers save their workbooks (.xlsx or .xls, named like the workbooks of Raw Video Data.zip, i.e. Rat12_hour3_Control_Restricted.xlsx)
+# into one folder. watch_folder.py checks the folder every few seconds and:
+#   - reads every new or changed workbook once, as soon as its size and modification time stop changing; the events are
+#     kept in <output>/parsed/ so that a restart does not read the workbooks again
+#   - logs the workbooks that cannot be read (i.e. still being copied, or truncated) and reads them again once they change
+#   - rebuilds the 1-second activity (times()) of the diet groups that received a workbook - the other groups are reused
+#   - writes Feeding_Binary_CSV_Files.zip and Sucrose_Binary_CSV_Files.zip with the binary CSV files, the normalized activity
+#     and its counts, the light/dark totals and the hourly totals of every rat scored so far
+# Every archive is built next to its final path and moved into place with os.replace(), so a reader always sees either
+# the previous or the new archive, never a half-written one. The bout, synchrony, circadian and behavior sequence files
+# need the whole recording - run Creating_Binary_CSV_Files.py once scoring is done.
+#
+#     python watch_folder.py incoming/ --output Live --interval 10
+#     python watch_folder.py incoming/ --output Live --once          (process the folder once and stop)
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import pandas as pd
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from binary_activity import light_summary, read_workbook, add_binary, times, hourly_totals
+from cohort_config import load_cohort, sucrose_groups, normalized_groups, light_on
+from group_aggregates import group_counts, save_counts
+
+
+#----------------------------------------------------------
+# Define Custom Methods
+#----------------------------------------------------------
+
+# Method to start an empty watch state - the events of every workbook read so far, the stamp of every workbook that could
+# not be read and the 1-second activity of every diet group
+def new_state():
+    return {"stamps": {}, "events": {}, "failed": {}, "feeding": {}, "sucrose": {}}
+
+# Method to find the diet group of a workbook from the end of its file name (like get_dataframe()) - None for other files
+def workbook_group(name, cohort):
+    if name.startswith(("~$", ".")):
+        return None
+    for group in cohort["groups"]:
+        if name.endswith((group["archive_name"] + ".xlsx", group["archive_name"] + ".xls")):
+            return group
+    return None
+
+# Method to list the workbooks of the watched folder with their stamp (size and modification time)
+def scan_folder(folder, cohort):
+    stamps = {}
+    for entry in os.scandir(folder):
+        if entry.is_file() and workbook_group(entry.name, cohort) is not None:
+            status = entry.stat()
+            stamps[entry.name] = [status.st_size, status.st_mtime_ns]
+    return stamps
+
+# Method to load the events read in an earlier run from <output>/parsed/
+def load_parsed(output):
+    state = new_state()
+    path = os.path.join(output, "parsed", "stamps.json")
+    if os.path.exists(path):
+        with open(path) as file:
+            for name, stamp in json.load(file).items():
+                events = os.path.join(output, "parsed", name + ".pkl")
+                if os.path.exists(events):
+                    state["stamps"][name] = stamp
+                    state["events"][name] = pd.read_pickle(events)
+    return state
+
+# Method to fold the new, changed and removed workbooks into the state - returns the names of the diet groups that changed
+# "ready" maps the workbooks to read to their stamp; workbooks that are not in "present" (the folder) anymore are removed
+# A workbook that cannot be read (i.e. a truncated .xlsx) is logged and keeps its previous events; its stamp is not
+# recorded, so it is read again once it changes
+def fold_workbooks(state, folder, ready, present, output, cohort):
+    changed = set()
+    os.makedirs(os.path.join(output, "parsed"), exist_ok = True)
+    state["failed"] = {name: stamp for name, stamp in state["failed"].items() if present.get(name) == stamp}
+    for name, stamp in sorted(ready.items()):
+        if state["stamps"].get(name) == stamp or state["failed"].get(name) == stamp:
+            continue
+        try:
+            events = read_workbook(os.path.join(folder, name))
+        except Exception as error:
+            print(time.strftime("%H:%M:%S") + " could not read " + name + " (" + type(error).__name__ + ": " + str(error) + ") - it is read again once it changes", flush = True)
+            state["failed"][name] = stamp
+            continue
+        state["events"][name] = events
+        state["stamps"][name] = stamp
+        state["events"][name].to_pickle(os.path.join(output, "parsed", name + ".pkl"))
+        changed.add(workbook_group(name, cohort)["name"])
+    for name in sorted(set(state["stamps"]) - set(present)):
+        del state["stamps"][name], state["events"][name]
+        os.remove(os.path.join(output, "parsed", name + ".pkl"))
+        changed.add(workbook_group(name, cohort)["name"])
+    write_json(os.path.join(output, "parsed", "stamps.json"), state["stamps"])
+    return changed
+
+# Method to rebuild the 1-second feeding (and sucrose) activity of one diet group from the events of all its workbooks
+def refresh_group(state, group, cohort):
+    names = sorted(name for name in state["events"] if workbook_group(name, cohort)["name"] == group["name"])
+    state["feeding"].pop(group["name"], None)
+    state["sucrose"].pop(group["name"], None)
+    if not names:
+        return
+    binary = add_binary(pd.concat([state["events"][name] for name in names]).sort_index())
+    state["feeding"][group["name"]] = times('Feeding', binary, group["name"], cohort = cohort)
+    if group["sucrose"]:
+        state["sucrose"][group["name"]] = times('Sucrose', binary, group["name"], cohort = cohort)
+
+# Method to write a JSON file through a temporary file next to it, so that the file is replaced in one step
+def write_json(path, data):
+    handle, temporary = tempfile.mkstemp(dir = os.path.dirname(os.path.abspath(path)), prefix = "." + os.path.basename(path), suffix = ".tmp")
+    with os.fdopen(handle, "w") as file:
+        json.dump(data, file, indent = 2)
+    os.replace(temporary, path)
+
+# Method to write the files of one activity (the layout of Creating_Binary_CSV_Files.py) into "folder"
+# "frames" maps diet group name to 1-second activity, "groups" lists the diet groups in the row order of the output files
+def write_activity_files(folder, activity, frames, binary_frames, groups, metafile, cohort, total_columns, prefix):
+    groups = [group for group in groups if group["name"] in frames]
+    if not groups:
+        return
+    normalized = pd.concat([frames[group["name"]]['mean'] for group in normalized_groups(groups)], axis = 1)
+    normalized.sort_index().fillna(0).to_csv(os.path.join(folder, activity + "_Normalized_Activity.csv"), index = True, index_label = "Date_Time",
+                                             header = [group["label"] for group in normalized_groups(groups)], date_format='%Y-%m-%d %H:%M:%S')
+    save_counts(os.path.join(folder, activity + "_Activity_Counts.npz"), group_counts({group["label"]: frames[group["name"]] for group in normalized_groups(groups)}))
+    for group in groups:
+        binary_frames[group["name"]].to_csv(os.path.join(folder, activity + "_" + group["file_name"] + "_Binary.csv"), index = True,
+                                            columns = frames[group["name"]].columns[:-1], date_format='%Y-%m-%d %H:%M:%S', index_label = "Date_Time")
+
+    totals = pd.DataFrame(columns = total_columns)
+    for group in groups:
+        totals = light_summary(totals, frames[group["name"]], light_on(cohort))
+    totals['group'] = metafile.loc[totals.index].Diet + ' ' + metafile.loc[totals.index].Feeding
+    totals.to_csv(os.path.join(folder, prefix + "_total.csv"))
+
+    hourly_frame = pd.concat([hourly_totals(frames[group["name"]]) for group in groups])
+    hourly_frame.index = hourly_frame.index.map(lambda x: int(str(x)[3:]))
+    hourly_frame['group'] = metafile.loc[hourly_frame.index].Diet + ' ' + metafile.loc[hourly_frame.index].Feeding
+    hourly_frame.to_csv(os.path.join(folder, prefix + "_total_by_hour.csv"))
+
+# Method to rebuild the Feeding and Sucrose archives in "output" - every archive is replaced in one step
+def write_archives(state, output, cohort):
+    body_weight = pd.read_csv(cohort["metafile"]).T
+    body_weight.columns = body_weight.iloc[0]
+    metafile = body_weight.iloc[1:3].T
+    # The sucrose binary CSV files hold the feeding activity, like the archives of Creating_Binary_CSV_Files.py
+    archives = [("Feeding_Binary_CSV_Files", "Feeding", state["feeding"], state["feeding"], cohort["groups"], ["light_food", "dark_food"], "food"),
+                ("Sucrose_Binary_CSV_Files", "Sucrose", state["sucrose"], state["feeding"], sucrose_groups(cohort), ["light_sucrose", "dark_sucrose"], "sucrose")]
+    for archive, activity, frames, binary_frames, groups, total_columns, prefix in archives:
+        if not any(group["name"] in frames for group in groups):
+            continue
+        # Build the archive in a temporary folder of "output" (the same file system), then move it into place
+        work = tempfile.mkdtemp(dir = output, prefix = "." + archive)
+        try:
+            folder = os.path.join(work, archive)
+            os.mkdir(folder)
+            write_activity_files(folder, activity, frames, binary_frames, groups, metafile, cohort, total_columns, prefix)
+            os.replace(shutil.make_archive(folder, 'zip', folder), os.path.join(output, archive + ".zip"))
+        finally:
+            shutil.rmtree(work, ignore_errors = True)
+
+# Method to process the workbooks that are ready - returns the names of the diet groups that changed
+def process_folder(state, folder, ready, present, output, cohort):
+    changed = fold_workbooks(state, folder, ready, present, output, cohort)
+    for group in cohort["groups"]:
+        if group["name"] in changed:
+            refresh_group(state, group, cohort)
+    if changed:
+        write_archives(state, output, cohort)
+        status = {"workbooks": sorted(state["stamps"]), "failed": sorted(state["failed"]), "groups": sorted(state["feeding"]), "refreshed": time.strftime("%Y-%m-%d %H:%M:%S")}
+        write_json(os.path.join(output, "watch_status.json"), status)
+    return changed
+
+# Method to watch a folder - a workbook is read once its stamp is the same in 2 checks in a row (the scorer finished saving it)
+# Set "once" to True to process the folder as it is and return; "checks" stops the watch after that many checks (None watches forever)
+def watch(folder, output, cohort = None, interval = 10, once = False, checks = None):
+    cohort = cohort or load_cohort()
+    os.makedirs(output, exist_ok = True)
+    state = load_parsed(output)
+    for group in cohort["groups"]:
+        refresh_group(state, group, cohort)
+    previous = {}
+    check = 0
+    while True:
+        present = scan_folder(folder, cohort)
+        ready = present if once else {name: stamp for name, stamp in present.items() if previous.get(name) == stamp}
+        changed = process_folder(state, folder, ready, present, output, cohort)
+        if changed:
+            print(time.strftime("%H:%M:%S") + " refreshed " + ", ".join(sorted(changed)) + " (" + str(len(state["stamps"])) + " workbooks)", flush = True)
+        check += 1
+        if once or (checks is not None and check >= checks):
+            return state
+        previous = present
+        time.sleep(interval)
+
+
+#----------------------------------------------------------
+# Watch a Folder from the Command Line
+#----------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Fold raw video workbooks into the binary CSV archives as they are scored")
+    parser.add_argument("folder", help = "folder the scorers save their workbooks to")
+    parser.add_argument("--output", default = "Live", help = "folder of the archives (and of the events read so far)")
+    parser.add_argument("--interval", type = float, default = 10, help = "seconds between 2 checks of the folder")
+    parser.add_argument("--once", action = "store_true", help = "process the folder once and stop")
+    arguments = parser.parse_args()
+    watch(arguments.folder, arguments.output, interval = arguments.interval, once = arguments.once)
@@ -0,0 +1,353 @@
+# Streaming Reader for the Raw Video Workbooks
+# Used by binary_activity.py to read the scored events of the .xlsx workbooks for
+# Time-Restricted Feeding in the Active Phase Drives Periods of Rapid Food Consumption in Rats Fed a High-Fat, High-Sugar Diet with Liquid Sucrose
+# by Kush Attal, Julia Wickman Shihoko Kojima, Sarah N. Blythe, Natalia Toporikova
+#
+# An .xlsx workbook is a zip file of XML parts. read_events() streams the worksheet part row by row straight from the
+# zip member and keeps only the cells of the columns the pipeline uses (seconds, Behavior, Status and Name), instead of
+# loading every cell, style and column of the workbook. The event times are converted from Excel serial dates exactly
+# like pandas.read_excel does (to the millisecond).
+#
+# columnar_archive() reads every workbook of a video archive once and keeps the events in a compact columnar file next
+# to the archive ("Raw Video Data.events.npz"): one int64 array of event times and one small integer code array per
+# text column. Later runs read that file instead of the workbooks, as long as the workbooks of the archive are unchanged:
+#     python workbook_reader.py "Raw Video Data.zip"
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import pandas as pd
+import numpy as np
+import html
+import os
+import re
+import sys
+import tempfile
+import zipfile
+
+
+#----------------------------------------------------------
+# Define Default Settings
+#----------------------------------------------------------
+# Columns of the workbooks used by the pipeline - "seconds" (the event time) becomes the index
+EVENT_COLUMNS = ["seconds", "Behavior", "Status", "Name"]
+
+# Text columns kept as category codes in the columnar file
+TEXT_COLUMNS = ["Behavior", "Status", "Name"]
+
+# Version of read_events() and of the columnar file layout - raise it whenever either changes, so that the columnar files
+# written by an earlier version are converted again
+READER_VERSION = 1
+
+# Day 0 of Excel serial dates (the 1900 and the 1904 date systems)
+EPOCH_1900 = np.datetime64("1899-12-30", "ns")
+EPOCH_1904 = np.datetime64("1904-01-01", "ns")
+
+# Milliseconds in a day
+DAY_MS = 86400000
+
+# Bytes of a worksheet part read at a time
+BLOCK_SIZE = 2**20
+
+# Rows and cells of a worksheet part (with or without a namespace prefix) and the parts of a cell
+ROW = re.compile(rb"<(?:\w+:)?row\b[^>]*?(?:/>|>(.*?)</(?:\w+:)?row>)", re.S)
+CELL = re.compile(rb"<(?:\w+:)?c\b([^>]*?)(?:/>|>(.*?)</(?:\w+:)?c>)", re.S)
+REFERENCE = re.compile(rb'\br="([A-Z]+)')
+KIND = re.compile(rb'\bt="(\w+)"')
+SHARED_STRING = re.compile(rb"<(?:\w+:)?si>(.*?)</(?:\w+:)?si>", re.S)
+PHONETIC = re.compile(rb"<(?:\w+:)?rPh\b.*?</(?:\w+:)?rPh>", re.S)
+TEXT = re.compile(rb"<(?:\w+:)?[vt]\b[^>]*>([^<]*)</(?:\w+:)?[vt]>")
+
+
+#----------------------------------------------------------
+# Define Custom Methods
+#----------------------------------------------------------
+
+# Method to read the shared strings of a workbook (text cells of type "s" hold a position in this list)
+def shared_strings(workbook):
+    if "xl/sharedStrings.xml" not in workbook.namelist():
+        return []
+    strings = []
+    for item in SHARED_STRING.findall(workbook.read("xl/sharedStrings.xml")):
+        # Phonetic runs (<rPh>) are not part of the text
+        text = b"".join(TEXT.findall(PHONETIC.sub(b"", item))).decode("utf-8")
+        strings.append(html.unescape(text) if "&" in text else text)
+    return strings
+
+# Method to find the day 0 of the serial dates of a workbook
+def workbook_epoch(workbook):
+    settings = workbook.read("xl/workbook.xml")
+    return EPOCH_1904 if re.search(rb'date1904="(1|true)"', settings) else EPOCH_1900
+
+# Method to find the worksheet part of the first sheet of a workbook
+def first_sheet(workbook):
+    parts = sorted(name for name in workbook.namelist() if re.fullmatch(r"xl/worksheets/sheet\d+\.xml", name))
+    return "xl/worksheets/sheet1.xml" if "xl/worksheets/sheet1.xml" in parts else parts[0]
+
+# Method to turn the letters of a cell reference (i.e. "C" of "C12") into a column position (0 for "A")
+def column_position(reference):
+    position = 0
+    for letter in reference:
+        if letter.isdigit():
+            break
+        position = position * 26 + ord(letter) - 64
+    return position - 1
+
+# Method to turn the text of a cell into its value - numbers become floats, text stays text and empty or error cells become None
+def cell_value(kind, text, strings):
+    if kind == "inlineStr" or kind == "str":
+        return text
+    if text == "" or kind == "e":
+        return None
+    if kind == "s":
+        return strings[int(text)]
+    if kind == "b":
+        return text == "1"
+    return float(text)
+
+# Method to build the pattern of the rows and of the cells of some columns (a set of column positions) - other cells are skipped by the pattern
+# Every match is either the start of a row (empty groups) or a cell: (attributes before the reference, column letters, attributes after it, content)
+def row_pattern(columns):
+    letters = b"|".join(column_letters(position).encode() for position in sorted(columns))
+    return re.compile(rb"<(?:\w+:)?row\b|<(?:\w+:)?c\b([^>]*?)\br=\"(" + letters + rb")\d+\"([^>]*?)(?:/>|>(.*?)</(?:\w+:)?c>)", re.S)
+
+# Method to turn a column position into the letters of a cell reference (i.e. "C" for 2)
+def column_letters(position):
+    letters = ""
+    position += 1
+    while position > 0:
+        position, remainder = divmod(position - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+# Method to turn the content and the attributes of one cell into its value
+def read_cell(attributes, content, strings):
+    kind = KIND.search(attributes)
+    text = b"".join(TEXT.findall(content)).decode("utf-8")
+    if "&" in text:
+        text = html.unescape(text)
+    return cell_value(kind.group(1).decode() if kind else "n", text, strings)
+
+# Method to read the cells of one row (the content of a <row> element) - returns a {column position: value} dictionary of the cells in "columns"
+# (every cell when "columns" is empty) and whether every cell has a reference
+def read_row(content, strings, columns):
+    values = {}
+    position = 0
+    referenced = True
+    for attributes, cell in CELL.findall(content):
+        reference = REFERENCE.search(attributes)
+        referenced = referenced and reference is not None
+        position = column_position(reference.group(1).decode()) if reference else position
+        if not columns or position in columns:
+            values[position] = read_cell(attributes, cell, strings)
+        position += 1
+    return values, referenced
+
+# Method to stream the rows of a worksheet part (an open file) - yields a {column position: value} dictionary for every row,
+# with the values of the cells in "columns" (a set of column positions - every column while it is empty, so the caller
+# can read the header row and then add the columns it needs)
+# The part is read in blocks of "block_size" bytes and the complete rows of a block are scanned with regular expressions,
+# so only one block is held in memory, no element tree is built and the cells of other columns are never decoded
+def stream_rows(stream, strings, columns, block_size = BLOCK_SIZE):
+    pending = b""
+    pattern = None
+    positions = None
+    while True:
+        block = stream.read(block_size)
+        pending += block
+        # Scan the complete rows, keep the rest for the next block
+        last = pending.rfind(b"</row>") + 6 if block else len(pending)
+        if last < 6 and block:
+            continue
+        begin = 0
+        if pattern is None:
+            for row in ROW.finditer(pending, 0, last):
+                values, referenced = read_row(row.group(1) or b"", strings, columns)
+                yield values
+                begin = row.end()
+                # Cells without a reference can only be found by counting, so the pattern of the columns is only used when every cell has one
+                if columns and referenced:
+                    pattern = row_pattern(columns)
+                    positions = {column_letters(position).encode(): position for position in columns}
+                    break
+        if pattern is not None:
+            values = None
+            for before, letters, after, cell in pattern.findall(pending, begin, last):
+                if not letters:
+                    if values is not None:
+                        yield values
+                    values = {}
+                else:
+                    values[positions[letters]] = read_cell(before + after, cell, strings)
+            if values is not None:
+                yield values
+        if not block:
+            return
+        pending = pending[last:]
+
+# Method to turn Excel serial dates into datetime64 values, rounded to the millisecond like pandas.read_excel (through openpyxl)
+def serial_dates(values, epoch = EPOCH_1900):
+    values = np.asarray(values, dtype = float)
+    days = np.floor(values)
+    milliseconds = np.round((values - days) * DAY_MS)
+    recorded = ~np.isnan(values)
+    dates = np.full(len(values), np.datetime64("NaT"), dtype = "datetime64[ns]")
+    dates[recorded] = (epoch + days[recorded].astype(np.int64) * np.timedelta64(1, "D")
+                       + milliseconds[recorded].astype(np.int64) * np.timedelta64(1, "ms"))
+    return dates
+
+# Method to read the events of one .xlsx workbook (a path or an open file) - only the cells of EVENT_COLUMNS are kept
+# Returns the columns of EVENT_COLUMNS (the event time as index) and the workbook row of every event ("source_row", row 1 is the header)
+def read_events(file):
+    with zipfile.ZipFile(file) as workbook:
+        strings = shared_strings(workbook)
+        epoch = workbook_epoch(workbook)
+        sheet = first_sheet(workbook)
+
+        with workbook.open(sheet) as stream:
+            wanted = set()
+            rows = stream_rows(stream, strings, wanted)
+            # Positions of the needed columns - the first column of each name, like pandas.read_excel
+            header = {}
+            for position, name in sorted(next(rows, {}).items()):
+                header.setdefault(name, position)
+            missing = [column for column in EVENT_COLUMNS if column not in header]
+            if missing:
+                raise ValueError("workbook has no " + ", ".join(missing) + " column")
+            positions = [header[column] for column in EVENT_COLUMNS]
+            wanted.update(positions)
+            values = [[row.get(position) for position in positions] for row in rows]
+
+    columns = list(zip(*values)) if values else [()] * len(EVENT_COLUMNS)
+    seconds = np.array([np.nan if value is None else value for value in columns[0]], dtype = float)
+    events = pd.DataFrame({column: np.array([np.nan if value is None else value for value in values], dtype = object)
+                           for column, values in zip(EVENT_COLUMNS[1:], columns[1:])},
+                          index = pd.DatetimeIndex(serial_dates(seconds, epoch), name = "seconds"))
+    # Keep the workbook row of every event (row 1 is the header) so that annotation problems can be traced back
+    events['source_row'] = np.arange(len(events)) + 2
+    return events
+
+# Method to find the columnar file of a video archive (i.e. "Raw Video Data.events.npz" for "Raw Video Data.zip")
+def columnar_path(archive_path):
+    return os.path.splitext(archive_path)[0] + ".events.npz"
+
+# Method to list the workbooks of a video archive and the CRC-32 of each (to tell if a columnar file is up to date)
+def archive_workbooks(video_archive):
+    return [(info.filename, info.CRC) for info in video_archive.infolist()
+            if info.filename.endswith(".xlsx") and not info.filename.startswith("__MACOSX")]
+
+# Method to read every workbook of a video archive once and write the events to a columnar file
+# Text is stored as category codes (-1 for empty cells) and the event times as int64 nanoseconds; returns False (and writes nothing)
+# when a text column holds numbers, which the codes cannot keep apart from text
+def convert_archive(video_archive, path):
+    workbooks = archive_workbooks(video_archive)
+    frames = [read_events(video_archive.open(name)) for name, _ in workbooks]
+    arrays = {"reader_version": np.array(READER_VERSION),
+              "workbooks": np.array([name for name, _ in workbooks], dtype = str),
+              "crc": np.array([crc for _, crc in workbooks], dtype = np.uint32),
+              "lengths": np.array([len(events) for events in frames], dtype = np.int64),
+              "seconds": np.concatenate([events.index.to_numpy(dtype = "datetime64[ns]").view(np.int64) for events in frames] or [np.empty(0, np.int64)])}
+    for column in TEXT_COLUMNS:
+        values = pd.Series(np.concatenate([events[column].to_numpy(dtype = object) for events in frames] or [np.empty(0, object)]), dtype = object)
+        if not values.dropna().map(lambda value: isinstance(value, str)).all():
+            return False
+        categories = pd.Categorical(values)
+        arrays[column + "_codes"] = categories.codes
+        arrays[column + "_categories"] = np.array(categories.categories, dtype = str)
+    # Write to a file of its own next to the final file and move it into place, so that a stopped conversion never leaves half a
+    # file behind and runs converting the same archive at the same time do not write into each other's file
+    handle, temporary = tempfile.mkstemp(dir = os.path.dirname(os.path.abspath(path)), prefix = "." + os.path.basename(path), suffix = ".tmp")
+    try:
+        with os.fdopen(handle, "wb") as file:
+            np.savez_compressed(file, **arrays)
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+    return True
+
+# Method to load a columnar file - returns its arrays and the first event of every workbook
+def load_columnar(path):
+    with np.load(path) as data:
+        columnar = {key: data[key] for key in data.files}
+    columnar["starts"] = np.concatenate([[0], np.cumsum(columnar["lengths"])])
+    columnar["positions"] = {name: position for position, name in enumerate(columnar["workbooks"])}
+    return columnar
+
+# Method to open the columnar file of a video archive (a path) - the file is created, or created again when a workbook of the
+# archive was added, removed or changed, the file was written by another READER_VERSION or it cannot be loaded (i.e. it is
+# damaged), by reading every workbook once; returns None when the events cannot be stored in columns
+def columnar_archive(archive_path):
+    path = columnar_path(archive_path)
+    with zipfile.ZipFile(archive_path) as video_archive:
+        workbooks = archive_workbooks(video_archive)
+        if os.path.exists(path):
+            # A damaged file (i.e. cut short) is converted again like an outdated one
+            try:
+                columnar = load_columnar(path)
+                if (int(columnar.get("reader_version", 0)) == READER_VERSION
+                        and list(zip(columnar["workbooks"].tolist(), columnar["crc"].tolist())) == workbooks):
+                    return columnar
+            except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+                pass
+        if not convert_archive(video_archive, path):
+            return None
+    return load_columnar(path)
+
+# Method to list the rows of the events of some workbooks (names in the video archive) in a columnar file, in the order of "names"
+def columnar_rows(columnar, names):
+    rows = [np.arange(columnar["starts"][columnar["positions"][name]], columnar["starts"][columnar["positions"][name] + 1]) for name in names]
+    return np.concatenate(rows) if rows else np.empty(0, dtype = np.int64)
+
+# Method to read the events of some workbooks (names in the video archive) from a columnar file, in the layout of read_events()
+# The events of the workbooks follow each other in the order of "names", like the workbooks read one after the other
+# With "start" and/or "end" only the events from "start" (included) to "end" (not included) are read, so a long recording can be
+# read one window at a time
+def columnar_events(columnar, names, start = None, end = None):
+    rows = columnar_rows(columnar, names)
+    # Workbook row of every event (row 1 is the header) and the file name of its workbook
+    lengths = [columnar["lengths"][columnar["positions"][name]] for name in names]
+    source_rows = np.concatenate([np.arange(length) + 2 for length in lengths] or [np.empty(0, dtype = np.int64)])
+    source_workbooks = np.repeat(np.array([os.path.basename(name) for name in names], dtype = object), lengths)
+    if start is not None or end is not None:
+        seconds = columnar["seconds"][rows]
+        keep = np.ones(len(rows), dtype = bool)
+        if start is not None:
+            keep &= seconds >= pd.Timestamp(start).value
+        if end is not None:
+            keep &= seconds < pd.Timestamp(end).value
+        rows, source_rows, source_workbooks = rows[keep], source_rows[keep], source_workbooks[keep]
+    events = pd.DataFrame({column: np.append(columnar[column + "_categories"].astype(object), np.nan)[columnar[column + "_codes"][rows]]
+                           for column in TEXT_COLUMNS},
+                          index = pd.DatetimeIndex(columnar["seconds"][rows].view("datetime64[ns]"), name = "seconds"))
+    events['source_row'] = source_rows
+    events['source_workbook'] = source_workbooks
+    return events
+
+# Method to find the first and last event and the rats with events of every behavior of some workbooks in a columnar file,
+# without reading the events - returns (first, last, {behavior: sorted rat Names}), like activity_rats() on the events
+def columnar_overview(columnar, names):
+    rows = columnar_rows(columnar, names)
+    seconds = columnar["seconds"][rows]
+    first = pd.Timestamp(seconds.min()) if len(rows) else pd.NaT
+    last = pd.Timestamp(seconds.max()) if len(rows) else pd.NaT
+    pairs = np.unique(np.stack([columnar["Behavior_codes"][rows], columnar["Name_codes"][rows]]).astype(np.int64), axis = 1)
+    rats = {}
+    for behavior_code, name_code in pairs.T:
+        if behavior_code >= 0 and name_code >= 0:
+            rats.setdefault(str(columnar["Behavior_categories"][behavior_code]), []).append(str(columnar["Name_categories"][name_code]))
+    return first, last, {behavior: np.sort(np.array(names, dtype = object)) for behavior, names in rats.items()}
+
+
+#----------------------------------------------------------
+# Convert a Video Archive Once
+#----------------------------------------------------------
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        raise SystemExit("Usage: python workbook_reader.py <video archive.zip>")
+    columnar = columnar_archive(sys.argv[1])
+    if columnar is None:
+        raise SystemExit("The events of " + sys.argv[1] + " hold numbers in a text column and cannot be stored in columns")
+    print(columnar_path(sys.argv[1]) + ": " + str(len(columnar["workbooks"])) + " workbooks, " + str(len(columnar["seconds"])) + " events, "
+          + str(os.path.getsize(columnar_path(sys.argv[1]))) + " bytes")
@@ -0,0 +1,190 @@
+# Scaling Benchmarks for Creating Binary Activity Data
+# Times and memory-profiles every stage of the binary activity pipeline (Data for figures/binary_activity.py)
+# on synthetic cohorts that are 1x, 10x, 100x and 1000x the size of the recorded cohort
+#
+# Usage (from the repository folder):
+#     python benchmarks/run_benchmarks.py --scales 1,10,100,1000
+#
+# Each scale runs in its own process (so that peak memory is measured per scale and a scale that runs out of
+# memory or time does not stop the others). One JSON record per stage is appended to benchmarks/benchmark_history.jsonl
+# Every stage runs twice: once for the wall and CPU times and once under tracemalloc for the peak traced memory, so that
+# tracing does not slow down the timed pass
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+
+BENCHMARK_FOLDER = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_FOLDER = os.path.dirname(BENCHMARK_FOLDER)
+sys.path.insert(0, os.path.join(REPOSITORY_FOLDER, "Data for figures"))
+from instrumentation import reset_peak_rss, peak_rss_mb
+
+
+#----------------------------------------------------------
+# Define Custom Methods
+#----------------------------------------------------------
+
+# Method to run one pipeline stage and measure wall time, CPU time, peak resident memory and peak (traced) memory
+# The times and the resident memory come from an untraced pass and the traced memory from a second pass under tracemalloc
+# The resident memory peak is reset before the stage where the system allows it ("peak_rss_mb"); otherwise the record holds the
+# peak of the whole worker process up to the end of the stage ("process_peak_rss_mb")
+# Returns the result of the stage and a record for the benchmark history
+def measure(stage, function, *arguments, rows = None):
+    peak_rss_key = "peak_rss_mb" if reset_peak_rss() else "process_peak_rss_mb"
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    result = function(*arguments)
+    cpu_time = time.process_time() - cpu_start
+    wall_time = time.perf_counter() - wall_start
+    peak_rss = peak_rss_mb()
+    del result
+    tracemalloc.start()
+    result = function(*arguments)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    if rows is None and hasattr(result, "shape"):
+        rows = int(result.shape[0])
+    record = {"stage": stage, "wall_s": round(wall_time, 4), "cpu_s": round(cpu_time, 4),
+              "peak_mb": round(peak / 2**20, 2), peak_rss_key: peak_rss, "rows": rows, "status": "ok"}
+    return result, record
+
+# Method to find the commit the benchmark runs against, so that regressions can be traced to a commit
+def current_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd = REPOSITORY_FOLDER,
+                                       stderr = subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Method to run all pipeline stages for a single scale (runs inside the worker process)
+def run_scale(scale, days, seed, write_workbooks):
+    import pandas as pd
+    import numpy as np
+    from binary_activity import light_summary, get_dataframe, add_binary, times
+    from synthetic_cohort import synthetic_cohort, compiled_group, write_video_archive, DEFAULT_GROUPS, COHORT_GROUPS
+    # Import the statistics libraries up front so that their import time is not counted in the "statistics" stage
+    import pingouin
+    import statsmodels.stats.multicomp
+
+    records = []
+    cohort, record = measure("generate_cohort", lambda: synthetic_cohort(DEFAULT_GROUPS, scale, days, seed = seed))
+    record["rows"] = int(sum(len(events) for rats in cohort.values() for events in rats.values()))
+    records.append(record)
+
+    with tempfile.TemporaryDirectory() as folder:
+        # Ingestion - read the workbooks back from a zip archive exactly like Creating_Binary_CSV_Files.py
+        compiled = {}
+        if write_workbooks:
+            archive_path = os.path.join(folder, "Raw Video Data.zip")
+            _, record = measure("write_workbooks", write_video_archive, cohort, archive_path, rows = records[0]["rows"])
+            records.append(record)
+            video_archive = zipfile.ZipFile(archive_path)
+            for diet in cohort:
+                compiled[diet], record = measure("get_dataframe", get_dataframe, diet, video_archive)
+                record["group"] = diet
+                records.append(record)
+        else:
+            for diet in cohort:
+                compiled[diet] = compiled_group(cohort, diet)
+
+        for diet in cohort:
+            binary, record = measure("add_binary", add_binary, compiled[diet])
+            record["group"] = diet
+            records.append(record)
+
+            # times() applies the restricted feeding hours and the unrecorded intervals of the matching cohort group
+            feeding, record = measure("times", times, "Feeding", binary, COHORT_GROUPS[diet])
+            record["group"] = diet
+            record["rats"] = int(feeding.shape[1] - 1)
+            records.append(record)
+
+            hourly, record = measure("hourly_resample",
+                                     lambda frame: frame.iloc[:, :-1].resample("1H").agg(pd.Series.sum, skipna = False).T, feeding)
+            record["group"] = diet
+            records.append(record)
+
+            summary = pd.DataFrame(columns = ["light_food", "dark_food"])
+            _, record = measure("light_summary", light_summary, summary, feeding, rows = int(feeding.shape[0]))
+            record["group"] = diet
+            records.append(record)
+
+            del binary, feeding
+
+        # Statistics - the repeated-measures ANOVA and Tukey HSD block run for every hourly figure (on the last diet group)
+        _, record = measure("statistics", hourly_statistics, hourly)
+        records.append(record)
+    return records
+
+# Method to run the repeated-measures ANOVA + Tukey HSD of figures_and_analysis.py on the first 8 hours of an hourly table
+def hourly_statistics(hourly):
+    import pingouin
+    import statsmodels.stats.multicomp
+    long_frame = hourly.iloc[:, :8].stack().reset_index()
+    long_frame.columns = ["Rat", "phase", "Consumption_Rate"]
+    long_frame["phase"] = long_frame["phase"].astype(str)
+    aov = pingouin.rm_anova(data = long_frame, dv = "Consumption_Rate", within = "phase", subject = "Rat", detailed = True)
+    tukey = statsmodels.stats.multicomp.MultiComparison(long_frame["Consumption_Rate"], long_frame["phase"]).tukeyhsd()
+    return aov, tukey
+
+# Method to run one scale in a separate process and collect its records
+def run_scale_in_process(scale, arguments):
+    command = [sys.executable, os.path.abspath(__file__), "--worker", "--scales", str(scale),
+               "--days", str(arguments.days), "--seed", str(arguments.seed)]
+    if arguments.skip_workbooks:
+        command.append("--skip-workbooks")
+    try:
+        completed = subprocess.run(command, capture_output = True, text = True, timeout = arguments.timeout)
+    except subprocess.TimeoutExpired:
+        return [{"stage": "all", "status": "timeout"}]
+    if completed.returncode != 0:
+        error = completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "exit code " + str(completed.returncode)
+        return [{"stage": "all", "status": "failed", "error": error}]
+    return [json.loads(line) for line in completed.stdout.splitlines() if line.startswith("{")]
+
+
+#----------------------------------------------------------
+# Run Benchmarks
+#----------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Scaling benchmarks for the binary activity pipeline")
+    parser.add_argument("--scales", default = "1,10,100,1000", help = "comma-separated cohort sizes relative to the recorded cohort")
+    parser.add_argument("--days", type = int, default = 1, help = "number of recorded days per rat")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--timeout", type = float, default = 3600, help = "seconds allowed for each scale")
+    parser.add_argument("--skip-workbooks", action = "store_true", help = "skip writing and reading .xlsx workbooks (no ingestion stage)")
+    parser.add_argument("--history", default = os.path.join(BENCHMARK_FOLDER, "benchmark_history.jsonl"))
+    parser.add_argument("--worker", action = "store_true", help = argparse.SUPPRESS)
+    arguments = parser.parse_args()
+    scales = [float(scale) for scale in arguments.scales.split(",")]
+
+    if arguments.worker:
+        records = run_scale(scales[0], arguments.days, arguments.seed, not arguments.skip_workbooks)
+        for record in records:
+            print(json.dumps(record))
+        sys.exit(0)
+
+    import pandas as pd
+    import numpy as np
+    run = {"run": datetime.datetime.now().isoformat(timespec = "seconds"), "commit": current_commit(),
+           "python": platform.python_version(), "pandas": pd.__version__, "numpy": np.__version__,
+           "machine": platform.machine(), "cpus": os.cpu_count(), "days": arguments.days, "seed": arguments.seed}
+    with open(arguments.history, "a") as history:
+        for scale in scales:
+            for record in run_scale_in_process(scale, arguments):
+                record.update(run)
+                record["scale"] = scale
+                history.write(json.dumps(record) + "\n")
+                print("%6gx  %-16s %-26s %8s s  %9s MB  %s" % (scale, record["stage"], record.get("group", ""),
+                      record.get("wall_s", ""), record.get("peak_mb", ""), record["status"]))
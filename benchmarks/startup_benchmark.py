@@ -0,0 +1,96 @@
+# Startup-Time Benchmark for Creating Figures and Performing Statistical Analysis
+# Times how long figures_and_analysis.py takes to start (--help) and to load and check the input data (--check-data),
+# and how long each statistics and plotting library takes to import on its own
+#
+# Usage (from the repository folder):
+#     python benchmarks/startup_benchmark.py --repeats 5 --limit 1
+#
+# Every command runs in a fresh process; the median wall time of the repeats is reported. One JSON record per command
+# is appended to benchmarks/benchmark_history.jsonl. The benchmark exits with status 1 if --help or --check-data take
+# longer than --limit seconds, so that a library imported at startup again is caught.
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+BENCHMARK_FOLDER = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_FOLDER = os.path.dirname(BENCHMARK_FOLDER)
+
+# Libraries whose import time is reported - figures_and_analysis.py imports all but pandas the first time they are used (see lazy_import.py)
+LAZY_LIBRARIES = ["pandas", "matplotlib.pyplot", "seaborn", "scipy.stats", "statsmodels.formula.api",
+                  "statsmodels.stats.multicomp", "pingouin"]
+
+
+#----------------------------------------------------------
+# Define Custom Methods
+#----------------------------------------------------------
+
+# Method to run a command in a fresh process "repeats" times and return the median wall time (in sec) and its status
+def time_command(command, repeats, folder = REPOSITORY_FOLDER):
+    wall_times = []
+    for _ in range(repeats):
+        wall_start = time.perf_counter()
+        completed = subprocess.run(command, cwd = folder, capture_output = True, text = True)
+        wall_times.append(time.perf_counter() - wall_start)
+        if completed.returncode != 0:
+            error = completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "exit code " + str(completed.returncode)
+            return None, "failed", error
+    return statistics.median(wall_times), "ok", None
+
+# Method to time the import of one library in a fresh process (not counting the start of the interpreter itself)
+def time_import(library, repeats):
+    code = "import time; start = time.perf_counter(); import " + library + "; print(time.perf_counter() - start)"
+    import_times = []
+    for _ in range(repeats):
+        completed = subprocess.run([sys.executable, "-c", code], capture_output = True, text = True)
+        if completed.returncode != 0:
+            return None, "failed"
+        import_times.append(float(completed.stdout.strip().splitlines()[-1]))
+    return statistics.median(import_times), "ok"
+
+
+#----------------------------------------------------------
+# Run Benchmark
+#----------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Startup-time benchmark for figures_and_analysis.py")
+    parser.add_argument("--repeats", type = int, default = 5, help = "number of runs of each command (the median is reported)")
+    parser.add_argument("--limit", type = float, default = 1.0, help = "largest allowed wall time (in sec) of --help and --check-data")
+    parser.add_argument("--folder", default = REPOSITORY_FOLDER, help = "folder with figures_and_analysis.py and its input data")
+    parser.add_argument("--skip-imports", action = "store_true", help = "skip timing the import of every library")
+    parser.add_argument("--history", default = os.path.join(BENCHMARK_FOLDER, "benchmark_history.jsonl"))
+    arguments = parser.parse_args()
+
+    script = os.path.join(arguments.folder, "figures_and_analysis.py")
+    records = []
+    for option in ["--help", "--check-data"]:
+        wall_time, status, error = time_command([sys.executable, script, option], arguments.repeats, arguments.folder)
+        record = {"stage": "startup_" + option[2:].replace("-", "_"), "wall_s": None if wall_time is None else round(wall_time, 4), "status": status}
+        if error is not None:
+            record["error"] = error
+        elif wall_time > arguments.limit:
+            record["status"] = "over_limit"
+        records.append(record)
+    if not arguments.skip_imports:
+        for library in LAZY_LIBRARIES:
+            import_time, status = time_import(library, arguments.repeats)
+            records.append({"stage": "import_" + library, "wall_s": None if import_time is None else round(import_time, 4), "status": status})
+
+    run = {"run": datetime.datetime.now().isoformat(timespec = "seconds"), "python": platform.python_version(),
+           "machine": platform.machine(), "cpus": os.cpu_count(), "repeats": arguments.repeats, "limit_s": arguments.limit}
+    with open(arguments.history, "a") as history:
+        for record in records:
+            record.update(run)
+            history.write(json.dumps(record) + "\n")
+            print("%-36s %8s s  %s" % (record["stage"], record["wall_s"], record["status"]))
+    sys.exit(1 if any(record["status"] == "over_limit" for record in records) else 0)
@@ -0,0 +1,123 @@
+# Synthetic Cohort Generator
+# Used to create synthetic raw video annotation workbooks (START/STOP/POINT events) for benchmarking the pipeline of
+# Time-Restricted Feeding in the Active Phase Drives Periods of Rapid Food Consumption in Rats Fed a High-Fat, High-Sugar Diet with Liquid Sucrose
+#
+# The synthetic workbooks have the same layout as the workbooks in "Raw Video Data.zip":
+# one workbook per rat with the columns "seconds", "Subject", "Behavior", "Status" and "Name"
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import pandas as pd
+import numpy as np
+import zipfile
+import io
+
+
+#----------------------------------------------------------
+# Define Default Bout Rates
+#----------------------------------------------------------
+# Average number of bouts per 24 hours and average bout duration (in sec) for each behavior,
+# measured from the 29 rats in "Raw Video Data.zip"
+DEFAULT_BOUT_RATES = {"Feeding":          {"bouts_per_day": 49.6,  "mean_duration": 62.5},
+                      "Grooming":         {"bouts_per_day": 168.8, "mean_duration": 41.3},
+                      "Rearing":          {"bouts_per_day": 245.2, "mean_duration": 10.4},
+                      "Sleeping/Resting": {"bouts_per_day": 82.7,  "mean_duration": 302.7},
+                      "Water":            {"bouts_per_day": 36.9,  "mean_duration": 18.3},
+                      "Sucrose":          {"bouts_per_day": 21.2,  "mean_duration": 37.0}}
+
+# Average number of locomotor (Zoomie) POINT events per 24 hours
+DEFAULT_ZOOMIE_RATE = 53.0
+
+# Number of rats per diet group in "Raw Video Data.zip" - this is the "1x" cohort size
+DEFAULT_GROUPS = {"Group_Control_Adlib": 8, "Group_Control_Restricted": 9, "Group_HFHS_Adlib": 5, "Group_HFHS_Restricted": 7}
+
+# Diet group of the cohort configuration (2018VT_cohort.json) that each synthetic group stands for - pass it to times() so that
+# the restricted feeding hours and the unrecorded intervals of the group are applied like in Creating_Binary_CSV_Files.py
+COHORT_GROUPS = {"Group_Control_Adlib": "Control Adlib", "Group_Control_Restricted": "Control Restricted",
+                 "Group_HFHS_Adlib": "HFHS Adlib", "Group_HFHS_Restricted": "HFHS Restricted"}
+
+# Only rats on the HFHS diet have access to liquid sucrose
+SUCROSE_GROUPS = ["Group_HFHS_Adlib", "Group_HFHS_Restricted"]
+
+
+#----------------------------------------------------------
+# Define Custom Methods
+#----------------------------------------------------------
+
+# Method to draw the START and STOP times of one behavior for one rat
+# Bouts arrive as a Poisson process and bout durations are exponentially distributed (the "distribution" can also be "lognormal")
+def synthetic_bouts(rng, recording_seconds, bouts_per_day, mean_duration, distribution = "exponential"):
+    number_of_bouts = rng.poisson(bouts_per_day * recording_seconds / 86400)
+    starts = np.sort(rng.uniform(0, recording_seconds, number_of_bouts))
+    if distribution == "lognormal":
+        durations = rng.lognormal(np.log(mean_duration) - 0.5, 1.0, number_of_bouts)
+    else:
+        durations = rng.exponential(mean_duration, number_of_bouts)
+    stops = starts + np.maximum(durations, 0.5)
+    # A bout of the same behavior cannot start before the previous bout stopped - cut it short 1 ms before the next START
+    stops[:-1] = np.minimum(stops[:-1], starts[1:] - 0.001)
+    stops = np.minimum(stops, recording_seconds - 0.001)
+    keep = stops > starts
+    return starts[keep], stops[keep]
+
+# Method to create the event dataframe of one rat - the same columns as a raw video workbook
+def synthetic_rat_events(rng, rat_name, days = 1, bout_rates = DEFAULT_BOUT_RATES, zoomie_rate = DEFAULT_ZOOMIE_RATE,
+                         sucrose = True, distribution = "exponential"):
+    recording_seconds = 86400 * days
+    times_in_seconds = []
+    behaviors = []
+    statuses = []
+    for behavior, rate in bout_rates.items():
+        if behavior == "Sucrose" and not sucrose:
+            continue
+        starts, stops = synthetic_bouts(rng, recording_seconds, rate["bouts_per_day"], rate["mean_duration"], distribution)
+        times_in_seconds.extend([starts, stops])
+        behaviors.extend([np.repeat(behavior, len(starts)), np.repeat(behavior, len(stops))])
+        statuses.extend([np.repeat("START", len(starts)), np.repeat("STOP", len(stops))])
+    # Locomotor activity is logged as single POINT events
+    points = np.sort(rng.uniform(0, recording_seconds, rng.poisson(zoomie_rate * days)))
+    times_in_seconds.append(points)
+    behaviors.append(np.repeat("Zoomie", len(points)))
+    statuses.append(np.repeat("POINT", len(points)))
+
+    # Round to milliseconds like the video scoring software
+    times_in_seconds = np.round(np.concatenate(times_in_seconds), 3)
+    events = pd.DataFrame({"seconds": pd.to_datetime(times_in_seconds, unit = "s"),
+                           "Subject": rat_name + "_00",
+                           "Behavior": np.concatenate(behaviors),
+                           "Status": np.concatenate(statuses),
+                           "Name": rat_name})
+    return events.sort_values("seconds", kind = "mergesort").reset_index(drop = True)
+
+# Method to create a whole synthetic cohort
+# Returns a dictionary of {diet name: {rat name: event dataframe}}; "scale" multiplies the number of rats in every group
+# Rats are numbered across the whole cohort ("Rat01", ..., "Rat99", "Rat100", ...) so that the rat numbers stay unique at every scale
+def synthetic_cohort(groups = DEFAULT_GROUPS, scale = 1, days = 1, bout_rates = DEFAULT_BOUT_RATES,
+                     zoomie_rate = DEFAULT_ZOOMIE_RATE, distribution = "exponential", seed = 0):
+    rng = np.random.default_rng(seed)
+    cohort = {}
+    rat_number = 1
+    for diet, number_of_rats in groups.items():
+        cohort[diet] = {}
+        for _ in range(int(number_of_rats * scale)):
+            rat_name = "Rat%02d" % rat_number
+            cohort[diet][rat_name] = synthetic_rat_events(rng, rat_name, days, bout_rates, zoomie_rate,
+                                                          sucrose = diet in SUCROSE_GROUPS, distribution = distribution)
+            rat_number += 1
+    return cohort
+
+# Method to build the compiled dataframe of a diet group directly (the same result as get_dataframe, without the workbooks)
+def compiled_group(cohort, diet):
+    return pd.concat(list(cohort[diet].values())).set_index("seconds").sort_index()
+
+# Method to write a synthetic cohort into a zip archive with the same layout as "Raw Video Data.zip"
+def write_video_archive(cohort, path):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for diet, rats in cohort.items():
+            for rat_name, events in rats.items():
+                workbook = io.BytesIO()
+                events.to_excel(workbook, index = False)
+                archive.writestr("Raw Video Data/" + diet + " Raw Video Data/" + rat_name + "_full_day_" + diet + ".xlsx", workbook.getvalue())
+    return path
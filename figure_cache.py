@@ -0,0 +1,127 @@
+# Content-Addressed Figure Cache
+# Used by figures_and_analysis.py to skip re-rendering figures whose inputs and drawing code have not changed for
+# Time-Restricted Feeding in the Active Phase Drives Periods of Rapid Food Consumption in Rats Fed a High-Fat, High-Sugar Diet with Liquid Sucrose
+# by Kush Attal, Julia Wickman Shihoko Kojima, Sarah N. Blythe, Natalia Toporikova
+#
+# The key of a figure is a SHA-256 hash of
+#   - every input dataframe (values, index, column names and dtypes),
+#   - the plot parameters (from plotting_by_group.csv),
+#   - the source code of the drawing functions (and of every function of the same script they call) - pass the function that
+#     sets the fonts, rcParams and dpi of the figures as well (i.e. set_figure_style), so that a style change re-renders the figures,
+#   - the source code of the figure cell itself and the matplotlib/seaborn versions.
+# The rendered files are kept in one folder per key. The least recently used folders are removed when the cache grows past its size limit.
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import pandas as pd
+import hashlib
+from importlib import metadata
+import inspect
+import os
+import shutil
+import time
+
+
+#----------------------------------------------------------
+# Define Default Settings
+#----------------------------------------------------------
+CACHE_FOLDER = "Figures_And_Analysis/figure_cache"
+
+# Largest total size of all cached figures (in MB)
+CACHE_SIZE_MB = 2048
+
+
+#----------------------------------------------------------
+# Define Custom Methods
+#----------------------------------------------------------
+
+# Method to add a dataframe (or series) to a hash
+def hash_frame(digest, frame):
+    digest.update(repr((type(frame).__name__, frame.shape)).encode())
+    if isinstance(frame, pd.DataFrame):
+        digest.update(repr([(str(column), str(dtype)) for column, dtype in frame.dtypes.items()]).encode())
+    else:
+        digest.update(repr((str(frame.name), str(frame.dtype))).encode())
+    digest.update(pd.util.hash_pandas_object(frame, index = True).to_numpy().tobytes())
+
+# Method to collect the source code of the drawing functions and of every function of the same script they call
+def function_sources(functions):
+    sources = {}
+    to_visit = list(functions)
+    while to_visit:
+        function = to_visit.pop()
+        if function.__name__ in sources:
+            continue
+        sources[function.__name__] = inspect.getsource(function)
+        for name in function.__code__.co_names:
+            called = function.__globals__.get(name)
+            if inspect.isfunction(called) and called.__module__ == function.__module__:
+                to_visit.append(called)
+    return [sources[name] for name in sorted(sources)]
+
+# Method to read the source code of one cell of a script - from the line with the cell title to the next "# In[" marker
+def cell_source(script_path, title):
+    with open(script_path) as script:
+        lines = script.read().splitlines()
+    start = next(number for number, line in enumerate(lines) if line.strip() == "# " + title)
+    end = next((number for number in range(start, len(lines)) if lines[number].startswith("# In[")), len(lines))
+    return "\n".join(lines[start:end])
+
+# Method to compute the cache key of a figure
+def figure_key(name, frames, plot_parameters, functions, source = ""):
+    digest = hashlib.sha256()
+    # Read the installed versions without importing matplotlib and seaborn, so that a figure restored from the cache never loads them
+    digest.update(repr((name, metadata.version("matplotlib"), metadata.version("seaborn"))).encode())
+    for frame in frames:
+        hash_frame(digest, frame)
+    for parameters in plot_parameters:
+        hash_frame(digest, parameters)
+    for function_source in function_sources(functions):
+        digest.update(function_source.encode())
+    digest.update(source.encode())
+    return digest.hexdigest()
+
+# Method to copy the cached files of a figure to their output paths - returns False if the figure is not in the cache
+def restore_figure(key, outputs, cache_folder = CACHE_FOLDER):
+    entry = os.path.join(cache_folder, key)
+    cached = [os.path.join(entry, os.path.basename(output)) for output in outputs]
+    if not all(os.path.exists(path) for path in cached):
+        return False
+    for path, output in zip(cached, outputs):
+        shutil.copyfile(path, output)
+    # Mark the entry as recently used
+    now = time.time()
+    os.utime(entry, (now, now))
+    return True
+
+# Method to keep the rendered files of a figure in the cache and evict the least recently used figures above the size limit
+def store_figure(key, outputs, cache_folder = CACHE_FOLDER, cache_size_mb = CACHE_SIZE_MB):
+    entry = os.path.join(cache_folder, key)
+    os.makedirs(entry, exist_ok = True)
+    for output in outputs:
+        shutil.copyfile(output, os.path.join(entry, os.path.basename(output)))
+    now = time.time()
+    os.utime(entry, (now, now))
+    evict_figures(cache_folder, cache_size_mb, keep = entry)
+
+# Method to remove the least recently used figures until the cache fits in "cache_size_mb" (the "keep" entry is never removed)
+def evict_figures(cache_folder = CACHE_FOLDER, cache_size_mb = CACHE_SIZE_MB, keep = None):
+    entries = []
+    for key in os.listdir(cache_folder):
+        entry = os.path.join(cache_folder, key)
+        if os.path.isdir(entry):
+            size = sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+            entries.append((os.path.getmtime(entry), size, entry))
+    total = sum(size for _, size, _ in entries)
+    removed = []
+    for _, size, entry in sorted(entries):
+        if total <= cache_size_mb * 2**20:
+            break
+        if entry == keep:
+            continue
+        shutil.rmtree(entry)
+        total -= size
+        removed.append(entry)
+    return removed
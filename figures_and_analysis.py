@@ -17,29 +17,58 @@ import pandas as pd
 import numpy as np
 import datetime
 import os 
-import matplotlib.pyplot as plt
-import matplotlib.patches as mpatches
-from matplotlib.lines import Line2D
-import seaborn as sns
 import math 
-import matplotlib.gridspec as gridspec
-from scipy import stats
-from statsmodels.formula.api import ols
-from statsmodels.stats.anova import anova_lm
-from pingouin import mixed_anova, read_dataset, pairwise_ttests
-import statsmodels.stats.multicomp
-from statsmodels.stats.power import TTestIndPower
+# Statistics and plotting libraries are imported the first time they are used (see lazy_import.py), so that
+# --help and --check-data start without loading them
+from lazy_import import LazyModule, lazy_callable
+plt = LazyModule("matplotlib.pyplot", on_import = lambda: set_figure_style())
+mpatches = LazyModule("matplotlib.patches")
+Line2D = lazy_callable("matplotlib.lines", "Line2D")
+sns = LazyModule("seaborn", on_import = lambda: set_figure_style())
+gridspec = LazyModule("matplotlib.gridspec")
+stats = LazyModule("scipy.stats")
+ols = lazy_callable("statsmodels.formula.api", "ols")
+anova_lm = lazy_callable("statsmodels.stats.anova", "anova_lm")
+mixed_anova = lazy_callable("pingouin", "mixed_anova")
+rm_anova = lazy_callable("pingouin", "rm_anova")
+read_dataset = lazy_callable("pingouin", "read_dataset")
+pairwise_ttests = lazy_callable("pingouin", "pairwise_ttests")
+multicomp = LazyModule("statsmodels.stats.multicomp")
+TTestIndPower = lazy_callable("statsmodels.stats.power", "TTestIndPower")
 import zipfile
 import shutil
 import sys
+# Shared pipeline modules (i.e. instrumentation.py) live next to Creating_Binary_CSV_Files.py
+sys.path.insert(0, "Data for figures")
+from instrumentation import stage
+from results_store import open_results_store, record_anova, record_anova_and_tukey, record_pairwise, export_legacy_csvs, store_tables, append_tables
+from figure_cache import figure_key, cell_source, restore_figure, store_figure, CACHE_SIZE_MB
+from cohort_config import load_cohort, design_groups
+from table_schema import read_totals, read_hourly_totals, expand_totals
+from stage_graph import new_graph, add_stage, run_graph, CHECKPOINT_FOLDER, WORKERS
+import argparse
+
+#----------------------------------------------------------
+# Read Options
+#----------------------------------------------------------
+parser = argparse.ArgumentParser(description = "Create all figures and statistical analysis of the manuscript")
+parser.add_argument("--force", action = "store_true", help = "re-render every figure even if it is in the figure cache")
+parser.add_argument("--cache-size", type = float, default = CACHE_SIZE_MB, help = "largest size of the figure cache in MB (least recently used figures are removed first)")
+parser.add_argument("--check-data", action = "store_true", help = "only load and check the input data, then exit without running the statistics or drawing the figures")
+parser.add_argument("--restart", action = "store_true", help = "remove the checkpoints of earlier runs and run every stage again (see stage_graph.py)")
+parser.add_argument("--workers", type = int, default = WORKERS, help = "number of stages (other than the figures) that run at the same time")
+arguments = parser.parse_args()
 
 #----------------------------------------------------------
 # Set Fonts and Background for the Figures
 #----------------------------------------------------------
-sns.set()
-sns.set_style("whitegrid", {'axes.grid' : False, 'axes.edgecolor': 'black', 'font.family': 'Arial'})
-plt.rcParams['hatch.linewidth'] = 3
-plt.rcParams['figure.dpi'] = 1000
+# Method to set the fonts and background - runs when matplotlib or seaborn is first imported, before anything is drawn
+def set_figure_style():
+    sns.set()
+    sns.set_style("whitegrid", {'axes.grid' : False, 'axes.edgecolor': 'black', 'font.family': 'Arial'})
+    plt.rcParams['hatch.linewidth'] = 3
+    plt.rcParams['figure.dpi'] = 1000
+    plt.rcParams['savefig.dpi'] = 1000
 
 #----------------------------------------------------------
 # Check Python Version
@@ -56,7 +85,7 @@ if sys.version < "3.8.2":
 #----------------------------------------------------------
 
 # Function to create Fig1A time plot
-def Fig1A_timeplot(metafile, body_weight):
+def Fig1A_timeplot(metafile, body_weight, plot_parameters):
     # Separate into subgroups according to diet and food accesibility, then plot each subgroup
     regime = metafile.Feeding.unique()
     diet   = metafile.Diet.unique()
@@ -87,7 +116,7 @@ def day_anova_analysis(day, anova_data):
     model = ols(formula, anova_data).fit()
     aov_table = anova_lm(model, typ=1)
 
-    mc_interaction = statsmodels.stats.multicomp.MultiComparison(anova_data[day], anova_data['diet_and_schedule'])
+    mc_interaction = multicomp.MultiComparison(anova_data[day], anova_data['diet_and_schedule'])
     mc_interaction_results = mc_interaction.tukeyhsd()
     mc_interaction = pd.DataFrame(data=mc_interaction_results._results_table.data[1:], columns=mc_interaction_results._results_table.data[0])
 
@@ -113,9 +142,9 @@ def Fig1B_boxplot(master_data, plot_parameters):
     
     
 # Function to create Fig1C through Fig1F boxplot
-def Fig1CtoF_boxplot(metabolite, unit, name):
+def Fig1CtoF_boxplot(metabolite, unit, name, plot_parameters):
     # Set the size, dashed lines, and colors for the figure
-    ax = sns.boxplot(x=master_data.index, y=metabolite, color='white', linewidth=1, palette=plot_parameters.fill_color, showfliers = False)
+    ax = sns.boxplot(x=metabolite.index, y=metabolite, color='white', linewidth=1, palette=plot_parameters.fill_color, showfliers = False)
     hatches = ["", "///", "", "///"]
     colors = ["black", "gray", "black", "red"]
     for i, hatch, patch in zip(plot_parameters.hatch_colors, plot_parameters.hatches, ax.artists):
@@ -153,7 +182,7 @@ def metabolite_anova_analysis(metabolite, anova_data):
     model = ols(formula, anova_data).fit()
     aov_table = anova_lm(model, typ=1)
     
-    mc_interaction = statsmodels.stats.multicomp.MultiComparison(anova_data[metabolite], anova_data['group'])
+    mc_interaction = multicomp.MultiComparison(anova_data[metabolite], anova_data['group'])
     mc_interaction_results = mc_interaction.tukeyhsd()
     mc_interaction = pd.DataFrame(data=mc_interaction_results._results_table.data[1:], columns=mc_interaction_results._results_table.data[0])
     
@@ -292,10 +321,29 @@ def runing_avg(x, window):
     z = x.rolling(window, win_type='boxcar').mean()
     z = z.dropna()
     return(z)
+
+# Method to plot a long time series with at most 2 points per horizontal pixel of the current axes (at the saved resolution, savefig.dpi)
+# The smallest and largest value of every pixel column are kept, so the drawn line looks the same as the full series
+def decimated_plot(series, **plot_arguments):
+    axes = plt.gca()
+    dpi = plt.rcParams['savefig.dpi']
+    if dpi == "figure":
+        dpi = axes.figure.dpi
+    pixels = int(np.ceil(axes.get_position().width * axes.figure.get_figwidth() * dpi))
+    if len(series) > 2 * pixels:
+        values = series.to_numpy()
+        bucket_size = int(np.ceil(len(values) / pixels))
+        padded = np.pad(values, (0, pixels * bucket_size - len(values)), mode = "edge").reshape(pixels, bucket_size)
+        starts = np.arange(pixels) * bucket_size
+        # Keep the minimum and maximum of every bucket in time order, plus the first and last point
+        keep = np.sort(np.stack([starts + padded.argmin(axis = 1), starts + padded.argmax(axis = 1)], axis = 1), axis = 1).ravel()
+        keep = np.unique(np.concatenate([[0], np.minimum(keep, len(values) - 1), [len(values) - 1]]))
+        series = series.iloc[keep]
+    return plt.plot(series, **plot_arguments)
     
 # Function to create Fig3A-D rolling-average Time Chart 
 def Fig3AD_timeplot(diet_column, color, linestyle, ymax=0.4, ylabel = "Normalized \nFeeding Activity"):
-    plt.plot(runing_avg(diet_column, 1800), color = color, linestyle = linestyle, lw = 1)
+    decimated_plot(runing_avg(diet_column, 1800), color = color, linestyle = linestyle, lw = 1)
     
     # Add x- and y-labels, ticks, and units
     plt.yticks(fontname = 'Arial', fontsize=10, color = 'black')
@@ -308,7 +356,7 @@ def Fig3AD_timeplot(diet_column, color, linestyle, ymax=0.4, ylabel = "Normalize
     plt.axvspan(0.875, 1.375, facecolor='black', alpha=0.15)
     
 # Function to create Fig3E and 3F time plot of hourly feeding activity during 8-hour restricted window 
-def Fig3EF_timeplot(hourly_dataframe, group, color, video_metafile):
+def Fig3EF_timeplot(hourly_dataframe, group, color, video_metafile, plot_parameters):
     # Separate new dataframe into subgroups according to diet and food accesibility
     hours = np.arange(0, hourly_dataframe.shape[0]) + 1
     ids = video_metafile[video_metafile == group].index
@@ -380,7 +428,7 @@ def Fig3G_barplot(df, title, barplot_plot_parameters, ymax = 600):
     
 # Function to create Fig4AB rolling-average Time Chart 
 def Fig4AB_timeplot(diet_column, color, linestyle, ymax=0.08, ylabel = "Normalized \nSucrose Activity"):
-    plt.plot(runing_avg(diet_column, 1800), color = color, linestyle = linestyle, lw = 1)
+    decimated_plot(runing_avg(diet_column, 1800), color = color, linestyle = linestyle, lw = 1)
     
     # Add x- and y-labels, ticks, and units
     plt.yticks(fontname = 'Arial', fontsize=10, color = 'black')
@@ -393,7 +441,7 @@ def Fig4AB_timeplot(diet_column, color, linestyle, ymax=0.08, ylabel = "Normaliz
     plt.axvspan(0.875, 1.375, facecolor='black', alpha=0.15)
     
 # Function to create Fig4C time plot of hourly sucrose activity during 8-hour restricted window 
-def Fig4C_timeplot(hourly_dataframe, group, color, video_metafile):
+def Fig4C_timeplot(hourly_dataframe, group, color, video_metafile, plot_parameters):
     # Separate new dataframe into subgroups according to diet and food accesibility
     hours = np.arange(0, hourly_dataframe.shape[0]) + 1
     ids = video_metafile[video_metafile == group].index
@@ -477,7 +525,7 @@ def activity_anova(anova_data):
     aov_table = anova_lm(model, typ=1)
     
     # Perform Tukey post-hoc
-    mc_interaction = statsmodels.stats.multicomp.MultiComparison(anova_data["Consumption_Rate"], anova_data['group_and_phase'])
+    mc_interaction = multicomp.MultiComparison(anova_data["Consumption_Rate"], anova_data['group_and_phase'])
     mc_interaction_results = mc_interaction.tukeyhsd(alpha = 0.05)
 
     # Place the Tukey results in a dataframe
@@ -500,7 +548,7 @@ def Fig5_boxplot(data, plot_parameters, name):
         patch.set_edgecolor(i)
     # Add x- and y-labels, ticks, and units    
     plt.xlabel('')
-    plt.ylabel(c.capitalize(), fontstyle = "italic", fontsize = "x-large")
+    plt.ylabel(name.capitalize(), fontstyle = "italic", fontsize = "x-large")
     ax.xaxis.set_major_formatter(plt.NullFormatter())
 
 # Method to create legend for Fig5
@@ -527,6 +575,10 @@ def make_gene_legend():
 if not os.path.exists("Figures_And_Analysis"):
     os.mkdir("Figures_And_Analysis")
 
+# Start from scratch if asked to - every stage runs again
+if arguments.restart and os.path.exists(CHECKPOINT_FOLDER):
+    shutil.rmtree(CHECKPOINT_FOLDER)
+
 
 # In[4]:
 
@@ -534,133 +586,196 @@ if not os.path.exists("Figures_And_Analysis"):
 #----------------------------------------------------------
 # Download Raw Data
 #----------------------------------------------------------
-# Download plot parameters
-plot_parameters = pd.read_csv("Data for figures/plotting_by_group.csv", index_col=0)
-
-# Download raw Body Weight Data
-body_weight = pd.read_csv("Data for figures/2018VT - daily weight log.csv")
-
-# Create metafile that holds group information for ALL rats
-plot_body_weight = body_weight.T
-plot_body_weight.columns = plot_body_weight.iloc[0]
-metafile = plot_body_weight.iloc[1:3].T
-
-# Download master document with metabolite data
-master_data = pd.read_csv("Data for figures/2018VT_termination_data_master_document.csv")
-# Correct column names and add columns
-master_data['diet_and_schedule']=master_data.diet+' '+master_data.feeding_schedule
-master_data = master_data.set_index('diet_and_schedule')
-master_data['group']=master_data.diet+' '+master_data.feeding_schedule
-master_data = master_data.rename(columns={" Leptin": "Leptin", "triglyceride (mg/mL)": "Triglyceride"}, index = {"control ad lib": "Control Ad Lib", "control restriction": "Control Restricted", "HFHS ad lib": "HFHS Ad Lib", "HFHS restriction": "HFHS Restricted"})
-
-# Download all Binary Feeding Data
-feeding_archive = zipfile.ZipFile(r'Data for figures/Feeding_Binary_CSV_Files.zip')
-sucrose_archive = zipfile.ZipFile(r'Data for figures/Sucrose_Binary_CSV_Files.zip')
-
-# Download data on total amount of time spent feeding
-# Variables "light_food" and "dark_food" contain total time(in sec) each rat spent eating during light and dark period respectively
-# Dark Period: before 9:00
-# Light Period: after 9:00
-feeding_data = pd.read_csv(feeding_archive.open('food_total.csv'), index_col = 0)
-
-# Download normalized data on binary feeding data for each experimental group
-normalized_feeding = pd.read_csv(feeding_archive.open('Feeding_Normalized_Activity.csv'), index_col='Date_Time', parse_dates=True)
-
-# Download hourly feeding data 
-feeding_hourly_frame = pd.read_csv(feeding_archive.open('food_total_by_hour.csv'), index_col = 0)
-
-# Create metafile of just group data for rats with video recordings
-video_metafile = feeding_hourly_frame["group"]
+# Method to download the raw data - "input_files" (size and modification time of every input file) only takes part in the stage key
+def load_data(cohort, input_files):
+    with stage("load_data"):
+        # Download plot parameters
+        plot_parameters = pd.read_csv("Data for figures/plotting_by_group.csv", index_col=0)
+
+        # Download raw Body Weight Data
+        body_weight = pd.read_csv(cohort["metafile"])
+
+        # Create metafile that holds group information for ALL rats
+        plot_body_weight = body_weight.T
+        plot_body_weight.columns = plot_body_weight.iloc[0]
+        metafile = plot_body_weight.iloc[1:3].T
+        metafile['group']=metafile.Diet+' '+metafile.Feeding
+
+        # Download master document with metabolite data
+        master_data = pd.read_csv("Data for figures/2018VT_termination_data_master_document.csv")
+        # Correct column names and add columns
+        master_data['diet_and_schedule']=master_data.diet+' '+master_data.feeding_schedule
+        master_data = master_data.set_index('diet_and_schedule')
+        master_data['group']=master_data.diet+' '+master_data.feeding_schedule
+        master_data = master_data.rename(columns={" Leptin": "Leptin", "triglyceride (mg/mL)": "Triglyceride"}, index = {group["metafile_group"]: group["label"] for group in cohort["groups"]})
+
+        # Download all Binary Feeding Data
+        with zipfile.ZipFile(r'Data for figures/Feeding_Binary_CSV_Files.zip') as feeding_archive, zipfile.ZipFile(r'Data for figures/Sucrose_Binary_CSV_Files.zip') as sucrose_archive:
+            # Download data on total amount of time spent feeding
+            # Variables "light_food" and "dark_food" contain total time(in sec) each rat spent eating during light and dark period respectively
+            # Dark Period: before 9:00
+            # Light Period: after 9:00
+            feeding_data = read_totals(feeding_archive.open('food_total.csv'))
+
+            # Download normalized data on binary feeding data for each experimental group
+            normalized_feeding = pd.read_csv(feeding_archive.open('Feeding_Normalized_Activity.csv'), index_col='Date_Time', parse_dates=True)
+
+            # Download hourly feeding data (seconds per hour as the smallest integer type and group as a category, see table_schema.py)
+            feeding_hourly_frame = read_hourly_totals(feeding_archive.open('food_total_by_hour.csv'))
+
+            # Create metafile of just group data for rats with video recordings
+            video_metafile = feeding_hourly_frame["group"]
+
+            # Download data on total amount of time spent drinking sucrose
+            sucrose_data = read_totals(sucrose_archive.open('sucrose_total.csv'))
+
+            # Download normalized data on binary sucrose data for each experimental group
+            normalized_sucrose = pd.read_csv(sucrose_archive.open('Sucrose_Normalized_Activity.csv'), index_col='Date_Time', parse_dates=True)
+
+            # Download hourly sucrose data
+            sucrose_hourly_frame = read_hourly_totals(sucrose_archive.open('sucrose_total_by_hour.csv'))
+
+        # Download gene data
+        gene_data = pd.read_csv("Data for figures/qPCR_normalized_gapdph.csv", index_col=0)
+
+    return {"plot_parameters": plot_parameters, "body_weight": body_weight, "metafile": metafile, "master_data": master_data,
+            "feeding_data": feeding_data, "normalized_feeding": normalized_feeding, "feeding_hourly_frame": feeding_hourly_frame,
+            "video_metafile": video_metafile, "sucrose_data": sucrose_data, "normalized_sucrose": normalized_sucrose,
+            "sucrose_hourly_frame": sucrose_hourly_frame, "gene_data": gene_data}
 
-# Download data on total amount of time spent drinking sucrose
-sucrose_data = pd.read_csv(sucrose_archive.open('sucrose_total.csv'), index_col = 0)
-
-# Download normalized data on binary sucrose data for each experimental group
-normalized_sucrose = pd.read_csv(sucrose_archive.open('Sucrose_Normalized_Activity.csv'), index_col='Date_Time', parse_dates=True)
+#----------------------------------------------------------
+# Check Input Data
+#----------------------------------------------------------
+# Method to check the raw data before anything is computed from it
+def check_data(plot_parameters, metafile, master_data, feeding_data, sucrose_data, feeding_hourly_frame, sucrose_hourly_frame,
+               normalized_feeding, normalized_sucrose, gene_data, video_metafile):
+    with stage("check_data"):
+        problems = []
+        rats = set(metafile.index.astype(str))
+        groups = set(metafile.Diet + ' ' + metafile.Feeding)
+        # Every diet group needs plot parameters
+        for group in sorted((groups | set(master_data.group)) - set(plot_parameters.index)):
+            problems.append("no plot parameters for group '" + group + "' in plotting_by_group.csv")
+        # Every rat with video, termination or gene data needs body weights
+        for name, frame in [("food_total.csv", feeding_data), ("sucrose_total.csv", sucrose_data), ("food_total_by_hour.csv", feeding_hourly_frame),
+                            ("sucrose_total_by_hour.csv", sucrose_hourly_frame), ("qPCR_normalized_gapdph.csv", gene_data)]:
+            for rat in sorted(set(frame.index.astype(str)) - rats, key = str):
+                problems.append("rat " + rat + " of " + name + " is not in the daily weight log")
+        for rat in sorted(set(master_data.Rat.astype(str)) - rats, key = str):
+            problems.append("rat " + rat + " of the termination data is not in the daily weight log")
+        # Hourly data has one column per hour and the normalized data one column per diet group, in time order
+        for name, frame in [("food_total_by_hour.csv", feeding_hourly_frame), ("sucrose_total_by_hour.csv", sucrose_hourly_frame)]:
+            if frame.shape[1] != 25 or "group" not in frame.columns:
+                problems.append(name + " does not have 24 hourly columns and a group column")
+        for group in sorted(set(master_data.index) - set(normalized_feeding.columns)):
+            problems.append("Feeding_Normalized_Activity.csv has no column for group '" + group + "'")
+        # Only the HFHS groups had access to sucrose
+        for group in sorted(set(normalized_sucrose.columns) - set(master_data.index)):
+            problems.append("Sucrose_Normalized_Activity.csv has a column for unknown group '" + group + "'")
+        for name, frame in [("Feeding_Normalized_Activity.csv", normalized_feeding), ("Sucrose_Normalized_Activity.csv", normalized_sucrose)]:
+            if not frame.index.is_monotonic_increasing:
+                problems.append(name + " is not sorted by time")
+        if problems:
+            raise Exception("Input data check failed:\n    " + "\n    ".join(problems))
+
+    return {"data_summary": {"rats": len(rats), "groups": len(groups), "video_rats": len(video_metafile)}}
 
-# Download hourly sucrose data 
-sucrose_hourly_frame = pd.read_csv(sucrose_archive.open('sucrose_total_by_hour.csv'), index_col = 0)
 
-# Download gene data
-gene_data = pd.read_csv("Data for figures/qPCR_normalized_gapdph.csv", index_col=0)
+# In[5]:
 
 
-# In[5]:
+#----------------------------------------------------------
+# Figure1 Dataframe Generation
+#----------------------------------------------------------
+# Method to create the daily body weight of every rat (one column per rat)
+def fig1_frames(body_weight):
+    with stage("derive_frames", figure = "Fig1"):
+        # Modify raw data for figures
+        plot_body_weight = body_weight.T
+        plot_body_weight.columns = plot_body_weight.iloc[0]
+        plot_body_weight = plot_body_weight.drop(['Rat', 'Diet', 'Feeding'])
 
+    return {"plot_body_weight": plot_body_weight}
 
 #----------------------------------------------------------
 # Figure1 Generation
 #----------------------------------------------------------
-# Modify raw data for figures
-plot_body_weight.drop(['Rat', 'Diet', 'Feeding'], inplace = True)
-
-# Figure 1 Size
-plt.figure(figsize = (7.48, 6))
-
-# Create Fig1A subplot
-plt.subplot2grid((2, 5), (0, 0), colspan=2)
-Fig1A_timeplot(metafile, plot_body_weight)
-# Significance Markers
-plt.annotate('*', (4.4, 80), fontsize=15, color = 'black', fontweight='bold')
-plt.annotate('#', (44.2, 365), fontsize=10, color = 'gray', fontweight='bold')
-# Subplot Text Label
-plt.figtext(0.05, 0.86, 'A', fontsize=15, fontweight='bold')
-
-# Create Fig1B subplot
-plt.subplot2grid((2, 5), (0, 2), colspan=2)
-Fig1B_boxplot(master_data.set_index("Rat"), plot_parameters)
-# Significance Markers
-plt.annotate('*', (1.93, 26.8), fontsize=15, color = 'black', fontweight='bold')
-# Subplot Text Label
-plt.figtext(0.395, 0.86, 'B', fontsize=15, fontweight='bold')
-
-# Create Legend
-ax = plt.subplot(2,5,5)
-make_legend()
-ax.axis('off')
-
-# LIVER WEIGHT
-plt.subplot(2, 4, 8)
-Fig1CtoF_boxplot(master_data.liver_weight, "g", "Liver Mass")
-# Increase number of yticks
-plt.yticks(np.arange(12, 22, 2))
-# Subplot Text Label
-plt.figtext(0.7, 0.43, "F", fontsize = 15, color = "black", fontweight = "bold")
-
-
-# TRIGLYCERIDE
-plt.subplot(2, 4, 7)
-Fig1CtoF_boxplot(master_data.Triglyceride, "mg/mL", "Triglyceride")
-# Significance Markers
-plt.annotate('*', (1.85, 4.7), fontsize=15, color = 'black', fontweight='bold')
-plt.annotate('#', (2.8, 3.5), fontsize=10, color = 'black', fontweight='bold')
-# Subplot Text Label
-plt.figtext(0.5, 0.43, "E", fontsize = 15, color = "black", fontweight = "bold")
-
-# ADIPONECTIN
-plt.subplot(2, 4, 6)
-Fig1CtoF_boxplot(master_data.Adiponectin, "mcg/mL", "Adiponectin")
-# Increase number of yticks
-plt.yticks(np.arange(4, 10, 1))
-# Significance Markers
-plt.annotate('#', (0.8, 9.5), fontsize=10, color = 'black', fontweight='bold')
-plt.annotate('*', (2.85, 7.5), fontsize=15, color = 'black', fontweight='bold')
-# Subplot Text Label
-plt.figtext(0.285, 0.43, "D", fontsize = 15, color = "black", fontweight = "bold")
-
-# LEPTIN
-plt.subplot(2, 4, 5)
-Fig1CtoF_boxplot(master_data.Leptin, "mcg/mL", "Leptin")
-# Significance Markers
-plt.annotate('#', (2.8, 2.1), fontsize=10, color = 'black', fontweight='bold')
-# Subplot Text Label
-plt.figtext(0.07, 0.43, "C", fontsize = 15, color = "black", fontweight = "bold")
-
-# Clean up figure
-sns.despine()
-plt.subplots_adjust(left=None, bottom=None, right=None, top=None, wspace=0.6, hspace=0.3)
-
-plt.savefig('Figures_And_Analysis/Fig1.tif', dpi = 1000)
+# Method to draw Figure 1
+def fig1_figure(metafile, plot_body_weight, master_data, plot_parameters):
+    with stage("figure", figure = "Fig1"):
+        # Restore the figure from the figure cache if its data, plot parameters and drawing code are unchanged (see figure_cache.py)
+        fig1_outputs = ['Figures_And_Analysis/Fig1.tif']
+        fig1_key = figure_key("Fig1", [metafile, plot_body_weight, master_data], [plot_parameters], [set_figure_style, Fig1A_timeplot, Fig1B_boxplot, Fig1CtoF_boxplot, make_legend],
+                              cell_source(os.path.abspath(__file__), "Figure1 Generation"))
+        if arguments.force or not restore_figure(fig1_key, fig1_outputs):
+            # Figure 1 Size
+            plt.figure(figsize = (7.48, 6))
+
+            # Create Fig1A subplot
+            plt.subplot2grid((2, 5), (0, 0), colspan=2)
+            Fig1A_timeplot(metafile, plot_body_weight, plot_parameters)
+            # Significance Markers
+            plt.annotate('*', (4.4, 80), fontsize=15, color = 'black', fontweight='bold')
+            plt.annotate('#', (44.2, 365), fontsize=10, color = 'gray', fontweight='bold')
+            # Subplot Text Label
+            plt.figtext(0.05, 0.86, 'A', fontsize=15, fontweight='bold')
+
+            # Create Fig1B subplot
+            plt.subplot2grid((2, 5), (0, 2), colspan=2)
+            Fig1B_boxplot(master_data.set_index("Rat"), plot_parameters)
+            # Significance Markers
+            plt.annotate('*', (1.93, 26.8), fontsize=15, color = 'black', fontweight='bold')
+            # Subplot Text Label
+            plt.figtext(0.395, 0.86, 'B', fontsize=15, fontweight='bold')
+
+            # Create Legend
+            ax = plt.subplot(2,5,5)
+            make_legend()
+            ax.axis('off')
+
+            # LIVER WEIGHT
+            plt.subplot(2, 4, 8)
+            Fig1CtoF_boxplot(master_data.liver_weight, "g", "Liver Mass", plot_parameters)
+            # Increase number of yticks
+            plt.yticks(np.arange(12, 22, 2))
+            # Subplot Text Label
+            plt.figtext(0.7, 0.43, "F", fontsize = 15, color = "black", fontweight = "bold")
+
+
+            # TRIGLYCERIDE
+            plt.subplot(2, 4, 7)
+            Fig1CtoF_boxplot(master_data.Triglyceride, "mg/mL", "Triglyceride", plot_parameters)
+            # Significance Markers
+            plt.annotate('*', (1.85, 4.7), fontsize=15, color = 'black', fontweight='bold')
+            plt.annotate('#', (2.8, 3.5), fontsize=10, color = 'black', fontweight='bold')
+            # Subplot Text Label
+            plt.figtext(0.5, 0.43, "E", fontsize = 15, color = "black", fontweight = "bold")
+
+            # ADIPONECTIN
+            plt.subplot(2, 4, 6)
+            Fig1CtoF_boxplot(master_data.Adiponectin, "mcg/mL", "Adiponectin", plot_parameters)
+            # Increase number of yticks
+            plt.yticks(np.arange(4, 10, 1))
+            # Significance Markers
+            plt.annotate('#', (0.8, 9.5), fontsize=10, color = 'black', fontweight='bold')
+            plt.annotate('*', (2.85, 7.5), fontsize=15, color = 'black', fontweight='bold')
+            # Subplot Text Label
+            plt.figtext(0.285, 0.43, "D", fontsize = 15, color = "black", fontweight = "bold")
+
+            # LEPTIN
+            plt.subplot(2, 4, 5)
+            Fig1CtoF_boxplot(master_data.Leptin, "mcg/mL", "Leptin", plot_parameters)
+            # Significance Markers
+            plt.annotate('#', (2.8, 2.1), fontsize=10, color = 'black', fontweight='bold')
+            # Subplot Text Label
+            plt.figtext(0.07, 0.43, "C", fontsize = 15, color = "black", fontweight = "bold")
+
+            # Clean up figure
+            sns.despine()
+            plt.subplots_adjust(left=None, bottom=None, right=None, top=None, wspace=0.6, hspace=0.3)
+
+            plt.savefig('Figures_And_Analysis/Fig1.tif', dpi = 1000)
+            store_figure(fig1_key, fig1_outputs, cache_size_mb = arguments.cache_size)
 
 
 # In[6]:
@@ -669,148 +784,164 @@ plt.savefig('Figures_And_Analysis/Fig1.tif', dpi = 1000)
 #----------------------------------------------------------
 # Figure1 Statistical Analysis
 #----------------------------------------------------------
-# Modify Raw Data
-body_weight.set_index("Rat", inplace = True)
-body_weight['diet_and_schedule'] = body_weight["Diet"].astype(str) +" "+ body_weight["Feeding"].astype(str)
-
-# Fig1A - 2x2 Mixed Model ANOVA for pre-TRF Body Weight Results 
-## Only comparing HFHS ad lib (n=17) vs Cont ad lib (n=18) (no restricted access yet)
-mix_anova_df = body_weight.reset_index().drop(["Feeding", "Diet"], axis=1).melt(id_vars=["diet_and_schedule", "Rat"]).rename(columns={"variable": "Time", "value": "body_weight"})
-preTRF = mix_anova_df.loc[0:944].replace({"HFHS restriction": "HFHS ad lib", "control restriction": "control ad lib"})
-aov = mixed_anova(dv='body_weight', between='diet_and_schedule', within='Time', subject='Rat', data=preTRF).round(3)
-
-# Fig1A - TukeyHSD for pre-TRF Body Weight Results
-preTRF_Tukey_results = pd.DataFrame()
-
-# Run TukeyHSD of body weight between HFHS ad lib (n=17) vs Control ad lib (n=18) (2 groups) every day until 28th day
-daynumber = 1
-for day in plot_body_weight.index[0:27]:
-    result = day_anova_analysis(day, body_weight.replace({"HFHS restriction": "HFHS ad lib", "control restriction": "control ad lib"}))
-    result.iloc[0, -1] = day
-    result.iloc[1, -1] = "Day: " + str(daynumber)
-    preTRF_Tukey_results = preTRF_Tukey_results.append(result)
-    daynumber += 1
-    
-# Send Results to CSV File
-preTRF_Tukey_clean = preTRF_Tukey_results.fillna("").rename(index={0:'', 1:'', 2:'', 3:'', 4:'', 5:''}).iloc[:,5:].reset_index(drop=True)
-pd.concat([aov, preTRF_Tukey_clean]).fillna("").to_csv("Figures_And_Analysis/Fig1A_MixedModel_ANOVA_and_TukeyHSD_preTRF.csv", index = False)
-
-# Fig1A - 2x2 Mixed Model ANOVA for post-TRF Body Weight Results
-## Between-Factor is between 4 diet-schedule groups
-postTRF = mix_anova_df.loc[945::]
-aov = mixed_anova(dv='body_weight', between='diet_and_schedule', within='Time', subject='Rat', data=postTRF).round(3)
-
-# Fig1A - TukeyHSD for post-TRF Body Weight Results
-postTRF_Tukey_results = pd.DataFrame()
-
-# Run TukeyHSD of body weight for each of 4 diet groups every day from day 28 (when restriction begins)
-daynumber = 28
-for day in plot_body_weight.index[27::]:
-    result = day_anova_analysis(day, body_weight)
-    result.iloc[0, -1] = day
-    result.iloc[1, -1] = "Day: " + str(daynumber)
-    postTRF_Tukey_results = postTRF_Tukey_results.append(result)
-    daynumber += 1
-# Send Results to CSV File
-postTRF_Tukey_clean = postTRF_Tukey_results.fillna("").rename(index={0:'', 1:'', 2:'', 3:'', 4:'', 5:''}).iloc[:,5:].reset_index(drop=True)
-pd.concat([aov, postTRF_Tukey_clean]).fillna("").to_csv("Figures_And_Analysis/Fig1A_MixedModel_ANOVA_and_TukeyHSD_postTRF.csv", index = False)
-
-# Fig1B 2x2 Simple ANOVA (2 Between Factors) analysis
-total_fat_mass_anova = metabolite_anova_analysis("total_fat_pad", master_data.set_index("Rat"))
-
-# Send Results to CSV File
-total_fat_mass_anova.fillna("").rename(index={0:'', 1:'', 2:'', 3:'', 4:'', 5:''}).to_csv("Figures_And_Analysis/Fig1B_ANOVA_and_TukeyHSD.csv")
-
-
-metabolites_hormones = ['Leptin', 'Adiponectin', 'Triglyceride', 'liver_weight']
-
-metabolite_results = pd.DataFrame()
-
-# Fig1C through F - 2x2 Simple ANOVA and Tukey
-for group in metabolites_hormones:
-    result = metabolite_anova_analysis(group, master_data.set_index("Rat"))
-    result.iloc[0, -1] = group
-    metabolite_results = metabolite_results.append(result)
-
-# Send Results to CSV File
-metabolite_results.fillna("").rename(index={0:'', 1:'', 2:'', 3:'', 4:'', 5:''}).to_csv("Figures_And_Analysis/Fig1CtoF_ANOVA_and_Tukey.csv")
+# Method to run the statistical analysis of Figure 1 - the results are collected in a store of this stage and written by write_results()
+def fig1_statistics(body_weight, plot_body_weight, master_data, cohort):
+    with stage("statistics", figure = "Fig1"):
+        results_store = open_results_store(":memory:")
+        control_ad_lib, control_restricted, HFHS_ad_lib, HFHS_restricted = design_groups(cohort, "metafile_group")
+        # The restricted groups were fed ad lib until restriction began
+        pre_restriction_groups = {HFHS_restricted: HFHS_ad_lib, control_restricted: control_ad_lib}
+
+        # Modify Raw Data
+        body_weight = body_weight.set_index("Rat")
+        body_weight['diet_and_schedule'] = body_weight["Diet"].astype(str) +" "+ body_weight["Feeding"].astype(str)
+
+        # Fig1A - 2x2 Mixed Model ANOVA for pre-TRF Body Weight Results
+        ## Only comparing HFHS ad lib (n=17) vs Cont ad lib (n=18) (no restricted access yet)
+        mix_anova_df = body_weight.reset_index().drop(["Feeding", "Diet"], axis=1).melt(id_vars=["diet_and_schedule", "Rat"]).rename(columns={"variable": "Time", "value": "body_weight"})
+        preTRF = mix_anova_df.loc[0:944].replace(pre_restriction_groups)
+        aov = mixed_anova(dv='body_weight', between='diet_and_schedule', within='Time', subject='Rat', data=preTRF).round(3)
+        record_anova(results_store, "Fig1A preTRF", "mixed_anova", aov)
+
+        # Fig1A - TukeyHSD for pre-TRF Body Weight Results
+        # Run TukeyHSD of body weight between HFHS ad lib (n=17) vs Control ad lib (n=18) (2 groups) every day until 28th day
+        daynumber = 1
+        for day in plot_body_weight.index[0:27]:
+            result = day_anova_analysis(day, body_weight.replace(pre_restriction_groups))
+            record_anova_and_tukey(results_store, "Fig1A preTRF", "anova", result, block = "Day: " + str(daynumber), label = day)
+            daynumber += 1
+
+        # Fig1A - 2x2 Mixed Model ANOVA for post-TRF Body Weight Results
+        ## Between-Factor is between 4 diet-schedule groups
+        postTRF = mix_anova_df.loc[945::]
+        aov = mixed_anova(dv='body_weight', between='diet_and_schedule', within='Time', subject='Rat', data=postTRF).round(3)
+        record_anova(results_store, "Fig1A postTRF", "mixed_anova", aov)
+
+        # Fig1A - TukeyHSD for post-TRF Body Weight Results
+        # Run TukeyHSD of body weight for each of 4 diet groups every day from day 28 (when restriction begins)
+        daynumber = 28
+        for day in plot_body_weight.index[27::]:
+            result = day_anova_analysis(day, body_weight)
+            record_anova_and_tukey(results_store, "Fig1A postTRF", "anova", result, block = "Day: " + str(daynumber), label = day)
+            daynumber += 1
+
+        # Fig1B 2x2 Simple ANOVA (2 Between Factors) analysis
+        total_fat_mass_anova = metabolite_anova_analysis("total_fat_pad", master_data.set_index("Rat"))
+        record_anova_and_tukey(results_store, "Fig1B", "anova", total_fat_mass_anova, block = "total_fat_pad")
+
+
+        metabolites_hormones = ['Leptin', 'Adiponectin', 'Triglyceride', 'liver_weight']
+
+        # Fig1C through F - 2x2 Simple ANOVA and Tukey
+        for group in metabolites_hormones:
+            result = metabolite_anova_analysis(group, master_data.set_index("Rat"))
+            record_anova_and_tukey(results_store, "Fig1CtoF", "anova", result, block = group)
+
+        fig1_results = store_tables(results_store)
+        results_store.close()
+
+    return {"fig1_results": fig1_results}
 
 
 # In[7]:
 
 
+#----------------------------------------------------------
+# Figure2 Dataframe Generation
+#----------------------------------------------------------
+# Method to create the total time spent consuming calories (feeding and drinking sucrose) of every rat
+def fig2_frames(feeding_data, sucrose_data, plot_parameters, cohort):
+    with stage("derive_frames", figure = "Fig2"):
+        control_ad_lib, control_restricted, HFHS_ad_lib, HFHS_restricted = design_groups(cohort, "metafile_group")
+        # Modify raw data for figures
+        # Totals as float64 and the group as text (the totals are loaded with compact types, see table_schema.py)
+        feeding_data = expand_totals(feeding_data)
+        sucrose_data = expand_totals(sucrose_data)
+
+        # Combine number of seconds in dark and light periods together into new column called "total_food"
+        feeding_data['total_food'] = feeding_data['light_food'] + feeding_data['dark_food']
+
+        # Combine number of seconds in dark and light periods together into new column called "total_food"
+        sucrose_data['total_sucrose'] = sucrose_data['light_sucrose'] + sucrose_data['dark_sucrose']
+
+        # Create dataframe with total amount of time spent drinking sucrose AND feeding
+        sucrose_and_feeding_data = feeding_data.drop(["group"], axis = 1).rename(columns={"light_food": "light", "dark_food": "dark", "total_food": "total"})
+        # Combine time spent feeding with time drinking sucrose
+        sucrose_and_feeding_data = sucrose_and_feeding_data.add(sucrose_data.drop(["group"], axis = 1).rename(columns={"light_sucrose": "light", "dark_sucrose": "dark", "total_sucrose": "total"}), fill_value = 0)
+        sucrose_and_feeding_data = sucrose_and_feeding_data.astype(int)
+        sucrose_and_feeding_data["group"] = feeding_data["group"]
+
+        # Create dataframe with ratios spent drinking sucrose AND feeding
+        sucrose_and_feeding_data_ratio = sucrose_and_feeding_data.copy()
+        sucrose_and_feeding_data_ratio["light"] = sucrose_and_feeding_data["light"]/sucrose_and_feeding_data["total"]
+        sucrose_and_feeding_data_ratio["dark"] = sucrose_and_feeding_data["dark"]/sucrose_and_feeding_data["total"]
+        sucrose_and_feeding_data_ratio["total"] = sucrose_and_feeding_data["total"]/sucrose_and_feeding_data["total"]
+
+
+        # Create a dataframe that combines the "dark" and "light" calorie-consuming hourly values into one column - for simple plotting
+        # Create an empty dataframe
+        plot_feeding_frame = pd.DataFrame()
+        # Combine/Merge the hourly sucrose AND feeding values from dark and light phase into one column
+        plot_feeding_frame["Consumption_Rate"] = pd.concat([sucrose_and_feeding_data["dark"], sucrose_and_feeding_data["light"]])
+        # Add the diet "group" column - add twice because combining 2 phases
+        plot_feeding_frame["group"] = pd.concat([sucrose_and_feeding_data["group"], sucrose_and_feeding_data["group"]])
+        # Create a new column with just the label "Night" or "Day" for all of the column values
+        plot_feeding_frame["phase"] = pd.concat([sucrose_and_feeding_data["group"].replace(sucrose_and_feeding_data["group"].values, "Night"), sucrose_and_feeding_data["group"].replace(sucrose_and_feeding_data["group"].values, "Day")])
+        # Keep only the ad lib animals
+        plot_feeding_frame = plot_feeding_frame.where((plot_feeding_frame.group == HFHS_ad_lib) | (plot_feeding_frame.group == control_ad_lib)).dropna()
+        # Make a normal index that makes it easy to index
+        plot_feeding_frame = plot_feeding_frame.reset_index(drop = True)
+
+        # Create a custom plot parameters for this barplot figure
+        barplot_plot_parameters = plot_parameters.reindex([control_restricted, HFHS_restricted, control_ad_lib, HFHS_ad_lib]).iloc[-2:]
+        # Add custom edge colors
+        barplot_plot_parameters["edgecolors"] = ["black", "darkred"]
+        edged_plot_parameters = plot_parameters.copy()
+        edged_plot_parameters["edgecolors"] = ["black", "gray", "darkred", "red"]
+
+    return {"total_feeding_data": feeding_data, "sucrose_and_feeding_data": sucrose_and_feeding_data, "sucrose_and_feeding_data_ratio": sucrose_and_feeding_data_ratio,
+            "plot_feeding_frame": plot_feeding_frame, "barplot_plot_parameters": barplot_plot_parameters, "edged_plot_parameters": edged_plot_parameters}
+
 #----------------------------------------------------------
 # Figure2 Generation
 #----------------------------------------------------------
-# Modify raw data for figures
-# Combine number of seconds in dark and light periods together into new column called "total_food"
-feeding_data['total_food'] = feeding_data['light_food'] + feeding_data['dark_food']
-
-# Combine number of seconds in dark and light periods together into new column called "total_food"
-sucrose_data['total_sucrose'] = sucrose_data['light_sucrose'] + sucrose_data['dark_sucrose']
-
-# Create dataframe with total amount of time spent drinking sucrose AND feeding
-sucrose_and_feeding_data = feeding_data.drop(["group"], axis = 1).rename(columns={"light_food": "light", "dark_food": "dark", "total_food": "total"})
-# Combine time spent feeding with time drinking sucrose 
-sucrose_and_feeding_data = sucrose_and_feeding_data.add(sucrose_data.drop(["group"], axis = 1).rename(columns={"light_sucrose": "light", "dark_sucrose": "dark", "total_sucrose": "total"}), fill_value = 0)
-sucrose_and_feeding_data = sucrose_and_feeding_data.astype(int)
-sucrose_and_feeding_data["group"] = feeding_data["group"]
-
-# Create dataframe with ratios spent drinking sucrose AND feeding
-sucrose_and_feeding_data_ratio = sucrose_and_feeding_data.copy()
-sucrose_and_feeding_data_ratio["light"] = sucrose_and_feeding_data["light"]/sucrose_and_feeding_data["total"]
-sucrose_and_feeding_data_ratio["dark"] = sucrose_and_feeding_data["dark"]/sucrose_and_feeding_data["total"]
-sucrose_and_feeding_data_ratio["total"] = sucrose_and_feeding_data["total"]/sucrose_and_feeding_data["total"]
-
-
-# Create a dataframe that combines the "dark" and "light" calorie-consuming hourly values into one column - for simple plotting
-# Create an empty dataframe
-plot_feeding_frame = pd.DataFrame()
-# Combine/Merge the hourly sucrose AND feeding values from dark and light phase into one column
-plot_feeding_frame["Consumption_Rate"] = pd.concat([sucrose_and_feeding_data["dark"], sucrose_and_feeding_data["light"]])
-# Add the diet "group" column - add twice because combining 2 phases
-plot_feeding_frame["group"] = pd.concat([sucrose_and_feeding_data["group"], sucrose_and_feeding_data["group"]])
-# Create a new column with just the label "Night" or "Day" for all of the column values
-plot_feeding_frame["phase"] = pd.concat([sucrose_and_feeding_data["group"].replace(sucrose_and_feeding_data["group"].values, "Night"), sucrose_and_feeding_data["group"].replace(sucrose_and_feeding_data["group"].values, "Day")])
-# Keep only the ad lib animals
-plot_feeding_frame = plot_feeding_frame.where((plot_feeding_frame.group == "HFHS ad lib") | (plot_feeding_frame.group == "control ad lib")).dropna()
-# Make a normal index that makes it easy to index
-plot_feeding_frame = plot_feeding_frame.reset_index(drop = True)
-
-# Create a custom plot parameters for this barplot figure
-barplot_plot_parameters = plot_parameters.reindex(["control restriction", "HFHS restriction", "control ad lib", "HFHS ad lib"]).iloc[-2:]
-# Add custom edge colors
-barplot_plot_parameters["edgecolors"] = ["black", "darkred"]
-plot_parameters["edgecolors"] = ["black", "gray", "darkred", "red"]
-
-# Figure 2 Size
-plt.figure(figsize=(7.48, 2.5))
-
-# Figure 2A
-plt.subplot(1,2,1)
-#Fig2A_boxplot(sucrose_and_feeding_data, 'total', "Total Time \n Consuming Calories (sec)", plot_parameters)
-Fig2A_barplot(sucrose_and_feeding_data, feeding_data,  "Total Time \n Consuming Calories (sec)", plot_parameters)
-plt.figtext(0.01, 0.88, "A", fontsize = 15, color = "black", fontweight = "bold")
-# Significance Markers
-plt.annotate('#', (0.95, 5000), fontsize=15, color = 'black', fontweight='bold')
-
-# Figure 2B
-plt.subplot(1,2,2)
-Fig2B_barplot(plot_feeding_frame,  "Time Spent \n Consuming Calories (sec)", barplot_plot_parameters)
-plt.figtext(0.5, 0.88, "B", fontsize = 15, color = "black", fontweight = "bold")
-# Add Numbers
-plt.annotate('29.47%', (0.09, 2000), fontsize=10, color = 'black', fontweight='bold')
-plt.annotate('70.53%', (-0.3, 4100), fontsize=10, color = 'black', fontweight='bold')
-plt.annotate('18.16%', (1.05, 1000), fontsize=10, color = 'red', fontweight='bold')
-plt.annotate('81.84%', (0.65, 3300), fontsize=10, color = 'red', fontweight='bold')
-
-# Significance Markers
-plt.annotate('*', (0.17, 3000), fontsize=15, color = 'black', fontweight='bold')
-plt.annotate('*', (1.17, 2000), fontsize=15, color = 'black', fontweight='bold')
-plt.plot([0, 1], [4500, 4500], 'k-', lw=1)
-plt.annotate('a', (0.45, 4600), fontsize=10, color = 'black', fontweight='bold')
-
-plt.savefig('Figures_And_Analysis/Fig2.tif', dpi = 1000)
+# Method to draw Figure 2
+def fig2_figure(sucrose_and_feeding_data, total_feeding_data, plot_feeding_frame, edged_plot_parameters, barplot_plot_parameters):
+    with stage("figure", figure = "Fig2"):
+        # Restore the figure from the figure cache if its data, plot parameters and drawing code are unchanged (see figure_cache.py)
+        fig2_outputs = ['Figures_And_Analysis/Fig2.tif']
+        fig2_key = figure_key("Fig2", [sucrose_and_feeding_data, total_feeding_data, plot_feeding_frame], [edged_plot_parameters, barplot_plot_parameters], [set_figure_style, Fig2A_barplot, Fig2B_barplot],
+                              cell_source(os.path.abspath(__file__), "Figure2 Generation"))
+        if arguments.force or not restore_figure(fig2_key, fig2_outputs):
+            # Figure 2 Size
+            plt.figure(figsize=(7.48, 2.5))
+
+            # Figure 2A
+            plt.subplot(1,2,1)
+            #Fig2A_boxplot(sucrose_and_feeding_data, 'total', "Total Time \n Consuming Calories (sec)", edged_plot_parameters)
+            Fig2A_barplot(sucrose_and_feeding_data, total_feeding_data,  "Total Time \n Consuming Calories (sec)", edged_plot_parameters)
+            plt.figtext(0.01, 0.88, "A", fontsize = 15, color = "black", fontweight = "bold")
+            # Significance Markers
+            plt.annotate('#', (0.95, 5000), fontsize=15, color = 'black', fontweight='bold')
+
+            # Figure 2B
+            plt.subplot(1,2,2)
+            Fig2B_barplot(plot_feeding_frame,  "Time Spent \n Consuming Calories (sec)", barplot_plot_parameters)
+            plt.figtext(0.5, 0.88, "B", fontsize = 15, color = "black", fontweight = "bold")
+            # Add Numbers
+            plt.annotate('29.47%', (0.09, 2000), fontsize=10, color = 'black', fontweight='bold')
+            plt.annotate('70.53%', (-0.3, 4100), fontsize=10, color = 'black', fontweight='bold')
+            plt.annotate('18.16%', (1.05, 1000), fontsize=10, color = 'red', fontweight='bold')
+            plt.annotate('81.84%', (0.65, 3300), fontsize=10, color = 'red', fontweight='bold')
+
+            # Significance Markers
+            plt.annotate('*', (0.17, 3000), fontsize=15, color = 'black', fontweight='bold')
+            plt.annotate('*', (1.17, 2000), fontsize=15, color = 'black', fontweight='bold')
+            plt.plot([0, 1], [4500, 4500], 'k-', lw=1)
+            plt.annotate('a', (0.45, 4600), fontsize=10, color = 'black', fontweight='bold')
+
+            plt.savefig('Figures_And_Analysis/Fig2.tif', dpi = 1000)
+            store_figure(fig2_key, fig2_outputs, cache_size_mb = arguments.cache_size)
 
 
 # In[8]:
@@ -819,36 +950,47 @@ plt.savefig('Figures_And_Analysis/Fig2.tif', dpi = 1000)
 #----------------------------------------------------------
 # Figure2 Statistical Analysis
 #----------------------------------------------------------
-# T-Tests for Fig3
-results = pd.DataFrame(columns = ["group1", "group2", "t-statistic", "p-value"])
-
-# T-Test #1: Control Ad Lib vs Control Restriction Total Calorie Consumption
-t, p = stats.ttest_ind(sucrose_and_feeding_data["total"].where(sucrose_and_feeding_data.group == "control ad lib").dropna(), 
-                      sucrose_and_feeding_data["total"].where(sucrose_and_feeding_data.group == "control restriction").dropna())
-results.loc[0] = ["control ad lib", "control restriction", t, p]
-# T-Test #2: HFHS Ad Lib vs HFHS Restriction Total Calorie Consumption
-t, p = stats.ttest_ind(sucrose_and_feeding_data["total"].where(sucrose_and_feeding_data.group == "HFHS ad lib").dropna(), 
-                      sucrose_and_feeding_data["total"].where(sucrose_and_feeding_data.group == "HFHS restriction").dropna())
-results.loc[1] = ["HFHS ad lib", "HFHS restriction", t, p]
-# T-Test #3: Control Ad Lib Day vs Night Calorie Consumption
-t, p = stats.ttest_ind(sucrose_and_feeding_data["light"].where(sucrose_and_feeding_data.group == "control ad lib").dropna(), 
-                      sucrose_and_feeding_data["dark"].where(sucrose_and_feeding_data.group == "control ad lib").dropna())
-results.loc[2] = ["Control ad lib Day", "Control ad lib Night", t, p]
-# T-Test #4: HFHS Ad Lib Day vs Night Total Calorie Consumption
-t, p = stats.ttest_ind(sucrose_and_feeding_data["light"].where(sucrose_and_feeding_data.group == "HFHS ad lib").dropna(), 
-                      sucrose_and_feeding_data["dark"].where(sucrose_and_feeding_data.group == "HFHS ad lib").dropna())
-results.loc[3] = ["HFHS ad lib Day", "HFHS ad lib Night", t, p]
-# T-Test #5 Control Ad Lib Day Ratio vs HFHS Ad Lib Day Ratio Calorie Consumption
-t, p = stats.ttest_ind(sucrose_and_feeding_data_ratio["light"].where(sucrose_and_feeding_data_ratio.group == "control ad lib").dropna(), 
-                      sucrose_and_feeding_data_ratio["light"].where(sucrose_and_feeding_data_ratio.group == "HFHS ad lib").dropna())
-results.loc[4] = ["control ad lib Day Ratio", "HFHS ad lib Day Ratio", t, p]
-
-# T-Test #6 Control Ad Lib Night Ratio vs HFHS Ad Lib Night Ratio Calorie Consumption
-t, p = stats.ttest_ind(sucrose_and_feeding_data_ratio["dark"].where(sucrose_and_feeding_data_ratio.group == "control ad lib").dropna(), 
-                      sucrose_and_feeding_data_ratio["dark"].where(sucrose_and_feeding_data_ratio.group == "HFHS ad lib").dropna())
-results.loc[5] = ["control ad lib Night Ratio", "HFHS ad lib Night Ratio", t, p]
-
-results.set_index("group1").to_csv("Figures_And_Analysis/Fig2_T_Tests.csv")
+# Method to run the statistical analysis of Figure 2
+def fig2_statistics(sucrose_and_feeding_data, sucrose_and_feeding_data_ratio, cohort):
+    with stage("statistics", figure = "Fig2"):
+        results_store = open_results_store(":memory:")
+        control_ad_lib, control_restricted, HFHS_ad_lib, HFHS_restricted = design_groups(cohort, "metafile_group")
+
+        # T-Tests for Fig3
+        results = pd.DataFrame(columns = ["group1", "group2", "t-statistic", "p-value"])
+
+        # T-Test #1: Control Ad Lib vs Control Restriction Total Calorie Consumption
+        t, p = stats.ttest_ind(sucrose_and_feeding_data["total"].where(sucrose_and_feeding_data.group == control_ad_lib).dropna(),
+                              sucrose_and_feeding_data["total"].where(sucrose_and_feeding_data.group == control_restricted).dropna())
+        results.loc[0] = [control_ad_lib, control_restricted, t, p]
+        # T-Test #2: HFHS Ad Lib vs HFHS Restriction Total Calorie Consumption
+        t, p = stats.ttest_ind(sucrose_and_feeding_data["total"].where(sucrose_and_feeding_data.group == HFHS_ad_lib).dropna(),
+                              sucrose_and_feeding_data["total"].where(sucrose_and_feeding_data.group == HFHS_restricted).dropna())
+        results.loc[1] = [HFHS_ad_lib, HFHS_restricted, t, p]
+        # T-Test #3: Control Ad Lib Day vs Night Calorie Consumption
+        t, p = stats.ttest_ind(sucrose_and_feeding_data["light"].where(sucrose_and_feeding_data.group == control_ad_lib).dropna(),
+                              sucrose_and_feeding_data["dark"].where(sucrose_and_feeding_data.group == control_ad_lib).dropna())
+        results.loc[2] = [control_ad_lib + " Day", control_ad_lib + " Night", t, p]
+        # T-Test #4: HFHS Ad Lib Day vs Night Total Calorie Consumption
+        t, p = stats.ttest_ind(sucrose_and_feeding_data["light"].where(sucrose_and_feeding_data.group == HFHS_ad_lib).dropna(),
+                              sucrose_and_feeding_data["dark"].where(sucrose_and_feeding_data.group == HFHS_ad_lib).dropna())
+        results.loc[3] = [HFHS_ad_lib + " Day", HFHS_ad_lib + " Night", t, p]
+        # T-Test #5 Control Ad Lib Day Ratio vs HFHS Ad Lib Day Ratio Calorie Consumption
+        t, p = stats.ttest_ind(sucrose_and_feeding_data_ratio["light"].where(sucrose_and_feeding_data_ratio.group == control_ad_lib).dropna(),
+                              sucrose_and_feeding_data_ratio["light"].where(sucrose_and_feeding_data_ratio.group == HFHS_ad_lib).dropna())
+        results.loc[4] = [control_ad_lib + " Day Ratio", HFHS_ad_lib + " Day Ratio", t, p]
+
+        # T-Test #6 Control Ad Lib Night Ratio vs HFHS Ad Lib Night Ratio Calorie Consumption
+        t, p = stats.ttest_ind(sucrose_and_feeding_data_ratio["dark"].where(sucrose_and_feeding_data_ratio.group == control_ad_lib).dropna(),
+                              sucrose_and_feeding_data_ratio["dark"].where(sucrose_and_feeding_data_ratio.group == HFHS_ad_lib).dropna())
+        results.loc[5] = [control_ad_lib + " Night Ratio", HFHS_ad_lib + " Night Ratio", t, p]
+
+        record_pairwise(results_store, "Fig2", "t_test", results, "t-statistic", "p-value", "t")
+
+        fig2_results = store_tables(results_store)
+        results_store.close()
+
+    return {"fig2_results": fig2_results}
 
 
 # In[9]:
@@ -857,35 +999,43 @@ results.set_index("group1").to_csv("Figures_And_Analysis/Fig2_T_Tests.csv")
 #----------------------------------------------------------
 # Figure3G Dataframe Generation
 #----------------------------------------------------------
-# Select only the final 3 hours of interest (from 4:00 to 7:00)
-final_hours_of_interest = feeding_hourly_frame[["4:00", "5:00", "6:00", "group"]]
-final_hours_of_interest = final_hours_of_interest[(final_hours_of_interest["group"] == "control restriction") | (final_hours_of_interest["group"] == "HFHS restriction")]
-
-# Create a dataframe that combines the final 3 hours of feeding into one column - for simple plotting and ANOVA
-# Create an empty dataframe
-final_feeding_frame = pd.DataFrame()
-# Combine/Merge the hourly feeding values from final 3 hours into one column
-final_feeding_frame["Consumption_Rate"] = pd.concat([final_hours_of_interest["4:00"],
-                                            final_hours_of_interest["5:00"],
-                                            final_hours_of_interest["6:00"]])
-# Add the diet "group" column into this dataframe
-final_feeding_frame["group"] = pd.concat([final_hours_of_interest["group"],
-                                 final_hours_of_interest["group"],
-                                 final_hours_of_interest["group"]])
-# Create a new column with just the label "6th", "7th" or "8th" for all of the column values
-final_feeding_frame["phase"] = pd.concat([final_hours_of_interest["group"].replace(final_hours_of_interest["group"].values, "6th Hour"), 
-                                 final_hours_of_interest["group"].replace(final_hours_of_interest["group"].values, "7th Hour"),
-                                 final_hours_of_interest["group"].replace(final_hours_of_interest["group"].values, "8th Hour")])
-# Sort values by alphabetical diet type and ascending hour
-final_feeding_frame = final_feeding_frame.sort_values(["group", "phase"], ascending=[False, True]).reset_index(drop = True)
-# Add column that combines diet type and hour
-final_feeding_frame['group_and_phase'] = final_feeding_frame["group"].astype(str) +" "+ final_feeding_frame["phase"].astype(str)
-final_feeding_frame = final_feeding_frame.dropna()
-
-# Create a custom plot parameter for the barplot figure
-final_barplot_plot_parameters = plot_parameters.reindex(["control ad lib", "HFHS ad lib", "control restriction", "HFHS restriction"]).iloc[-2:]
-# Add custom edge colors
-final_barplot_plot_parameters["edgecolors"] = ["grey", "red"]
+# Method to create the feeding of the restricted rats in the final 3 hours of their feeding window
+def fig3g_frames(feeding_hourly_frame, plot_parameters, cohort):
+    with stage("derive_frames", figure = "Fig3G"):
+        control_ad_lib, control_restricted, HFHS_ad_lib, HFHS_restricted = design_groups(cohort, "metafile_group")
+        # Hourly counts as float64 and the group as text (the totals are loaded with compact types, see table_schema.py)
+        feeding_hourly_frame = expand_totals(feeding_hourly_frame)
+        # Select only the final 3 hours of interest (from 4:00 to 7:00)
+        final_hours_of_interest = feeding_hourly_frame[["4:00", "5:00", "6:00", "group"]]
+        final_hours_of_interest = final_hours_of_interest[(final_hours_of_interest["group"] == control_restricted) | (final_hours_of_interest["group"] == HFHS_restricted)]
+
+        # Create a dataframe that combines the final 3 hours of feeding into one column - for simple plotting and ANOVA
+        # Create an empty dataframe
+        final_feeding_frame = pd.DataFrame()
+        # Combine/Merge the hourly feeding values from final 3 hours into one column
+        final_feeding_frame["Consumption_Rate"] = pd.concat([final_hours_of_interest["4:00"],
+                                                    final_hours_of_interest["5:00"],
+                                                    final_hours_of_interest["6:00"]])
+        # Add the diet "group" column into this dataframe
+        final_feeding_frame["group"] = pd.concat([final_hours_of_interest["group"],
+                                         final_hours_of_interest["group"],
+                                         final_hours_of_interest["group"]])
+        # Create a new column with just the label "6th", "7th" or "8th" for all of the column values
+        final_feeding_frame["phase"] = pd.concat([final_hours_of_interest["group"].replace(final_hours_of_interest["group"].values, "6th Hour"),
+                                         final_hours_of_interest["group"].replace(final_hours_of_interest["group"].values, "7th Hour"),
+                                         final_hours_of_interest["group"].replace(final_hours_of_interest["group"].values, "8th Hour")])
+        # Sort values by alphabetical diet type and ascending hour
+        final_feeding_frame = final_feeding_frame.sort_values(["group", "phase"], ascending=[False, True]).reset_index(drop = True)
+        # Add column that combines diet type and hour
+        final_feeding_frame['group_and_phase'] = final_feeding_frame["group"].astype(str) +" "+ final_feeding_frame["phase"].astype(str)
+        final_feeding_frame = final_feeding_frame.dropna()
+
+        # Create a custom plot parameter for the barplot figure
+        feeding_barplot_plot_parameters = plot_parameters.reindex([control_ad_lib, HFHS_ad_lib, control_restricted, HFHS_restricted]).iloc[-2:]
+        # Add custom edge colors
+        feeding_barplot_plot_parameters["edgecolors"] = ["grey", "red"]
+
+    return {"final_feeding_frame": final_feeding_frame, "feeding_barplot_plot_parameters": feeding_barplot_plot_parameters}
 
 
 # In[10]:
@@ -894,99 +1044,112 @@ final_barplot_plot_parameters["edgecolors"] = ["grey", "red"]
 #----------------------------------------------------------
 # Figure3 Generation
 #----------------------------------------------------------
-# Figure 3 Size
-f = plt.figure(figsize = (7.48, 9.34))
-
-# Fig3A - Control AdLib
-plt.subplot2grid((22, 2), (0, 0), rowspan=5)
-Fig3AD_timeplot(normalized_feeding["Control Ad Lib"], "0.1", "-")
-# Remove x-axis and ticks for subplot
-plt.xlabel('')
-plt.xticks([])
-## Remove '0' from y-axis
-plt.gca().yaxis.get_major_ticks()[0].label1.set_visible(False)
-plt.figtext(0.04, 0.865, "A", fontsize = 15, color = "black", fontweight = "bold")
-### Group Label
-plt.figtext(0.39, 0.86, "Cont AL", fontsize = 10, color = "black", fontweight = "bold")
-
-# Fig3B - HFHS AdLib
-plt.subplot2grid((22, 2), (0, 1), rowspan=5)
-Fig3AD_timeplot(normalized_feeding["HFHS Ad Lib"], "red", "-")
-plt.xlabel('')
-plt.xticks([])
-# Remove y-axis and ticks for subplot
-plt.ylabel('')
-plt.yticks([])
-plt.figtext(0.5, 0.865, "B", fontsize = 15, color = "black", fontweight = "bold")
-### Group Label
-plt.figtext(0.8, 0.86, "HFHS AL", fontsize = 10, color = "red", fontweight = "bold")
-
-# Fig3C - Control Restricted
-plt.subplot2grid((22, 2), (5, 0), rowspan=5)
-Fig3AD_timeplot(normalized_feeding["Control Restricted"], "0.1", "--")
-plt.xlabel('')
-plt.xticks([])
-## Remove '0' from y-axis
-plt.gca().yaxis.get_major_ticks()[0].label1.set_visible(False)
-plt.figtext(0.04, 0.69, "C", fontsize = 15, color = "black", fontweight = "bold")
-### Group Label
-plt.figtext(0.39, 0.685, "Cont Res", fontsize = 10, color = "black", fontweight = "bold")
-
-# Fig3D - HFHS Restricted
-plt.subplot2grid((22, 2), (5, 1), rowspan=5)
-Fig3AD_timeplot(normalized_feeding["HFHS Restricted"], "red", "--")
-plt.ylabel('')
-plt.yticks([])
-plt.xlabel('')
-plt.xticks([])
-plt.figtext(0.5, 0.69, "D", fontsize = 15, color = "black", fontweight = "bold")
-### Group Label
-plt.figtext(0.8, 0.685, "HFHS Res", fontsize = 10, color = "red", fontweight = "bold")
-
-# Fig3E - Control Restrited - 8-Hour Period
-plt.subplot2grid((22, 2), (10, 0), rowspan=5)
-Fig3EF_timeplot(feeding_hourly_frame.T.iloc[:-1, :], "control restriction", "0.1", video_metafile)
-# Significance Markers
-plt.annotate('*', (6.7, 220), fontsize=15, color = 'black', fontweight='bold')
-plt.annotate('*', (7.7, 150), fontsize=15, color = 'black', fontweight='bold')
-plt.annotate('*', (8.7, 220), fontsize=15, color = 'black', fontweight='bold')
-plt.annotate('*', (9.7, 240), fontsize=15, color = 'black', fontweight='bold')
-plt.figtext(0.04, 0.515, "E", fontsize = 15, color = "black", fontweight = "bold")
-### Group Label
-plt.figtext(0.39, 0.51, "Cont Res", fontsize = 10, color = "black", fontweight = "bold")
-
-# Fig3F - HFHS Restrited - 8-Hour Period
-plt.subplot2grid((22, 2), (10, 1), rowspan=5)
-Fig3EF_timeplot(feeding_hourly_frame.T.iloc[:-1, :], "HFHS restriction", "red", video_metafile)
-plt.ylabel('')
-plt.yticks([])
-# Significance Markers
-plt.annotate('*', (5.7, 200), fontsize=15, color = 'black', fontweight='bold')
-plt.annotate('*', (6.7, 210), fontsize=15, color = 'black', fontweight='bold')
-plt.annotate('*', (7.6, 215), fontsize=15, color = 'black', fontweight='bold')
-plt.annotate('*', (8.5, 160), fontsize=15, color = 'black', fontweight='bold')
-plt.figtext(0.5, 0.515, "F", fontsize = 15, color = "black", fontweight = "bold")
-### Group Label
-plt.figtext(0.8, 0.51, "HFHS Res", fontsize = 10, color = "red", fontweight = "bold")
-
-# Fig3G - Final 3 Hours
-ax = plt.subplot2grid((22, 2), (17, 0), rowspan=5, colspan=2)
-Fig3G_barplot(final_feeding_frame, "Time Spent \nFeeding (sec)", final_barplot_plot_parameters)
-# Increase number of yticks
-plt.yticks(np.arange(0, 700, 100))
-# Significance Markers
-plt.annotate('*', (1, 580), fontsize=15, color = 'black', fontweight='bold')
-plt.plot([0.75, 1.25], [600, 600], 'k-', lw=1)
-plt.annotate('*', (1.1, 535), fontsize=15, color = 'black', fontweight='bold')
-plt.plot([1, 1.25], [555, 555], 'k-', lw=1)
-plt.figtext(0.04, 0.28, "G", fontsize = 15, color = "black", fontweight = "bold")
-
-# Despine subplot
-ax.spines["right"].set_visible(False)
-ax.spines["top"].set_visible(False)
-plt.subplots_adjust(wspace=0.15, hspace=None)
-
-plt.savefig("Figures_And_Analysis/Fig3.tif", dpi = 1000, bbox_inches="tight")
+# Method to draw Figure 3
+def fig3_figure(normalized_feeding, feeding_hourly_frame, video_metafile, final_feeding_frame, feeding_barplot_plot_parameters, plot_parameters, cohort):
+    with stage("figure", figure = "Fig3"):
+        control_ad_lib, control_restricted, HFHS_ad_lib, HFHS_restricted = design_groups(cohort, "label")
+        control_restricted_group, HFHS_restricted_group = design_groups(cohort, "metafile_group")[1::2]
+        # Hourly counts as float64 and the group as text (the totals are loaded with compact types, see table_schema.py)
+        feeding_hourly_frame = expand_totals(feeding_hourly_frame)
+        # Restore the figure from the figure cache if its data, plot parameters and drawing code are unchanged (see figure_cache.py)
+        fig3_outputs = ['Figures_And_Analysis/Fig3.tif']
+        fig3_key = figure_key("Fig3", [normalized_feeding, feeding_hourly_frame, video_metafile, final_feeding_frame], [feeding_barplot_plot_parameters, plot_parameters], [set_figure_style, Fig3AD_timeplot, Fig3EF_timeplot, Fig3G_barplot],
+                              cell_source(os.path.abspath(__file__), "Figure3 Generation"))
+        if arguments.force or not restore_figure(fig3_key, fig3_outputs):
+            # Figure 3 Size
+            f = plt.figure(figsize = (7.48, 9.34))
+
+            # Fig3A - Control AdLib
+            plt.subplot2grid((22, 2), (0, 0), rowspan=5)
+            Fig3AD_timeplot(normalized_feeding[control_ad_lib], "0.1", "-")
+            # Remove x-axis and ticks for subplot
+            plt.xlabel('')
+            plt.xticks([])
+            ## Remove '0' from y-axis
+            plt.gca().yaxis.get_major_ticks()[0].label1.set_visible(False)
+            plt.figtext(0.04, 0.865, "A", fontsize = 15, color = "black", fontweight = "bold")
+            ### Group Label
+            plt.figtext(0.39, 0.86, "Cont AL", fontsize = 10, color = "black", fontweight = "bold")
+
+            # Fig3B - HFHS AdLib
+            plt.subplot2grid((22, 2), (0, 1), rowspan=5)
+            Fig3AD_timeplot(normalized_feeding[HFHS_ad_lib], "red", "-")
+            plt.xlabel('')
+            plt.xticks([])
+            # Remove y-axis and ticks for subplot
+            plt.ylabel('')
+            plt.yticks([])
+            plt.figtext(0.5, 0.865, "B", fontsize = 15, color = "black", fontweight = "bold")
+            ### Group Label
+            plt.figtext(0.8, 0.86, "HFHS AL", fontsize = 10, color = "red", fontweight = "bold")
+
+            # Fig3C - Control Restricted
+            plt.subplot2grid((22, 2), (5, 0), rowspan=5)
+            Fig3AD_timeplot(normalized_feeding[control_restricted], "0.1", "--")
+            plt.xlabel('')
+            plt.xticks([])
+            ## Remove '0' from y-axis
+            plt.gca().yaxis.get_major_ticks()[0].label1.set_visible(False)
+            plt.figtext(0.04, 0.69, "C", fontsize = 15, color = "black", fontweight = "bold")
+            ### Group Label
+            plt.figtext(0.39, 0.685, "Cont Res", fontsize = 10, color = "black", fontweight = "bold")
+
+            # Fig3D - HFHS Restricted
+            plt.subplot2grid((22, 2), (5, 1), rowspan=5)
+            Fig3AD_timeplot(normalized_feeding[HFHS_restricted], "red", "--")
+            plt.ylabel('')
+            plt.yticks([])
+            plt.xlabel('')
+            plt.xticks([])
+            plt.figtext(0.5, 0.69, "D", fontsize = 15, color = "black", fontweight = "bold")
+            ### Group Label
+            plt.figtext(0.8, 0.685, "HFHS Res", fontsize = 10, color = "red", fontweight = "bold")
+
+            # Fig3E - Control Restrited - 8-Hour Period
+            plt.subplot2grid((22, 2), (10, 0), rowspan=5)
+            Fig3EF_timeplot(feeding_hourly_frame.T.iloc[:-1, :], control_restricted_group, "0.1", video_metafile, plot_parameters)
+            # Significance Markers
+            plt.annotate('*', (6.7, 220), fontsize=15, color = 'black', fontweight='bold')
+            plt.annotate('*', (7.7, 150), fontsize=15, color = 'black', fontweight='bold')
+            plt.annotate('*', (8.7, 220), fontsize=15, color = 'black', fontweight='bold')
+            plt.annotate('*', (9.7, 240), fontsize=15, color = 'black', fontweight='bold')
+            plt.figtext(0.04, 0.515, "E", fontsize = 15, color = "black", fontweight = "bold")
+            ### Group Label
+            plt.figtext(0.39, 0.51, "Cont Res", fontsize = 10, color = "black", fontweight = "bold")
+
+            # Fig3F - HFHS Restrited - 8-Hour Period
+            plt.subplot2grid((22, 2), (10, 1), rowspan=5)
+            Fig3EF_timeplot(feeding_hourly_frame.T.iloc[:-1, :], HFHS_restricted_group, "red", video_metafile, plot_parameters)
+            plt.ylabel('')
+            plt.yticks([])
+            # Significance Markers
+            plt.annotate('*', (5.7, 200), fontsize=15, color = 'black', fontweight='bold')
+            plt.annotate('*', (6.7, 210), fontsize=15, color = 'black', fontweight='bold')
+            plt.annotate('*', (7.6, 215), fontsize=15, color = 'black', fontweight='bold')
+            plt.annotate('*', (8.5, 160), fontsize=15, color = 'black', fontweight='bold')
+            plt.figtext(0.5, 0.515, "F", fontsize = 15, color = "black", fontweight = "bold")
+            ### Group Label
+            plt.figtext(0.8, 0.51, "HFHS Res", fontsize = 10, color = "red", fontweight = "bold")
+
+            # Fig3G - Final 3 Hours
+            ax = plt.subplot2grid((22, 2), (17, 0), rowspan=5, colspan=2)
+            Fig3G_barplot(final_feeding_frame, "Time Spent \nFeeding (sec)", feeding_barplot_plot_parameters)
+            # Increase number of yticks
+            plt.yticks(np.arange(0, 700, 100))
+            # Significance Markers
+            plt.annotate('*', (1, 580), fontsize=15, color = 'black', fontweight='bold')
+            plt.plot([0.75, 1.25], [600, 600], 'k-', lw=1)
+            plt.annotate('*', (1.1, 535), fontsize=15, color = 'black', fontweight='bold')
+            plt.plot([1, 1.25], [555, 555], 'k-', lw=1)
+            plt.figtext(0.04, 0.28, "G", fontsize = 15, color = "black", fontweight = "bold")
+
+            # Despine subplot
+            ax.spines["right"].set_visible(False)
+            ax.spines["top"].set_visible(False)
+            plt.subplots_adjust(wspace=0.15, hspace=None)
+
+            plt.savefig("Figures_And_Analysis/Fig3.tif", dpi = 1000, bbox_inches="tight")
+            store_figure(fig3_key, fig3_outputs, cache_size_mb = arguments.cache_size)
 
 
 # In[11]:
@@ -995,64 +1158,76 @@ plt.savefig("Figures_And_Analysis/Fig3.tif", dpi = 1000, bbox_inches="tight")
 #----------------------------------------------------------
 # Figure3 Statistical Analysis
 #----------------------------------------------------------
-eight_hour_period = ["23:00", "0:00", "1:00", "2:00", "3:00", "4:00", "5:00", "6:00"]
-three_hour_period = ["4:00", "5:00", "6:00"]
-
-#---------------HFHSRes---------------------------------------
-#-------Fig3F Repeated Measure ANOVA + Tukey for 8 hours-------
-# Create dataframe of HFHSRes data over 8 hours
-HFHSRes = feeding_hourly_frame.where(feeding_hourly_frame.group == "HFHS restriction").dropna(how="all").reset_index().melt(id_vars=["group", "index"]).rename(columns={"index": "Rat", "variable": "phase", "value": "Consumption_Rate"})
-HFHSRes_8h = HFHSRes[HFHSRes["phase"].isin(eight_hour_period)]
-HFHSRes_8h["group_and_phase"] = HFHSRes_8h["group"] + " " + HFHSRes_8h["phase"]
-
-# Repeated Measure ANOVA with Multiple Comparisions for 1st Hour vs Remaining 7 hours
-aov = HFHSRes_8h.rm_anova(dv='Consumption_Rate', within='phase', subject='Rat',  detailed=True)
-# Posthoc TukeyHSD
-result = activity_anova(HFHSRes_8h)
-# Send results to CSV
-result_clean = result.fillna("").rename(index={0:'', 1:'', 2:'', 3:'', 4:'', 5:''}).iloc[:,5:].reset_index(drop=True)
-pd.concat([aov, result_clean]).fillna("").to_csv("Figures_and_Analysis/Fig3F_RMAnova_Tukey.csv", index = False)
-
-#-------Fig3G Repeated Measure ANOVA + Tukey for final 3 hours----
-# Create dataframe of HFHSRes data over 3 hours
-HFHSRes_3h = HFHSRes[HFHSRes["phase"].isin(three_hour_period)]
-HFHSRes_3h["group_and_phase"] = HFHSRes_3h["group"] + " " + HFHSRes_3h["phase"]
-
-# Repeated Measure ANOVA with Multiple Comparisions for final 3 hours
-aov = HFHSRes_3h.rm_anova(dv='Consumption_Rate', within='phase', subject='Rat',  detailed=True)
-# Posthoc TukeyHSD
-result = activity_anova(HFHSRes_3h)
-# Send results to CSV
-result_clean = result.fillna("").rename(index={0:'', 1:'', 2:'', 3:'', 4:'', 5:''}).iloc[:,5:].reset_index(drop=True)
-pd.concat([aov, result_clean]).fillna("").to_csv("Figures_and_Analysis/Fig3G_RMAnova_Tukey_HFHSRes.csv", index = False)
-
-#---------------ContRes---------------------------------------
-#-------Fig3E Repeated Measure ANOVA + Tukey for 8 hours-------
-# Create dataframe of ContRes data over 8 hours
-ContRes = feeding_hourly_frame.where(feeding_hourly_frame.group == "control restriction").dropna(how="all").reset_index().melt(id_vars=["group", "index"]).rename(columns={"index": "Rat", "variable": "phase", "value": "Consumption_Rate"})
-ContRes_8h = ContRes[ContRes["phase"].isin(eight_hour_period)].dropna()
-ContRes_8h["group_and_phase"] = ContRes_8h["group"] + " " + ContRes_8h["phase"]
-
-# Repeated Measure ANOVA with Multiple Comparisions for 1st Hour vs Remaining 7 hours
-aov = ContRes_8h.rm_anova(dv='Consumption_Rate', within='phase', subject='Rat',  detailed=True)
-# Posthoc TukeyHSD
-result = activity_anova(ContRes_8h)
-# Send results to CSV
-result_clean = result.fillna("").rename(index={0:'', 1:'', 2:'', 3:'', 4:'', 5:''}).iloc[:,5:].reset_index(drop=True)
-pd.concat([aov, result_clean]).fillna("").to_csv("Figures_and_Analysis/Fig3E_RMAnova_Tukey.csv", index = False)
-
-#-------Fig3G Repeated Measure ANOVA + Tukey for final 3 hours----
-# Create dataframe of ContRes data over 3 hours
-ContRes_3h = ContRes[ContRes["phase"].isin(three_hour_period)].dropna()
-ContRes_3h["group_and_phase"] = ContRes_3h["group"] + " " + ContRes_3h["phase"]
-
-# Repeated Measure ANOVA with Multiple Comparisions for final 3 hours
-aov = ContRes_3h.rm_anova(dv='Consumption_Rate', within='phase', subject='Rat',  detailed=True)
-# Posthoc TukeyHSD
-result = activity_anova(ContRes_3h)
-# Send results to CSV
-result_clean = result.fillna("").rename(index={0:'', 1:'', 2:'', 3:'', 4:'', 5:''}).iloc[:,5:].reset_index(drop=True)
-pd.concat([aov, result_clean]).fillna("").to_csv("Figures_and_Analysis/Fig3G_RMAnova_Tukey_ContRes.csv", index = False)
+# Method to run the statistical analysis of Figure 3
+def fig3_statistics(feeding_hourly_frame, cohort):
+    with stage("statistics", figure = "Fig3"):
+        # Hourly counts as float64 and the group as text (the totals are loaded with compact types, see table_schema.py)
+        feeding_hourly_frame = expand_totals(feeding_hourly_frame)
+        results_store = open_results_store(":memory:")
+        eight_hour_period = cohort["analysis_windows"]["eight_hour_period"]
+        three_hour_period = cohort["analysis_windows"]["three_hour_period"]
+        control_ad_lib, control_restricted, HFHS_ad_lib, HFHS_restricted = design_groups(cohort, "metafile_group")
+
+        #---------------HFHSRes---------------------------------------
+        #-------Fig3F Repeated Measure ANOVA + Tukey for 8 hours-------
+        # Create dataframe of HFHSRes data over 8 hours
+        HFHSRes = feeding_hourly_frame.where(feeding_hourly_frame.group == HFHS_restricted).dropna(how="all").reset_index().melt(id_vars=["group", "index"]).rename(columns={"index": "Rat", "variable": "phase", "value": "Consumption_Rate"})
+        HFHSRes_8h = HFHSRes[HFHSRes["phase"].isin(eight_hour_period)]
+        HFHSRes_8h["group_and_phase"] = HFHSRes_8h["group"] + " " + HFHSRes_8h["phase"]
+
+        # Repeated Measure ANOVA with Multiple Comparisions for 1st Hour vs Remaining 7 hours
+        aov = rm_anova(data=HFHSRes_8h, dv='Consumption_Rate', within='phase', subject='Rat',  detailed=True)
+        # Posthoc TukeyHSD
+        result = activity_anova(HFHSRes_8h)
+        # Send results to the results store
+        record_anova(results_store, "Fig3F", "rm_anova", aov)
+        record_anova_and_tukey(results_store, "Fig3F", "anova", result)
+
+        #-------Fig3G Repeated Measure ANOVA + Tukey for final 3 hours----
+        # Create dataframe of HFHSRes data over 3 hours
+        HFHSRes_3h = HFHSRes[HFHSRes["phase"].isin(three_hour_period)]
+        HFHSRes_3h["group_and_phase"] = HFHSRes_3h["group"] + " " + HFHSRes_3h["phase"]
+
+        # Repeated Measure ANOVA with Multiple Comparisions for final 3 hours
+        aov = rm_anova(data=HFHSRes_3h, dv='Consumption_Rate', within='phase', subject='Rat',  detailed=True)
+        # Posthoc TukeyHSD
+        result = activity_anova(HFHSRes_3h)
+        # Send results to the results store
+        record_anova(results_store, "Fig3G HFHSRes", "rm_anova", aov)
+        record_anova_and_tukey(results_store, "Fig3G HFHSRes", "anova", result)
+
+        #---------------ContRes---------------------------------------
+        #-------Fig3E Repeated Measure ANOVA + Tukey for 8 hours-------
+        # Create dataframe of ContRes data over 8 hours
+        ContRes = feeding_hourly_frame.where(feeding_hourly_frame.group == control_restricted).dropna(how="all").reset_index().melt(id_vars=["group", "index"]).rename(columns={"index": "Rat", "variable": "phase", "value": "Consumption_Rate"})
+        ContRes_8h = ContRes[ContRes["phase"].isin(eight_hour_period)].dropna()
+        ContRes_8h["group_and_phase"] = ContRes_8h["group"] + " " + ContRes_8h["phase"]
+
+        # Repeated Measure ANOVA with Multiple Comparisions for 1st Hour vs Remaining 7 hours
+        aov = rm_anova(data=ContRes_8h, dv='Consumption_Rate', within='phase', subject='Rat',  detailed=True)
+        # Posthoc TukeyHSD
+        result = activity_anova(ContRes_8h)
+        # Send results to the results store
+        record_anova(results_store, "Fig3E", "rm_anova", aov)
+        record_anova_and_tukey(results_store, "Fig3E", "anova", result)
+
+        #-------Fig3G Repeated Measure ANOVA + Tukey for final 3 hours----
+        # Create dataframe of ContRes data over 3 hours
+        ContRes_3h = ContRes[ContRes["phase"].isin(three_hour_period)].dropna()
+        ContRes_3h["group_and_phase"] = ContRes_3h["group"] + " " + ContRes_3h["phase"]
+
+        # Repeated Measure ANOVA with Multiple Comparisions for final 3 hours
+        aov = rm_anova(data=ContRes_3h, dv='Consumption_Rate', within='phase', subject='Rat',  detailed=True)
+        # Posthoc TukeyHSD
+        result = activity_anova(ContRes_3h)
+        # Send results to the results store
+        record_anova(results_store, "Fig3G ContRes", "rm_anova", aov)
+        record_anova_and_tukey(results_store, "Fig3G ContRes", "anova", result)
+
+        fig3_results = store_tables(results_store)
+        results_store.close()
+
+    return {"fig3_results": fig3_results}
 
 
 # In[12]:
@@ -1061,35 +1236,43 @@ pd.concat([aov, result_clean]).fillna("").to_csv("Figures_and_Analysis/Fig3G_RMA
 #----------------------------------------------------------
 # Figure4D Dataframe Generation
 #----------------------------------------------------------
-# Select only the final 3 hours of interest (from 4:00 to 7:00)
-final_hours_of_interest = sucrose_hourly_frame[["4:00", "5:00", "6:00", "group"]]
-final_hours_of_interest = final_hours_of_interest[(final_hours_of_interest["group"] == "HFHS ad lib") | (final_hours_of_interest["group"] == "HFHS restriction")]
-
-# Create a dataframe that combines the final 3 hours of feeding into one column - for simple plotting and ANOVA
-# Create an empty dataframe
-final_sucrose_frame = pd.DataFrame()
-# Combine/Merge the hourly feeding values from final 3 hours into one column
-final_sucrose_frame["Consumption_Rate"] = pd.concat([final_hours_of_interest["4:00"],
-                                            final_hours_of_interest["5:00"],
-                                            final_hours_of_interest["6:00"]])
-# Add the diet "group" column into this dataframe
-final_sucrose_frame["group"] = pd.concat([final_hours_of_interest["group"],
-                                 final_hours_of_interest["group"],
-                                 final_hours_of_interest["group"]])
-# Create a new column with just the label "6th", "7th" or "8th" for all of the column values
-final_sucrose_frame["phase"] = pd.concat([final_hours_of_interest["group"].replace(final_hours_of_interest["group"].values, "6th Hour"), 
-                                 final_hours_of_interest["group"].replace(final_hours_of_interest["group"].values, "7th Hour"),
-                                 final_hours_of_interest["group"].replace(final_hours_of_interest["group"].values, "8th Hour")])
-# Sort values by alphabetical diet type and ascending hour
-final_sucrose_frame = final_sucrose_frame.sort_values(["group", "phase"], ascending=[True, True]).reset_index(drop = True)
-# Add column that combines diet type and hour
-final_sucrose_frame['group_and_phase'] = final_sucrose_frame["group"].astype(str) +" "+ final_sucrose_frame["phase"].astype(str)
-final_sucrose_frame = final_sucrose_frame.dropna()
-
-# Create a custom plot parameter for the barplot figure
-final_barplot_plot_parameters = plot_parameters.reindex(["control ad lib", "control restriction", "HFHS ad lib", "HFHS restriction"]).iloc[-2:]
-# Add custom edge colors
-final_barplot_plot_parameters["edgecolors"] = ["darkred", "red"]
+# Method to create the sucrose drinking of the HFHS rats in the final 3 hours of the feeding window
+def fig4d_frames(sucrose_hourly_frame, plot_parameters, cohort):
+    with stage("derive_frames", figure = "Fig4D"):
+        control_ad_lib, control_restricted, HFHS_ad_lib, HFHS_restricted = design_groups(cohort, "metafile_group")
+        # Hourly counts as float64 and the group as text (the totals are loaded with compact types, see table_schema.py)
+        sucrose_hourly_frame = expand_totals(sucrose_hourly_frame)
+        # Select only the final 3 hours of interest (from 4:00 to 7:00)
+        final_hours_of_interest = sucrose_hourly_frame[["4:00", "5:00", "6:00", "group"]]
+        final_hours_of_interest = final_hours_of_interest[(final_hours_of_interest["group"] == HFHS_ad_lib) | (final_hours_of_interest["group"] == HFHS_restricted)]
+
+        # Create a dataframe that combines the final 3 hours of feeding into one column - for simple plotting and ANOVA
+        # Create an empty dataframe
+        final_sucrose_frame = pd.DataFrame()
+        # Combine/Merge the hourly feeding values from final 3 hours into one column
+        final_sucrose_frame["Consumption_Rate"] = pd.concat([final_hours_of_interest["4:00"],
+                                                    final_hours_of_interest["5:00"],
+                                                    final_hours_of_interest["6:00"]])
+        # Add the diet "group" column into this dataframe
+        final_sucrose_frame["group"] = pd.concat([final_hours_of_interest["group"],
+                                         final_hours_of_interest["group"],
+                                         final_hours_of_interest["group"]])
+        # Create a new column with just the label "6th", "7th" or "8th" for all of the column values
+        final_sucrose_frame["phase"] = pd.concat([final_hours_of_interest["group"].replace(final_hours_of_interest["group"].values, "6th Hour"),
+                                         final_hours_of_interest["group"].replace(final_hours_of_interest["group"].values, "7th Hour"),
+                                         final_hours_of_interest["group"].replace(final_hours_of_interest["group"].values, "8th Hour")])
+        # Sort values by alphabetical diet type and ascending hour
+        final_sucrose_frame = final_sucrose_frame.sort_values(["group", "phase"], ascending=[True, True]).reset_index(drop = True)
+        # Add column that combines diet type and hour
+        final_sucrose_frame['group_and_phase'] = final_sucrose_frame["group"].astype(str) +" "+ final_sucrose_frame["phase"].astype(str)
+        final_sucrose_frame = final_sucrose_frame.dropna()
+
+        # Create a custom plot parameter for the barplot figure
+        sucrose_barplot_plot_parameters = plot_parameters.reindex([control_ad_lib, control_restricted, HFHS_ad_lib, HFHS_restricted]).iloc[-2:]
+        # Add custom edge colors
+        sucrose_barplot_plot_parameters["edgecolors"] = ["darkred", "red"]
+
+    return {"final_sucrose_frame": final_sucrose_frame, "sucrose_barplot_plot_parameters": sucrose_barplot_plot_parameters}
 
 
 # In[13]:
@@ -1098,55 +1281,68 @@ final_barplot_plot_parameters["edgecolors"] = ["darkred", "red"]
 #----------------------------------------------------------
 # Figure4 Generation
 #----------------------------------------------------------
-# Figure 4 Size
-plt.figure(figsize = (7.48, 4.67))
-
-# Fig6A - HFHS AdLib
-plt.subplot2grid((2, 2), (0, 0))
-Fig4AB_timeplot(normalized_sucrose["HFHS Ad Lib"], "red", "-")
-# Add x-axis and ticks for subplot
-plt.xticks([0.875, 1.125, 1.375, 1.625, 1.875],['21:00', '3:00', '9:00', '15:00', '21:00'], rotation=0, fontname = 'Arial', fontsize=10, color = 'black')
-# Remove leading 0
-plt.gca().yaxis.get_major_ticks()[0].label1.set_visible(False)
-plt.figtext(0.02, 0.93, "A", fontsize = 15, color = "black", fontweight = "bold")
-### Group Label
-plt.figtext(0.37, 0.91, "HFHS AL", fontsize = 10, color = "red", fontweight = "bold")
-
-# Fig6B - HFHS Restriction
-plt.subplot2grid((2, 2), (0, 1))
-Fig4AB_timeplot(normalized_sucrose["HFHS Restricted"], "red", "--")
-# Add x-axis and ticks for subplot
-plt.xticks([0.875, 1.125, 1.375, 1.625, 1.875],['21:00', '3:00', '9:00', '15:00', '21:00'], rotation=0, fontname = 'Arial', fontsize=10, color = 'black')
-## Remove leading 0
-plt.gca().yaxis.get_major_ticks()[0].label1.set_visible(False)
-plt.figtext(0.5, 0.93, "B", fontsize = 15, color = "black", fontweight = "bold")
-### Group Label
-plt.figtext(0.85, 0.91, "HFHS Res", fontsize = 10, color = "red", fontweight = "bold")
-
-# HFHS Restrited - Binge
-plt.subplot2grid((2, 2), (1, 0))
-Fig4C_timeplot(sucrose_hourly_frame.T.iloc[:-1, :], "HFHS restriction", "red", video_metafile)
-# Significance Markers
-#plt.annotate('*', (3.7, 45), fontsize=15, color = 'black', fontweight='bold')
-#plt.annotate('*', (5.7, 75), fontsize=15, color = 'black', fontweight='bold')
-plt.figtext(0.02, 0.45, "C", fontsize = 15, color = "black", fontweight = "bold")
-### Group Label
-plt.figtext(0.37, 0.43, "HFHS Res", fontsize = 10, color = "red", fontweight = "bold")
-
-# Fig4D - Final 3 Hours
-ax = plt.subplot2grid((2, 2), (1, 1))
-Fig4D_barplot(final_sucrose_frame, "Time Spent \nDrinking Sucrose (sec)", final_barplot_plot_parameters)
-# Increase number of yticks
-plt.yticks(np.arange(0, 175, 25))
-plt.figtext(0.5, 0.45, "D", fontsize = 15, color = "black", fontweight = "bold")
-
-# Despine subplot
-ax.spines["right"].set_visible(False)
-ax.spines["top"].set_visible(False)
-#plt.subplots_adjust(wspace=0.5, hspace=None)
-plt.tight_layout()
-
-plt.savefig("Figures_And_Analysis/Fig4.tif", dpi = 1000, bbox_inches="tight")
+# Method to draw Figure 4
+def fig4_figure(normalized_sucrose, sucrose_hourly_frame, video_metafile, final_sucrose_frame, sucrose_barplot_plot_parameters, plot_parameters, cohort):
+    with stage("figure", figure = "Fig4"):
+        HFHS_ad_lib, HFHS_restricted = design_groups(cohort, "label")[2:]
+        HFHS_restricted_group = design_groups(cohort, "metafile_group")[3]
+        # Hourly counts as float64 and the group as text (the totals are loaded with compact types, see table_schema.py)
+        sucrose_hourly_frame = expand_totals(sucrose_hourly_frame)
+        # Restore the figure from the figure cache if its data, plot parameters and drawing code are unchanged (see figure_cache.py)
+        fig4_outputs = ['Figures_And_Analysis/Fig4.tif']
+        fig4_key = figure_key("Fig4", [normalized_sucrose, sucrose_hourly_frame, video_metafile, final_sucrose_frame], [sucrose_barplot_plot_parameters, plot_parameters], [set_figure_style, Fig4AB_timeplot, Fig4C_timeplot, Fig4D_barplot],
+                              cell_source(os.path.abspath(__file__), "Figure4 Generation"))
+        if arguments.force or not restore_figure(fig4_key, fig4_outputs):
+            # Figure 4 Size
+            plt.figure(figsize = (7.48, 4.67))
+
+            # Fig6A - HFHS AdLib
+            plt.subplot2grid((2, 2), (0, 0))
+            Fig4AB_timeplot(normalized_sucrose[HFHS_ad_lib], "red", "-")
+            # Add x-axis and ticks for subplot
+            plt.xticks([0.875, 1.125, 1.375, 1.625, 1.875],['21:00', '3:00', '9:00', '15:00', '21:00'], rotation=0, fontname = 'Arial', fontsize=10, color = 'black')
+            # Remove leading 0
+            plt.gca().yaxis.get_major_ticks()[0].label1.set_visible(False)
+            plt.figtext(0.02, 0.93, "A", fontsize = 15, color = "black", fontweight = "bold")
+            ### Group Label
+            plt.figtext(0.37, 0.91, "HFHS AL", fontsize = 10, color = "red", fontweight = "bold")
+
+            # Fig6B - HFHS Restriction
+            plt.subplot2grid((2, 2), (0, 1))
+            Fig4AB_timeplot(normalized_sucrose[HFHS_restricted], "red", "--")
+            # Add x-axis and ticks for subplot
+            plt.xticks([0.875, 1.125, 1.375, 1.625, 1.875],['21:00', '3:00', '9:00', '15:00', '21:00'], rotation=0, fontname = 'Arial', fontsize=10, color = 'black')
+            ## Remove leading 0
+            plt.gca().yaxis.get_major_ticks()[0].label1.set_visible(False)
+            plt.figtext(0.5, 0.93, "B", fontsize = 15, color = "black", fontweight = "bold")
+            ### Group Label
+            plt.figtext(0.85, 0.91, "HFHS Res", fontsize = 10, color = "red", fontweight = "bold")
+
+            # HFHS Restrited - Binge
+            plt.subplot2grid((2, 2), (1, 0))
+            Fig4C_timeplot(sucrose_hourly_frame.T.iloc[:-1, :], HFHS_restricted_group, "red", video_metafile, plot_parameters)
+            # Significance Markers
+            #plt.annotate('*', (3.7, 45), fontsize=15, color = 'black', fontweight='bold')
+            #plt.annotate('*', (5.7, 75), fontsize=15, color = 'black', fontweight='bold')
+            plt.figtext(0.02, 0.45, "C", fontsize = 15, color = "black", fontweight = "bold")
+            ### Group Label
+            plt.figtext(0.37, 0.43, "HFHS Res", fontsize = 10, color = "red", fontweight = "bold")
+
+            # Fig4D - Final 3 Hours
+            ax = plt.subplot2grid((2, 2), (1, 1))
+            Fig4D_barplot(final_sucrose_frame, "Time Spent \nDrinking Sucrose (sec)", sucrose_barplot_plot_parameters)
+            # Increase number of yticks
+            plt.yticks(np.arange(0, 175, 25))
+            plt.figtext(0.5, 0.45, "D", fontsize = 15, color = "black", fontweight = "bold")
+
+            # Despine subplot
+            ax.spines["right"].set_visible(False)
+            ax.spines["top"].set_visible(False)
+            #plt.subplots_adjust(wspace=0.5, hspace=None)
+            plt.tight_layout()
+
+            plt.savefig("Figures_And_Analysis/Fig4.tif", dpi = 1000, bbox_inches="tight")
+            store_figure(fig4_key, fig4_outputs, cache_size_mb = arguments.cache_size)
 
 
 # In[14]:
@@ -1155,115 +1351,145 @@ plt.savefig("Figures_And_Analysis/Fig4.tif", dpi = 1000, bbox_inches="tight")
 #----------------------------------------------------------
 # Figure4 Statistical Analysis
 #----------------------------------------------------------
-#---------------------HFHSRes----------------------------
-#-------Fig4C Repeated Measure ANOVA + Tukey for 8 hours-------
-# Create dataframe of HFHSRes data over 8 hours
-HFHSRes = sucrose_hourly_frame.where(sucrose_hourly_frame.group == "HFHS restriction").dropna(how="all").reset_index().melt(id_vars=["group", "index"]).rename(columns={"index": "Rat", "variable": "phase", "value": "Consumption_Rate"})
-HFHSRes_8h = HFHSRes[HFHSRes["phase"].isin(eight_hour_period)]
-HFHSRes_8h["group_and_phase"] = HFHSRes_8h["group"] + " " + HFHSRes_8h["phase"]
-
-# Repeated Measure ANOVA with Multiple Comparisions for 1st Hour vs Remaining 7 hours
-aov = HFHSRes_8h.rm_anova(dv='Consumption_Rate', within='phase', subject='Rat',  detailed=True)
-# Posthoc TukeyHSD
-result = activity_anova(HFHSRes_8h)
-# Send results to CSV
-result_clean = result.fillna("").rename(index={0:'', 1:'', 2:'', 3:'', 4:'', 5:''}).iloc[:,5:].reset_index(drop=True)
-pd.concat([aov, result_clean]).fillna("").to_csv("Figures_and_Analysis/Fig4C_RMAnova_Tukey.csv", index = False)
-
-#-------Fig3G Repeated Measure ANOVA + Tukey for final 3 hours----
-# Create dataframe of HFHSRes data over 3 hours
-HFHSRes_3h = HFHSRes[HFHSRes["phase"].isin(three_hour_period)]
-HFHSRes_3h["group_and_phase"] = HFHSRes_3h["group"] + " " + HFHSRes_3h["phase"]
-
-# Repeated Measure ANOVA with Multiple Comparisions for final 3 hours
-aov = HFHSRes_3h.rm_anova(dv='Consumption_Rate', within='phase', subject='Rat',  detailed=True)
-# Posthoc TukeyHSD
-result = activity_anova(HFHSRes_3h)
-# Send results to CSV
-result_clean = result.fillna("").rename(index={0:'', 1:'', 2:'', 3:'', 4:'', 5:''}).iloc[:,5:].reset_index(drop=True)
-pd.concat([aov, result_clean]).fillna("").to_csv("Figures_and_Analysis/Fig4D_RMAnova_Tukey_HFHSRes.csv", index = False)
-
-#---------------------HFHSAL----------------------------
-#-------Fig3G Repeated Measure ANOVA + Tukey for final 3 hours----
-# Create dataframe of HFHSAL data over 3 hours
-HFHSAL = sucrose_hourly_frame.where(sucrose_hourly_frame.group == "HFHS ad lib").dropna(how="all").reset_index().melt(id_vars=["group", "index"]).rename(columns={"index": "Rat", "variable": "phase", "value": "Consumption_Rate"})
-HFHSAL_3h = HFHSAL[HFHSAL["phase"].isin(three_hour_period)]
-HFHSAL_3h["group_and_phase"] = HFHSAL_3h["group"] + " " + HFHSAL_3h["phase"]
-
-# Repeated Measure ANOVA with Multiple Comparisions for final 3 hours
-aov = HFHSAL_3h.rm_anova(dv='Consumption_Rate', within='phase', subject='Rat',  detailed=True)
-# Posthoc TukeyHSD
-result = activity_anova(HFHSAL_3h)
-# Send results to CSV
-result_clean = result.fillna("").rename(index={0:'', 1:'', 2:'', 3:'', 4:'', 5:''}).iloc[:,5:].reset_index(drop=True)
-pd.concat([aov, result_clean]).fillna("").to_csv("Figures_and_Analysis/Fig4D_RMAnova_Tukey_HFHSAL.csv", index = False)
+# Method to run the statistical analysis of Figure 4
+def fig4_statistics(sucrose_hourly_frame, cohort):
+    with stage("statistics", figure = "Fig4"):
+        # Hourly counts as float64 and the group as text (the totals are loaded with compact types, see table_schema.py)
+        sucrose_hourly_frame = expand_totals(sucrose_hourly_frame)
+        results_store = open_results_store(":memory:")
+        eight_hour_period = cohort["analysis_windows"]["eight_hour_period"]
+        three_hour_period = cohort["analysis_windows"]["three_hour_period"]
+        control_ad_lib, control_restricted, HFHS_ad_lib, HFHS_restricted = design_groups(cohort, "metafile_group")
+
+        #---------------------HFHSRes----------------------------
+        #-------Fig4C Repeated Measure ANOVA + Tukey for 8 hours-------
+        # Create dataframe of HFHSRes data over 8 hours
+        HFHSRes = sucrose_hourly_frame.where(sucrose_hourly_frame.group == HFHS_restricted).dropna(how="all").reset_index().melt(id_vars=["group", "index"]).rename(columns={"index": "Rat", "variable": "phase", "value": "Consumption_Rate"})
+        HFHSRes_8h = HFHSRes[HFHSRes["phase"].isin(eight_hour_period)]
+        HFHSRes_8h["group_and_phase"] = HFHSRes_8h["group"] + " " + HFHSRes_8h["phase"]
+
+        # Repeated Measure ANOVA with Multiple Comparisions for 1st Hour vs Remaining 7 hours
+        aov = rm_anova(data=HFHSRes_8h, dv='Consumption_Rate', within='phase', subject='Rat',  detailed=True)
+        # Posthoc TukeyHSD
+        result = activity_anova(HFHSRes_8h)
+        # Send results to the results store
+        record_anova(results_store, "Fig4C", "rm_anova", aov)
+        record_anova_and_tukey(results_store, "Fig4C", "anova", result)
+
+        #-------Fig3G Repeated Measure ANOVA + Tukey for final 3 hours----
+        # Create dataframe of HFHSRes data over 3 hours
+        HFHSRes_3h = HFHSRes[HFHSRes["phase"].isin(three_hour_period)]
+        HFHSRes_3h["group_and_phase"] = HFHSRes_3h["group"] + " " + HFHSRes_3h["phase"]
+
+        # Repeated Measure ANOVA with Multiple Comparisions for final 3 hours
+        aov = rm_anova(data=HFHSRes_3h, dv='Consumption_Rate', within='phase', subject='Rat',  detailed=True)
+        # Posthoc TukeyHSD
+        result = activity_anova(HFHSRes_3h)
+        # Send results to the results store
+        record_anova(results_store, "Fig4D HFHSRes", "rm_anova", aov)
+        record_anova_and_tukey(results_store, "Fig4D HFHSRes", "anova", result)
+
+        #---------------------HFHSAL----------------------------
+        #-------Fig3G Repeated Measure ANOVA + Tukey for final 3 hours----
+        # Create dataframe of HFHSAL data over 3 hours
+        HFHSAL = sucrose_hourly_frame.where(sucrose_hourly_frame.group == HFHS_ad_lib).dropna(how="all").reset_index().melt(id_vars=["group", "index"]).rename(columns={"index": "Rat", "variable": "phase", "value": "Consumption_Rate"})
+        HFHSAL_3h = HFHSAL[HFHSAL["phase"].isin(three_hour_period)]
+        HFHSAL_3h["group_and_phase"] = HFHSAL_3h["group"] + " " + HFHSAL_3h["phase"]
+
+        # Repeated Measure ANOVA with Multiple Comparisions for final 3 hours
+        aov = rm_anova(data=HFHSAL_3h, dv='Consumption_Rate', within='phase', subject='Rat',  detailed=True)
+        # Posthoc TukeyHSD
+        result = activity_anova(HFHSAL_3h)
+        # Send results to the results store
+        record_anova(results_store, "Fig4D HFHSAL", "rm_anova", aov)
+        record_anova_and_tukey(results_store, "Fig4D HFHSAL", "anova", result)
+
+        fig4_results = store_tables(results_store)
+        results_store.close()
+
+    return {"fig4_results": fig4_results}
 
 
 # In[15]:
 
 
 #----------------------------------------------------------
-# Figure5 Generation
+# Figure5 Dataframe Generation
 #----------------------------------------------------------
-metafile['group']=metafile.Diet+' '+metafile.Feeding
-
-# Rearrange so that Oxtr is the last gene column
-col_list = list(gene_data)
-col_list[11], col_list[8] = col_list[8], col_list[11]
-gene_data = gene_data.loc[:,col_list]
-
-
-gene_list = gene_data.columns.unique()
-# Remove outliers, that is the measurments which is larger than 7
-for c in gene_list:
-    # Find index of an outlier and replace it with NAN
-    out_ind = gene_data[c][gene_data[c]>=7].index
-    gene_data[c][out_ind ]=np.NaN
-# Add experimental group as a column to the gene dataset
-ids_in_gene_data = gene_data.index
-gene_data['group'] = metafile.group.loc[ids_in_gene_data]
-gene_data['diet'] = metafile.Diet.loc[ids_in_gene_data]
-gene_data['feeding_schedule'] = metafile.Feeding.loc[ids_in_gene_data]
-
-# Figure 8 Size
-plt.figure(figsize = (7.48,7.48))
-
-# Adjust subplot size
-plt.subplots_adjust(wspace = 0.3 )
-subplot_n=1
-for c in gene_list[:-1]:
-    plt.subplot(4,3,subplot_n)
-    Fig5_boxplot(gene_data, plot_parameters, c)
-    if subplot_n == 2:
-        # Significance Markers for NPY
-        plt.annotate('*', (2.9, 1.6), fontsize=15, color = 'black', fontweight='bold')
-    if subplot_n == 6:
-        # Significance Markers for Ghsr
-        plt.annotate('#', (0.9, 2.3), fontsize=10, color = 'black', fontweight='bold')
-    if subplot_n == 7:
-        # Significance Markers for Insr
-        plt.annotate('#', (0.9, 1.35), fontsize=10, color = 'black', fontweight='bold')
-        plt.annotate('#', (2.9, 1.45), fontsize=10, color = 'black', fontweight='bold')
-    if subplot_n == 8:
-        # Significance Markers for Lepr
-        plt.annotate('#', (0.9, 1.8), fontsize=10, color = 'black', fontweight='bold')
-    
-    subplot_n = subplot_n+1 
-    
-
-### Designate the last subplot for the legend
-ax = plt.subplot(4,3,subplot_n)
-# Remove the x- and y-ticks
-plt.xticks([])
-plt.yticks([])
-# Remove the x- and y-axis lines
-ax.set_frame_on(False)
-make_gene_legend()
+# Method to create the gene expression of every rat without outliers and with its experimental group
+def fig5_frames(gene_data, metafile):
+    with stage("derive_frames", figure = "Fig5"):
+        # Rearrange so that Oxtr is the last gene column
+        col_list = list(gene_data)
+        col_list[11], col_list[8] = col_list[8], col_list[11]
+        plot_gene_data = gene_data.loc[:,col_list]
+
+
+        gene_list = plot_gene_data.columns.unique()
+        # Remove outliers, that is the measurments which is larger than 7
+        for c in gene_list:
+            # Find index of an outlier and replace it with NAN
+            out_ind = plot_gene_data[c][plot_gene_data[c]>=7].index
+            plot_gene_data[c][out_ind ]=np.NaN
+        # Add experimental group as a column to the gene dataset
+        ids_in_gene_data = plot_gene_data.index
+        plot_gene_data['group'] = metafile.group.loc[ids_in_gene_data]
+        plot_gene_data['diet'] = metafile.Diet.loc[ids_in_gene_data]
+        plot_gene_data['feeding_schedule'] = metafile.Feeding.loc[ids_in_gene_data]
+
+    return {"plot_gene_data": plot_gene_data, "gene_list": gene_list}
 
-# Clean up plot
-sns.despine()
-plt.tight_layout()
-plt.savefig('Figures_and_Analysis/Fig5.tiff', dpi = 1000)
+#----------------------------------------------------------
+# Figure5 Generation
+#----------------------------------------------------------
+# Method to draw Figure 5
+def fig5_figure(plot_gene_data, gene_list, plot_parameters):
+    with stage("figure", figure = "Fig5"):
+        # Restore the figure from the figure cache if its data, plot parameters and drawing code are unchanged (see figure_cache.py)
+        fig5_outputs = ['Figures_And_Analysis/Fig5.tiff']
+        fig5_key = figure_key("Fig5", [plot_gene_data], [plot_parameters], [set_figure_style, Fig5_boxplot, make_gene_legend],
+                              cell_source(os.path.abspath(__file__), "Figure5 Generation"))
+        if arguments.force or not restore_figure(fig5_key, fig5_outputs):
+            # Figure 8 Size
+            plt.figure(figsize = (7.48,7.48))
+
+            # Adjust subplot size
+            plt.subplots_adjust(wspace = 0.3 )
+            subplot_n=1
+            for c in gene_list[:-1]:
+                plt.subplot(4,3,subplot_n)
+                Fig5_boxplot(plot_gene_data, plot_parameters, c)
+                if subplot_n == 2:
+                    # Significance Markers for NPY
+                    plt.annotate('*', (2.9, 1.6), fontsize=15, color = 'black', fontweight='bold')
+                if subplot_n == 6:
+                    # Significance Markers for Ghsr
+                    plt.annotate('#', (0.9, 2.3), fontsize=10, color = 'black', fontweight='bold')
+                if subplot_n == 7:
+                    # Significance Markers for Insr
+                    plt.annotate('#', (0.9, 1.35), fontsize=10, color = 'black', fontweight='bold')
+                    plt.annotate('#', (2.9, 1.45), fontsize=10, color = 'black', fontweight='bold')
+                if subplot_n == 8:
+                    # Significance Markers for Lepr
+                    plt.annotate('#', (0.9, 1.8), fontsize=10, color = 'black', fontweight='bold')
+
+                subplot_n = subplot_n+1
+
+
+            ### Designate the last subplot for the legend
+            ax = plt.subplot(4,3,subplot_n)
+            # Remove the x- and y-ticks
+            plt.xticks([])
+            plt.yticks([])
+            # Remove the x- and y-axis lines
+            ax.set_frame_on(False)
+            make_gene_legend()
+
+            # Clean up plot
+            sns.despine()
+            plt.tight_layout()
+            plt.savefig('Figures_And_Analysis/Fig5.tiff', dpi = 1000)
+            store_figure(fig5_key, fig5_outputs, cache_size_mb = arguments.cache_size)
 
 
 # In[17]:
@@ -1272,33 +1498,110 @@ plt.savefig('Figures_and_Analysis/Fig5.tiff', dpi = 1000)
 #----------------------------------------------------------
 # Figure5 Statistical Analysis
 #----------------------------------------------------------
-# Create a dictionary to hold MannU Whitney Results
-feeding = metafile.Feeding.unique()
-diet   = metafile.Diet.unique()
-group_dict={}
-for x in diet:
-        for y in feeding:
-            group = str(x)+' '+str(y)
-            ids = gene_data[(gene_data.diet==x) & (gene_data.feeding_schedule==y)].index
-            genes_by_group = gene_data.loc[ids]
-            genes_by_group.dropna(inplace = True)
-            group_dict[group]=genes_by_group
-            
-# MannU Whitney Analysis
-groups = metafile.group.unique()
-column_names = ["gene", "group1", "group2", "U-statistic", "p_value"]
-gene_df = pd.DataFrame(columns = column_names)
-i=0
-for c in gene_list:
-    
-    for x in groups:
-        group1 = group_dict[x][c]
-        
-        for y in groups:
-            if(y!= x):
-                group2 = group_dict[y][c]
-                u_statistic, pVal = stats.mannwhitneyu(group1, group2)
-                gene_df.loc[i]=[c, x, y, u_statistic, pVal]
-                i+=1
-gene_df.set_index("gene").to_csv('Figures_and_Analysis/Fig5_Mann_Whitney.csv')
+# Method to run the statistical analysis of Figure 5
+def fig5_statistics(plot_gene_data, gene_list, metafile):
+    with stage("statistics", figure = "Fig5"):
+        results_store = open_results_store(":memory:")
+
+        # Create a dictionary to hold MannU Whitney Results
+        feeding = metafile.Feeding.unique()
+        diet   = metafile.Diet.unique()
+        group_dict={}
+        for x in diet:
+                for y in feeding:
+                    group = str(x)+' '+str(y)
+                    ids = plot_gene_data[(plot_gene_data.diet==x) & (plot_gene_data.feeding_schedule==y)].index
+                    genes_by_group = plot_gene_data.loc[ids]
+                    genes_by_group.dropna(inplace = True)
+                    group_dict[group]=genes_by_group
+
+        # MannU Whitney Analysis
+        groups = metafile.group.unique()
+        column_names = ["gene", "group1", "group2", "U-statistic", "p_value"]
+        gene_df = pd.DataFrame(columns = column_names)
+        i=0
+        for c in gene_list:
+
+            for x in groups:
+                group1 = group_dict[x][c]
+
+                for y in groups:
+                    if(y!= x):
+                        group2 = group_dict[y][c]
+                        u_statistic, pVal = stats.mannwhitneyu(group1, group2)
+                        gene_df.loc[i]=[c, x, y, u_statistic, pVal]
+                        i+=1
+        record_pairwise(results_store, "Fig5", "mann_whitney", gene_df, "U-statistic", "p_value", "U", block_column = "gene")
+
+        fig5_results = store_tables(results_store)
+        results_store.close()
+
+    return {"fig5_results": fig5_results}
+
 
+#----------------------------------------------------------
+# Write Statistical Results
+#----------------------------------------------------------
+# Method to gather the results of every statistics stage (in figure order) into the results store and generate the legacy CSV files from it
+def write_results(fig1_results, fig2_results, fig3_results, fig4_results, fig5_results):
+    with stage("write_results"):
+        # Open the results store that collects every statistical result of this run (see results_store.py)
+        results_store = open_results_store("Figures_And_Analysis/statistical_results.sqlite", reset = True)
+        for tables in [fig1_results, fig2_results, fig3_results, fig4_results, fig5_results]:
+            append_tables(results_store, tables)
+        # Generate the legacy CSV files from the results store
+        export_legacy_csvs(results_store, "Figures_And_Analysis")
+        results_store.close()
+
+
+#----------------------------------------------------------
+# Run the Stages
+#----------------------------------------------------------
+# Every stage reads the outputs of the stages before it by name - a rerun reuses the checkpoints of the stages that did not change (see stage_graph.py)
+graph = new_graph()
+add_stage(graph, "load_data", load_data, inputs = ["cohort", "input_files"],
+          outputs = ["plot_parameters", "body_weight", "metafile", "master_data", "feeding_data", "normalized_feeding", "feeding_hourly_frame",
+                     "video_metafile", "sucrose_data", "normalized_sucrose", "sucrose_hourly_frame", "gene_data"])
+add_stage(graph, "check_data", check_data, inputs = ["plot_parameters", "metafile", "master_data", "feeding_data", "sucrose_data", "feeding_hourly_frame",
+                                                     "sucrose_hourly_frame", "normalized_feeding", "normalized_sucrose", "gene_data", "video_metafile"],
+          outputs = ["data_summary"])
+add_stage(graph, "fig1_frames", fig1_frames, inputs = ["body_weight"], outputs = ["plot_body_weight"])
+add_stage(graph, "fig1_figure", fig1_figure, inputs = ["metafile", "plot_body_weight", "master_data", "plot_parameters"],
+          files = ['Figures_And_Analysis/Fig1.tif'], main_thread = True)
+add_stage(graph, "fig1_statistics", fig1_statistics, inputs = ["body_weight", "plot_body_weight", "master_data", "cohort"], outputs = ["fig1_results"])
+add_stage(graph, "fig2_frames", fig2_frames, inputs = ["feeding_data", "sucrose_data", "plot_parameters", "cohort"],
+          outputs = ["total_feeding_data", "sucrose_and_feeding_data", "sucrose_and_feeding_data_ratio", "plot_feeding_frame", "barplot_plot_parameters", "edged_plot_parameters"])
+add_stage(graph, "fig2_figure", fig2_figure, inputs = ["sucrose_and_feeding_data", "total_feeding_data", "plot_feeding_frame", "edged_plot_parameters", "barplot_plot_parameters"],
+          files = ['Figures_And_Analysis/Fig2.tif'], main_thread = True)
+add_stage(graph, "fig2_statistics", fig2_statistics, inputs = ["sucrose_and_feeding_data", "sucrose_and_feeding_data_ratio", "cohort"], outputs = ["fig2_results"])
+add_stage(graph, "fig3g_frames", fig3g_frames, inputs = ["feeding_hourly_frame", "plot_parameters", "cohort"], outputs = ["final_feeding_frame", "feeding_barplot_plot_parameters"])
+add_stage(graph, "fig3_figure", fig3_figure, inputs = ["normalized_feeding", "feeding_hourly_frame", "video_metafile", "final_feeding_frame", "feeding_barplot_plot_parameters",
+                                                       "plot_parameters", "cohort"], files = ['Figures_And_Analysis/Fig3.tif'], main_thread = True)
+add_stage(graph, "fig3_statistics", fig3_statistics, inputs = ["feeding_hourly_frame", "cohort"], outputs = ["fig3_results"])
+add_stage(graph, "fig4d_frames", fig4d_frames, inputs = ["sucrose_hourly_frame", "plot_parameters", "cohort"], outputs = ["final_sucrose_frame", "sucrose_barplot_plot_parameters"])
+add_stage(graph, "fig4_figure", fig4_figure, inputs = ["normalized_sucrose", "sucrose_hourly_frame", "video_metafile", "final_sucrose_frame", "sucrose_barplot_plot_parameters",
+                                                       "plot_parameters", "cohort"], files = ['Figures_And_Analysis/Fig4.tif'], main_thread = True)
+add_stage(graph, "fig4_statistics", fig4_statistics, inputs = ["sucrose_hourly_frame", "cohort"], outputs = ["fig4_results"])
+add_stage(graph, "fig5_frames", fig5_frames, inputs = ["gene_data", "metafile"], outputs = ["plot_gene_data", "gene_list"])
+add_stage(graph, "fig5_figure", fig5_figure, inputs = ["plot_gene_data", "gene_list", "plot_parameters"], files = ['Figures_And_Analysis/Fig5.tiff'], main_thread = True)
+add_stage(graph, "fig5_statistics", fig5_statistics, inputs = ["plot_gene_data", "gene_list", "metafile"], outputs = ["fig5_results"])
+add_stage(graph, "write_results", write_results, inputs = ["fig1_results", "fig2_results", "fig3_results", "fig4_results", "fig5_results"], checkpoint = False)
+
+# Cohort of the figures - the 2018VT study unless the TRF_COHORT environment variable names another cohort configuration (see cohort_config.py)
+cohort = load_cohort()
+# Size and modification time of every input file - a new version of an input file runs load_data (and every stage after it) again
+input_files = {}
+for path in ["Data for figures/plotting_by_group.csv", cohort["metafile"], "Data for figures/2018VT_termination_data_master_document.csv",
+             "Data for figures/Feeding_Binary_CSV_Files.zip", "Data for figures/Sucrose_Binary_CSV_Files.zip", "Data for figures/qPCR_normalized_gapdph.csv"]:
+    input_files[path] = [os.stat(path).st_size, os.stat(path).st_mtime_ns]
+settings = {"cohort": cohort, "input_files": input_files}
+
+# Load and check the input data first, so that a data problem stops the run before any figure or statistic
+values = run_graph(graph, settings, targets = ["check_data"], workers = arguments.workers)
+if arguments.check_data:
+    print("Input data check passed: " + str(values["data_summary"]["rats"]) + " rats, " + str(values["data_summary"]["groups"]) + " diet groups, "
+          + str(values["data_summary"]["video_rats"]) + " rats with video recordings")
+    sys.exit(0)
+
+# Run every other stage - figures are drawn again with --force
+run_graph(graph, settings, rerun = [name for name in graph["stages"] if name.endswith("_figure")] if arguments.force else [], workers = arguments.workers)
@@ -0,0 +1,62 @@
+# Lazy Imports of Statistics and Plotting Libraries
+# Used by figures_and_analysis.py so that starting the script (i.e. --help or --check-data) does not wait for
+# seaborn, statsmodels, pingouin, scipy and matplotlib to load for
+# Time-Restricted Feeding in the Active Phase Drives Periods of Rapid Food Consumption in Rats Fed a High-Fat, High-Sugar Diet with Liquid Sucrose
+# by Kush Attal, Julia Wickman Shihoko Kojima, Sarah N. Blythe, Natalia Toporikova
+#
+# LazyModule("seaborn") stands in for "import seaborn" and lazy_callable("pingouin", "mixed_anova") for
+# "from pingouin import mixed_anova". The library is imported the first time one of its attributes is used or the
+# function is called, and only once.
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import importlib
+import threading
+
+
+#----------------------------------------------------------
+# Define Custom Methods
+#----------------------------------------------------------
+
+# Stages of stage_graph.py run on several threads - they import one library at a time, so that no thread
+# sees a library that another thread has only half imported
+IMPORT_LOCK = threading.RLock()
+
+# Module that is imported the first time one of its attributes is used
+# "on_import" (optional) is called once, right after the import (i.e. to set the style of a plotting library)
+class LazyModule:
+    def __init__(self, name, on_import = None):
+        self._name = name
+        self._on_import = on_import
+        self._module = None
+
+    # Method to import the module (only the first time)
+    def _load(self):
+        if self._module is None:
+            with IMPORT_LOCK:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+                    if self._on_import is not None:
+                        self._on_import()
+        return self._module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "imported" if self._module is not None else "not imported yet"
+        return "<lazy module '" + self._name + "' (" + state + ")>"
+
+# Method to create a function (or class) of a module that is imported the first time the function is called
+def lazy_callable(module_name, attribute):
+    module = LazyModule(module_name)
+    def call(*arguments, **keyword_arguments):
+        return getattr(module, attribute)(*arguments, **keyword_arguments)
+    call.__name__ = attribute
+    call.__qualname__ = attribute
+    return call
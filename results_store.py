@@ -0,0 +1,298 @@
+# Structured Results Store for Statistical Analysis
+# Used to collect every statistical result from figures_and_analysis.py into one SQLite table for
+# Time-Restricted Feeding in the Active Phase Drives Periods of Rapid Food Consumption in Rats Fed a High-Fat, High-Sugar Diet with Liquid Sucrose
+# by Kush Attal, Julia Wickman Shihoko Kojima, Sarah N. Blythe, Natalia Toporikova
+#
+# Every ANOVA, Tukey HSD, t-test and Mann-Whitney result is stored as one typed row in the "results" table.
+# The legacy CSV files (i.e. "Fig3F_RMAnova_Tukey.csv") are built from these rows and can be written out on demand:
+#     python results_store.py Figures_And_Analysis/statistical_results.sqlite Figures_And_Analysis
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import pandas as pd
+import sqlite3
+import os
+import sys
+
+
+#----------------------------------------------------------
+# Define Table Layout
+#----------------------------------------------------------
+# Columns of the results table - one row per ANOVA source, per Tukey comparison or per pairwise test
+# "label" names a block in the legacy CSV files (i.e. the date of a day of body weights); "ss" to "p_spher" are the sums of
+# squares, mean squares and sphericity test of the ANOVA tables
+RESULT_COLUMNS = ["figure", "test", "block", "label", "factor", "group1", "group2",
+                  "statistic_name", "statistic", "df1", "df2", "p", "p_adj",
+                  "effect_size", "meandiff", "lower", "upper", "reject",
+                  "ss", "ms", "eps", "sphericity", "w_spher", "p_spher"]
+NUMERIC_COLUMNS = ["statistic", "df1", "df2", "p", "p_adj", "effect_size", "meandiff", "lower", "upper", "ss", "ms", "eps", "w_spher", "p_spher"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id             INTEGER PRIMARY KEY AUTOINCREMENT,
+    figure         TEXT NOT NULL,
+    test           TEXT NOT NULL,
+    block          TEXT,
+    label          TEXT,
+    factor         TEXT,
+    group1         TEXT,
+    group2         TEXT,
+    statistic_name TEXT,
+    statistic      REAL,
+    df1            REAL,
+    df2            REAL,
+    p              REAL,
+    p_adj          REAL,
+    effect_size    REAL,
+    meandiff       REAL,
+    lower          REAL,
+    upper          REAL,
+    reject         INTEGER,
+    ss             REAL,
+    ms             REAL,
+    eps            REAL,
+    sphericity     INTEGER,
+    w_spher        REAL,
+    p_spher        REAL
+);
+CREATE INDEX IF NOT EXISTS results_by_figure ON results (figure, test, block);
+CREATE INDEX IF NOT EXISTS results_by_factor ON results (factor);
+CREATE INDEX IF NOT EXISTS results_by_groups ON results (group1, group2);
+CREATE INDEX IF NOT EXISTS results_by_p ON results (p);
+"""
+
+# Legacy CSV files, in the order figures_and_analysis.py writes them: (file name, layout, figure, block labels) - see legacy_frame()
+# Block labels go into the "reject" column: "block" puts the block on the first row of every block, "label_and_block" the label on the
+# first and the block on the second row
+LEGACY_FILES = [("Fig1A_MixedModel_ANOVA_and_TukeyHSD_preTRF.csv", "anova_blocks", "Fig1A preTRF", "label_and_block"),
+                ("Fig1A_MixedModel_ANOVA_and_TukeyHSD_postTRF.csv", "anova_blocks", "Fig1A postTRF", "label_and_block"),
+                ("Fig1B_ANOVA_and_TukeyHSD.csv", "anova_tukey", "Fig1B", None),
+                ("Fig1CtoF_ANOVA_and_Tukey.csv", "anova_tukey", "Fig1CtoF", "block"),
+                ("Fig2_T_Tests.csv", "pairwise", "Fig2", None),
+                ("Fig3F_RMAnova_Tukey.csv", "anova_blocks", "Fig3F", None),
+                ("Fig3G_RMAnova_Tukey_HFHSRes.csv", "anova_blocks", "Fig3G HFHSRes", None),
+                ("Fig3E_RMAnova_Tukey.csv", "anova_blocks", "Fig3E", None),
+                ("Fig3G_RMAnova_Tukey_ContRes.csv", "anova_blocks", "Fig3G ContRes", None),
+                ("Fig4C_RMAnova_Tukey.csv", "anova_blocks", "Fig4C", None),
+                ("Fig4D_RMAnova_Tukey_HFHSRes.csv", "anova_blocks", "Fig4D HFHSRes", None),
+                ("Fig4D_RMAnova_Tukey_HFHSAL.csv", "anova_blocks", "Fig4D HFHSAL", None),
+                ("Fig5_Mann_Whitney.csv", "pairwise", "Fig5", None)]
+
+# Columns of the pingouin ANOVA tables (mixed_anova and rm_anova) and the results columns they come from
+PINGOUIN_COLUMNS = {"mixed_anova": [("Source", "factor"), ("SS", "ss"), ("DF1", "df1"), ("DF2", "df2"), ("MS", "ms"), ("F", "statistic"),
+                                    ("p-unc", "p"), ("p-GG-corr", "p_adj"), ("np2", "effect_size"), ("eps", "eps"), ("sphericity", "sphericity"),
+                                    ("W-spher", "w_spher"), ("p-spher", "p_spher")],
+                    "rm_anova": [("Source", "factor"), ("SS", "ss"), ("DF", "df1"), ("MS", "ms"), ("F", "statistic"), ("p-unc", "p"),
+                                 ("p-GG-corr", "p_adj"), ("ng2", "effect_size"), ("eps", "eps"), ("sphericity", "sphericity"),
+                                 ("W-spher", "w_spher"), ("p-spher", "p_spher")]}
+# Columns of the statsmodels ANOVA tables and of the Tukey HSD tables
+ANOVA_COLUMNS = [("df", "df1"), ("sum_sq", "ss"), ("mean_sq", "ms"), ("F", "statistic"), ("PR(>F)", "p")]
+TUKEY_COLUMNS = [("group1", "group1"), ("group2", "group2"), ("meandiff", "meandiff"), ("p-adj", "p_adj"), ("lower", "lower"),
+                 ("upper", "upper"), ("reject", "reject")]
+# Index and columns of the pairwise tests
+PAIRWISE_COLUMNS = {"t_test": ("group1", [("group2", "group2"), ("t-statistic", "statistic"), ("p-value", "p")]),
+                    "mann_whitney": ("gene", [("group1", "group1"), ("group2", "group2"), ("U-statistic", "statistic"), ("p_value", "p")])}
+
+
+#----------------------------------------------------------
+# Define Custom Methods
+#----------------------------------------------------------
+
+# Method to open (and create if needed) the results store - set "reset" to True to drop the results of a previous run
+def open_results_store(path, reset = False):
+    store = sqlite3.connect(path)
+    if reset:
+        # Drop the tables of a previous run, which may have been written with an older layout
+        store.executescript("DROP TABLE IF EXISTS results; DROP TABLE IF EXISTS legacy_csv;")
+    store.executescript(SCHEMA)
+    store.commit()
+    return store
+
+# Method to turn a cell into a float - blank cells ("") and text become NaN, which SQLite stores as NULL
+def to_number(value):
+    number = pd.to_numeric(pd.Series([value]), errors = "coerce").iloc[0]
+    if pd.isna(number):
+        return None
+    return float(number)
+
+# Method to turn a cell into text - blank cells become NULL
+def to_text(value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)) or value == "":
+        return None
+    return str(value)
+
+# Method to turn a True/False cell into 1 or 0 - blank cells become NULL
+def to_flag(value):
+    if to_text(value) is None:
+        return None
+    return int(str(value) == "True")
+
+# Method to append a list of row dictionaries to the results table
+def append_rows(store, rows):
+    records = [tuple(row.get(column) for column in RESULT_COLUMNS) for row in rows]
+    store.executemany("INSERT INTO results (" + ", ".join(RESULT_COLUMNS) + ") VALUES (" + ", ".join("?" * len(RESULT_COLUMNS)) + ")", records)
+    store.commit()
+    return len(records)
+
+# Method to record an ANOVA table - accepts both pingouin tables (with a "Source" column) and statsmodels anova_lm tables (sources in the index)
+# "label" (optional) names the block in the legacy CSV files
+def record_anova(store, figure, test, aov_table, block = None, label = None):
+    rows = []
+    for factor, row in aov_table.iterrows():
+        # pingouin names the source in a column, statsmodels in the index
+        if "Source" in aov_table.columns:
+            factor = row["Source"]
+        # pingouin mixed_anova reports DF1 and DF2, rm_anova reports DF, statsmodels reports df
+        df1 = row.get("DF1", row.get("DF", row.get("df")))
+        # Effect size: partial eta-squared for mixed_anova and generalized eta-squared for rm_anova
+        effect_size = row.get("np2", row.get("ng2"))
+        rows.append({"figure": figure, "test": test, "block": to_text(block), "label": to_text(label), "factor": to_text(factor),
+                     "statistic_name": "F", "statistic": to_number(row.get("F")),
+                     "df1": to_number(df1), "df2": to_number(row.get("DF2")),
+                     "p": to_number(row.get("p-unc", row.get("PR(>F)"))), "p_adj": to_number(row.get("p-GG-corr")),
+                     "effect_size": to_number(effect_size),
+                     "ss": to_number(row.get("SS", row.get("sum_sq"))), "ms": to_number(row.get("MS", row.get("mean_sq"))),
+                     "eps": to_number(row.get("eps")), "sphericity": to_flag(row.get("sphericity")),
+                     "w_spher": to_number(row.get("W-spher")), "p_spher": to_number(row.get("p-spher"))})
+    return append_rows(store, rows)
+
+# Method to record a Tukey HSD table (the columns of statsmodels' tukeyhsd() summary)
+def record_tukey(store, figure, tukey_table, block = None, label = None):
+    rows = []
+    for _, row in tukey_table.iterrows():
+        rows.append({"figure": figure, "test": "tukey_hsd", "block": to_text(block), "label": to_text(label),
+                     "group1": to_text(row["group1"]), "group2": to_text(row["group2"]),
+                     "statistic_name": "meandiff", "statistic": to_number(row.get("meandiff")),
+                     "p": to_number(row.get("p-adj")), "p_adj": to_number(row.get("p-adj")),
+                     "meandiff": to_number(row.get("meandiff")), "lower": to_number(row.get("lower")),
+                     "upper": to_number(row.get("upper")),
+                     "reject": to_flag(row.get("reject"))})
+    return append_rows(store, rows)
+
+# Method to record the combined ANOVA + Tukey dataframes returned by day_anova_analysis, metabolite_anova_analysis and activity_anova
+# Rows without a "group1" are ANOVA rows, rows with a "group1" are Tukey comparisons
+def record_anova_and_tukey(store, figure, test, result, block = None, label = None):
+    is_tukey = result["group1"].notna() & (result["group1"] != "")
+    anova_rows = result[~is_tukey].drop(columns = ["group1", "group2", "meandiff", "p-adj", "lower", "upper", "reject"], errors = "ignore")
+    count = record_anova(store, figure, test, anova_rows, block, label)
+    count += record_tukey(store, figure, result[is_tukey], block, label)
+    return count
+
+# Method to record a table of pairwise tests (t-tests or Mann-Whitney U) with one row per comparison
+def record_pairwise(store, figure, test, table, statistic_column, p_column, statistic_name, block_column = None):
+    rows = []
+    for _, row in table.iterrows():
+        rows.append({"figure": figure, "test": test,
+                     "block": to_text(row[block_column]) if block_column is not None else None,
+                     "group1": to_text(row["group1"]), "group2": to_text(row["group2"]),
+                     "statistic_name": statistic_name, "statistic": to_number(row[statistic_column]),
+                     "p": to_number(row[p_column])})
+    return append_rows(store, rows)
+
+# Method to read every result of a store - i.e. to keep the results of one stage of stage_graph.py in its checkpoint
+def store_tables(store):
+    return {"results": pd.read_sql_query("SELECT " + ", ".join(RESULT_COLUMNS) + " FROM results ORDER BY id", store)}
+
+# Method to append the tables of store_tables() to a store, after the results it already holds
+def append_tables(store, tables):
+    rows = [{column: None if pd.isna(value) else value for column, value in row.items()} for row in tables["results"].to_dict("records")]
+    append_rows(store, rows)
+
+# Method to pick the values of some results columns as a row of a legacy CSV file - "columns" is a list of (legacy column, results column)
+def legacy_row(result, columns):
+    return {legacy: result[column] for legacy, column in columns}
+
+# Method to build the legacy layout of one CSV file from the results of its figure (from query_results(), in the order they were recorded)
+# "anova_tukey": the statsmodels ANOVA table and the Tukey HSD table of every block, one after the other
+# "anova_blocks": the pingouin ANOVA table, then the Tukey HSD table of every block below an empty row for every statsmodels ANOVA row
+# "pairwise": one row per t-test or Mann-Whitney U test
+# Returns the dataframe and the arguments of to_csv()
+def legacy_frame(results, layout, labels = None):
+    if layout == "pairwise":
+        index, columns = PAIRWISE_COLUMNS[results.test.iloc[0]]
+        frame = pd.DataFrame([legacy_row(result, [(index, "group1" if index == "group1" else "block")] + columns) for _, result in results.iterrows()])
+        return frame.set_index(index), {}
+    rows = []
+    index = []
+    if layout == "anova_blocks":
+        pingouin = results[results.test.isin(PINGOUIN_COLUMNS)]
+        # Only the columns pingouin filled in (i.e. no sphericity columns when there is no sphericity test)
+        columns = [(legacy, column) for legacy, column in PINGOUIN_COLUMNS[pingouin.test.iloc[0]] if pingouin[column].notna().any()]
+        rows += [legacy_row(result, columns) for _, result in pingouin.iterrows()]
+        results = results[~results.test.isin(PINGOUIN_COLUMNS)]
+    for block in results.block.drop_duplicates():
+        block_results = results[results.block == block] if pd.notna(block) else results[results.block.isna()]
+        block_rows = []
+        for _, result in block_results.iterrows():
+            if result.test == "tukey_hsd":
+                block_rows.append(legacy_row(result, TUKEY_COLUMNS))
+                index.append("")
+            else:
+                block_rows.append(legacy_row(result, ANOVA_COLUMNS) if layout == "anova_tukey" else {})
+                index.append(result.factor)
+        if labels == "block":
+            block_rows[0]["reject"] = block
+        elif labels == "label_and_block":
+            block_rows[0]["reject"] = block_results.label.iloc[0]
+            block_rows[1]["reject"] = block
+        rows += block_rows
+    if layout == "anova_blocks":
+        frame = pd.DataFrame(rows, columns = [legacy for legacy, _ in columns + TUKEY_COLUMNS])
+        return frame.fillna(""), {"index": False}
+    frame = pd.DataFrame(rows, index = index, columns = [legacy for legacy, _ in ANOVA_COLUMNS + TUKEY_COLUMNS])
+    return frame.fillna(""), {}
+
+# Method to write the legacy CSV files of every figure in the store into a directory, built from the results table
+def export_legacy_csvs(store, directory, filenames = None):
+    if not os.path.exists(directory):
+        os.mkdir(directory)
+    written = []
+    for filename, layout, figure, labels in LEGACY_FILES:
+        if filenames is not None and filename not in filenames:
+            continue
+        results = query_results(store, figure = figure)
+        if len(results) == 0:
+            continue
+        frame, to_csv_arguments = legacy_frame(results, layout, labels)
+        frame.to_csv(os.path.join(directory, filename), **to_csv_arguments)
+        written.append(filename)
+    return written
+
+# Method to query the results table - every argument is optional and the filters use the table indexes
+# i.e. query_results(store, figure = "Fig3F", test = "tukey_hsd", max_p = 0.05)
+def query_results(store, figure = None, test = None, block = None, factor = None, group = None, max_p = None):
+    conditions = []
+    parameters = []
+    for column, value in [("figure", figure), ("test", test), ("block", block), ("factor", factor)]:
+        if value is not None:
+            conditions.append(column + " = ?")
+            parameters.append(value)
+    if group is not None:
+        conditions.append("(group1 = ? OR group2 = ?)")
+        parameters.extend([group, group])
+    if max_p is not None:
+        conditions.append("p <= ?")
+        parameters.append(max_p)
+    sql = "SELECT " + ", ".join(RESULT_COLUMNS) + " FROM results"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY id"
+    results = pd.read_sql_query(sql, store, params = parameters)
+    # Empty numeric columns come back as object columns of None - make every numeric column a float column
+    results[NUMERIC_COLUMNS] = results[NUMERIC_COLUMNS].astype(float)
+    for column in ["reject", "sphericity"]:
+        results[column] = results[column].map({1: True, 0: False})
+    return results
+
+
+#----------------------------------------------------------
+# Regenerate Legacy CSV Files on Demand
+#----------------------------------------------------------
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        raise SystemExit("Usage: python results_store.py <results.sqlite> <output directory>")
+    store = open_results_store(sys.argv[1])
+    for filename in export_legacy_csvs(store, sys.argv[2]):
+        print(filename)
@@ -0,0 +1,234 @@
+# Checkpointed Stage Graph
+# Used by figures_and_analysis.py to run the data loading, dataframe generation, figures and statistical analysis as a graph of named stages for
+# Time-Restricted Feeding in the Active Phase Drives Periods of Rapid Food Consumption in Rats Fed a High-Fat, High-Sugar Diet with Liquid Sucrose
+# by Kush Attal, Julia Wickman Shihoko Kojima, Sarah N. Blythe, Natalia Toporikova
+#
+# Every stage is a function that takes the outputs of earlier stages (or the settings of the run) as keyword arguments
+# and returns a dictionary of its own outputs. The outputs of a stage that succeeds are kept in
+# Figures_And_Analysis/checkpoints/<stage>.pkl, and checkpoints.json records the key of the stage - a SHA-256 hash of
+#   - the source code of the stage function and of every function of the same script it calls (see figure_cache.py),
+#   - the keys of the stages it reads from and the values of the settings it reads,
+#   - the pandas version (the checkpoints are pickled dataframes).
+# A rerun reuses every stage whose key is unchanged (and whose output files still exist), so it resumes at the stages
+# that failed or changed and at the stages that read from them. A failed stage does not stop the stages that do not
+# read from it. Stages whose inputs are ready run at the same time on a pool of worker threads; stages that draw with
+# pyplot (which is not thread-safe) run one after the other on the main thread.
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import hashlib
+import json
+import os
+import pickle
+import sys
+import tempfile
+import time
+import traceback
+from figure_cache import hash_frame, function_sources
+
+
+#----------------------------------------------------------
+# Define Default Settings
+#----------------------------------------------------------
+CHECKPOINT_FOLDER = "Figures_And_Analysis/checkpoints"
+
+# Number of worker threads for the stages that do not draw with pyplot
+WORKERS = 4
+
+
+#----------------------------------------------------------
+# Define Custom Methods
+#----------------------------------------------------------
+
+# Method to start an empty stage graph
+def new_graph(checkpoint_folder = CHECKPOINT_FOLDER):
+    return {"folder": checkpoint_folder, "stages": {}, "producers": {}}
+
+# Method to add a stage - "inputs" are outputs of stages added before it or settings of run_graph(), "outputs" are the keys
+# of the dictionary the function returns and "files" the files the stage writes (its checkpoint is only reused while they exist)
+# Set "main_thread" for stages that draw with pyplot and "checkpoint" to False for stages that must run every time
+def add_stage(graph, name, function, inputs = (), outputs = (), files = (), main_thread = False, checkpoint = True):
+    if name in graph["stages"]:
+        raise Exception("stage '" + name + "' is already in the stage graph")
+    for output in outputs:
+        if output in graph["producers"]:
+            raise Exception("output '" + output + "' of stage '" + name + "' is already an output of stage '" + graph["producers"][output] + "'")
+        graph["producers"][output] = name
+    graph["stages"][name] = {"function": function, "inputs": list(inputs), "outputs": list(outputs), "files": list(files),
+                             "main_thread": main_thread, "checkpoint": checkpoint}
+
+# Method to list the stages a stage reads from
+def upstream_stages(graph, name):
+    return sorted(set(graph["producers"][value] for value in graph["stages"][name]["inputs"] if value in graph["producers"]))
+
+# Method to add a setting to a hash - dataframes by their values, anything else by its JSON text
+def hash_value(digest, value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        hash_frame(digest, value)
+    else:
+        digest.update(json.dumps(value, sort_keys = True, default = str).encode())
+
+# Method to compute the key of every stage (stages are added after the stages they read from, so one pass is enough)
+def stage_keys(graph, settings):
+    keys = {}
+    for name, entry in graph["stages"].items():
+        digest = hashlib.sha256()
+        digest.update(repr((name, pd.__version__, entry["outputs"], entry["files"])).encode())
+        for function_source in function_sources([entry["function"]]):
+            digest.update(function_source.encode())
+        for value in entry["inputs"]:
+            digest.update(value.encode())
+            if value in graph["producers"]:
+                digest.update(keys[graph["producers"][value]].encode())
+            elif value in settings:
+                hash_value(digest, settings[value])
+            else:
+                raise Exception("stage '" + name + "' reads '" + value + "', which is neither a setting nor an output of an earlier stage")
+        keys[name] = digest.hexdigest()
+    return keys
+
+# Method to list the stages needed for "targets" (every stage when None), in the order they were added
+def needed_stages(graph, targets = None):
+    if targets is None:
+        return list(graph["stages"])
+    needed = set()
+    to_visit = list(targets)
+    while to_visit:
+        name = to_visit.pop()
+        if name not in needed:
+            needed.add(name)
+            to_visit.extend(upstream_stages(graph, name))
+    return [name for name in graph["stages"] if name in needed]
+
+# Method to read the record of the previous runs (key, status, seconds and error of every stage)
+def load_manifest(folder):
+    path = os.path.join(folder, "checkpoints.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+# Method to write a file through a temporary file next to it, so that a stopped run never leaves half a checkpoint behind
+def replace_file(path, write, mode = "w"):
+    handle, temporary = tempfile.mkstemp(dir = os.path.dirname(os.path.abspath(path)), prefix = "." + os.path.basename(path), suffix = ".tmp")
+    with os.fdopen(handle, mode) as file:
+        write(file)
+    os.replace(temporary, path)
+
+# Method to find the checkpoint file of a stage
+def checkpoint_path(graph, name):
+    return os.path.join(graph["folder"], name + ".pkl")
+
+# Method to check if the checkpoint of a stage can be reused
+def is_checkpointed(graph, name, key, manifest):
+    entry = graph["stages"][name]
+    record = manifest.get(name, {})
+    return (entry["checkpoint"] and record.get("key") == key and record.get("status") in ("ran", "reused")
+            and os.path.exists(checkpoint_path(graph, name)) and all(os.path.exists(path) for path in entry["files"]))
+
+# Method to read the checkpointed outputs of a stage into "values"
+def load_outputs(graph, name, values):
+    with open(checkpoint_path(graph, name), "rb") as file:
+        values.update(pickle.load(file))
+
+# Method to collect the keyword arguments of a stage - the outputs of reused stages are read the first time a stage needs them
+def stage_arguments(graph, name, values):
+    for value in graph["stages"][name]["inputs"]:
+        if value not in values:
+            load_outputs(graph, graph["producers"][value], values)
+    return {value: values[value] for value in graph["stages"][name]["inputs"]}
+
+# Method to run one stage and write its checkpoint - returns the outputs of the stage and its wall time
+def call_stage(graph, name, arguments):
+    entry = graph["stages"][name]
+    start = time.perf_counter()
+    outputs = entry["function"](**arguments) or {}
+    missing = set(entry["outputs"]) - set(outputs)
+    if missing:
+        raise Exception("stage '" + name + "' did not return " + ", ".join(sorted(missing)))
+    outputs = {output: outputs[output] for output in entry["outputs"]}
+    if entry["checkpoint"]:
+        replace_file(checkpoint_path(graph, name), lambda file: pickle.dump(outputs, file, protocol = pickle.HIGHEST_PROTOCOL), mode = "wb")
+    return outputs, time.perf_counter() - start
+
+# Method to record the end of a stage in the manifest (on the main thread only)
+def finish_stage(graph, name, key, manifest, status, values, result = None, error = None):
+    if error is None:
+        outputs, seconds = result
+        values.update(outputs)
+        status[name] = "ran"
+        manifest[name] = {"key": key, "status": "ran", "seconds": round(seconds, 3)}
+    else:
+        print("Stage '" + name + "' failed:", file = sys.stderr)
+        traceback.print_exception(type(error), error, error.__traceback__)
+        status[name] = "failed"
+        manifest[name] = {"key": key, "status": "failed", "error": repr(error)}
+    replace_file(os.path.join(graph["folder"], "checkpoints.json"), lambda file: json.dump(manifest, file, indent = 2))
+
+# Method to run the stages needed for "targets" (every stage when None) and return the values of the settings and of every output
+# Stages named in "rerun" run even if their checkpoint could be reused
+# Raises an exception once every stage that does not read from a failed stage has finished - the next run resumes from the failed stages
+def run_graph(graph, settings, targets = None, rerun = (), workers = WORKERS):
+    os.makedirs(graph["folder"], exist_ok = True)
+    keys = stage_keys(graph, settings)
+    manifest = load_manifest(graph["folder"])
+    values = dict(settings)
+    status = {}
+    pending = []
+    for name in needed_stages(graph, targets):
+        if name not in rerun and is_checkpointed(graph, name, keys[name], manifest):
+            status[name] = "reused"
+            manifest[name]["status"] = "reused"
+        else:
+            pending.append(name)
+
+    running = {}
+    with ThreadPoolExecutor(max_workers = workers) as pool:
+        while pending or running:
+            # Stages that read from a failed (or skipped) stage are skipped
+            for name in list(pending):
+                if any(status.get(upstream) in ("failed", "skipped") for upstream in upstream_stages(graph, name)):
+                    status[name] = "skipped"
+                    manifest[name] = {"key": keys[name], "status": "skipped"}
+                    pending.remove(name)
+            ready = [name for name in pending if all(status.get(upstream) in ("ran", "reused") for upstream in upstream_stages(graph, name))]
+            # Start the worker stages first, so they run while the main thread draws
+            for name in ready:
+                if not graph["stages"][name]["main_thread"]:
+                    running[pool.submit(call_stage, graph, name, stage_arguments(graph, name, values))] = name
+                    pending.remove(name)
+            main_ready = [name for name in ready if graph["stages"][name]["main_thread"]]
+            if main_ready:
+                name = main_ready[0]
+                pending.remove(name)
+                try:
+                    finish_stage(graph, name, keys[name], manifest, status, values, result = call_stage(graph, name, stage_arguments(graph, name, values)))
+                except Exception as error:
+                    finish_stage(graph, name, keys[name], manifest, status, values, error = error)
+                done = [future for future in running if future.done()]
+            elif running:
+                done = wait(running, return_when = FIRST_COMPLETED).done
+            else:
+                # Nothing is running and nothing is ready
+                break
+            for future in done:
+                name = running.pop(future)
+                if future.exception() is None:
+                    finish_stage(graph, name, keys[name], manifest, status, values, result = future.result())
+                else:
+                    finish_stage(graph, name, keys[name], manifest, status, values, error = future.exception())
+
+    replace_file(os.path.join(graph["folder"], "checkpoints.json"), lambda file: json.dump(manifest, file, indent = 2))
+    failed = [name for name in status if status[name] == "failed"]
+    if failed:
+        skipped = [name for name in status if status[name] == "skipped"]
+        raise Exception("Stages failed: " + ", ".join(failed) + (" (skipped: " + ", ".join(skipped) + ")" if skipped else "")
+                        + " - the other stages are checkpointed, run again to resume from the failed stages")
+    for name in targets or []:
+        if status[name] == "reused":
+            load_outputs(graph, name, values)
+    return values
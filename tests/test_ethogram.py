@@ -0,0 +1,65 @@
+# Tests of the Occupancy Matrices and the Ethogram (shared_activity.py, ethogram.py)
+# Creating_Binary_CSV_Files.py and Creating_Multi_Day_CSV_Files.py save the occupancy matrices of every diet group on every
+# run, so these must work for rats without a recorded second and keep the activity exactly.
+#
+#     python -m pytest tests
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import pandas as pd
+import numpy as np
+import os
+import sys
+import pytest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Data for figures"))
+from shared_activity import occupancy_matrix, save_occupancy, load_occupancy, UNRECORDED
+from ethogram import ethogram_codes, downsample_codes
+
+
+#----------------------------------------------------------
+# Define Custom Methods
+#----------------------------------------------------------
+
+# Method to build a small 1-second dataframe like times() - NaN marks the seconds that were not recorded
+def small_times(values, rats):
+    times = pd.DataFrame(np.array(values, dtype = float), index = pd.date_range("1970-01-01 21:00:00", periods = len(values), freq = "S"),
+                         columns = pd.Index(rats, name = ""))
+    times['mean'] = times.mean(axis = 1).fillna(0)
+    return times
+
+
+#----------------------------------------------------------
+# Tests
+#----------------------------------------------------------
+
+# Test that the occupancy matrices keep the activity and the unrecorded seconds, also of a rat that was never recorded
+def test_save_and_load_occupancy(tmp_path):
+    feeding = small_times([[1, np.nan, 0], [0, np.nan, 1], [np.nan, np.nan, 1]], ["Rat02", "Rat03", "Rat04"])
+    zoomie = small_times([[3, 0], [0, 2], [1, 0]], ["Rat02", "Rat04"])
+    save_occupancy(tmp_path / "Occupancy.npz", "Control Ad Lib", {"Feeding": feeding, "Zoomie": zoomie})
+    group, behaviors = load_occupancy(tmp_path / "Occupancy.npz")
+    assert group == "Control Ad Lib" and list(behaviors) == ["Feeding", "Zoomie"]
+    rats, index, occupancy = behaviors["Feeding"]
+    assert rats == ["Rat02", "Rat03", "Rat04"]
+    assert (index == feeding.index.to_numpy(dtype = "datetime64[ns]")).all()
+    assert occupancy.tolist() == [[1, UNRECORDED, 0], [0, UNRECORDED, 1], [UNRECORDED, UNRECORDED, 1]]
+    assert behaviors["Zoomie"][2].tolist() == [[3, 0], [0, 2], [1, 0]]
+
+# Test that a matrix without any recorded second or without rows is accepted, and values that do not fit in uint8 are not
+def test_occupancy_matrix_limits():
+    assert occupancy_matrix(small_times([[np.nan], [np.nan]], ["Rat02"]))[2].tolist() == [[UNRECORDED], [UNRECORDED]]
+    assert occupancy_matrix(small_times(np.empty((0, 2)), ["Rat02", "Rat03"]))[2].shape == (0, 2)
+    with pytest.raises(ValueError):
+        occupancy_matrix(small_times([[UNRECORDED]], ["Rat02"]))
+
+# Test that a bin holds the behavior of the most seconds, 0 without a behavior and the unrecorded code without a recorded second
+def test_ethogram_codes_and_downsampling():
+    feeding = np.array([[1, 1], [1, 0], [0, UNRECORDED], [0, UNRECORDED]], dtype = np.uint8)
+    water = np.array([[0, 1], [0, 1], [0, UNRECORDED], [0, UNRECORDED]], dtype = np.uint8)
+    assert ethogram_codes([feeding, water], 2).tolist() == [[1, 0], [2, 3]]
+    # Merging columns follows the same rule on the codes
+    codes = np.array([[1, 1, 2, 0, 0, 3, 3], [3, 3, 3, 3, 3, 3, 3]], dtype = np.uint8)
+    assert downsample_codes(codes, 3, 3).tolist() == [[1, 0, 3], [3, 3, 3]]
+    assert downsample_codes(codes, 7, 3).tolist() == codes.tolist()
@@ -0,0 +1,97 @@
+# Tests of the Content-Addressed Figure Cache (figure_cache.py)
+# figures_and_analysis.py restores a figure from the cache when its key is unchanged, so every change that alters the
+# drawing (data, plot parameters, drawing code, the style function and the figure cell) must change the key.
+#
+#     python -m pytest tests
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import pandas as pd
+import importlib.util
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from figure_cache import figure_key, cell_source, restore_figure, store_figure
+
+
+#----------------------------------------------------------
+# Define Default Settings
+#----------------------------------------------------------
+# Drawing script with a style function, a drawing function and a function it calls
+SCRIPT = '''
+def set_figure_style():
+    plt.rcParams['hatch.linewidth'] = 3
+
+def draw_bars(frame):
+    return bar_edges(frame)
+
+def bar_edges(frame):
+    return ["black"] * len(frame)
+
+
+#----------------------------------------------------------
+# Figure1 Generation
+#----------------------------------------------------------
+# Method to draw Figure 1
+def fig1_figure(frame):
+    draw_bars(frame)
+
+
+# In[2]:
+'''
+
+
+#----------------------------------------------------------
+# Define Custom Methods
+#----------------------------------------------------------
+
+# Method to write the drawing script into "folder" with one text replaced and import it - returns the module and its path
+def load_script(folder, name, old = "", new = ""):
+    path = os.path.join(str(folder), name + ".py")
+    with open(path, "w") as script:
+        script.write(SCRIPT.replace(old, new))
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module, path
+
+# Method to compute the key of Figure 1 of a drawing script like figures_and_analysis.py does
+def script_key(module, path, frame, plot_parameters):
+    return figure_key("Fig1", [frame], [plot_parameters], [module.set_figure_style, module.draw_bars], cell_source(path, "Figure1 Generation"))
+
+
+#----------------------------------------------------------
+# Tests
+#----------------------------------------------------------
+
+# Test that the key only changes when the data, plot parameters, drawing code, style function or figure cell change
+def test_key_changes_with_every_input(tmp_path):
+    frame = pd.DataFrame({"total": [1, 2, 3], "group": ["control ad lib", "HFHS ad lib", "HFHS ad lib"]})
+    plot_parameters = pd.DataFrame({"colors": ["gray", "red"]}, index = ["control ad lib", "HFHS ad lib"])
+    module, path = load_script(tmp_path, "original")
+    key = script_key(module, path, frame, plot_parameters)
+    assert script_key(*load_script(tmp_path, "same"), frame.copy(), plot_parameters.copy()) == key
+
+    changed = frame.copy()
+    changed.loc[0, "total"] = 4
+    assert script_key(module, path, changed, plot_parameters) != key
+    assert script_key(module, path, frame.astype({"total": float}), plot_parameters) != key
+    assert script_key(module, path, frame, plot_parameters.replace("red", "darkred")) != key
+    # A style change, a change of a function the drawing function calls and a change of the figure cell
+    assert script_key(*load_script(tmp_path, "style", "'hatch.linewidth'] = 3", "'hatch.linewidth'] = 1"), frame, plot_parameters) != key
+    assert script_key(*load_script(tmp_path, "edges", '["black"]', '["darkred"]'), frame, plot_parameters) != key
+    assert script_key(*load_script(tmp_path, "cell", "    draw_bars(frame)", "    draw_bars(frame.iloc[1:])"), frame, plot_parameters) != key
+
+# Test that a stored figure is restored under its key only
+def test_store_and_restore_figure(tmp_path):
+    output = tmp_path / "Fig1.tif"
+    output.write_bytes(b"figure 1")
+    cache = str(tmp_path / "figure_cache")
+    assert not restore_figure("key1", [str(output)], cache)
+    store_figure("key1", [str(output)], cache)
+    output.write_bytes(b"")
+    assert restore_figure("key1", [str(output)], cache)
+    assert output.read_bytes() == b"figure 1"
+    assert not restore_figure("key2", [str(output)], cache)
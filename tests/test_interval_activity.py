@@ -0,0 +1,39 @@
+# Tests of the Sub-Second Interval Representation (interval_activity.py)
+# At a resolution of 1 second the activity built from the intervals must be exactly the 1-second pivot table of times(),
+# including the rows of 0s of time-restricted rats and the seconds that were not recorded.
+#
+#     python -m pytest tests
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import pandas as pd
+import os
+import sys
+import zipfile
+import pytest
+DATA_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Data for figures")
+sys.path.insert(0, DATA_FOLDER)
+from binary_activity import get_dataframe, add_binary, times, hourly_totals
+from interval_activity import activity_intervals, activity_frame, interval_hourly_totals
+from cohort_config import load_cohort_config
+
+
+#----------------------------------------------------------
+# Tests
+#----------------------------------------------------------
+
+# Test that the intervals give times() at 1 second for a time-restricted and an ad lib group, for feeding (with the rows of
+# 0s outside the feeding window), another behavior (without them) and the Zoomie counts
+@pytest.mark.parametrize("archive_name, diet", [("Control_Restricted", "Control Restricted"), ("Control_Adlib", "Control Adlib")])
+def test_activity_frame_matches_times(archive_name, diet):
+    cohort = load_cohort_config()
+    with zipfile.ZipFile(os.path.join(DATA_FOLDER, "Raw Video Data.zip")) as video_archive:
+        binary = add_binary(get_dataframe(archive_name, video_archive))
+    for behavior in ['Feeding', 'Water', 'Zoomie']:
+        expected = times(behavior, binary, diet, behavior == 'Zoomie', cohort)
+        activity = activity_intervals(behavior, binary, diet, behavior == 'Zoomie', cohort)
+        pd.testing.assert_frame_equal(activity_frame(activity, "1S"), expected, check_freq = False)
+        # The hourly totals hold the same seconds (the index of the rats is not named)
+        pd.testing.assert_frame_equal(interval_hourly_totals(activity, "1S"), hourly_totals(expected), check_names = False)
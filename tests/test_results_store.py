@@ -0,0 +1,89 @@
+# Tests of the Structured Results Store (results_store.py)
+# figures_and_analysis.py used to write every statistical result straight to its CSV file. The legacy CSV files built from the
+# results store must be byte for byte the files written the old way.
+#
+#     python -m pytest tests
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import pandas as pd
+import numpy as np
+import os
+import sys
+from scipy import stats
+from statsmodels.formula.api import ols
+from statsmodels.stats.anova import anova_lm
+import statsmodels.stats.multicomp
+from pingouin import rm_anova
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from results_store import open_results_store, record_anova, record_anova_and_tukey, record_pairwise, export_legacy_csvs
+
+
+#----------------------------------------------------------
+# Define Custom Methods
+#----------------------------------------------------------
+
+# Method to build the consumption of 6 rats of 2 diet groups in 3 hours
+def consumption_data():
+    random = np.random.RandomState(0)
+    data = pd.DataFrame({"Rat": np.repeat(["Rat" + str(rat) for rat in range(1, 7)], 3),
+                         "group": np.repeat(["HFHS restriction"] * 3 + ["control restriction"] * 3, 3),
+                         "phase": ["4:00", "5:00", "6:00"] * 6,
+                         "Consumption_Rate": random.randint(0, 600, 18).astype(float)})
+    data["group_and_phase"] = data["group"] + " " + data["phase"]
+    return data
+
+# Method to run a 1-way ANOVA and Tukey post-hoc, combined into 1 dataframe like activity_anova() of figures_and_analysis.py
+def anova_and_tukey(data, factor):
+    aov_table = anova_lm(ols('Consumption_Rate ~ C(' + factor + ')', data).fit(), typ=1)
+    mc_interaction_results = statsmodels.stats.multicomp.MultiComparison(data["Consumption_Rate"], data[factor]).tukeyhsd(alpha = 0.05)
+    mc_interaction = pd.DataFrame(data=mc_interaction_results._results_table.data[1:], columns=mc_interaction_results._results_table.data[0])
+    return pd.concat([aov_table, mc_interaction], axis = 0, sort = False)
+
+# Method to compare the bytes of a CSV file written the old way with the legacy CSV file of the results store
+def assert_same_csv(legacy, exported):
+    with open(legacy, "rb") as legacy_file, open(exported, "rb") as exported_file:
+        assert legacy_file.read() == exported_file.read()
+
+
+#----------------------------------------------------------
+# Tests
+#----------------------------------------------------------
+
+# Test that the t-tests, the ANOVA + Tukey tables and the repeated measure ANOVA blocks are exported as the old CSV files
+def test_legacy_csvs_match_old_files(tmp_path):
+    data = consumption_data()
+    store = open_results_store(":memory:")
+    legacy = tmp_path / "legacy"
+    legacy.mkdir()
+
+    # Pairwise t-tests (Fig2)
+    results = pd.DataFrame(columns = ["group1", "group2", "t-statistic", "p-value"])
+    for number, phase in enumerate(["4:00", "5:00"]):
+        t, p = stats.ttest_ind(data.Consumption_Rate.where((data.group == "HFHS restriction") & (data.phase == phase)).dropna(),
+                               data.Consumption_Rate.where((data.group == "control restriction") & (data.phase == phase)).dropna())
+        results.loc[number] = ["HFHS restriction " + phase, "control restriction " + phase, t, p]
+    results.set_index("group1").to_csv(legacy / "Fig2_T_Tests.csv")
+    record_pairwise(store, "Fig2", "t_test", results, "t-statistic", "p-value", "t")
+
+    # ANOVA and Tukey tables of one block of 4 groups (Fig1B)
+    result = anova_and_tukey(data[data.phase != "6:00"], "group_and_phase")
+    result.fillna("").rename(index={0:'', 1:'', 2:'', 3:'', 4:'', 5:''}).to_csv(legacy / "Fig1B_ANOVA_and_TukeyHSD.csv")
+    record_anova_and_tukey(store, "Fig1B", "anova", result, block = "Consumption_Rate")
+
+    # Repeated measure ANOVA above the Tukey table (Fig3F)
+    restricted = data[data.group == "HFHS restriction"]
+    aov = rm_anova(data=restricted, dv='Consumption_Rate', within='phase', subject='Rat', detailed=True)
+    result = anova_and_tukey(restricted, "group_and_phase")
+    result_clean = result.fillna("").rename(index={0:'', 1:'', 2:'', 3:'', 4:'', 5:''}).iloc[:,5:].reset_index(drop=True)
+    pd.concat([aov, result_clean]).fillna("").to_csv(legacy / "Fig3F_RMAnova_Tukey.csv", index = False)
+    record_anova(store, "Fig3F", "rm_anova", aov)
+    record_anova_and_tukey(store, "Fig3F", "anova", result)
+
+    written = export_legacy_csvs(store, str(tmp_path / "exported"))
+    assert written == ["Fig1B_ANOVA_and_TukeyHSD.csv", "Fig2_T_Tests.csv", "Fig3F_RMAnova_Tukey.csv"]
+    for filename in written:
+        assert_same_csv(legacy / filename, tmp_path / "exported" / filename)
+    store.close()
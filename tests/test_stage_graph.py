@@ -0,0 +1,100 @@
+# Tests of the Checkpointed Stage Graph (stage_graph.py)
+# A rerun of figures_and_analysis.py must reuse the checkpoint of every stage that did not change and run again only an
+# edited stage, a failed stage and the stages that read from them.
+#
+#     python -m pytest tests
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import importlib.util
+import json
+import os
+import sys
+import pytest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from stage_graph import new_graph, add_stage, run_graph
+
+
+#----------------------------------------------------------
+# Define Default Settings
+#----------------------------------------------------------
+# Stages of a small analysis: load_data feeds fig1_frames and fig2_frames, fig1_frames feeds fig1_statistics
+SCRIPT = '''
+def load_data(cohort):
+    return {"data": list(range(cohort["rats"]))}
+
+def fig1_frames(data):
+    return {"fig1_frame": [value * 2 for value in data]}
+
+def fig1_statistics(fig1_frame):
+    return {"fig1_results": sum(fig1_frame)}
+
+def fig2_frames(data):
+    return {"fig2_frame": [value + 1 for value in data]}
+'''
+
+
+#----------------------------------------------------------
+# Define Custom Methods
+#----------------------------------------------------------
+
+# Method to write the stages with one text replaced into "folder", import them and build their graph
+def stage_script_graph(folder, name, old = "", new = ""):
+    path = os.path.join(str(folder), name + ".py")
+    with open(path, "w") as script:
+        script.write(SCRIPT.replace(old, new))
+    spec = importlib.util.spec_from_file_location(name, path)
+    stages = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(stages)
+    graph = new_graph(os.path.join(str(folder), "checkpoints"))
+    add_stage(graph, "load_data", stages.load_data, inputs = ["cohort"], outputs = ["data"])
+    add_stage(graph, "fig1_frames", stages.fig1_frames, inputs = ["data"], outputs = ["fig1_frame"])
+    add_stage(graph, "fig1_statistics", stages.fig1_statistics, inputs = ["fig1_frame"], outputs = ["fig1_results"])
+    add_stage(graph, "fig2_frames", stages.fig2_frames, inputs = ["data"], outputs = ["fig2_frame"])
+    return graph
+
+# Method to read the status of every stage of the last run
+def stage_status(graph):
+    with open(os.path.join(graph["folder"], "checkpoints.json")) as file:
+        return {name: record["status"] for name, record in json.load(file).items()}
+
+
+#----------------------------------------------------------
+# Tests
+#----------------------------------------------------------
+
+# Test that an edited stage runs again with the stages that read from it, and every other stage is reused
+def test_edited_stage_invalidates_downstream_only(tmp_path):
+    settings = {"cohort": {"rats": 4}}
+    graph = stage_script_graph(tmp_path, "original")
+    values = run_graph(graph, settings)
+    assert values["fig1_results"] == 12 and values["fig2_frame"] == [1, 2, 3, 4]
+    assert set(stage_status(graph).values()) == {"ran"}
+
+    # Unchanged stages are all reused
+    run_graph(stage_script_graph(tmp_path, "unchanged"), settings)
+    assert set(stage_status(graph).values()) == {"reused"}
+
+    graph = stage_script_graph(tmp_path, "edited", "value * 2", "value * 3")
+    values = run_graph(graph, settings, targets = ["fig1_statistics", "fig2_frames"])
+    assert stage_status(graph) == {"load_data": "reused", "fig1_frames": "ran", "fig1_statistics": "ran", "fig2_frames": "reused"}
+    assert values["fig1_results"] == 18 and values["fig2_frame"] == [1, 2, 3, 4]
+
+    # A changed setting runs every stage that reads from it
+    run_graph(graph, {"cohort": {"rats": 5}})
+    assert set(stage_status(graph).values()) == {"ran"}
+
+# Test that a failed stage stops only the stages that read from it, and the next run resumes from it
+def test_failed_stage_resumes(tmp_path):
+    settings = {"cohort": {"rats": 4}}
+    graph = stage_script_graph(tmp_path, "failing", "    return {\"fig1_frame\"", "    raise ValueError(\"no data\")\n    return {\"fig1_frame\"")
+    with pytest.raises(Exception, match = "fig1_frames"):
+        run_graph(graph, settings)
+    assert stage_status(graph) == {"load_data": "ran", "fig1_frames": "failed", "fig1_statistics": "skipped", "fig2_frames": "ran"}
+
+    graph = stage_script_graph(tmp_path, "fixed")
+    values = run_graph(graph, settings, targets = ["fig1_statistics"])
+    assert stage_status(graph) == {"load_data": "reused", "fig1_frames": "ran", "fig1_statistics": "ran", "fig2_frames": "ran"}
+    assert values["fig1_results"] == 12
@@ -0,0 +1,95 @@
+# Tests of the Watch-Folder Ingestion (watch_folder.py)
+# The archives built from workbooks dropped into a folder must match the archives of Creating_Binary_CSV_Files.py
+# (Feeding_Binary_CSV_Files.zip and Sucrose_Binary_CSV_Files.zip in Data for figures), and a workbook that cannot be
+# read must not stop the watch.
+#
+#     python -m pytest tests
+
+
+#----------------------------------------------------------
+# Import libraries
+#----------------------------------------------------------
+import os
+import sys
+import zipfile
+DATA_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Data for figures")
+sys.path.insert(0, DATA_FOLDER)
+from watch_folder import watch, process_folder, scan_folder
+from cohort_config import load_cohort
+
+
+#----------------------------------------------------------
+# Define Custom Methods
+#----------------------------------------------------------
+
+# Method to copy the workbooks of Raw Video Data.zip whose name ends with "suffix" into "folder" - returns their names
+def copy_workbooks(folder, suffix = ".xlsx"):
+    names = []
+    with zipfile.ZipFile(os.path.join(DATA_FOLDER, "Raw Video Data.zip")) as archive:
+        for member in archive.namelist():
+            name = os.path.basename(member)
+            if member.startswith("__MACOSX") or name.startswith(".") or not name.endswith(suffix):
+                continue
+            with open(os.path.join(folder, name), "wb") as file:
+                file.write(archive.read(member))
+            names.append(name)
+    return sorted(names)
+
+# Method to compare the files of a watch archive with the files of the same name in the archive of Creating_Binary_CSV_Files.py
+# "only" limits the comparison to some files - returns the number of files compared
+def assert_same_files(watched, archive, only = None):
+    with zipfile.ZipFile(watched) as watched_archive, zipfile.ZipFile(os.path.join(DATA_FOLDER, archive)) as reference_archive:
+        reference = {os.path.basename(member): member for member in reference_archive.namelist()}
+        compared = 0
+        for member in watched_archive.namelist():
+            name = os.path.basename(member)
+            if name in reference and (only is None or name in only):
+                assert watched_archive.read(member) == reference_archive.read(reference[name]), name
+                compared += 1
+        return compared
+
+
+#----------------------------------------------------------
+# Tests
+#----------------------------------------------------------
+
+# Test that all workbooks dropped into the folder give the archives of Creating_Binary_CSV_Files.py
+def test_watch_matches_creating_binary_csv_files(tmp_path):
+    incoming = tmp_path / "incoming"
+    incoming.mkdir()
+    names = copy_workbooks(incoming)
+    state = watch(str(incoming), str(tmp_path / "Live"), once = True)
+    assert sorted(state["stamps"]) == names
+    assert not state["failed"]
+    # 4 binary files, the normalized activity and the 2 totals of feeding; 2 binary files, the normalized activity and the 2 totals of sucrose
+    assert assert_same_files(tmp_path / "Live" / "Feeding_Binary_CSV_Files.zip", "Feeding_Binary_CSV_Files.zip") == 7
+    assert assert_same_files(tmp_path / "Live" / "Sucrose_Binary_CSV_Files.zip", "Sucrose_Binary_CSV_Files.zip") == 5
+
+# Test that a truncated workbook is logged and skipped, is not read again until it changes, and is read once it is complete
+def test_watch_skips_truncated_workbook(tmp_path, capsys):
+    incoming = tmp_path / "incoming"
+    incoming.mkdir()
+    output = tmp_path / "Live"
+    names = copy_workbooks(incoming, "_HFHS_Restricted.xlsx")
+    complete = (incoming / names[0]).read_bytes()
+    (incoming / names[0]).write_bytes(complete[:len(complete) // 2])
+
+    state = watch(str(incoming), str(output), once = True)
+    assert names[0] in state["failed"] and names[0] not in state["stamps"]
+    assert sorted(state["stamps"]) == names[1:]
+    assert "could not read " + names[0] in capsys.readouterr().out
+    assert os.path.exists(output / "Feeding_Binary_CSV_Files.zip")
+
+    # The same truncated workbook is not read again
+    cohort = load_cohort()
+    present = scan_folder(str(incoming), cohort)
+    assert process_folder(state, str(incoming), present, present, str(output), cohort) == set()
+    assert "could not read" not in capsys.readouterr().out
+
+    # Once the scorer saves the whole workbook it is read and the group matches Creating_Binary_CSV_Files.py
+    (incoming / names[0]).write_bytes(complete)
+    present = scan_folder(str(incoming), cohort)
+    assert process_folder(state, str(incoming), present, present, str(output), cohort) == {"HFHS Restricted"}
+    assert not state["failed"] and sorted(state["stamps"]) == names
+    assert assert_same_files(output / "Feeding_Binary_CSV_Files.zip", "Feeding_Binary_CSV_Files.zip", ["Feeding_HFHS_Restricted_Binary.csv"]) == 1
+    assert assert_same_files(output / "Sucrose_Binary_CSV_Files.zip", "Sucrose_Binary_CSV_Files.zip", ["Sucrose_HFHS_Restricted_Binary.csv"]) == 1